@@ -0,0 +1,6 @@
+# Benchmarks offline (sin red): servidor Gemini falso y harness de replay
+
+# discord.py-self 2.0 falla al importarse después de httpx (typing_extensions
+# recientes exponen __annotations__ en CachedSlotProperty); src.main ya importa
+# discord antes que gemini_client, aquí forzamos el mismo orden.
+import discord  # noqa: F401
@@ -0,0 +1,29 @@
+from __future__ import annotations
+
+import math
+from typing import Dict, Iterable, List
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    """Nearest-rank percentile over an already sorted list (q in 0..100)."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(q / 100.0 * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def summarize(values: Iterable[float]) -> Dict[str, float]:
+    data = sorted(values)
+    return {
+        "n": float(len(data)),
+        "p50": percentile(data, 50),
+        "p95": percentile(data, 95),
+        "p99": percentile(data, 99),
+        "max": data[-1] if data else 0.0,
+    }
+
+
+def fmt_ms(stats: Dict[str, float]) -> str:
+    return "n={n:.0f} p50={p50:.2f}ms p95={p95:.2f}ms p99={p99:.2f}ms max={max:.2f}ms".format(
+        **{k: (v if k == "n" else v * 1000.0) for k, v in stats.items()}
+    )
@@ -0,0 +1,95 @@
+"""Admission control under a flood the send lanes cannot keep up with.
+
+Replays busy traffic over a few channels with slow per-channel pacing and
+short send lanes, once with every trigger admitted (the old behaviour: the
+reply is generated and then dropped if the lane is full) and once with the
+AdmissionController. Prints Gemini calls, replies sent, triggers shed before
+generation, generations thrown away after it and end-to-end latency.
+Uso: python -m bench.bench_admission [--events 600] [--channels 3] [--pacing 0.3]
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import logging
+import os
+from typing import Dict, Optional
+
+os.environ.setdefault("DISCORD_TOKEN", "bench")
+os.environ.setdefault("GEMINI_API_KEY", "bench")
+
+from src import discord_client  # noqa: E402
+from src.admission import AdmissionController  # noqa: E402
+from src.config import settings  # noqa: E402
+from src.metrics import ADMISSION_REJECTIONS  # noqa: E402
+
+from . import replay  # noqa: E402
+from ._stats import fmt_ms, summarize  # noqa: E402
+
+
+class _AdmitAll(AdmissionController):
+    def admit(self, channel_id: int, priority: int) -> Optional[str]:
+        return None
+
+
+def _rejections() -> Dict[str, float]:
+    out: Dict[str, float] = {}
+    for (priority, reason), child in ADMISSION_REJECTIONS._children.items():
+        key = f"{priority}/{reason}"
+        out[key] = out.get(key, 0.0) + child.value
+    return out
+
+
+async def run(args: argparse.Namespace) -> None:
+    controller = discord_client.admission
+    replay_args = replay.make_parser().parse_args(
+        ["--scenario", "channels", "--events", str(args.events), "--channels", str(args.channels),
+         "--rate", str(args.rate), "--speed", "1", "--latency", str(args.latency), "--latency-jitter", "0.1"]
+    )
+    for label, admission in (("admit all", _AdmitAll(*_sources(controller))), ("admission", controller)):
+        def setup() -> None:
+            replay.reset_state()
+            settings.MIN_SECONDS_BETWEEN_MESSAGES_PER_CHANNEL = args.pacing
+            settings.QUEUE_MAX_SIZE_PER_CHANNEL = args.queue
+            settings.ADMISSION_MAX_WAIT_SECONDS = args.max_wait
+            discord_client.admission = admission
+
+        before = _rejections()
+        try:
+            report = await replay.run_replay(replay_args, setup=setup)
+        finally:
+            discord_client.admission = controller
+        after = _rejections()
+        delta = {k: int(v - before.get(k, 0.0)) for k, v in after.items() if v > before.get(k, 0.0)}
+        wasted = sum(n for k, n in delta.items() if k.endswith("queue_full_after_generation"))
+        shed = sum(delta.values()) - wasted
+        print(f"{label:<10}: triggers={report.triggers} gemini_calls={report.gemini_calls} "
+              f"replies={report.replies} shed_before={shed} wasted_generations={wasted}")
+        if report.stages["end_to_end"]:
+            print(f"  end_to_end {fmt_ms(summarize(report.stages['end_to_end']))}")
+        if delta:
+            print("  rejections: " + " ".join(f"{k}={n}" for k, n in sorted(delta.items())))
+
+
+def _sources(controller: AdmissionController):
+    return controller._depth, controller._gemini_waiting, controller._send_seconds
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--events", type=int, default=600)
+    parser.add_argument("--channels", type=int, default=3)
+    parser.add_argument("--rate", type=float, default=60.0, help="mensajes/s de la traza")
+    parser.add_argument("--latency", type=float, default=0.3)
+    parser.add_argument("--pacing", type=float, default=0.3, help="MIN_SECONDS_BETWEEN_MESSAGES_PER_CHANNEL")
+    parser.add_argument("--queue", type=int, default=5, help="QUEUE_MAX_SIZE_PER_CHANNEL")
+    parser.add_argument("--max-wait", type=float, default=2.0, help="ADMISSION_MAX_WAIT_SECONDS")
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+    # el aviso por cada respuesta descartada taparía el resultado
+    logging.getLogger("src.discord_client").setLevel(logging.ERROR)
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
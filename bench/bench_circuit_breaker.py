@@ -0,0 +1,169 @@
+"""A Gemini outage with and without the circuit breaker, on virtual time.
+
+Runs the real on_message pipeline and gemini_client (quota, tenacity
+retries, TIMEOUT_S) against an in-process Gemini stand-in that hangs until
+TIMEOUT_S and times out during the outage window, then answers normally
+again. Default settings otherwise. Prints the peak of concurrent handler
+coroutines and of Gemini requests in flight, HTTP attempts spent during the
+outage, replies, and how long after the outage the first reply went out.
+Uso: python -m bench.bench_circuit_breaker [--minutes 30] [--outage-start 10] [--outage-minutes 5]
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+from typing import Dict, List
+
+import httpx
+
+os.environ.setdefault("DISCORD_TOKEN", "bench")
+os.environ.setdefault("GEMINI_API_KEY", "bench")
+
+from src import discord_client, gemini_client, llm_backend  # noqa: E402
+from src.admission import AdmissionController  # noqa: E402
+from src.clock import run_virtual  # noqa: E402
+from src.config import settings  # noqa: E402
+from src.gemini_client import QuotaScheduler  # noqa: E402
+from src.inactivity import InactivityEngine  # noqa: E402
+from src.metrics import CIRCUIT_REJECTIONS  # noqa: E402
+from src.send_scheduler import SendScheduler  # noqa: E402
+
+from . import replay, traces  # noqa: E402
+from .fake_discord import BOT_USER, FakeChannel, FakeDiscord, FakeGuild, FakeMessage, FakeReference, FakeUser  # noqa: E402
+
+_REPLY = {"candidates": [{"content": {"role": "model", "parts": [{"text": "holaaa~ ya estoy de vuelta"}]}}]}
+
+
+class _Outage:
+    """Gemini stand-in: `latency` per call, or a hang until TIMEOUT_S inside [start, end)."""
+
+    def __init__(self, start: float, end: float, latency: float) -> None:
+        self.start = start
+        self.end = end
+        self.latency = latency
+        self.attempts = 0
+        self.attempts_in_outage = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+
+    async def handle(self, request: httpx.Request) -> httpx.Response:
+        now = asyncio.get_running_loop().time()
+        self.attempts += 1
+        self.in_flight += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        try:
+            if self.start <= now < self.end:
+                self.attempts_in_outage += 1
+                await asyncio.sleep(settings.TIMEOUT_S)
+                raise httpx.ReadTimeout("timed out", request=request)
+            await asyncio.sleep(self.latency)
+            return httpx.Response(200, content=json.dumps(_REPLY).encode(), headers={"Content-Type": "application/json"})
+        finally:
+            self.in_flight -= 1
+
+
+def _fresh_components() -> None:
+    # Objetos ligados al loop: uno nuevo por simulación
+    dc = discord_client
+    gemini_client.quota = QuotaScheduler(clock=gemini_client.loop_time)
+    gemini_client._breakers.clear()
+    dc.send_scheduler = SendScheduler(lambda items: dc._deliver(items), clock=dc._loop_time)
+    dc.admission = AdmissionController(
+        dc.send_scheduler.depth, lambda: gemini_client.quota.waiting, dc._mean_delivery_seconds
+    )
+    dc.inactivity = InactivityEngine(dc._send_inactivity_message, dc._last_activity, clock=dc._loop_time)
+    replay.reset_state()
+
+
+async def simulate(args: argparse.Namespace) -> Dict[str, float]:
+    random.seed(args.seed)
+    _fresh_components()
+    outage = _Outage(args.outage_start * 60, (args.outage_start + args.outage_minutes) * 60, args.llm_latency)
+    gemini_client._client = httpx.AsyncClient(base_url="http://gemini.invalid", transport=httpx.MockTransport(outage.handle))
+    api = FakeDiscord()
+    guild = FakeGuild(1)
+    channels: Dict[int, FakeChannel] = {}
+    discord_client.bot._connection.user = BOT_USER
+    discord_client.bot.get_channel = channels.get
+    discord_client.inactivity.start()
+
+    def message(ev: traces.TraceEvent) -> FakeMessage:
+        channel = channels.get(ev.channel_id)
+        if channel is None:
+            channel = channels[ev.channel_id] = FakeChannel(api, ev.channel_id, guild)
+        author = FakeUser(ev.author_id)
+        if ev.kind == traces.REPLY:
+            target = api.last_bot_message.get(ev.channel_id)
+            if target is not None:
+                return FakeMessage(api, channel, author, ev.content, reference=FakeReference(target.id, target))
+        if ev.kind == traces.CHATTER:
+            return FakeMessage(api, channel, author, ev.content)
+        return FakeMessage(api, channel, author, ev.content, mentions=[BOT_USER])
+
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    duration = args.minutes * 60.0
+    tasks: List[asyncio.Task] = []
+    peak_handlers = 0
+    rejected_before = CIRCUIT_REJECTIONS._children[()].value
+    events = traces.many_channels(channels=args.channels, events=int(args.rate * duration), rate=args.rate, seed=args.seed)
+    try:
+        for ev in events:
+            delay = start + ev.at - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            tasks = [t for t in tasks if not t.done()]
+            peak_handlers = max(peak_handlers, len(tasks))
+            tasks.append(asyncio.create_task(discord_client.on_message(message(ev))))
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await discord_client.send_scheduler.join()
+    finally:
+        await discord_client.inactivity.close()
+        await discord_client.send_scheduler.close()
+        await gemini_client.close_client()
+        del discord_client.bot.get_channel
+    after = [t - start for t, _, _, _ in api.sent if t - start >= outage.end]
+    return {
+        "peak_handlers": peak_handlers,
+        "peak_in_flight": outage.peak_in_flight,
+        "attempts": outage.attempts,
+        "attempts_in_outage": outage.attempts_in_outage,
+        "failed_fast": CIRCUIT_REJECTIONS._children[()].value - rejected_before,
+        "replies": len(api.sent),
+        "recovery": (min(after) - outage.end) if after else float("nan"),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--minutes", type=float, default=30.0)
+    parser.add_argument("--outage-start", type=float, default=10.0)
+    parser.add_argument("--outage-minutes", type=float, default=5.0)
+    parser.add_argument("--channels", type=int, default=20)
+    parser.add_argument("--rate", type=float, default=1.0, help="mensajes/s entrantes (30% triggers)")
+    parser.add_argument("--llm-latency", type=float, default=0.8)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.ERROR)
+    # Cada trigger fallido deja un traceback: fuera del resultado
+    logging.getLogger("src.discord_client").setLevel(logging.CRITICAL)
+    llm_backend.backend = llm_backend.GeminiBackend()
+
+    print(f"{args.minutes:.0f} simulated minutes, outage (hang until TIMEOUT_S={settings.TIMEOUT_S}s) "
+          f"from minute {args.outage_start:g} for {args.outage_minutes:g}")
+    for enabled in (False, True):
+        settings.CIRCUIT_BREAKER_ENABLED = enabled
+        r = run_virtual(simulate(args))
+        label = "breaker" if enabled else "no breaker"
+        print(f"{label:<10}: peak handlers={r['peak_handlers']:.0f} peak gemini in flight={r['peak_in_flight']:.0f} "
+              f"attempts={r['attempts']:.0f} (during outage {r['attempts_in_outage']:.0f}) "
+              f"failed fast={r['failed_fast']:.0f} replies={r['replies']:.0f} "
+              f"first reply {r['recovery']:.1f}s after recovery")
+
+
+if __name__ == "__main__":
+    main()
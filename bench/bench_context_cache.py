@@ -0,0 +1,57 @@
+"""Request size with the system prompt inline vs referenced from cachedContents.
+
+Also checks the inline fallback when the server-side cache disappears.
+Uso: python -m bench.bench_context_cache [--requests 50]
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import logging
+import os
+
+os.environ.setdefault("DISCORD_TOKEN", "bench")
+os.environ.setdefault("GEMINI_API_KEY", "bench")
+
+from src import gemini_client  # noqa: E402
+from src.config import settings  # noqa: E402
+
+from .fake_gemini import FakeGeminiServer  # noqa: E402
+
+
+async def _bytes_per_request(server: FakeGeminiServer, n: int) -> float:
+    before_bytes, before_reqs = server.request_bytes, server.requests
+    for _ in range(n):
+        await gemini_client.generate_reply("hola", settings.DISCORD_SYSTEM_PROMPT)
+    return (server.request_bytes - before_bytes) / max(1, server.requests - before_reqs)
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=50)
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+
+    async with FakeGeminiServer() as server:
+        settings.GEMINI_BASE_URL = server.url
+        settings.GEMINI_CONTEXT_CACHE_ENABLED = False
+        inline = await _bytes_per_request(server, args.requests)
+
+        settings.GEMINI_CONTEXT_CACHE_ENABLED = True
+        await gemini_client.generate_reply("hola", settings.DISCORD_SYSTEM_PROMPT)  # dispara la creación
+        await asyncio.sleep(0.05)
+        cached = await _bytes_per_request(server, args.requests)
+
+        # Fallback: la caché desaparece en el servidor
+        for name in list(server.cached_contents):
+            server.expire_cache(name)
+        reply = await gemini_client.generate_reply("hola", settings.DISCORD_SYSTEM_PROMPT)
+        await gemini_client.close_client()
+
+    print(f"inline system prompt : {inline:.0f} bytes/request")
+    print(f"cached system prompt : {cached:.0f} bytes/request")
+    print(f"fallback after expiry: {'ok' if reply else 'FAILED'}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
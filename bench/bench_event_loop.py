@@ -0,0 +1,150 @@
+"""Event-loop lag under the offline replay, asyncio vs uvloop.
+
+Runs the same replay (real on_message pipeline, in-process Gemini server and
+fake Discord) once per loop implementation, with the LoopMonitor sampling
+every --interval seconds. Every --stall-every-th formatted reply can also
+stall the loop: --parse-kb json-parses a payload of that size (C code that
+holds the GIL) and --block-ms sleeps synchronously (like a blocking log
+handler), the kinds of stall the watchdog is there to catch. Prints the replay summary,
+loop lag percentiles, stalls reported past LOOP_SLOW_CALLBACK_SECONDS and
+end-to-end latency. uvloop is skipped if it is not installed.
+Uso: python -m bench.bench_event_loop [--events 1000] [--parse-kb 30000] [--block-ms 150] [--show-stacks]
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import time
+from typing import Dict, List, Optional
+
+os.environ.setdefault("DISCORD_TOKEN", "bench")
+os.environ.setdefault("GEMINI_API_KEY", "bench")
+
+from src import discord_client, gemini_client, loop_monitor  # noqa: E402
+from src.admission import AdmissionController  # noqa: E402
+from src.config import settings  # noqa: E402
+from src.gemini_client import QuotaScheduler  # noqa: E402
+from src.metrics import LOOP_STALLS  # noqa: E402
+from src.send_scheduler import SendScheduler  # noqa: E402
+
+from . import replay  # noqa: E402
+from ._stats import fmt_ms, summarize  # noqa: E402
+
+
+class _Lags:
+    """Stand-in for the lag histogram that keeps every sample."""
+
+    def __init__(self) -> None:
+        self.samples: List[float] = []
+
+    def observe(self, value: float) -> None:
+        self.samples.append(value)
+
+
+def _fresh_components() -> None:
+    # Objetos ligados al loop: uno nuevo por implementación
+    dc = discord_client
+    gemini_client.quota = QuotaScheduler(clock=gemini_client.loop_time)
+    gemini_client._breakers.clear()
+    dc.send_scheduler = SendScheduler(lambda items: dc._deliver(items), clock=dc._loop_time)
+    dc.admission = AdmissionController(
+        dc.send_scheduler.depth, lambda: gemini_client.quota.waiting, dc._mean_delivery_seconds
+    )
+    dc.compactor._slots = None
+
+
+async def simulate(args: argparse.Namespace) -> Dict[str, object]:
+    _fresh_components()
+    replay_args = replay.make_parser().parse_args(
+        ["--scenario", args.scenario, "--events", str(args.events), "--channels", str(args.channels),
+         "--speed", str(args.speed), "--latency", str(args.latency)]
+    )
+    payload = json.dumps({"candidates": [{"text": "x" * 1000}] * max(0, args.parse_kb)}) if args.parse_kb else ""
+    original_format = discord_client._format_compact
+    calls = [0]
+
+    def format_compact(*a, **kw):
+        calls[0] += 1
+        if calls[0] % args.stall_every == 0:
+            if payload:
+                json.loads(payload)
+            if args.block_ms:
+                time.sleep(args.block_ms / 1000)
+        return original_format(*a, **kw)
+
+    def setup() -> None:
+        replay.reset_state()
+        discord_client._format_compact = format_compact
+
+    lags = _Lags()
+    histogram, loop_monitor.LOOP_LAG_SECONDS = loop_monitor.LOOP_LAG_SECONDS, lags
+    monitor = loop_monitor.LoopMonitor()
+    stalls_before = LOOP_STALLS._children[()].value if () in LOOP_STALLS._children else 0.0
+    monitor.start()
+    try:
+        report = await replay.run_replay(replay_args, setup=setup)
+    finally:
+        await monitor.stop()
+        loop_monitor.LOOP_LAG_SECONDS = histogram
+        discord_client._format_compact = original_format
+    return {
+        "report": report,
+        "lags": lags.samples,
+        "stalls": LOOP_STALLS._children[()].value - stalls_before if () in LOOP_STALLS._children else 0.0,
+    }
+
+
+def run(name: str, args: argparse.Namespace) -> Optional[Dict[str, object]]:
+    factory = loop_monitor.loop_factory(name)
+    if factory is None:
+        return None
+    # Sin asyncio.Runner (3.11+): el bot soporta Python 3.10
+    loop = factory()
+    asyncio.set_event_loop(loop)
+    try:
+        return loop.run_until_complete(simulate(args))
+    finally:
+        loop.run_until_complete(loop.shutdown_asyncgens())
+        asyncio.set_event_loop(None)
+        loop.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scenario", choices=("channels", "bursts", "chains", "mixed"), default="mixed")
+    parser.add_argument("--events", type=int, default=1000)
+    parser.add_argument("--channels", type=int, default=200)
+    parser.add_argument("--speed", type=float, default=10.0)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--interval", type=float, default=0.01, help="LOOP_MONITOR_INTERVAL_SECONDS")
+    parser.add_argument("--slow", type=float, default=settings.LOOP_SLOW_CALLBACK_SECONDS,
+                        help="LOOP_SLOW_CALLBACK_SECONDS")
+    parser.add_argument("--parse-kb", type=int, default=0, help="JSON a parsear en el loop (0 = sin bloqueos)")
+    parser.add_argument("--block-ms", type=float, default=0.0, help="bloqueo síncrono en el loop (0 = ninguno)")
+    parser.add_argument("--stall-every", type=int, default=50)
+    parser.add_argument("--show-stacks", action="store_true", help="mostrar el aviso del watchdog con su pila")
+    args = parser.parse_args()
+    settings.LOOP_MONITOR_ENABLED = True
+    settings.LOOP_MONITOR_INTERVAL_SECONDS = args.interval
+    settings.LOOP_SLOW_CALLBACK_SECONDS = args.slow
+    if not args.show_stacks:
+        logging.getLogger("src.loop_monitor").setLevel(logging.ERROR)
+
+    for name in ("asyncio", "uvloop"):
+        r = run(name, args)
+        if r is None:
+            print(f"{name:<8}: not installed (pip install {name}), skipped")
+            continue
+        report = r["report"]
+        print(f"{name:<8}: ", end="")
+        report.print()
+        if r["lags"]:
+            print(f"  loop lag       {fmt_ms(summarize(r['lags']))}")
+        print(f"  stalls > {args.slow * 1000:.0f} ms reported by the watchdog: {r['stalls']:.0f}")
+
+
+if __name__ == "__main__":
+    main()
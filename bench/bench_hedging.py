@@ -0,0 +1,106 @@
+"""Hedged generation against a primary model with a heavy latency tail.
+
+The fake server answers the primary model in ~latency and a fraction
+`--slow-rate` of calls `--slow-latency` later; the fallback model is fast.
+Compares primary-only against HedgedBackend: latency percentiles, hedge
+rate, which request won, p50/p95 of the calls that were hedged and of
+those that were not, and the extra calls.
+Uso: python -m bench.bench_hedging [--requests 400] [--concurrency 8] [--slow-rate 0.05]
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import logging
+import os
+import time
+from typing import List
+
+os.environ.setdefault("DISCORD_TOKEN", "bench")
+os.environ.setdefault("GEMINI_API_KEY", "bench")
+
+from src import gemini_client  # noqa: E402
+from src.config import settings  # noqa: E402
+from src.llm_backend import GeminiBackend, HedgedBackend, LLMBackend, LocalBackend  # noqa: E402
+
+from ._stats import fmt_ms, summarize  # noqa: E402
+from .fake_gemini import FakeGeminiServer  # noqa: E402
+
+PRIMARY = "gemini-2.5-flash"
+FALLBACK = "gemini-2.5-flash-lite"
+
+
+async def _drive(backend: LLMBackend, args: argparse.Namespace) -> List[float]:
+    samples: List[float] = []
+    queue = list(range(args.requests))
+
+    async def worker() -> None:
+        while queue:
+            i = queue.pop()
+            t0 = time.perf_counter()
+            await backend.generate(f"hola {i}", "prompt")
+            samples.append(time.perf_counter() - t0)
+
+    await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+    return samples
+
+
+async def run(args: argparse.Namespace) -> None:
+    settings.GEMINI_MODEL = PRIMARY
+    settings.LLM_HEDGE_MIN_DELAY_SECONDS = args.min_delay
+    settings.LLM_HEDGE_PERCENTILE = args.percentile
+    settings.LLM_HEDGE_MAX_RATIO = args.max_ratio
+    for label in ("primary only", "hedged"):
+        server = FakeGeminiServer(
+            latency=args.latency,
+            latency_jitter=args.latency / 2,
+            slow_rate=args.slow_rate,
+            slow_latency=args.slow_latency,
+            model_latency={FALLBACK: args.fallback_latency},
+        )
+        async with server:
+            settings.GEMINI_BASE_URL = server.url
+            try:
+                if label == "hedged":
+                    backend: LLMBackend = HedgedBackend(GeminiBackend(), GeminiBackend(FALLBACK))
+                else:
+                    backend = GeminiBackend()
+                samples = await _drive(backend, args)
+            finally:
+                await gemini_client.close_client()
+        print(f"{label:<12}: {fmt_ms(summarize(samples))}")
+        calls = ", ".join(f"{m}={n}" for m, n in sorted(server.calls_by_model.items()))
+        if isinstance(backend, HedgedBackend):
+            print(f"  hedge rate {backend.hedged / backend.requests:.1%} (cap {args.max_ratio:.0%}), "
+                  f"fallback won {backend.hedge_wins}/{backend.hedged}, "
+                  f"delay now {backend.hedge_delay() * 1000:.0f}ms")
+            for kind, tracker in backend.call_latency.items():
+                # Ventana de las últimas llamadas de cada tipo, no todo el run
+                print(f"  {kind:<8} calls: p50={(tracker.percentile(50) or 0) * 1000:.2f}ms "
+                      f"p95={(tracker.percentile(95) or 0) * 1000:.2f}ms (last {len(tracker)})")
+        print(f"  server calls: {calls}")
+
+    local = LocalBackend()
+    first = [await local.generate(f"hola {i}", "prompt") for i in range(5)]
+    second = [await local.generate(f"hola {i}", "prompt") for i in range(5)]
+    print(f"local backend deterministic: {first == second} ({first[0]!r}, ...)")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=0.15)
+    parser.add_argument("--slow-rate", type=float, default=0.05)
+    parser.add_argument("--slow-latency", type=float, default=2.0)
+    parser.add_argument("--fallback-latency", type=float, default=0.08)
+    parser.add_argument("--percentile", type=float, default=95.0)
+    parser.add_argument("--min-delay", type=float, default=0.2)
+    parser.add_argument("--max-ratio", type=float, default=0.15)
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""Handshake cost of a fresh httpx client per call vs the shared pooled client.
+
+Each iteration sends one generateContent request to the in-process server
+twice: once on a brand new client (what every call paid before the shared
+client) and once on the pooled client, alternating so that both see the same
+machine noise. httpcore's trace hook times the TCP connect and the TLS
+handshake of every request directly; the pooled client only connects on its
+first request. Prints the fresh client's setup (a new SSL context loading the
+trusted certificates: with TLS only the server's self-signed one, so real CA
+bundles cost more) and connect/handshake percentiles, request latency for both
+clients, and the per-iteration difference (fresh minus pooled).
+Uso: python -m bench.bench_http_client [--iterations 1000] [--no-tls]
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import logging
+import os
+import time
+from typing import Dict, List, Optional
+
+os.environ.setdefault("DISCORD_TOKEN", "bench")
+os.environ.setdefault("GEMINI_API_KEY", "bench")
+
+from src import gemini_client  # noqa: E402
+from src.config import settings  # noqa: E402
+
+from ._stats import fmt_ms, summarize  # noqa: E402
+from .fake_gemini import FakeGeminiServer  # noqa: E402
+
+_BODY = {"contents": [{"role": "user", "parts": [{"text": "hola"}]}]}
+
+# Fases de conexión que se cronometran (eventos de httpcore, sin el sufijo .started/.complete)
+_PHASES = ("connection.connect_tcp", "connection.start_tls")
+
+
+class _Phases:
+    """httpcore trace callback that records how long each connection phase took."""
+
+    def __init__(self) -> None:
+        self.started: Dict[str, float] = {}
+        self.seconds: Dict[str, float] = {}
+
+    async def __call__(self, event: str, info: dict) -> None:
+        name, _, stage = event.rpartition(".")
+        if name not in _PHASES:
+            return
+        if stage == "started":
+            self.started[name] = time.perf_counter()
+        elif stage == "complete":
+            self.seconds[name] = time.perf_counter() - self.started.pop(name)
+
+    def handshake(self) -> Optional[float]:
+        if not self.seconds:
+            return None  # conexión reutilizada del pool
+        return sum(self.seconds.values())
+
+
+async def _request(client, url: str) -> _Phases:
+    phases = _Phases()
+    resp = await client.post(url, params={"key": settings.GEMINI_API_KEY}, json=_BODY,
+                             extensions={"trace": phases})
+    resp.raise_for_status()
+    return phases
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--iterations", type=int, default=1000)
+    parser.add_argument("--no-tls", action="store_true")
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+
+    samples: Dict[str, List[float]] = {
+        key: [] for key in ("setup", "tcp", "tls", "handshake", "fresh", "pooled", "saved")
+    }
+    pooled_handshakes = 0
+    async with FakeGeminiServer(tls=not args.no_tls) as server:
+        if server.cert_path:
+            # httpx respeta SSL_CERT_FILE (trust_env) al crear el contexto TLS
+            os.environ["SSL_CERT_FILE"] = server.cert_path
+        settings.GEMINI_BASE_URL = server.url
+        url = f"/v1beta/models/{settings.GEMINI_MODEL}:generateContent"
+        pooled = gemini_client.open_client()
+        await _request(pooled, url)  # la única conexión del pool
+        try:
+            for _ in range(args.iterations):
+                # Comportamiento anterior: un AsyncClient nuevo por llamada (con su contexto TLS)
+                t0 = time.perf_counter()
+                fresh = gemini_client._build_client()
+                samples["setup"].append(time.perf_counter() - t0)
+                async with fresh:
+                    phases = await _request(fresh, url)
+                fresh_seconds = time.perf_counter() - t0
+                samples["fresh"].append(fresh_seconds)
+                samples["tcp"].append(phases.seconds.get("connection.connect_tcp", 0.0))
+                if "connection.start_tls" in phases.seconds:
+                    samples["tls"].append(phases.seconds["connection.start_tls"])
+                samples["handshake"].append(phases.handshake() or 0.0)
+
+                t0 = time.perf_counter()
+                phases = await _request(pooled, url)
+                pooled_seconds = time.perf_counter() - t0
+                samples["pooled"].append(pooled_seconds)
+                pooled_handshakes += phases.handshake() is not None
+                samples["saved"].append(fresh_seconds - pooled_seconds)
+        finally:
+            await gemini_client.close_client()
+
+    print(f"server: {server.url} ({'TLS' if server.tls else 'plain TCP'}), {args.iterations} iterations")
+    # Incluye cargar los certificados de confianza en un SSLContext nuevo
+    print(f"fresh client, setup         {fmt_ms(summarize(samples['setup']))}")
+    print(f"fresh client, TCP connect   {fmt_ms(summarize(samples['tcp']))}")
+    if samples["tls"]:
+        print(f"fresh client, TLS handshake {fmt_ms(summarize(samples['tls']))}")
+    print(f"fresh client, connect total {fmt_ms(summarize(samples['handshake']))}")
+    print(f"pooled client: {pooled_handshakes} handshakes in {args.iterations} requests "
+          f"(connections opened by the server: {server.connections})")
+    print(f"request, fresh client       {fmt_ms(summarize(samples['fresh']))}")
+    print(f"request, pooled client      {fmt_ms(summarize(samples['pooled']))}")
+    print(f"saved per call (paired)     {fmt_ms(summarize(samples['saved']))}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,125 @@
+"""Inactivity messages: periodic full scan (previous watcher) vs the deadline heap.
+
+Many tracked channels, a few of which go idle at random moments. The fake
+generation only sleeps `--latency`. Reports how late each inactivity message
+started relative to its deadline, and the CPU spent finding due channels.
+The previous watcher is reproduced with its check interval scaled by the
+same factor as INACTIVITY_SECONDS (30 s out of 60 s).
+Uso: python -m bench.bench_inactivity [--channels 20000] [--idle 100] [--latency 0.2]
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import logging
+import os
+import random
+import time
+from typing import List
+
+os.environ.setdefault("DISCORD_TOKEN", "bench")
+os.environ.setdefault("GEMINI_API_KEY", "bench")
+
+from src.config import settings  # noqa: E402
+from src.inactivity import InactivityEngine  # noqa: E402
+from src.state_store import StateStore  # noqa: E402
+
+from ._stats import fmt_ms, summarize  # noqa: E402
+
+
+def _store(args: argparse.Namespace, now: float) -> StateStore:
+    store = StateStore(
+        max_channels=args.channels * 2,
+        max_cooldowns=10,
+        ttl_seconds=1e9,
+        memory_turns=4,
+        clock=lambda: asyncio.get_running_loop().time(),
+    )
+    rng = random.Random(args.seed)
+    idle = set(rng.sample(range(args.channels), args.idle))
+    for cid in range(args.channels):
+        ch = store.channel(cid)
+        # Los inactivos vencen repartidos en la ventana; el resto sigue activo durante la prueba
+        ch.last_trigger = now + rng.uniform(0, args.spread) if cid in idle else now + 1e6
+    return store
+
+
+async def run_legacy(args: argparse.Namespace) -> None:
+    loop = asyncio.get_running_loop()
+    store = _store(args, loop.time())
+    interval = settings.INACTIVITY_SECONDS / 2
+    lateness: List[float] = []
+    scan_cpu: List[float] = []
+
+    async def watcher() -> None:
+        while True:
+            await asyncio.sleep(interval)
+            now = loop.time()
+            t0 = time.process_time()
+            due = [ch for ch in store.channels()
+                   if ch.last_trigger is not None and now - ch.last_trigger >= settings.INACTIVITY_SECONDS]
+            scan_cpu.append(time.process_time() - t0)
+            for ch in due:
+                # Generación en serie, como el watcher anterior
+                lateness.append(loop.time() - (ch.last_trigger + settings.INACTIVITY_SECONDS))
+                await asyncio.sleep(args.latency)
+                ch.last_trigger = loop.time() + 1e6
+
+    task = asyncio.create_task(watcher())
+    while len(lateness) < args.idle:
+        await asyncio.sleep(0.05)
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+    print(f"full scan every {interval:.2f}s: late {fmt_ms(summarize(lateness))}")
+    print(f"  cpu per wakeup {fmt_ms(summarize(scan_cpu))} over {args.channels} channels")
+
+
+async def run_engine(args: argparse.Namespace) -> None:
+    loop = asyncio.get_running_loop()
+    store = _store(args, loop.time())
+    lateness: List[float] = []
+
+    def last_activity(cid: int):
+        ch = store.peek(cid)
+        return ch.last_trigger if ch is not None else None
+
+    async def fire(cid: int) -> None:
+        ch = store.peek(cid)
+        lateness.append(loop.time() - (ch.last_trigger + settings.INACTIVITY_SECONDS))
+        await asyncio.sleep(args.latency)
+        ch.last_trigger = loop.time() + 1e6
+
+    engine = InactivityEngine(fire, last_activity)
+    engine.start()
+    t0 = time.process_time()
+    for cid in range(args.channels):
+        engine.watch(cid)
+    watch_cpu = time.process_time() - t0
+    t0 = time.process_time()
+    while len(lateness) < args.idle:
+        await asyncio.sleep(0.05)
+    run_cpu = time.process_time() - t0
+    await engine.close()
+    print(f"deadline heap, concurrency {settings.INACTIVITY_CONCURRENCY}: late {fmt_ms(summarize(lateness))}")
+    print(f"  cpu: watch() {watch_cpu / args.channels * 1e6:.2f}us/channel once, "
+          f"{run_cpu * 1000:.1f}ms total for {args.idle} due channels (incl. bench polling)")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--channels", type=int, default=20_000)
+    parser.add_argument("--idle", type=int, default=100)
+    parser.add_argument("--inactivity", type=float, default=1.0, help="INACTIVITY_SECONDS para la prueba")
+    parser.add_argument("--spread", type=float, default=10.0, help="segundos en los que se reparten los vencimientos")
+    parser.add_argument("--latency", type=float, default=0.2, help="latencia de la generación falsa")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+    settings.INACTIVITY_ENABLED = True
+    settings.INACTIVITY_SECONDS = args.inactivity
+    asyncio.run(run_legacy(args))
+    asyncio.run(run_engine(args))
+
+
+if __name__ == "__main__":
+    main()
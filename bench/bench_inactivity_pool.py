@@ -0,0 +1,185 @@
+"""Inactivity messages generated on the deadline vs served from the pool, on virtual time.
+
+Seeds --channels allowed channels as active at t=0 (what on_ready does, so
+they all go quiet together) and keeps a trickle of exchanges going on random
+channels, which move their deadline and invalidate their pool. The real
+InactivityEngine, InactivityPool, admission and send lanes run against a
+Gemini stand-in that takes --llm-latency (±50%) per call. Prints the wait
+from deadline to enqueue, Gemini calls at the deadline vs in the background,
+the peak of calls in flight and started in any 10 s, pool hits and wasted fills.
+Uso: python -m bench.bench_inactivity_pool [--minutes 60] [--channels 40] [--inactivity 300]
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import logging
+import os
+import random
+from bisect import bisect_left
+from typing import Dict, List, Tuple
+
+os.environ.setdefault("DISCORD_TOKEN", "bench")
+os.environ.setdefault("GEMINI_API_KEY", "bench")
+
+from src import discord_client, gemini_client  # noqa: E402
+from src.admission import AdmissionController  # noqa: E402
+from src.clock import run_virtual  # noqa: E402
+from src.config import settings  # noqa: E402
+from src.gemini_client import PRIORITY_INACTIVITY  # noqa: E402
+from src.inactivity import InactivityEngine, InactivityPool  # noqa: E402
+from src.metrics import INACTIVITY_POOL_FILLS, INACTIVITY_POOL_LOOKUPS  # noqa: E402
+from src.send_scheduler import SendScheduler  # noqa: E402
+
+from . import replay  # noqa: E402
+from ._stats import fmt_ms, summarize  # noqa: E402
+from .fake_discord import FakeChannel, FakeDiscord, FakeGuild  # noqa: E402
+
+
+def _counts(metric) -> Dict[str, float]:
+    return {key[0]: child.value for key, child in metric._children.items()}
+
+
+def _delta(after: Dict[str, float], before: Dict[str, float], key: str) -> int:
+    return int(after.get(key, 0.0) - before.get(key, 0.0))
+
+
+class _Gemini:
+    """generate_reply stand-in: start time and priority of every call, calls in flight."""
+
+    def __init__(self, latency: float) -> None:
+        self.latency = latency
+        self.calls: List[Tuple[float, int]] = []
+        self.in_flight = 0
+        self.peak_in_flight = 0
+
+    async def generate(self, text, system_prompt, *, history=None, sink=None, priority=0, **_) -> str:
+        self.calls.append((asyncio.get_running_loop().time(), priority))
+        self.in_flight += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.latency * random.uniform(0.5, 1.5))
+        finally:
+            self.in_flight -= 1
+        return "holaaa~ seguís por aquí?"
+
+    def peak_per_window(self, window: float = 10.0) -> int:
+        starts = sorted(t for t, _ in self.calls)
+        return max((i - bisect_left(starts, t - window) + 1 for i, t in enumerate(starts)), default=0)
+
+
+async def simulate(args: argparse.Namespace, pool_size: int) -> Dict[str, object]:
+    random.seed(args.seed)
+    dc = discord_client
+    settings.INACTIVITY_POOL_SIZE = pool_size
+    gemini = _Gemini(args.llm_latency)
+    waits: List[float] = []
+    enqueued = [0]
+
+    async def fire(channel_id: int) -> None:
+        # Desde el plazo real: incluye la espera por un hueco de INACTIVITY_CONCURRENCY
+        due = dc._last_activity(channel_id) + settings.INACTIVITY_SECONDS
+        before = enqueued[0]
+        await dc._send_inactivity_message(channel_id)
+        if enqueued[0] > before:
+            waits.append(loop.time() - due)
+
+    def enqueue(channel, content: str) -> None:
+        enqueued[0] += 1
+        original_enqueue(channel, content)
+
+    # Objetos ligados al loop: uno nuevo por simulación
+    replay.reset_state()
+    dc.send_scheduler = SendScheduler(lambda items: dc._deliver(items), clock=dc._loop_time)
+    dc.admission = AdmissionController(dc.send_scheduler.depth, lambda: 0, dc._mean_delivery_seconds)
+    dc.inactivity = InactivityEngine(fire, dc._last_activity, clock=dc._loop_time)
+    dc.inactivity_pool = InactivityPool(
+        lambda ch: dc._generate_inactivity_text(ch, gemini_client.PRIORITY_BACKGROUND),
+        lambda channel_id: dc.state.peek(channel_id),
+        busy=lambda: False,
+        clock=dc._loop_time,
+    )
+    original_enqueue, original_generate = dc._enqueue_send_channel, dc.generate_reply
+    dc._enqueue_send_channel = enqueue
+    dc.generate_reply = gemini.generate
+
+    loop = asyncio.get_running_loop()
+    api = FakeDiscord()
+    guild = FakeGuild(1)
+    channels = {cid: FakeChannel(api, cid, guild) for cid in range(1, args.channels + 1)}
+    dc.bot.get_channel = channels.get
+    lookups, fills = _counts(INACTIVITY_POOL_LOOKUPS), _counts(INACTIVITY_POOL_FILLS)
+    try:
+        for cid in channels:
+            dc.state.channel(cid).last_trigger = loop.time()
+            dc.inactivity.watch(cid)
+            dc.inactivity_pool.watch(cid)
+        dc.inactivity.start()
+        dc.inactivity_pool.start()
+        end = loop.time() + args.minutes * 60.0
+        # Intercambios sueltos: mueven el plazo del canal e invalidan su pool, como _answer
+        while True:
+            await asyncio.sleep(random.expovariate(args.exchanges / 60.0))
+            if loop.time() >= end:
+                break
+            ch = dc.state.channel(random.choice(list(channels)))
+            ch.last_trigger = loop.time()
+            dc._remember(ch, "user", "eh, alguien vio lo de ayer?")
+            dc._remember(ch, "model", "síii, fue buenísimo jaja")
+            dc.inactivity.watch(ch.channel_id)
+            dc.inactivity_pool.invalidate(ch)
+        await dc.send_scheduler.join()
+    finally:
+        await dc.inactivity.close()
+        await dc.inactivity_pool.close()
+        await dc.send_scheduler.close()
+        dc._enqueue_send_channel = original_enqueue
+        dc.generate_reply = original_generate
+        del dc.bot.get_channel
+    after_lookups, after_fills = _counts(INACTIVITY_POOL_LOOKUPS), _counts(INACTIVITY_POOL_FILLS)
+    return {
+        "sent": len(api.sent),
+        "waits": waits,
+        "deadline_calls": sum(1 for _, p in gemini.calls if p == PRIORITY_INACTIVITY),
+        "background_calls": sum(1 for _, p in gemini.calls if p != PRIORITY_INACTIVITY),
+        "peak_in_flight": gemini.peak_in_flight,
+        "peak_10s": gemini.peak_per_window(),
+        "hits": _delta(after_lookups, lookups, "hit"),
+        "misses": _delta(after_lookups, lookups, "miss"),
+        "fills": _delta(after_fills, fills, "ok"),
+        "discarded": _delta(after_fills, fills, "discarded"),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--minutes", type=float, default=60.0)
+    parser.add_argument("--channels", type=int, default=40)
+    parser.add_argument("--inactivity", type=float, default=300.0, help="INACTIVITY_SECONDS")
+    parser.add_argument("--exchanges", type=float, default=4.0, help="intercambios/min entre todos los canales")
+    parser.add_argument("--pool-size", type=int, default=2)
+    parser.add_argument("--llm-latency", type=float, default=1.5)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.ERROR)
+    settings.INACTIVITY_ENABLED = True
+    settings.INACTIVITY_SECONDS = args.inactivity
+    settings.MIN_SECONDS_BETWEEN_MESSAGES_PER_CHANNEL = 0
+
+    print(f"{args.minutes:.0f} simulated minutes, {args.channels} channels quiet from t=0, "
+          f"INACTIVITY_SECONDS={args.inactivity:g}, {args.exchanges:g} exchanges/min")
+    for pool_size in sorted({0, 1, args.pool_size}):
+        r = run_virtual(simulate(args, pool_size))
+        label = f"pool={pool_size}" if pool_size else "no pool"
+        print(f"{label:<8}: inactivity messages={r['sent']} gemini calls at deadline={r['deadline_calls']} "
+              f"background={r['background_calls']} peak in flight={r['peak_in_flight']} "
+              f"peak started/10s={r['peak_10s']}")
+        if pool_size:
+            print(f"  pool hits={r['hits']} misses={r['misses']} fills={r['fills']} "
+                  f"(discarded mid-generation {r['discarded']}, never served {r['fills'] - r['hits']})")
+        if r["waits"]:
+            print(f"  deadline->enqueued {fmt_ms(summarize(r['waits']))}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""Location filter cost per gateway message, and hot reload of .env.
+
+1. _is_allowed_location() for allowed and rejected messages: the previous
+   path (re-parse ALLOWED_GUILD_IDS / ALLOWED_CHANNEL_IDS on every message)
+   vs the LocationFilter compiled once into frozensets.
+2. Rejection through on_message (the filter is now the first check).
+3. SIGHUP reload: time from the signal until the new filter is live, with
+   the bot object (and its gateway connection) untouched.
+Uso: python -m bench.bench_location_filter [--ids 200] [--iterations 200000]
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import logging
+import os
+import signal
+import tempfile
+import time
+
+os.environ.setdefault("DISCORD_TOKEN", "bench")
+os.environ.setdefault("GEMINI_API_KEY", "bench")
+
+from src import config, discord_client  # noqa: E402
+from src.config import LocationFilter, settings  # noqa: E402
+from src.settings_reloader import SettingsReloader  # noqa: E402
+
+from .fake_discord import BOT_USER, FakeChannel, FakeDiscord, FakeGuild, FakeMessage, FakeUser  # noqa: E402
+
+
+def legacy_is_allowed(message) -> bool:
+    """Filter as it was: both ID lists parsed again for every message."""
+    allowed_guilds = settings.get_allowed_guild_ids()
+    allowed_channels = settings.get_allowed_channel_ids()
+    if not allowed_guilds and not allowed_channels:
+        return True
+    if allowed_guilds:
+        guild_id = message.guild.id if message.guild else None
+        if guild_id not in allowed_guilds:
+            return False
+    if allowed_channels:
+        if message.channel.id not in allowed_channels:
+            return False
+    return True
+
+
+def _configure(ids: int) -> None:
+    settings.ALLOWED_GUILD_IDS = ",".join(str(10_000 + i) for i in range(max(1, ids // 10)))
+    settings.ALLOWED_CHANNEL_IDS = ",".join(str(500_000 + i) for i in range(ids))
+    discord_client.location_filter = LocationFilter.from_settings(settings)
+
+
+def bench_filter(args: argparse.Namespace) -> None:
+    api = FakeDiscord(api_latency=0.0)
+    user = FakeUser(201)
+    allowed = FakeMessage(api, FakeChannel(api, 500_000 + args.ids - 1, FakeGuild(10_000)), user, "hola")
+    rejected = FakeMessage(api, FakeChannel(api, 999_999, FakeGuild(77)), user, "hola")
+    for label, msg in (("allowed", allowed), ("rejected", rejected)):
+        for name, fn in (("parse per message", legacy_is_allowed), ("compiled", discord_client._is_allowed_location)):
+            t0 = time.perf_counter()
+            for _ in range(args.iterations):
+                fn(msg)
+            per_call = (time.perf_counter() - t0) / args.iterations
+            print(f"{label:<8} {name:<17}: {per_call * 1e6:.3f}us/message ({args.ids} channel ids)")
+
+
+async def bench_on_message(args: argparse.Namespace) -> None:
+    discord_client.bot._connection.user = BOT_USER
+    api = FakeDiscord(api_latency=0.0)
+    msg = FakeMessage(api, FakeChannel(api, 999_999, FakeGuild(77)), FakeUser(201), "hola")
+    t0 = time.perf_counter()
+    for _ in range(args.iterations // 10):
+        await discord_client.on_message(msg)
+    per_call = (time.perf_counter() - t0) / (args.iterations // 10)
+    print(f"on_message rejected by location: {per_call * 1e6:.3f}us/message")
+
+
+async def bench_reload(args: argparse.Namespace) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        env_file = os.path.join(tmp, ".env")
+        with open(env_file, "w", encoding="utf-8") as f:
+            f.write(f"ALLOWED_CHANNEL_IDS={settings.ALLOWED_CHANNEL_IDS}\n")
+        saved = config.env_path, os.environ.get("ALLOWED_GUILD_IDS")
+        config.env_path = env_file
+        os.environ["ALLOWED_GUILD_IDS"] = ""
+        bot = discord_client.bot
+        reloaded = asyncio.Event()
+        reloader = SettingsReloader(lambda changed: (discord_client._on_settings_reloaded(changed), reloaded.set()))
+        try:
+            reloader.start()
+            with open(env_file, "w", encoding="utf-8") as f:
+                f.write("ALLOWED_CHANNEL_IDS=123,456\n")
+            t0 = time.perf_counter()
+            os.kill(os.getpid(), signal.SIGHUP)
+            await asyncio.wait_for(reloaded.wait(), 5)
+            elapsed = time.perf_counter() - t0
+        finally:
+            await reloader.stop()
+            config.env_path = saved[0]
+            if saved[1] is None:
+                os.environ.pop("ALLOWED_GUILD_IDS", None)
+            else:
+                os.environ["ALLOWED_GUILD_IDS"] = saved[1]
+        live = sorted(discord_client.location_filter.channel_ids)
+        print(f"SIGHUP reload: {elapsed * 1000:.2f}ms until filter live, channels={live}, "
+              f"same bot object={discord_client.bot is bot}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--ids", type=int, default=200)
+    parser.add_argument("--iterations", type=int, default=200_000)
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+    _configure(args.ids)
+    bench_filter(args)
+    asyncio.run(bench_on_message(args))
+    asyncio.run(bench_reload(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""Event-loop cost of logging with a slow output stream.
+
+Emits a mix of httpx-style DEBUG lines, INFO lines and repeated errors with a
+traceback and a large Gemini payload from inside the event loop, writing to a
+stream that takes `--write-delay` per write (a slow terminal or log pipe).
+Compares the old setup (root at DEBUG, synchronous StreamHandler) with the
+queue pipeline, without and with the repeated-error rate limit. Prints the
+time each logging call takes on the loop, loop lag seen by a 5 ms ticker,
+lines written and the background drain time.
+Uso: python -m bench.bench_logging [--records 3000] [--write-delay 0.0005]
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import io
+import logging
+import os
+import time
+from typing import List
+
+os.environ.setdefault("DISCORD_TOKEN", "bench")
+os.environ.setdefault("GEMINI_API_KEY", "bench")
+
+from src import logging_config  # noqa: E402
+from src.config import settings  # noqa: E402
+
+from ._stats import fmt_ms, summarize  # noqa: E402
+
+_PAYLOAD = {"candidates": [{"content": {"parts": [{"text": "x" * 64}] * 40}, "finishReason": "SAFETY"}] * 8}
+
+
+class SlowStream(io.StringIO):
+    """Counts lines and sleeps on every write, like a blocked stdout pipe."""
+
+    def __init__(self, delay: float) -> None:
+        super().__init__()
+        self.delay = delay
+        self.lines = 0
+
+    def write(self, s: str) -> int:
+        if self.delay > 0:
+            time.sleep(self.delay)
+        self.lines += s.count("\n")
+        return len(s)
+
+
+def _old_setup(stream: SlowStream) -> None:
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    handler = logging.StreamHandler(stream)
+    handler.setFormatter(logging.Formatter("%(name)s - %(levelname)s - %(message)s"))
+    root.addHandler(handler)
+    root.setLevel(logging.DEBUG)
+    for name in logging_config.parse_levels(settings.LOG_LEVELS):
+        logging.getLogger(name).setLevel(logging.NOTSET)
+
+
+async def _workload(records: int) -> tuple:
+    http = logging.getLogger("httpx")
+    gemini = logging.getLogger("src.gemini_client")
+    client = logging.getLogger("src.discord_client")
+    calls: List[float] = []
+    lags: List[float] = []
+    stop = False
+
+    async def ticker() -> None:
+        loop = asyncio.get_running_loop()
+        while not stop:
+            t0 = loop.time()
+            await asyncio.sleep(0.005)
+            lags.append(loop.time() - t0 - 0.005)
+
+    tick = asyncio.create_task(ticker())
+    for i in range(records):
+        t0 = time.perf_counter()
+        kind = i % 10
+        if kind < 6:
+            http.debug('HTTP Request: POST %s "HTTP/1.1 200 OK"', "https://generativelanguage.googleapis.com/v1beta")
+        elif kind < 9:
+            client.info("Reply enqueued for channel %s", 10_000 + i % 7)
+        else:
+            try:
+                raise ValueError("No text parts in response")
+            except ValueError as e:
+                gemini.error("Failed to parse Gemini response: %s | payload=%s", e, _PAYLOAD, exc_info=e)
+        calls.append(time.perf_counter() - t0)
+        if i % 20 == 0:
+            await asyncio.sleep(0)
+    stop = True
+    await tick
+    return calls, lags
+
+
+async def run(args: argparse.Namespace) -> None:
+    for label in ("sync, DEBUG (old)", "queue", "queue + rate limit"):
+        stream = SlowStream(args.write_delay)
+        if label.startswith("sync"):
+            _old_setup(stream)
+        else:
+            settings.LOG_RATE_LIMIT_BURST = args.burst if label.endswith("limit") else 0
+            logging_config.setup_logging(settings, stream=stream)
+        t0 = time.perf_counter()
+        calls, lags = await _workload(args.records)
+        loop_seconds = time.perf_counter() - t0
+        t1 = time.perf_counter()
+        logging_config.shutdown_logging()
+        drain = time.perf_counter() - t1
+        print(f"{label:<19}: loop busy {loop_seconds * 1000:.0f}ms, {stream.lines} lines written, "
+              f"background drain {drain * 1000:.0f}ms")
+        print(f"  per call  {fmt_ms(summarize(calls))}")
+        print(f"  loop lag  {fmt_ms(summarize(lags))}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--records", type=int, default=3000)
+    parser.add_argument("--write-delay", type=float, default=0.0005)
+    parser.add_argument("--burst", type=int, default=5)
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
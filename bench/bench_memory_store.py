@@ -0,0 +1,105 @@
+"""SQLite write-behind memory backend: write throughput, cold loads, on_message overhead.
+
+Uso: python -m bench.bench_memory_store [--turns 50000] [--channels 2000]
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import logging
+import os
+import random
+import tempfile
+import time
+from typing import List
+
+os.environ.setdefault("DISCORD_TOKEN", "bench")
+os.environ.setdefault("GEMINI_API_KEY", "bench")
+
+from src import discord_client  # noqa: E402
+from src.config import settings  # noqa: E402
+from src.memory_store import SQLiteMemoryStore  # noqa: E402
+
+from . import replay  # noqa: E402
+from ._stats import fmt_ms, summarize  # noqa: E402
+
+
+async def bench_writes(path: str, turns: int, channels: int) -> None:
+    store = SQLiteMemoryStore(path)
+    await store.start()
+    t0 = time.perf_counter()
+    for i in range(turns):
+        store.append(10_000 + i % channels, "user" if i % 2 == 0 else "model", f"mensaje número {i} " * 3)
+    enqueue = time.perf_counter() - t0
+    await store.flush()
+    total = time.perf_counter() - t0
+    await store.close()
+    print(f"writes: {turns} turns, append() {enqueue / turns * 1e6:.2f}us/op on the loop, "
+          f"{turns / total:.0f} turns/s persisted in {store.batches} batches")
+
+
+def _populate(path: str, channels: int, turns_per_channel: int) -> None:
+    import sqlite3
+
+    from src.memory_store import _SCHEMA
+
+    conn = sqlite3.connect(path)
+    conn.executescript(_SCHEMA)
+    with conn:
+        conn.executemany(
+            "INSERT INTO turns (channel_id, role, text, created_at) VALUES (?, ?, ?, ?)",
+            ((10_000 + c, "user", f"turno {t} del canal {c}", 0.0)
+             for c in range(channels) for t in range(turns_per_channel)),
+        )
+    conn.close()
+
+
+async def bench_startup_and_loads(tmp: str, channels: int) -> None:
+    for count in (100, channels):
+        path = os.path.join(tmp, f"populated-{count}.sqlite3")
+        _populate(path, count, 20)
+        store = SQLiteMemoryStore(path)
+        t0 = time.perf_counter()
+        await store.start()
+        startup = time.perf_counter() - t0
+        samples: List[float] = []
+        for cid in random.Random(0).sample(range(count), min(200, count)):
+            t1 = time.perf_counter()
+            await store.load(10_000 + cid, settings.MEMORY_MAX_TURNS)
+            samples.append(time.perf_counter() - t1)
+        await store.close()
+        print(f"stored channels={count}: startup={startup * 1000:.2f}ms cold load {fmt_ms(summarize(samples))}")
+
+
+async def bench_on_message(tmp: str, events: int) -> None:
+    args = replay.make_parser().parse_args(
+        ["--scenario", "chains", "--events", str(events), "--channels", "100", "--latency", "0.0",
+         "--latency-jitter", "0.0", "--discord-latency", "0.0", "--speed", "5"]
+    )
+    for backend in ("memory", "sqlite"):
+        settings.MEMORY_BACKEND = backend
+        settings.MEMORY_DB_PATH = os.path.join(tmp, "replay.sqlite3")
+        # Como setup_hook: abierta antes de que llegue el primer mensaje
+        await discord_client.open_memory_store()
+        report = await replay.run_replay(args, setup=replay.reset_state)
+        await discord_client.close_memory_store()
+        print(f"on_message with MEMORY_BACKEND={backend}:")
+        for stage in ("trigger", "end_to_end"):
+            print(f"  {stage:<11} {fmt_ms(summarize(report.stages[stage]))}")
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--turns", type=int, default=50_000)
+    parser.add_argument("--channels", type=int, default=2_000)
+    parser.add_argument("--events", type=int, default=600)
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+    with tempfile.TemporaryDirectory() as tmp:
+        await bench_writes(os.path.join(tmp, "writes.sqlite3"), args.turns, args.channels)
+        await bench_startup_and_loads(tmp, args.channels)
+        await bench_on_message(tmp, args.events)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,126 @@
+"""Request payload building: per-call rebuild vs pre-serialized turns, and prompt sizes.
+
+1. Build time of the generateContent body for several history lengths: the
+   previous path (dict history -> contents list -> json.dumps on every call)
+   vs payload_builder.build_body over Turn objects serialized once.
+2. Distribution of estimated prompt tokens over a long synthetic conversation
+   with occasional pasted walls of text: turn cap only vs HISTORY_TOKEN_BUDGET.
+3. Estimator calibration against the fake server's usageMetadata.
+Uso: python -m bench.bench_payload [--iterations 20000] [--turns 2000]
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List
+
+os.environ.setdefault("DISCORD_TOKEN", "bench")
+os.environ.setdefault("GEMINI_API_KEY", "bench")
+
+from src import gemini_client  # noqa: E402
+from src.config import settings  # noqa: E402
+from src.payload_builder import GENERATION_CONFIG, Turn, build_body, estimator  # noqa: E402
+
+from ._stats import summarize  # noqa: E402
+from .fake_gemini import FakeGeminiServer  # noqa: E402
+
+
+def legacy_body(text: str, system_prompt: str, history: List[Dict[str, str]]) -> bytes:
+    """Body as built before: contents rebuilt from dicts and fully re-serialized per call."""
+    contents: List[Dict[str, Any]] = []
+    for msg in history:
+        if msg.get("text"):
+            contents.append({"role": msg.get("role", "user"), "parts": [{"text": msg["text"]}]})
+    contents.append({"role": "user", "parts": [{"text": text}]})
+    payload = {
+        "system_instruction": {"parts": [{"text": system_prompt}]},
+        "contents": contents,
+        "generation_config": dict(GENERATION_CONFIG),
+    }
+    return json.dumps(payload).encode("utf-8")
+
+
+def _message(rng: random.Random, paste_rate: float) -> str:
+    if rng.random() < paste_rate:
+        return "log pegado: " + "ERROR timeout al conectar con el servidor; " * rng.randint(40, 120)
+    return " ".join(rng.choice(("hola", "jaja", "que tal", "owo", "mapa", "bandera", "pixel", "✨"))
+                    for _ in range(rng.randint(3, 30)))
+
+
+def bench_build(iterations: int) -> None:
+    rng = random.Random(0)
+    prompt = settings.DISCORD_SYSTEM_PROMPT
+    for turns in (6, 20, 50):
+        dicts = [{"role": "user" if i % 2 == 0 else "model", "text": _message(rng, 0.0)} for i in range(turns)]
+        objs = [Turn(d["role"], d["text"]) for d in dicts]
+        t0 = time.perf_counter()
+        for _ in range(iterations):
+            legacy_body("hola bot", prompt, dicts)
+        legacy = (time.perf_counter() - t0) / iterations
+        t0 = time.perf_counter()
+        for _ in range(iterations):
+            build_body("hola bot", prompt, objs)
+        new = (time.perf_counter() - t0) / iterations
+        print(f"history={turns:>2} turns: rebuild {legacy * 1e6:7.1f}us  pre-serialized {new * 1e6:7.1f}us  "
+              f"({legacy / new:.1f}x)")
+
+
+def bench_prompt_sizes(turns: int, budget: int) -> None:
+    rng = random.Random(1)
+    memory: Deque[Turn] = deque(maxlen=settings.MEMORY_MAX_TURNS)
+    sizes: Dict[str, List[float]] = {"turn cap only": [], f"budget={budget}": []}
+    for i in range(turns):
+        text = _message(rng, 0.03)
+        history = list(memory)
+        sizes["turn cap only"].append(build_body(text, "", history)[1])
+        sizes[f"budget={budget}"].append(build_body(text, "", history, budget=budget)[1])
+        memory.append(Turn("user", text))
+        memory.append(Turn("model", _message(rng, 0.0)))
+    print(f"estimated history+message tokens over {turns} calls (MEMORY_MAX_TURNS={settings.MEMORY_MAX_TURNS}):")
+    for name, values in sizes.items():
+        stats = summarize(values)
+        print(f"  {name:<14} p50={stats['p50']:.0f} p95={stats['p95']:.0f} p99={stats['p99']:.0f} max={stats['max']:.0f}")
+
+
+async def bench_calibration(calls: int) -> None:
+    rng = random.Random(2)
+    async with FakeGeminiServer() as server:
+        settings.GEMINI_BASE_URL = server.url
+        before = estimator.factor
+        errors: List[float] = []
+        for _ in range(calls):
+            text = _message(rng, 0.1)
+            _, estimate = build_body(text, settings.DISCORD_SYSTEM_PROMPT)
+            actual = server._prompt_tokens({
+                "system_instruction": {"parts": [{"text": settings.DISCORD_SYSTEM_PROMPT}]},
+                "contents": [{"parts": [{"text": text}]}],
+            })
+            errors.append(abs(estimate - actual) / actual)
+            await gemini_client.generate_reply(text, settings.DISCORD_SYSTEM_PROMPT)
+        await gemini_client.close_client()
+    n = max(1, calls // 5)
+    print(f"calibration: factor {before:.3f} -> {estimator.factor:.3f} after {estimator.samples} responses; "
+          f"mean abs error first {n} calls {sum(errors[:n]) / n:.1%}, last {n} {sum(errors[-n:]) / n:.1%}")
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--iterations", type=int, default=20_000)
+    parser.add_argument("--turns", type=int, default=2_000)
+    parser.add_argument("--budget", type=int, default=settings.HISTORY_TOKEN_BUDGET)
+    parser.add_argument("--calls", type=int, default=100)
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+    bench_build(args.iterations)
+    bench_prompt_sizes(args.turns, args.budget)
+    await bench_calibration(args.calls)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
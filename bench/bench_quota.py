@@ -0,0 +1,75 @@
+"""Quota-aware Gemini scheduling under a hard requests-per-window quota.
+
+The fake server admits `--quota` generate calls per `--window` seconds and
+answers the rest with 429 + retryDelay. A burst of mentions and inactivity
+pings is fired at once, first with only the reactive controls (AIMD
+concurrency + global pause on the server's retry delay), then with the RPM
+bucket matching the quota. Reports 429s, failures and latency per priority.
+Uso: python -m bench.bench_quota [--mentions 100] [--pings 20] [--quota 10] [--window 1]
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import logging
+import os
+import time
+from typing import Dict, List
+
+os.environ.setdefault("DISCORD_TOKEN", "bench")
+os.environ.setdefault("GEMINI_API_KEY", "bench")
+
+from src import gemini_client  # noqa: E402
+from src.config import settings  # noqa: E402
+
+from ._stats import fmt_ms, summarize  # noqa: E402
+from .fake_gemini import FakeGeminiServer  # noqa: E402
+
+
+async def _one(priority: int, samples: Dict[int, List[float]], failures: List[int]) -> None:
+    t0 = time.perf_counter()
+    try:
+        await gemini_client.generate_reply("hola", "prompt", priority=priority)
+    except Exception:  # noqa: BLE001
+        failures.append(priority)
+        return
+    samples[priority].append(time.perf_counter() - t0)
+
+
+async def run(args: argparse.Namespace, rpm: int) -> None:
+    settings.GEMINI_QUOTA_RPM = rpm
+    settings.GEMINI_QUOTA_BURST_SECONDS = args.window
+    gemini_client.quota = gemini_client.QuotaScheduler()
+    server = FakeGeminiServer(latency=args.latency, quota_requests=args.quota, quota_window=args.window)
+    async with server:
+        settings.GEMINI_BASE_URL = server.url
+        samples: Dict[int, List[float]] = {gemini_client.PRIORITY_MENTION: [], gemini_client.PRIORITY_INACTIVITY: []}
+        failures: List[int] = []
+        # Los pings de inactividad llegan primero: aun así deben ceder ante las menciones
+        jobs = [gemini_client.PRIORITY_INACTIVITY] * args.pings + [gemini_client.PRIORITY_MENTION] * args.mentions
+        t0 = time.perf_counter()
+        await asyncio.gather(*(_one(p, samples, failures) for p in jobs))
+        wall = time.perf_counter() - t0
+        await gemini_client.close_client()
+    label = f"GEMINI_QUOTA_RPM={rpm}" if rpm else "no RPM bucket (AIMD + retry delay only)"
+    print(f"{label}: wall={wall:.2f}s calls={server.generate_calls} 429s={server.status_counts.get(429, 0)} "
+          f"failed={len(failures)} final concurrency limit={gemini_client.quota.limit}")
+    print(f"  mentions   {fmt_ms(summarize(samples[gemini_client.PRIORITY_MENTION]))}")
+    print(f"  inactivity {fmt_ms(summarize(samples[gemini_client.PRIORITY_INACTIVITY]))}")
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--mentions", type=int, default=100)
+    parser.add_argument("--pings", type=int, default=20)
+    parser.add_argument("--quota", type=int, default=10, help="llamadas admitidas por ventana")
+    parser.add_argument("--window", type=float, default=1.0)
+    parser.add_argument("--latency", type=float, default=0.05)
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.ERROR)
+    await run(args, rpm=0)
+    await run(args, rpm=int(args.quota * 60 / args.window))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,101 @@
+"""Reply detection with the local index of our own message IDs vs fetch_message.
+
+1. Reply chains through on_message (half of the references unresolved):
+   fetch_message calls and trigger latency with and without the index.
+2. Background traffic replying to other users (never a trigger): fetches
+   that the index avoids entirely.
+3. Cost of SentMessageIndex.is_ours() itself.
+Uso: python -m bench.bench_reply_index [--events 600] [--others 500] [--discord-latency 0.05]
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import logging
+import os
+import time
+
+os.environ.setdefault("DISCORD_TOKEN", "bench")
+os.environ.setdefault("GEMINI_API_KEY", "bench")
+
+from src import discord_client  # noqa: E402
+from src.config import settings  # noqa: E402
+from src.state_store import SentMessageIndex  # noqa: E402
+
+from . import replay  # noqa: E402
+from ._stats import fmt_ms, summarize  # noqa: E402
+from .fake_discord import (  # noqa: E402
+    BOT_USER,
+    FakeChannel,
+    FakeDiscord,
+    FakeGuild,
+    FakeMessage,
+    FakeReference,
+    FakeUser,
+)
+
+
+def _disable_index() -> None:
+    replay.reset_state()
+    # Ventana 0: nada queda cubierto, cada reply sin resolver acaba en fetch_message
+    discord_client.sent_index = SentMessageIndex(window_seconds=0.0, max_ids=0)
+
+
+async def bench_chains(args: argparse.Namespace) -> None:
+    replay_args = replay.make_parser().parse_args(
+        ["--scenario", "chains", "--events", str(args.events), "--channels", "50",
+         "--discord-latency", str(args.discord_latency), "--speed", "10"]
+    )
+    for label, setup in (("fetch only", _disable_index), ("sent index", replay.reset_state)):
+        report = await replay.run_replay(replay_args, setup=setup)
+        print(f"reply chains, {label:<10}: fetch_message={report.discord_calls.get('fetch_message', 0)} "
+              f"replies={report.replies} trigger {fmt_ms(summarize(report.stages['trigger']))}")
+
+
+async def bench_others(args: argparse.Namespace) -> None:
+    discord_client.bot._connection.user = BOT_USER
+    settings.ALLOWED_GUILD_IDS = settings.ALLOWED_CHANNEL_IDS = None
+    for label, setup in (("fetch only", _disable_index), ("sent index", replay.reset_state)):
+        setup()
+        api = FakeDiscord(api_latency=args.discord_latency)
+        channel = FakeChannel(api, 900_001, FakeGuild(1))
+        alice, bob = FakeUser(201), FakeUser(202)
+        samples = []
+        for i in range(args.others):
+            target = FakeMessage(api, channel, alice, f"mensaje {i}")
+            api.messages[target.id] = target
+            msg = FakeMessage(api, channel, bob, "jaja sí", reference=FakeReference(target.id, None))
+            t0 = time.perf_counter()
+            await discord_client.on_message(msg)
+            samples.append(time.perf_counter() - t0)
+        print(f"replies to others, {label:<10}: fetch_message={api.api_calls['fetch_message']} "
+              f"on_message {fmt_ms(summarize(samples))}")
+
+
+def bench_lookup() -> None:
+    index = SentMessageIndex(window_seconds=settings.SENT_INDEX_WINDOW_SECONDS, max_ids=settings.SENT_INDEX_MAX_IDS)
+    ours = [FakeMessage(FakeDiscord(), FakeChannel(FakeDiscord(), 1), BOT_USER, "x").id for _ in range(10_000)]
+    for message_id in ours:
+        index.add(message_id)
+    n = 200_000
+    t0 = time.perf_counter()
+    for i in range(n):
+        index.is_ours(ours[i % len(ours)] + (i & 1))
+    print(f"is_ours(): {(time.perf_counter() - t0) / n * 1e6:.2f}us/lookup with {len(index)} ids "
+          f"(hit={index.hits} miss={index.misses} fetch={index.unknown})")
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--events", type=int, default=600)
+    parser.add_argument("--others", type=int, default=500)
+    parser.add_argument("--discord-latency", type=float, default=0.05)
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+    await bench_chains(args)
+    await bench_others(args)
+    bench_lookup()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
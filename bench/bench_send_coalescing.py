@@ -0,0 +1,93 @@
+"""Windowed send coalescing under mention bursts.
+
+Replays bursts of mentions (several users, same channel, a couple of
+seconds) with per-channel pacing, once sending every reply on its own
+(COALESCE_WINDOW_SECONDS=0) and once with the coalescing window. Pacing and
+window are given in trace time and scaled by --speed like the replay's
+batch window. Prints Discord API calls, replies per send, the longest merged
+message, and the wait from enqueue to send of every reply (merged or not).
+Replies of a channel merge with each other (the merged send answers the
+newest mention); a lone reply goes out at once instead of waiting the window.
+Uso: python -m bench.bench_send_coalescing [--events 400] [--channels 10] [--window 2]
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import time
+from typing import Dict, List
+
+os.environ.setdefault("DISCORD_TOKEN", "bench")
+os.environ.setdefault("GEMINI_API_KEY", "bench")
+
+from src import discord_client  # noqa: E402
+from src.config import settings  # noqa: E402
+
+from . import replay  # noqa: E402
+from ._stats import fmt_ms, summarize  # noqa: E402
+
+
+async def run(args: argparse.Namespace) -> None:
+    replay_args = replay.make_parser().parse_args(
+        ["--scenario", "bursts", "--events", str(args.events), "--channels", str(args.channels),
+         "--speed", str(args.speed), "--latency", str(args.latency)]
+    )
+    original_deliver, original_enqueue = discord_client._deliver, discord_client._enqueue_send
+    for window in (0.0, args.window):
+        batches: List[int] = []
+        longest = [0]
+        queued_at: Dict[int, float] = {}
+        waits: List[float] = []
+
+        def enqueue(message, content):
+            queued_at[message.id] = time.perf_counter()
+            return original_enqueue(message, content)
+
+        async def deliver(items):
+            batches.append(len(items))
+            longest[0] = max(longest[0], sum(len(i["content"]) for i in items) + len(items) - 1)
+            await original_deliver(items)
+            # Todas las respuestas del lote, no solo la que lleva el hilo
+            now = time.perf_counter()
+            waits.extend(now - queued_at.pop(i["reply_to"].id) for i in items if i.get("reply_to") is not None)
+
+        def setup() -> None:
+            replay.reset_state()
+            settings.MIN_SECONDS_BETWEEN_MESSAGES_PER_CHANNEL = args.pacing / args.speed
+            settings.COALESCE_WINDOW_SECONDS = window / args.speed
+            discord_client._deliver = deliver
+            discord_client._enqueue_send = enqueue
+
+        try:
+            report = await replay.run_replay(replay_args, setup=setup)
+        finally:
+            discord_client._deliver = original_deliver
+            discord_client._enqueue_send = original_enqueue
+        calls = sum(report.discord_calls.get(k, 0) for k in ("send", "reply"))
+        items = sum(batches)
+        label = f"window={window:g}s" if window else "one by one"
+        print(f"{label:<12}: triggers={report.triggers} replies delivered={items} discord sends={calls} "
+              f"({items / max(1, len(batches)):.2f} replies/send, max {max(batches, default=0)}, "
+              f"longest message {longest[0]} chars)")
+        # Tiempos de reloj: en tiempo de la traza son --speed veces más largos
+        if waits:
+            print(f"  queued->sent, every reply    {fmt_ms(summarize(waits))}")
+        if report.stages["end_to_end"]:
+            print(f"  end_to_end, threaded replies {fmt_ms(summarize(report.stages['end_to_end']))}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--events", type=int, default=400)
+    parser.add_argument("--channels", type=int, default=10)
+    parser.add_argument("--window", type=float, default=settings.COALESCE_WINDOW_SECONDS)
+    parser.add_argument("--pacing", type=float, default=settings.MIN_SECONDS_BETWEEN_MESSAGES_PER_CHANNEL)
+    parser.add_argument("--speed", type=float, default=10.0)
+    parser.add_argument("--latency", type=float, default=0.05)
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""Latency of non-streaming generateContent vs streaming with compact cut-off.
+
+The fake server decodes a long reply at a fixed chunk rate; the streaming
+path should stop as soon as _format_compact's output is settled.
+Uso: python -m bench.bench_streaming [--requests 30] [--chunk-delay 0.005]
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import logging
+import os
+import time
+from typing import List
+
+os.environ.setdefault("DISCORD_TOKEN", "bench")
+os.environ.setdefault("GEMINI_API_KEY", "bench")
+
+from src import gemini_client  # noqa: E402
+from src.config import settings  # noqa: E402
+from src.discord_client import CompactFormatter, _format_compact  # noqa: E402
+
+from ._stats import fmt_ms, summarize  # noqa: E402
+from .fake_gemini import FakeGeminiServer  # noqa: E402
+
+LONG_REPLY = (
+    "holaaaa~ owo ✨ qué tal todo por aquí, defendamos la banderitaaaa 💖. "
+    "*se tira al suelo dramaticamente* el mapa está en guerra épica de pixelitos. "
+) * 12
+
+
+async def _run(server: FakeGeminiServer, n: int, streaming: bool) -> List[float]:
+    settings.GEMINI_STREAMING_ENABLED = streaming
+    samples: List[float] = []
+    for _ in range(n):
+        t0 = time.perf_counter()
+        text = await gemini_client.generate_reply("hola", "prompt", sink=CompactFormatter())
+        samples.append(time.perf_counter() - t0)
+        assert _format_compact(text) == _format_compact(LONG_REPLY)
+    return samples
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=30)
+    parser.add_argument("--chunk-delay", type=float, default=0.005)
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+
+    async with FakeGeminiServer(reply_text=LONG_REPLY, stream_chunk_delay=args.chunk_delay) as server:
+        settings.GEMINI_BASE_URL = server.url
+        # el servidor no-streaming devuelve todo de golpe tras "decodificar" la respuesta completa
+        original = server.handle
+
+        async def _handle_with_decode_time(method, path, query, body):
+            if path.endswith(":generateContent"):
+                chunks = -(-len(LONG_REPLY) // server.stream_chunk_chars)
+                await asyncio.sleep(chunks * server.stream_chunk_delay)
+            return await original(method, path, query, body)
+
+        server.handle = _handle_with_decode_time
+        full = summarize(await _run(server, args.requests, streaming=False))
+        before = server.stream_chunks_sent
+        streamed = summarize(await _run(server, args.requests, streaming=True))
+        chunks = (server.stream_chunks_sent - before) / args.requests
+        await gemini_client.close_client()
+
+    total_chunks = -(-len(LONG_REPLY) // server.stream_chunk_chars)
+    print(f"generateContent      : {fmt_ms(full)}")
+    print(f"streamGenerateContent: {fmt_ms(streamed)}")
+    print(f"chunks read per reply: {chunks:.1f} of {total_chunks}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
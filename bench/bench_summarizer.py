@@ -0,0 +1,120 @@
+"""Rolling history summaries: prompt size, lost turns and background cost.
+
+Replays long reply chains over a few channels, once with SUMMARY_ENABLED off
+(old turns fall off the MEMORY_MAX_TURNS deque and are gone) and once on.
+The fake Gemini server answers every summary with its short canned reply, so
+the bench pads each summary to SUMMARY_MAX_CHARS: the token figures are the
+worst case. Prints history tokens per reply prompt, turns lost vs folded,
+the extra background Gemini calls and end-to-end latency of the replies.
+Uso: python -m bench.bench_summarizer [--events 600] [--channels 4]
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+from typing import Dict, List
+
+os.environ.setdefault("DISCORD_TOKEN", "bench")
+os.environ.setdefault("GEMINI_API_KEY", "bench")
+
+from src import discord_client  # noqa: E402
+from src.config import settings  # noqa: E402
+from src.metrics import SUMMARY_COMPACTIONS, SUMMARY_FOLDED_TURNS  # noqa: E402
+
+from . import replay  # noqa: E402
+from ._stats import fmt_ms, summarize  # noqa: E402
+
+_PAD = " y además siguieron hablando de lo mismo"
+
+
+def _compactions() -> Dict[str, float]:
+    return {key[0]: child.value for key, child in SUMMARY_COMPACTIONS._children.items()}
+
+
+def _folded() -> float:
+    return next(iter(SUMMARY_FOLDED_TURNS._children.values())).value
+
+
+async def run(args: argparse.Namespace) -> None:
+    replay_args = replay.make_parser().parse_args(
+        ["--scenario", "chains", "--events", str(args.events), "--channels", str(args.channels),
+         "--speed", str(args.speed), "--latency", str(args.latency)]
+    )
+    compactor = discord_client.compactor
+    original_generate, original_remember = compactor._generate, discord_client._remember
+
+    async def padded_summary(*a, **kw) -> str:
+        text = await original_generate(*a, **kw)
+        while len(text) < settings.SUMMARY_MAX_CHARS:
+            text += _PAD
+        return text
+
+    for enabled in (False, True):
+        history_tokens: List[int] = []
+        remembered = [0]
+
+        def setup() -> None:
+            replay.reset_state()
+            settings.SUMMARY_ENABLED = enabled
+            settings.SUMMARY_TRIGGER_TOKENS = args.trigger_tokens
+            settings.HISTORY_TOKEN_BUDGET = 0
+            original_reply = discord_client.generate_reply
+
+            async def generate(*a, history=None, **kw):
+                history_tokens.append(sum(turn.tokens() for turn in history or ()))
+                return await original_reply(*a, history=history, **kw)
+
+            def remember(*a, **kw):
+                remembered[0] += 1
+                return original_remember(*a, **kw)
+
+            discord_client.generate_reply = generate
+            discord_client._remember = remember
+
+        reply_fn = discord_client.generate_reply
+        compactor._generate = padded_summary
+        before, folded_before = _compactions(), _folded()
+        try:
+            report = await replay.run_replay(replay_args, setup=setup)
+        finally:
+            discord_client.generate_reply = reply_fn
+            discord_client._remember = original_remember
+            compactor._generate = original_generate
+        after = _compactions()
+        done = {k: int(v - before.get(k, 0.0)) for k, v in after.items() if v > before.get(k, 0.0)}
+        folded = int(_folded() - folded_before)
+        kept = sum(len(ch.memory) for ch in discord_client.state.channels())
+        lost = remembered[0] - kept - folded
+        background = sum(done.values())
+        label = "summary" if enabled else "no summary"
+        print(f"{label:<10}: replies={report.replies} gemini_calls={report.gemini_calls} "
+              f"(background {background}) turns kept={kept} folded={folded} lost={lost}")
+        print(f"  history tokens/prompt {_tokens(history_tokens)}")
+        if done:
+            print("  compactions: " + " ".join(f"{k}={n}" for k, n in sorted(done.items())))
+        if report.stages["end_to_end"]:
+            print(f"  end_to_end {fmt_ms(summarize(report.stages['end_to_end']))}")
+
+
+def _tokens(values: List[int]) -> str:
+    ordered = sorted(values)
+    if not ordered:
+        return "n/a"
+    mean = sum(ordered) / len(ordered)
+    return f"mean={mean:.0f} p95={ordered[int(0.95 * (len(ordered) - 1))]} max={ordered[-1]}"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--events", type=int, default=600)
+    parser.add_argument("--channels", type=int, default=4)
+    parser.add_argument("--speed", type=float, default=5.0)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--trigger-tokens", type=int, default=settings.SUMMARY_TRIGGER_TOKENS)
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""Tracing overhead and what a single trace explains.
+
+1. Cost of the spans of one trigger (root + 8 children) when tracing is
+   disabled, enabled but not sampled, and sampled into the JSONL exporter.
+2. A replay with every trigger traced to a temporary JSONL file; prints
+   span counts per stage and the breakdown of the slowest trace.
+Uso: python -m bench.bench_tracing [--iterations 50000] [--events 300]
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import tempfile
+import time
+from collections import Counter, defaultdict
+from typing import Dict, List
+
+os.environ.setdefault("DISCORD_TOKEN", "bench")
+os.environ.setdefault("GEMINI_API_KEY", "bench")
+
+from src.config import settings  # noqa: E402
+from src.tracing import tracer  # noqa: E402
+
+from . import replay  # noqa: E402
+
+_CHILDREN = ("batch_window", "generate_reply", "gemini_attempt", "quota_wait",
+             "format_compact", "queue_wait", "typing", "send")
+
+
+def _one_trigger() -> None:
+    with tracer.trace("on_message", channel_id=1) as root:
+        for name in _CHILDREN:
+            with tracer.span(name) as span:
+                span.set("k", 1)
+        root.set("batch_size", 1)
+
+
+async def bench_overhead(args: argparse.Namespace, path: str) -> None:
+    settings.TRACING_JSONL_PATH = path
+    settings.TRACING_EXPORTER = "jsonl"
+    for _ in range(args.iterations // 10):
+        _one_trigger()  # calentamiento
+    for label, enabled, rate in (("disabled", False, 0.0), ("enabled, unsampled", True, 0.0), ("sampled", True, 1.0)):
+        settings.TRACING_ENABLED = enabled
+        settings.TRACING_SAMPLE_RATE = rate
+        tracer.start()
+        t0 = time.perf_counter()
+        for _ in range(args.iterations):
+            _one_trigger()
+        per = (time.perf_counter() - t0) / args.iterations
+        await tracer.stop()
+        print(f"{label:<19}: {per * 1e6:.2f}us per trigger (9 spans)")
+    os.remove(path)
+
+
+def _report(path: str) -> None:
+    traces: Dict[str, List[dict]] = defaultdict(list)
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            span = json.loads(line)
+            traces[span["trace_id"]].append(span)
+    names = Counter(span["name"] for spans in traces.values() for span in spans)
+    print(f"traces={len(traces)} spans={sum(names.values())} " + " ".join(f"{k}={v}" for k, v in sorted(names.items())))
+
+    def total(spans: List[dict]) -> float:
+        return (max(s["end_ns"] for s in spans) - min(s["start_ns"] for s in spans)) / 1e6
+
+    slowest = max(traces.values(), key=total)
+    print(f"slowest trace: {total(slowest):.1f}ms end to end")
+    origin = min(s["start_ns"] for s in slowest)
+    for span in sorted(slowest, key=lambda s: s["start_ns"]):
+        attrs = {k: v for k, v in span["attributes"].items() if k != "channel_id"}
+        print(f"  +{(span['start_ns'] - origin) / 1e6:8.1f}ms {span['name']:<15} {span['duration_ms']:8.1f}ms "
+              f"{attrs if attrs else ''}{' error=' + span['error'] if span['error'] else ''}")
+
+
+async def bench_replay(args: argparse.Namespace, path: str) -> None:
+    def setup() -> None:
+        replay.reset_state()
+        settings.TRACING_ENABLED = True
+        settings.TRACING_SAMPLE_RATE = 1.0
+        settings.TRACING_JSONL_PATH = path
+        tracer.start()
+
+    replay_args = replay.make_parser().parse_args(
+        ["--scenario", "mixed", "--events", str(args.events), "--channels", "50", "--speed", "10",
+         "--latency", "0.05", "--latency-jitter", "0.2", "--error-rate", "0.03"]
+    )
+    try:
+        await replay.run_replay(replay_args, setup=setup)
+    finally:
+        await tracer.stop()
+    _report(path)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--iterations", type=int, default=50_000)
+    parser.add_argument("--events", type=int, default=300)
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "traces.jsonl")
+        asyncio.run(bench_overhead(args, path))
+        asyncio.run(bench_replay(args, path))
+
+
+if __name__ == "__main__":
+    main()
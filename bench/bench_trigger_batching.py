@@ -0,0 +1,40 @@
+"""Generation-side trigger batching under mention bursts.
+
+Replays bursts of mentions in the same channel with and without
+TRIGGER_BATCH_WINDOW_SECONDS and compares Gemini calls per trigger and
+end-to-end latency of the replies actually sent.
+Uso: python -m bench.bench_trigger_batching [--events 800] [--window 2.0]
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import logging
+
+from . import replay
+from ._stats import fmt_ms, summarize
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--events", type=int, default=800)
+    parser.add_argument("--channels", type=int, default=50)
+    parser.add_argument("--window", type=float, default=2.0)
+    parser.add_argument("--speed", type=float, default=10.0)
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+
+    for window in (0.0, args.window):
+        replay_args = replay.make_parser().parse_args(
+            ["--scenario", "bursts", "--events", str(args.events), "--channels", str(args.channels),
+             "--speed", str(args.speed), "--batch-window", str(window)]
+        )
+        report = await replay.run_replay(replay_args, setup=replay.reset_state)
+        print(f"window={window:.1f}s: triggers={report.triggers} gemini calls={report.gemini_calls} "
+              f"({report.gemini_calls / max(1, report.triggers):.3f}/trigger) replies={report.replies} "
+              f"dropped={report.dropped}")
+        print(f"  end_to_end {fmt_ms(summarize(report.stages['end_to_end']))}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
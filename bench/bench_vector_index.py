@@ -0,0 +1,117 @@
+"""Long-term vector memory: search cost, prompt size and recalled context.
+
+1. Cosine top-k over a channel index of N exchanges (NumPy matrix-vector
+   product if numpy is installed, array('f') dot products otherwise).
+2. A long synthetic conversation jumping between topics, then prompts about
+   topics last discussed far back. Compares the plain history (last
+   MEMORY_MAX_TURNS turns) with the recent window plus recalled exchanges:
+   estimated history tokens and how often an exchange on the prompt's topic
+   made it into the prompt.
+Uso: python -m bench.bench_vector_index [--exchanges 120] [--queries 300]
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import random
+import time
+from typing import List
+
+os.environ.setdefault("DISCORD_TOKEN", "bench")
+os.environ.setdefault("GEMINI_API_KEY", "bench")
+
+from src import vector_index  # noqa: E402
+from src.config import settings  # noqa: E402
+from src.payload_builder import Turn  # noqa: E402
+from src.vector_index import ChannelVectors, HashingEmbedder  # noqa: E402
+
+TOPICS = {
+    "python": "python asyncio error traceback excepción import módulo pip entorno virtual",
+    "wplace": "wplace mapa pixel bandera defender atacar overlay plantilla alianza",
+    "pizza": "pizza horno masa receta queso tomate mozzarella harina levadura",
+    "trabajo": "infojobs trabajo entrevista curriculum oferta empresa sueldo contrato",
+    "discord": "discord servidor roles permisos canal moderador bot webhook",
+    "musica": "música concierto entradas festival grupo disco canción gira",
+    "futbol": "fútbol partido liga gol equipo entrenador fichaje estadio",
+    "juegos": "videojuego steam partida nivel jefe mando consola ranked",
+}
+FILLER = "jaja pues la verdad no sé tío oye mira eso igual".split()
+
+
+def _utterance(rng: random.Random, topic: str) -> str:
+    words = rng.sample(TOPICS[topic].split(), 4) + rng.sample(FILLER, 3)
+    rng.shuffle(words)
+    return " ".join(words)
+
+
+def bench_search(args: argparse.Namespace) -> None:
+    backend = "numpy" if vector_index.np is not None else "array('f') (numpy not installed)"
+    rng = random.Random(0)
+    dim = settings.VECTOR_DIM
+    for n in (32, 128, 512):
+        index = ChannelVectors(dim, n)
+        turn = Turn("user", "x")
+        for _ in range(n):
+            index.add([rng.gauss(0, 1) for _ in range(dim)], turn, turn)
+        queries = [[rng.gauss(0, 1) for _ in range(dim)] for _ in range(200)]
+        t0 = time.perf_counter()
+        for q in queries:
+            index.search(q, settings.VECTOR_TOP_K, before_seq=n - 3)
+        per = (time.perf_counter() - t0) / len(queries)
+        print(f"search n={n:<4} dim={dim}: {per * 1e6:8.1f}us per query, "
+              f"{index.nbytes() / 1024:.0f}KiB vectors [{backend}]")
+
+
+def bench_recall(args: argparse.Namespace) -> None:
+    rng = random.Random(args.seed)
+    embedder = HashingEmbedder(settings.VECTOR_DIM)
+    memory: List[Turn] = []
+    topics: List[str] = []
+    index = None
+    for _ in range(args.exchanges):
+        topic = rng.choice(list(TOPICS))
+        user, model = Turn("user", _utterance(rng, topic)), Turn("model", _utterance(rng, topic))
+        memory += [user, model]
+        topics.append(topic)
+        index = vector_index.index_exchange(index, embedder.embed_one(user.text), user, model)
+    by_text = {turn.text: topic for turn, topic in zip(memory[::2], topics)}
+    by_text.update({turn.text: topic for turn, topic in zip(memory[1::2], topics)})
+
+    recent = settings.VECTOR_RECENT_TURNS
+    # Temas que no aparecen en las últimas MEMORY_MAX_TURNS: el historial plano no los tiene
+    plain = memory[-settings.MEMORY_MAX_TURNS:]
+    in_plain = {by_text[t.text] for t in plain}
+    old_topics = [t for t in TOPICS if t in topics and t not in in_plain] or list(TOPICS)
+
+    results = {"plain": [0, 0], "vector": [0, 0]}  # [tokens, aciertos]
+    for _ in range(args.queries):
+        topic = rng.choice(old_topics)
+        prompt = _utterance(rng, topic)
+        recalled = vector_index.recall(index, embedder.embed_one(prompt), recent)
+        for label, history in (("plain", plain), ("vector", recalled + memory[-recent:])):
+            results[label][0] += sum(t.tokens() for t in history)
+            results[label][1] += any(by_text[t.text] == topic for t in history)
+
+    def line(label: str, desc: str) -> str:
+        tokens, hits = results[label]
+        return (f"{label:<6} ({desc}): {tokens / args.queries:6.0f} history tokens/prompt, "
+                f"topic context present {hits / args.queries:.0%}")
+
+    print(f"{args.exchanges} exchanges, {args.queries} prompts about topics older than the last "
+          f"{settings.MEMORY_MAX_TURNS} turns")
+    print(line("plain", f"last {settings.MEMORY_MAX_TURNS} turns"))
+    print(line("vector", f"last {recent} + top {settings.VECTOR_TOP_K}"))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--exchanges", type=int, default=120)
+    parser.add_argument("--queries", type=int, default=300)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    bench_search(args)
+    bench_recall(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+"""An hour of Discord traffic through on_message on virtual time.
+
+Runs the real pacing, cooldowns, batch window, typing simulation and
+inactivity timers (default settings) against bench.fake_discord and the
+LocalBackend on a VirtualTimeLoop. Prints wall time vs simulated time,
+sends, inactivity messages and the tightest per-channel send gap, and
+replays the same seed twice: exits with status 1 if the send timelines differ.
+Uso: python -m bench.bench_virtual_time [--hours 1] [--channels 20] [--events 3000]
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import logging
+import os
+import random
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+
+os.environ.setdefault("DISCORD_TOKEN", "bench")
+os.environ.setdefault("GEMINI_API_KEY", "bench")
+
+from src import discord_client, llm_backend  # noqa: E402
+from src.admission import AdmissionController  # noqa: E402
+from src.clock import run_virtual  # noqa: E402
+from src.config import settings  # noqa: E402
+from src.gemini_client import PRIORITY_BACKGROUND  # noqa: E402
+from src.inactivity import InactivityEngine, InactivityPool  # noqa: E402
+from src.send_scheduler import SendScheduler  # noqa: E402
+from src.summarizer import HistoryCompactor  # noqa: E402
+
+from . import replay, traces  # noqa: E402
+from .fake_discord import BOT_USER, FakeChannel, FakeDiscord, FakeGuild, FakeMessage, FakeReference, FakeUser  # noqa: E402
+
+Timeline = List[Tuple[float, int, bool, str]]
+
+
+# Globales de discord_client que cada simulación sustituye
+_REPLACED = (
+    "send_scheduler", "admission", "inactivity", "inactivity_pool", "compactor", "state", "sent_index", "location_filter"
+)
+
+
+@contextmanager
+def _components(channels: Dict[int, FakeChannel]) -> Iterator[None]:
+    """Loop-bound components and fresh state for one simulation; the originals are restored after."""
+    dc = discord_client
+    saved = {name: getattr(dc, name) for name in _REPLACED}
+    user = dc.bot._connection.user
+    # Objetos ligados al loop: uno nuevo por simulación
+    dc.send_scheduler = SendScheduler(lambda items: dc._deliver(items), clock=dc._loop_time)
+    dc.admission = AdmissionController(dc.send_scheduler.depth, lambda: 0, dc._mean_delivery_seconds)
+    dc.inactivity = InactivityEngine(dc._send_inactivity_message, dc._last_activity, clock=dc._loop_time)
+    # También lo que guarda estado por canal: si no, la segunda pasada consume otros números aleatorios
+    dc.inactivity_pool = InactivityPool(
+        lambda ch: dc._generate_inactivity_text(ch, PRIORITY_BACKGROUND),
+        lambda channel_id: dc.state.peek(channel_id),
+        busy=lambda: False,
+        clock=dc._loop_time,
+    )
+    dc.compactor = HistoryCompactor(dc.generate_reply, clock=dc._loop_time)
+    replay.reset_state()
+    dc.bot._connection.user = BOT_USER
+    dc.bot.get_channel = channels.get
+    try:
+        yield
+    finally:
+        del dc.bot.get_channel
+        dc.bot._connection.user = user
+        for name, value in saved.items():
+            setattr(dc, name, value)
+
+
+async def simulate(args: argparse.Namespace) -> Tuple[Timeline, int]:
+    random.seed(args.seed)
+    api = FakeDiscord()
+    guild = FakeGuild(1)
+    channels: Dict[int, FakeChannel] = {}
+    with _components(channels):
+        return await _play(args, api, guild, channels)
+
+
+async def _play(
+    args: argparse.Namespace, api: FakeDiscord, guild: FakeGuild, channels: Dict[int, FakeChannel]
+) -> Tuple[Timeline, int]:
+    discord_client.inactivity.start()
+
+    def message(ev: traces.TraceEvent) -> FakeMessage:
+        channel = channels.get(ev.channel_id)
+        if channel is None:
+            channel = channels[ev.channel_id] = FakeChannel(api, ev.channel_id, guild)
+        author = FakeUser(ev.author_id)
+        if ev.kind == traces.REPLY:
+            target = api.last_bot_message.get(ev.channel_id)
+            if target is not None:
+                return FakeMessage(api, channel, author, ev.content, reference=FakeReference(target.id, target))
+        if ev.kind == traces.CHATTER:
+            return FakeMessage(api, channel, author, ev.content)
+        return FakeMessage(api, channel, author, ev.content, mentions=[BOT_USER])
+
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    duration = args.hours * 3600.0
+    tasks: List[asyncio.Task] = []
+    triggers = 0
+    events = traces.many_channels(channels=args.channels, events=args.events, rate=args.events / duration, seed=args.seed)
+    try:
+        for ev in events:
+            delay = start + ev.at - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            triggers += ev.kind != traces.CHATTER
+            tasks.append(asyncio.create_task(discord_client.on_message(message(ev))))
+        await asyncio.gather(*tasks, return_exceptions=True)
+        # Cola final más un ciclo de inactividad
+        await asyncio.sleep(settings.INACTIVITY_SECONDS * 2)
+        await discord_client.send_scheduler.join()
+    finally:
+        await discord_client.inactivity.close()
+        await discord_client.send_scheduler.close()
+    timeline = [(t - start, channel_id, reply_to is None, content) for t, channel_id, reply_to, content in api.sent]
+    return timeline, triggers
+
+
+def _min_gap(timeline: Timeline) -> Optional[float]:
+    last: Dict[int, float] = {}
+    gap: Optional[float] = None
+    for t, channel_id, _, _ in timeline:
+        if channel_id in last:
+            d = t - last[channel_id]
+            gap = d if gap is None else min(gap, d)
+        last[channel_id] = t
+    return gap
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--hours", type=float, default=1.0)
+    parser.add_argument("--channels", type=int, default=20)
+    parser.add_argument("--events", type=int, default=3000)
+    parser.add_argument("--llm-latency", type=float, default=0.8)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+    llm_backend.backend = llm_backend.LocalBackend(latency=args.llm_latency)
+
+    runs = []
+    for _ in range(2):
+        t0 = time.perf_counter()
+        timeline, triggers = run_virtual(simulate(args))
+        runs.append((timeline, time.perf_counter() - t0))
+    timeline, wall = runs[0]
+    span = timeline[-1][0] if timeline else 0.0
+    inactive = sum(1 for _, _, unprompted, _ in timeline if unprompted)
+    gap = _min_gap(timeline)
+    print(f"simulated {span / 3600:.2f}h in {wall * 1000:.0f}ms wall ({span / max(wall, 1e-9):,.0f}x)")
+    print(f"  triggers={triggers} sends={len(timeline)} (inactivity={inactive}) "
+          f"min per-channel gap={gap if gap is not None else float('nan'):.3f}s "
+          f"(MIN_SECONDS_BETWEEN_MESSAGES_PER_CHANNEL={settings.MIN_SECONDS_BETWEEN_MESSAGES_PER_CHANNEL})")
+    first, second = runs[0][0], runs[1][0]
+    if first != second:
+        diverged = next((i for i, (a, b) in enumerate(zip(first, second)) if a != b), min(len(first), len(second)))
+        print(f"  second run DIFFERS at send #{diverged} ({len(first)} vs {len(second)} sends)")
+        raise SystemExit(1)
+    print(f"  second run identical ({runs[1][1] * 1000:.0f}ms wall)")
+
+
+if __name__ == "__main__":
+    main()
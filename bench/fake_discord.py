@@ -0,0 +1,129 @@
+from __future__ import annotations
+
+import asyncio
+import itertools
+import time
+from typing import Dict, List, Optional, Tuple
+
+# Snowflakes con timestamp real para que la lógica basada en IDs funcione igual
+DISCORD_EPOCH_MS = 1420070400000
+_sequence = itertools.count()
+
+
+def make_snowflake(at: Optional[float] = None) -> int:
+    ms = int((time.time() if at is None else at) * 1000) - DISCORD_EPOCH_MS
+    return (ms << 22) | (next(_sequence) & 0x3FFFFF)
+
+
+class FakeUser:
+    def __init__(self, user_id: int, name: str = "") -> None:
+        self.id = user_id
+        self.name = name or f"user{user_id}"
+        self.display_name = self.name
+        self.bot = False
+
+    def __eq__(self, other: object) -> bool:
+        return isinstance(other, FakeUser) and other.id == self.id
+
+    def __hash__(self) -> int:
+        return hash(self.id)
+
+    def __str__(self) -> str:
+        return self.name
+
+
+class FakeGuild:
+    def __init__(self, guild_id: int) -> None:
+        self.id = guild_id
+
+
+class FakeReference:
+    def __init__(self, message_id: int, resolved: Optional["FakeMessage"] = None) -> None:
+        self.message_id = message_id
+        self.resolved = resolved
+
+
+class _Typing:
+    def __init__(self, channel: "FakeChannel") -> None:
+        self.channel = channel
+
+    async def __aenter__(self) -> None:
+        self.channel.typing_calls += 1
+
+    async def __aexit__(self, *exc) -> None:
+        return None
+
+
+class FakeDiscord:
+    """Shared fake Discord API: message store, API latency and call log."""
+
+    def __init__(self, *, api_latency: float = 0.0) -> None:
+        self.api_latency = api_latency
+        self.messages: Dict[int, FakeMessage] = {}
+        # (loop time, channel_id, reply_to_id or None, content)
+        self.sent: List[Tuple[float, int, Optional[int], str]] = []
+        self.api_calls: Dict[str, int] = {"send": 0, "reply": 0, "fetch_message": 0}
+        self.last_bot_message: Dict[int, "FakeMessage"] = {}
+
+    async def _api(self, kind: str) -> None:
+        self.api_calls[kind] += 1
+        if self.api_latency:
+            await asyncio.sleep(self.api_latency)
+
+
+class FakeChannel:
+    def __init__(self, api: FakeDiscord, channel_id: int, guild: Optional[FakeGuild] = None) -> None:
+        self._api = api
+        self.id = channel_id
+        self.guild = guild
+        self.typing_calls = 0
+
+    def typing(self) -> _Typing:
+        return _Typing(self)
+
+    async def send(self, content: str, **_: object) -> "FakeMessage":
+        await self._api._api("send")
+        return self._record(content, None)
+
+    async def fetch_message(self, message_id: int) -> "FakeMessage":
+        await self._api._api("fetch_message")
+        try:
+            return self._api.messages[message_id]
+        except KeyError:
+            raise LookupError(f"Unknown message {message_id}") from None
+
+    def _record(self, content: str, reply_to: Optional[int]) -> "FakeMessage":
+        msg = FakeMessage(self._api, self, BOT_USER, content)
+        self._api.messages[msg.id] = msg
+        self._api.sent.append((asyncio.get_running_loop().time(), self.id, reply_to, content))
+        self._api.last_bot_message[self.id] = msg
+        return msg
+
+
+class FakeMessage:
+    def __init__(
+        self,
+        api: FakeDiscord,
+        channel: FakeChannel,
+        author: FakeUser,
+        content: str,
+        *,
+        mentions: Optional[List[FakeUser]] = None,
+        reference: Optional[FakeReference] = None,
+    ) -> None:
+        self._api = api
+        self.id = make_snowflake()
+        self.channel = channel
+        self.guild = channel.guild
+        self.author = author
+        self.content = content
+        self.mentions = mentions or []
+        self.reference = reference
+
+    async def reply(self, content: str, **_: object) -> "FakeMessage":
+        await self._api._api("reply")
+        return self.channel._record(content, self.id)
+
+
+# Usuario del selfbot; el harness lo instala como bot.user
+BOT_USER = FakeUser(1, "selfbot")
@@ -0,0 +1,305 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import math
+import os
+import itertools
+import random
+import ssl
+import subprocess
+import tempfile
+from typing import AsyncIterator, Dict, Optional, Set, Tuple, Union
+from urllib.parse import parse_qs, urlsplit
+
+
+Body = Union[bytes, AsyncIterator[bytes]]
+Response = Tuple[int, Dict[str, str], Body]
+
+
+def make_self_signed_cert(directory: str) -> Tuple[str, str]:
+    """Create a throwaway certificate for 127.0.0.1 using the openssl CLI."""
+    cert = os.path.join(directory, "cert.pem")
+    key = os.path.join(directory, "key.pem")
+    subprocess.run(
+        [
+            "openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes",
+            "-keyout", key, "-out", cert, "-days", "1",
+            "-subj", "/CN=127.0.0.1", "-addext", "subjectAltName=IP:127.0.0.1",
+        ],
+        check=True,
+        capture_output=True,
+    )
+    return cert, key
+
+
+class FakeGeminiServer:
+    """Minimal HTTP/1.1 keep-alive server that mimics the Gemini REST API."""
+
+    def __init__(
+        self,
+        *,
+        reply_text: str = "holaaa~ owo ✨",
+        tls: bool = False,
+        stream_chunk_chars: int = 16,
+        stream_chunk_delay: float = 0.0,
+        latency: float = 0.0,
+        latency_jitter: float = 0.0,
+        error_rate: float = 0.0,
+        rate_limit_rate: float = 0.0,
+        retry_after: float = 1.0,
+        quota_requests: int = 0,
+        quota_window: float = 60.0,
+        slow_rate: float = 0.0,
+        slow_latency: float = 0.0,
+        model_latency: Optional[Dict[str, float]] = None,
+        seed: int = 0,
+    ) -> None:
+        self.reply_text = reply_text
+        self.tls = tls
+        # Fallos inyectados en las llamadas de generación
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        # Cola larga: una fracción de llamadas tarda slow_latency extra; latencia base por modelo
+        self.slow_rate = slow_rate
+        self.slow_latency = slow_latency
+        self.model_latency = dict(model_latency or {})
+        self.calls_by_model: Dict[str, int] = {}
+        self._rng = random.Random(seed)
+        # Cuota real: como mucho quota_requests llamadas por ventana fija (0 = sin cuota)
+        self.quota_requests = quota_requests
+        self.quota_window = quota_window
+        self._window_start = 0.0
+        self._window_calls = 0
+        self.max_in_flight = 0
+        self._in_flight = 0
+        self.status_counts: Dict[int, int] = {}
+        self.generate_calls = 0
+        # streaming: ~4 chars por token; el delay simula la velocidad de decodificación
+        self.stream_chunk_chars = stream_chunk_chars
+        self.stream_chunk_delay = stream_chunk_delay
+        self.stream_chunks_sent = 0
+        self.connections = 0
+        self.requests = 0
+        self.request_bytes = 0
+        # cachedContents registrados: name -> cuerpo de creación
+        self.cached_contents: Dict[str, Dict] = {}
+        self._cache_ids = itertools.count(1)
+        self.cert_path: Optional[str] = None
+        self._tmpdir: Optional[tempfile.TemporaryDirectory] = None
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._handlers: Set[asyncio.Task] = set()
+        self.port = 0
+
+    @property
+    def url(self) -> str:
+        scheme = "https" if self.tls else "http"
+        return f"{scheme}://127.0.0.1:{self.port}"
+
+    async def start(self) -> None:
+        ssl_ctx = None
+        if self.tls:
+            self._tmpdir = tempfile.TemporaryDirectory()
+            self.cert_path, key = make_self_signed_cert(self._tmpdir.name)
+            ssl_ctx = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+            ssl_ctx.load_cert_chain(self.cert_path, key)
+        self._server = await asyncio.start_server(self._handle_conn, "127.0.0.1", 0, ssl=ssl_ctx)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def stop(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            for task in list(self._handlers):
+                task.cancel()
+            await asyncio.gather(*self._handlers, return_exceptions=True)
+            await self._server.wait_closed()
+            self._server = None
+        if self._tmpdir is not None:
+            self._tmpdir.cleanup()
+            self._tmpdir = None
+
+    async def __aenter__(self) -> "FakeGeminiServer":
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        await self.stop()
+
+    def expire_cache(self, name: str) -> None:
+        """Simulate server-side expiry of a cachedContents entry."""
+        self.cached_contents.pop(name, None)
+
+    def _over_quota(self) -> Optional[Response]:
+        if self.quota_requests <= 0:
+            return None
+        now = asyncio.get_running_loop().time()
+        if now - self._window_start >= self.quota_window:
+            self._window_start, self._window_calls = now, 0
+        self._window_calls += 1
+        if self._window_calls <= self.quota_requests:
+            return None
+        # Como Gemini: RetryInfo.retryDelay en el cuerpo y Retry-After en segundos enteros
+        delay = self._window_start + self.quota_window - now
+        body = {"error": {
+            "code": 429,
+            "message": "Resource has been exhausted (e.g. check quota).",
+            "status": "RESOURCE_EXHAUSTED",
+            "details": [{"@type": "type.googleapis.com/google.rpc.RetryInfo", "retryDelay": f"{delay:.3f}s"}],
+        }}
+        return self._json(429, body, {"Retry-After": str(math.ceil(delay))})
+
+    async def _inject_faults(self, model: str) -> Optional[Response]:
+        self.generate_calls += 1
+        self.calls_by_model[model] = self.calls_by_model.get(model, 0) + 1
+        over = self._over_quota()
+        if over is not None:
+            return over
+        delay = self.model_latency.get(model, self.latency) + self._rng.uniform(0.0, self.latency_jitter)
+        if self.slow_rate and self._rng.random() < self.slow_rate:
+            delay += self.slow_latency
+        if delay > 0:
+            await asyncio.sleep(delay)
+        roll = self._rng.random()
+        if roll < self.rate_limit_rate:
+            return self._json(
+                429,
+                {"error": {"code": 429, "message": "Resource has been exhausted", "status": "RESOURCE_EXHAUSTED"}},
+                {"Retry-After": f"{self.retry_after:g}"},
+            )
+        if roll < self.rate_limit_rate + self.error_rate:
+            return self._error(503, "The model is overloaded")
+        return None
+
+    async def handle(self, method: str, path: str, query: Dict[str, str], body: bytes) -> Response:
+        if method == "POST" and path.endswith(("generateContent", "streamGenerateContent")):
+            self._in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self._in_flight)
+            try:
+                fault = await self._inject_faults(path.rsplit("/", 1)[-1].split(":", 1)[0])
+            finally:
+                self._in_flight -= 1
+            if fault is not None:
+                return fault
+        if method == "POST" and path.endswith(":generateContent"):
+            request = json.loads(body or b"{}")
+            cached = request.get("cached_content")
+            if cached and cached not in self.cached_contents:
+                return self._error(404, f"CachedContent not found: {cached}")
+            return self._json(200, self._generate_payload(self.reply_text, self._prompt_tokens(request)))
+        if method == "POST" and path.endswith(":streamGenerateContent"):
+            request = json.loads(body or b"{}")
+            cached = request.get("cached_content")
+            if cached and cached not in self.cached_contents:
+                return self._error(404, f"CachedContent not found: {cached}")
+            return 200, {"Content-Type": "text/event-stream"}, self._sse(self.reply_text, self._prompt_tokens(request))
+        if method == "POST" and path == "/v1beta/cachedContents":
+            request = json.loads(body or b"{}")
+            name = f"cachedContents/fake{next(self._cache_ids)}"
+            self.cached_contents[name] = request
+            return self._json(200, {"name": name, "model": request.get("model"), "ttl": request.get("ttl")})
+        if path.startswith("/v1beta/cachedContents/"):
+            name = path[len("/v1beta/"):]
+            if name not in self.cached_contents:
+                return self._error(404, f"CachedContent not found: {name}")
+            if method == "PATCH":
+                self.cached_contents[name].update(json.loads(body or b"{}"))
+                return self._json(200, {"name": name})
+            if method == "DELETE":
+                del self.cached_contents[name]
+                return self._json(200, {})
+        return self._error(404, f"{method} {path} not found")
+
+    def _prompt_tokens(self, request: Dict) -> int:
+        """Prompt size as a tokenizer would report it (~3.3 chars/token, unlike the client's 4)."""
+        system = request.get("system_instruction")
+        cached = self.cached_contents.get(request.get("cached_content") or "")
+        if cached is not None:
+            system = cached.get("systemInstruction")
+        chars = sum(len(p.get("text", "")) for p in (system or {}).get("parts", []))
+        for content in request.get("contents", []):
+            chars += sum(len(p.get("text", "")) for p in content.get("parts", []))
+        return int(chars / 3.3) + 1
+
+    def _generate_payload(self, text: str, prompt_tokens: int = 100) -> Dict:
+        return {
+            "candidates": [{"content": {"role": "model", "parts": [{"text": text}]}}],
+            "usageMetadata": {
+                "promptTokenCount": prompt_tokens,
+                "candidatesTokenCount": 20,
+                "totalTokenCount": prompt_tokens + 20,
+            },
+        }
+
+    async def _sse(self, text: str, prompt_tokens: int = 100) -> AsyncIterator[bytes]:
+        step = max(1, self.stream_chunk_chars)
+        for i in range(0, len(text), step):
+            if self.stream_chunk_delay:
+                await asyncio.sleep(self.stream_chunk_delay)
+            chunk = {
+                "candidates": [{"content": {"role": "model", "parts": [{"text": text[i : i + step]}]}}],
+                # Como Gemini: el tamaño del prompt viaja en cada chunk
+                "usageMetadata": {"promptTokenCount": prompt_tokens},
+            }
+            self.stream_chunks_sent += 1
+            yield f"data: {json.dumps(chunk)}\r\n\r\n".encode("utf-8")
+
+    @classmethod
+    def _error(cls, status: int, message: str) -> Response:
+        return cls._json(status, {"error": {"code": status, "message": message}})
+
+    @staticmethod
+    def _json(status: int, payload: Dict, headers: Optional[Dict[str, str]] = None) -> Response:
+        out = {"Content-Type": "application/json"}
+        out.update(headers or {})
+        return status, out, json.dumps(payload).encode("utf-8")
+
+    async def _handle_conn(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self.connections += 1
+        task = asyncio.current_task()
+        self._handlers.add(task)
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                method, target, _ = line.decode("latin-1").split(" ", 2)
+                headers: Dict[str, str] = {}
+                while True:
+                    raw = await reader.readline()
+                    if raw in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = raw.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                length = int(headers.get("content-length", "0") or 0)
+                body = await reader.readexactly(length) if length else b""
+                parts = urlsplit(target)
+                query = {k: v[0] for k, v in parse_qs(parts.query).items()}
+                self.requests += 1
+                self.request_bytes += len(body)
+                status, resp_headers, payload = await self.handle(method, parts.path, query, body)
+                self.status_counts[status] = self.status_counts.get(status, 0) + 1
+                head = [f"HTTP/1.1 {status} X"]
+                if isinstance(payload, bytes):
+                    resp_headers.setdefault("Content-Length", str(len(payload)))
+                else:
+                    resp_headers["Transfer-Encoding"] = "chunked"
+                head.extend(f"{k}: {v}" for k, v in resp_headers.items())
+                writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1"))
+                if isinstance(payload, bytes):
+                    writer.write(payload)
+                    await writer.drain()
+                else:
+                    async for piece in payload:
+                        writer.write(b"%x\r\n%s\r\n" % (len(piece), piece))
+                        await writer.drain()
+                    writer.write(b"0\r\n\r\n")
+                    await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, ssl.SSLError, asyncio.CancelledError):
+            # CancelledError: stop() cancela las conexiones abiertas (p. ej. streams cortados)
+            pass
+        finally:
+            self._handlers.discard(task)
+            writer.close()
@@ -0,0 +1,335 @@
+"""Offline end-to-end replay of synthetic Discord traffic through on_message.
+
+Drives discord_client.on_message with fake messages against the fake Gemini
+server and reports per-stage latency, throughput, Gemini calls per trigger
+and resident memory growth.
+
+Uso: python -m bench.replay --scenario mixed --channels 200 --events 3000 --rate 200
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import logging
+import os
+import time
+from typing import Callable, Dict, Iterable, List, Optional
+
+os.environ.setdefault("DISCORD_TOKEN", "bench")
+os.environ.setdefault("GEMINI_API_KEY", "bench")
+
+from src import discord_client  # noqa: E402
+from src import gemini_client  # noqa: E402
+from src.config import LocationFilter, settings  # noqa: E402
+from src.state_store import SentMessageIndex, StateStore  # noqa: E402
+
+from . import traces  # noqa: E402
+from ._stats import fmt_ms, summarize  # noqa: E402
+from .fake_discord import BOT_USER, FakeChannel, FakeDiscord, FakeGuild, FakeMessage, FakeReference, FakeUser  # noqa: E402
+from .fake_gemini import FakeGeminiServer  # noqa: E402
+
+STAGES = ("trigger", "generation", "formatting", "queue_to_send", "typing", "send", "end_to_end")
+
+
+def rss_bytes() -> int:
+    try:
+        with open("/proc/self/statm") as fh:
+            return int(fh.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        import resource
+
+        # ru_maxrss es el pico (KiB en Linux), no el RSS actual
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def configure_for_replay(*, typing: bool = False) -> None:
+    """Shrink human-like delays so a replay finishes in seconds."""
+    settings.REPLY_COOLDOWN_SECONDS = 0
+    settings.MIN_SECONDS_BETWEEN_MESSAGES_PER_CHANNEL = 0.05
+    settings.SEND_JITTER_SECONDS = 0.0
+    settings.COALESCE_WINDOW_SECONDS = 0.0
+    settings.TRIGGER_BATCH_WINDOW_SECONDS = 0.0
+    settings.INACTIVITY_ENABLED = False
+    settings.HUMAN_SIMULATION_ENABLED = typing
+    settings.MIN_TYPING_DELAY = 0.01
+    settings.MAX_TYPING_DELAY = 0.05
+    settings.TYPING_MAX_SECONDS_CAP = 0.05
+    settings.WORDS_PER_SECOND = 500.0
+
+
+def reset_state() -> None:
+    """Fresh per-channel state so consecutive replays in one process start cold."""
+    discord_client.state = StateStore(
+        max_channels=settings.STATE_MAX_CHANNELS,
+        max_cooldowns=settings.STATE_MAX_COOLDOWNS,
+        ttl_seconds=settings.STATE_TTL_SECONDS,
+        memory_turns=settings.MEMORY_MAX_TURNS,
+        clock=discord_client._loop_time,
+    )
+    discord_client.sent_index = SentMessageIndex(
+        window_seconds=settings.SENT_INDEX_WINDOW_SECONDS,
+        max_ids=settings.SENT_INDEX_MAX_IDS,
+    )
+    discord_client.location_filter = LocationFilter.from_settings(settings)
+
+
+class ReplayReport:
+    def __init__(self) -> None:
+        self.stages: Dict[str, List[float]] = {name: [] for name in STAGES}
+        self.messages = 0
+        self.triggers = 0
+        self.replies = 0
+        self.dropped = 0
+        self.errors = 0
+        self.gemini_calls = 0
+        self.discord_calls: Dict[str, int] = {}
+        self.wall_seconds = 0.0
+        self.rss_samples: List[int] = []
+        self.state: Dict[str, int] = {}
+
+    def print(self) -> None:
+        print(f"messages={self.messages} triggers={self.triggers} replies={self.replies} "
+              f"dropped={self.dropped} errors={self.errors} wall={self.wall_seconds:.2f}s")
+        print(f"throughput: {self.messages / max(self.wall_seconds, 1e-9):.1f} msg/s in, "
+              f"{self.replies / max(self.wall_seconds, 1e-9):.1f} replies/s out")
+        print(f"gemini calls per trigger: {self.gemini_calls / max(1, self.triggers):.3f}  "
+              f"discord calls: {self.discord_calls}")
+        for name in STAGES:
+            if self.stages[name]:
+                print(f"  {name:<14} {fmt_ms(summarize(self.stages[name]))}")
+        if self.rss_samples:
+            start, end, peak = self.rss_samples[0], self.rss_samples[-1], max(self.rss_samples)
+            mib = 1024 * 1024
+            print(f"rss: start={start / mib:.1f}MiB end={end / mib:.1f}MiB peak={peak / mib:.1f}MiB "
+                  f"growth={(end - start) / mib:+.2f}MiB")
+        if self.state:
+            print("state: " + " ".join(f"{k}={v}" for k, v in self.state.items()))
+
+
+def state_sizes() -> Dict[str, int]:
+    sizes = discord_client.state.counters()
+    sizes["send_lanes"] = discord_client.send_scheduler.active_lanes()
+    sizes["tasks"] = len(asyncio.all_tasks())
+    return sizes
+
+
+class ReplayHarness:
+    """Replays TraceEvents through on_message with timing hooks on each stage."""
+
+    def __init__(self, server: FakeGeminiServer, api: FakeDiscord, *, speed: float = 1.0) -> None:
+        self.server = server
+        self.api = api
+        self.speed = speed
+        self.guild = FakeGuild(1)
+        self.channels: Dict[int, FakeChannel] = {}
+        self.report = ReplayReport()
+        self._task_started: Dict[asyncio.Task, float] = {}
+        self._trigger_started: Dict[int, float] = {}
+        self._enqueued_at: Dict[int, float] = {}
+        self._restore: List[Callable[[], None]] = []
+
+    def _channel(self, channel_id: int) -> FakeChannel:
+        channel = self.channels.get(channel_id)
+        if channel is None:
+            channel = self.channels[channel_id] = FakeChannel(self.api, channel_id, self.guild)
+        return channel
+
+    def _message(self, ev: traces.TraceEvent) -> FakeMessage:
+        channel = self._channel(ev.channel_id)
+        author = FakeUser(ev.author_id)
+        if ev.kind == traces.REPLY:
+            target = self.api.last_bot_message.get(ev.channel_id)
+            if target is not None:
+                ref = FakeReference(target.id, target if ev.resolved else None)
+                return FakeMessage(self.api, channel, author, ev.content, reference=ref)
+        if ev.kind == traces.CHATTER:
+            return FakeMessage(self.api, channel, author, ev.content)
+        return FakeMessage(self.api, channel, author, ev.content, mentions=[BOT_USER])
+
+    # --- hooks de medición ---------------------------------------------------
+    def _patch(self, name: str, factory: Callable[[Callable], Callable]) -> None:
+        original = getattr(discord_client, name)
+        setattr(discord_client, name, factory(original))
+        self._restore.append(lambda: setattr(discord_client, name, original))
+
+    def _install_hooks(self) -> None:
+        stages = self.report.stages
+
+        def wrap_generate(original):
+            async def generate(*args, **kwargs):
+                task = asyncio.current_task()
+                t0 = time.perf_counter()
+                if task in self._task_started:
+                    stages["trigger"].append(t0 - self._task_started[task])
+                try:
+                    return await original(*args, **kwargs)
+                finally:
+                    stages["generation"].append(time.perf_counter() - t0)
+            return generate
+
+        def wrap_format(original):
+            def fmt(*args, **kwargs):
+                t0 = time.perf_counter()
+                try:
+                    return original(*args, **kwargs)
+                finally:
+                    stages["formatting"].append(time.perf_counter() - t0)
+            return fmt
+
+        def wrap_typing(original):
+            async def typing(*args, **kwargs):
+                t0 = time.perf_counter()
+                try:
+                    return await original(*args, **kwargs)
+                finally:
+                    stages["typing"].append(time.perf_counter() - t0)
+            return typing
+
+        def wrap_enqueue(original):
+            def enqueue(message, content):
+                self._enqueued_at.setdefault(message.id, time.perf_counter())
+                return original(message, content)
+            return enqueue
+
+        self._patch("generate_reply", wrap_generate)
+        self._patch("_format_compact", wrap_format)
+        self._patch("_simulate_human_typing", wrap_typing)
+        self._patch("_enqueue_send", wrap_enqueue)
+
+        # Las llamadas de envío del fake miden la etapa "send" y cierran el end-to-end
+        original_reply = FakeMessage.reply
+
+        async def reply(msg, content, **kwargs):
+            t0 = time.perf_counter()
+            out = await original_reply(msg, content, **kwargs)
+            t1 = time.perf_counter()
+            stages["send"].append(t1 - t0)
+            if msg.id in self._enqueued_at:
+                stages["queue_to_send"].append(t0 - self._enqueued_at.pop(msg.id))
+            if msg.id in self._trigger_started:
+                stages["end_to_end"].append(t1 - self._trigger_started.pop(msg.id))
+            self.report.replies += 1
+            return out
+
+        FakeMessage.reply = reply
+        self._restore.append(lambda: setattr(FakeMessage, "reply", original_reply))
+
+    # --- replay ---------------------------------------------------------------
+    async def _drive(self, msg: FakeMessage) -> None:
+        task = asyncio.current_task()
+        t0 = time.perf_counter()
+        self._task_started[task] = t0
+        self._trigger_started[msg.id] = t0
+        try:
+            await discord_client.on_message(msg)
+        except asyncio.QueueFull:
+            self.report.dropped += 1
+        except Exception:  # noqa: BLE001
+            self.report.errors += 1
+        finally:
+            self._task_started.pop(task, None)
+
+    async def _drain(self, timeout: float) -> None:
+        try:
+            await asyncio.wait_for(discord_client.send_scheduler.join(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    async def run(self, events: Iterable[traces.TraceEvent], *, drain_timeout: float = 60.0) -> ReplayReport:
+        discord_client.bot._connection.user = BOT_USER
+        self._install_hooks()
+        gemini_calls_before = self.server.generate_calls
+        discord_before = dict(self.api.api_calls)
+        tasks: List[asyncio.Task] = []
+        self.report.rss_samples.append(rss_bytes())
+        start = time.perf_counter()
+        try:
+            for i, ev in enumerate(events):
+                delay = start + ev.at / self.speed - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                self.report.messages += 1
+                if ev.kind != traces.CHATTER:
+                    self.report.triggers += 1
+                tasks.append(asyncio.create_task(self._drive(self._message(ev))))
+                if i % 500 == 0:
+                    self.report.rss_samples.append(rss_bytes())
+                    tasks = [t for t in tasks if not t.done()]
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await self._drain(drain_timeout)
+            self.report.wall_seconds = time.perf_counter() - start
+            self.report.rss_samples.append(rss_bytes())
+            self.report.state = state_sizes()
+        finally:
+            for undo in reversed(self._restore):
+                undo()
+            await discord_client.send_scheduler.close()
+        self.report.gemini_calls = self.server.generate_calls - gemini_calls_before
+        self.report.discord_calls = {k: v - discord_before.get(k, 0) for k, v in self.api.api_calls.items()}
+        return self.report
+
+
+def build_trace(args: argparse.Namespace) -> Iterable[traces.TraceEvent]:
+    if args.scenario == "channels":
+        return traces.many_channels(channels=args.channels, events=args.events, rate=args.rate, seed=args.seed)
+    if args.scenario == "bursts":
+        return traces.mention_bursts(channels=args.channels, events=args.events, seed=args.seed)
+    if args.scenario == "chains":
+        return traces.reply_chains(channels=args.channels, events=args.events, seed=args.seed)
+    return traces.mixed(channels=args.channels, events=args.events, rate=args.rate, seed=args.seed)
+
+
+def make_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scenario", choices=("channels", "bursts", "chains", "mixed"), default="mixed")
+    parser.add_argument("--channels", type=int, default=200)
+    parser.add_argument("--events", type=int, default=3000)
+    parser.add_argument("--rate", type=float, default=200.0, help="eventos/s del escenario 'channels'")
+    parser.add_argument("--speed", type=float, default=10.0, help="factor de aceleración del replay")
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--latency-jitter", type=float, default=0.05)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--retry-after", type=float, default=1.0)
+    parser.add_argument("--discord-latency", type=float, default=0.01)
+    parser.add_argument("--typing", action="store_true", help="mantener la simulación de escritura (acortada)")
+    parser.add_argument("--streaming", action="store_true")
+    parser.add_argument("--batch-window", type=float, default=0.0,
+                        help="TRIGGER_BATCH_WINDOW_SECONDS en tiempo de la traza (0 = sin agrupar)")
+    parser.add_argument("--seed", type=int, default=0)
+    return parser
+
+
+async def run_replay(args: argparse.Namespace, *, setup: Optional[Callable[[], None]] = None) -> ReplayReport:
+    logging.getLogger().setLevel(logging.WARNING)
+    configure_for_replay(typing=args.typing)
+    settings.GEMINI_STREAMING_ENABLED = args.streaming
+    # La ventana se expresa en tiempo de la traza, igual que los eventos
+    settings.TRIGGER_BATCH_WINDOW_SECONDS = args.batch_window / args.speed
+    if setup is not None:
+        setup()
+    server = FakeGeminiServer(
+        latency=args.latency,
+        latency_jitter=args.latency_jitter,
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        retry_after=args.retry_after,
+        seed=args.seed,
+    )
+    async with server:
+        settings.GEMINI_BASE_URL = server.url
+        harness = ReplayHarness(server, FakeDiscord(api_latency=args.discord_latency), speed=args.speed)
+        try:
+            report = await harness.run(build_trace(args))
+        finally:
+            await gemini_client.close_client()
+    return report
+
+
+def main() -> None:
+    args = make_parser().parse_args()
+    asyncio.run(run_replay(args)).print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+from __future__ import annotations
+
+import random
+from typing import Iterator, List
+
+# Tipos de evento: "mention" (nos mencionan), "reply" (responden a nuestro último
+# mensaje del canal) y "chatter" (mensaje que no debe disparar nada)
+MENTION = "mention"
+REPLY = "reply"
+CHATTER = "chatter"
+
+_WORDS = "hola que tal mapa pixel bandera defender ayuda python error discord gracias jaja".split()
+
+
+class TraceEvent:
+    __slots__ = ("at", "channel_id", "author_id", "kind", "content", "resolved")
+
+    def __init__(
+        self, at: float, channel_id: int, author_id: int, kind: str, content: str, resolved: bool = True
+    ) -> None:
+        self.at = at
+        self.channel_id = channel_id
+        self.author_id = author_id
+        self.kind = kind
+        self.content = content
+        # False: reference.resolved llega vacío y hay que resolverlo (fetch_message)
+        self.resolved = resolved
+
+
+def _text(rng: random.Random) -> str:
+    return " ".join(rng.choice(_WORDS) for _ in range(rng.randint(3, 25)))
+
+
+def _channel_ids(channels: int) -> List[int]:
+    return [10_000 + i for i in range(channels)]
+
+
+def _pick_channel(rng: random.Random, ids: List[int]) -> int:
+    # Zipf aproximado: pocos canales concentran casi todo el tráfico
+    return ids[min(len(ids) - 1, int(rng.paretovariate(1.2)) - 1)]
+
+
+def many_channels(
+    *, channels: int, events: int, rate: float, seed: int = 0, trigger_ratio: float = 0.3
+) -> Iterator[TraceEvent]:
+    """Poisson traffic spread over many channels, mostly non-triggering chatter."""
+    rng = random.Random(seed)
+    ids = _channel_ids(channels)
+    at = 0.0
+    for _ in range(events):
+        at += rng.expovariate(rate)
+        roll = rng.random()
+        if roll < trigger_ratio * 0.7:
+            kind = MENTION
+        elif roll < trigger_ratio:
+            kind = REPLY
+        else:
+            kind = CHATTER
+        yield TraceEvent(at, _pick_channel(rng, ids), 100 + rng.randrange(500), kind, _text(rng), rng.random() < 0.8)
+
+
+def mention_bursts(
+    *, channels: int, events: int, burst_size: int = 8, burst_window: float = 2.0, gap: float = 5.0, seed: int = 0
+) -> Iterator[TraceEvent]:
+    """Several users mentioning the bot in the same channel within a few seconds."""
+    rng = random.Random(seed)
+    ids = _channel_ids(channels)
+    at = 0.0
+    emitted = 0
+    while emitted < events:
+        channel_id = rng.choice(ids)
+        start = at
+        for offset in sorted(rng.uniform(0.0, burst_window) for _ in range(burst_size)):
+            if emitted >= events:
+                break
+            yield TraceEvent(start + offset, channel_id, 100 + rng.randrange(500), MENTION, _text(rng))
+            emitted += 1
+        at += rng.expovariate(1.0 / gap) if gap > 0 else 0.0
+
+
+def reply_chains(
+    *, channels: int, events: int, chain_length: int = 6, think_time: float = 4.0, seed: int = 0
+) -> Iterator[TraceEvent]:
+    """Users holding a back-and-forth with the bot by replying to its last message."""
+    rng = random.Random(seed)
+    ids = _channel_ids(channels)
+    pending: List[TraceEvent] = []
+    for i in range(0, events, chain_length):
+        channel_id = rng.choice(ids)
+        author_id = 100 + rng.randrange(500)
+        at = rng.uniform(0.0, events / max(1, chain_length) * think_time / max(1, channels))
+        for step in range(min(chain_length, events - i)):
+            kind = MENTION if step == 0 else REPLY
+            pending.append(TraceEvent(at, channel_id, author_id, kind, _text(rng), rng.random() < 0.5))
+            at += rng.expovariate(1.0 / think_time)
+    pending.sort(key=lambda ev: ev.at)
+    return iter(pending)
+
+
+def mixed(*, channels: int, events: int, rate: float, seed: int = 0) -> Iterator[TraceEvent]:
+    third = max(1, events // 3)
+    merged = list(many_channels(channels=channels, events=third, rate=rate, seed=seed))
+    merged.extend(mention_bursts(channels=max(1, channels // 10), events=third, seed=seed + 1))
+    merged.extend(reply_chains(channels=max(1, channels // 5), events=events - 2 * third, seed=seed + 2))
+    merged.sort(key=lambda ev: ev.at)
+    return iter(merged)
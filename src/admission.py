@@ -0,0 +1,88 @@
+from __future__ import annotations
+
+import logging
+from typing import Callable, Dict, Optional
+
+from .config import settings
+from .gemini_client import PRIORITY_INACTIVITY, PRIORITY_MENTION, PRIORITY_REPLY
+from .metrics import ADMISSION_REJECTIONS
+
+
+logger = logging.getLogger(__name__)
+
+PRIORITY_NAMES = {PRIORITY_MENTION: "mention", PRIORITY_REPLY: "reply", PRIORITY_INACTIVITY: "inactivity"}
+
+
+class AdmissionController:
+    """Decides, before any Gemini call, whether a reply can still be delivered.
+
+    A channel's load is its queued sends plus the replies already admitted and
+    still generating (reserved until they are enqueued or given up). Mentions
+    may fill the whole lane and wait up to ADMISSION_MAX_WAIT_SECONDS; replies
+    leave the last slot to mentions and accept half that wait; inactivity
+    pings only go out when the lane is empty and nobody waits for Gemini
+    quota. Rejections are counted by priority and reason.
+    """
+
+    def __init__(
+        self,
+        depth: Callable[[int], int],
+        gemini_waiting: Callable[[], int],
+        send_seconds: Callable[[], float],
+    ) -> None:
+        self._depth = depth
+        self._gemini_waiting = gemini_waiting
+        self._send_seconds = send_seconds
+        self._reserved: Dict[int, int] = {}
+
+    def ahead(self, channel_id: int) -> int:
+        return self._depth(channel_id) + self._reserved.get(channel_id, 0)
+
+    def expected_wait(self, channel_id: int) -> float:
+        """Seconds until a reply admitted now would be sent (pacing + delivery per message ahead)."""
+        per_message = settings.MIN_SECONDS_BETWEEN_MESSAGES_PER_CHANNEL + self._send_seconds()
+        return self.ahead(channel_id) * per_message
+
+    def admit(self, channel_id: int, priority: int) -> Optional[str]:
+        """Reserve a send slot; returns None if admitted, else the rejection reason."""
+        ahead = self.ahead(channel_id)
+        capacity = settings.QUEUE_MAX_SIZE_PER_CHANNEL
+        reason: Optional[str] = None
+        if priority <= PRIORITY_MENTION:
+            if ahead >= capacity:
+                reason = "queue_full"
+            elif self.expected_wait(channel_id) > settings.ADMISSION_MAX_WAIT_SECONDS:
+                reason = "queue_wait"
+        elif priority == PRIORITY_REPLY:
+            if ahead >= max(1, capacity - 1):
+                reason = "queue_full"
+            elif self.expected_wait(channel_id) > settings.ADMISSION_MAX_WAIT_SECONDS / 2:
+                reason = "queue_wait"
+            elif self._gemini_waiting() >= settings.ADMISSION_MAX_GEMINI_WAITING:
+                reason = "gemini_backlog"
+        else:
+            if ahead > 0:
+                reason = "queue_busy"
+            elif self._gemini_waiting() > 0:
+                reason = "gemini_backlog"
+        if reason is not None:
+            ADMISSION_REJECTIONS.labels(PRIORITY_NAMES.get(priority, str(priority)), reason).inc()
+            logger.debug("Shed %s for channel %s: %s", PRIORITY_NAMES.get(priority, priority), channel_id, reason)
+            return reason
+        self._reserved[channel_id] = self._reserved.get(channel_id, 0) + 1
+        return None
+
+    def release(self, channel_id: int) -> None:
+        """Drop the reservation once the reply is enqueued (or abandoned)."""
+        left = self._reserved.get(channel_id, 0) - 1
+        if left > 0:
+            self._reserved[channel_id] = left
+        else:
+            self._reserved.pop(channel_id, None)
+
+    def reserved(self) -> int:
+        return sum(self._reserved.values())
+
+    def reject(self, priority: int, reason: str) -> None:
+        """Count a rejection decided elsewhere (e.g. the lane filled up during generation)."""
+        ADMISSION_REJECTIONS.labels(PRIORITY_NAMES.get(priority, str(priority)), reason).inc()
@@ -0,0 +1,126 @@
+from __future__ import annotations
+
+import logging
+from collections import deque
+from typing import Callable, Deque
+
+from .config import settings
+from .metrics import CIRCUIT_REJECTIONS, CIRCUIT_TRANSITIONS
+
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+# Valor exportado por estado (gauge): 0 cerrado, 1 probando, 2 abierto
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class CircuitOpenError(Exception):
+    """The circuit is open: the call was refused without touching the network."""
+
+
+class CircuitBreaker:
+    """Closed / open / half-open breaker fed with the outcome of every attempt.
+
+    Closed: the last CIRCUIT_WINDOW_SIZE outcomes are kept; once there are at
+    least CIRCUIT_MIN_CALLS and the share of failures (errors, timeouts and
+    attempts slower than CIRCUIT_SLOW_CALL_SECONDS) reaches
+    CIRCUIT_FAILURE_RATIO, the circuit opens. Open: every call fails at once
+    with CircuitOpenError for CIRCUIT_OPEN_SECONDS. Half-open: up to
+    CIRCUIT_HALF_OPEN_PROBES calls go through; if they all succeed the circuit
+    closes with a clean window, any failure opens it again. Outcomes that say
+    nothing about the service's health (429, 4xx, cancellations) are released
+    without being counted.
+    """
+
+    def __init__(self, name: str, *, clock: Callable[[], float]) -> None:
+        self.name = name
+        self._clock = clock
+        self._state = CLOSED
+        self._window: Deque[bool] = deque()  # True = fallo
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probes = 0  # sondas en vuelo en half-open
+        self._probe_successes = 0
+
+    @property
+    def state(self) -> str:
+        if self._state == OPEN and self._clock() - self._opened_at >= settings.CIRCUIT_OPEN_SECONDS:
+            self._transition(HALF_OPEN)
+        return self._state
+
+    def is_open(self) -> bool:
+        return settings.CIRCUIT_BREAKER_ENABLED and self.state == OPEN
+
+    def reject_if_open(self) -> None:
+        """Raise CircuitOpenError while open, without taking a half-open probe."""
+        if self.is_open():
+            CIRCUIT_REJECTIONS.inc()
+            raise CircuitOpenError(f"circuit for {self.name} is open")
+
+    def before_call(self) -> bool:
+        """Admit a call or raise CircuitOpenError; returns True if the call is a half-open probe."""
+        if not settings.CIRCUIT_BREAKER_ENABLED:
+            return False
+        state = self.state
+        if state == CLOSED:
+            return False
+        if state == HALF_OPEN and self._probes < max(1, settings.CIRCUIT_HALF_OPEN_PROBES):
+            self._probes += 1
+            return True
+        CIRCUIT_REJECTIONS.inc()
+        raise CircuitOpenError(f"circuit for {self.name} is {state}")
+
+    def record(self, probe: bool, *, failed: bool, seconds: float = 0.0) -> None:
+        """Count the outcome of an admitted call."""
+        if not settings.CIRCUIT_BREAKER_ENABLED:
+            return
+        slow = settings.CIRCUIT_SLOW_CALL_SECONDS
+        failed = failed or (slow > 0 and seconds > slow)
+        if probe:
+            self._probes = max(0, self._probes - 1)
+            if self._state != HALF_OPEN:
+                return
+            if failed:
+                self._open("half-open probe failed")
+                return
+            self._probe_successes += 1
+            if self._probe_successes >= max(1, settings.CIRCUIT_HALF_OPEN_PROBES):
+                self._transition(CLOSED)
+            return
+        if self._state != CLOSED:
+            # Llamadas que empezaron antes de abrir: ya no dicen nada nuevo
+            return
+        self._window.append(failed)
+        self._failures += failed
+        while len(self._window) > max(1, settings.CIRCUIT_WINDOW_SIZE):
+            self._failures -= self._window.popleft()
+        if len(self._window) >= settings.CIRCUIT_MIN_CALLS and (
+            self._failures >= settings.CIRCUIT_FAILURE_RATIO * len(self._window)
+        ):
+            self._open(f"{self._failures}/{len(self._window)} recent attempts failed")
+
+    def release(self, probe: bool) -> None:
+        """Give back an admitted call whose outcome is not counted."""
+        if probe:
+            self._probes = max(0, self._probes - 1)
+
+    def _open(self, reason: str) -> None:
+        self._opened_at = self._clock()
+        self._transition(OPEN)
+        logger.warning(
+            "Circuit for %s opened (%s); failing fast for %.0fs", self.name, reason, settings.CIRCUIT_OPEN_SECONDS
+        )
+
+    def _transition(self, state: str) -> None:
+        previous, self._state = self._state, state
+        self._window.clear()
+        self._failures = 0
+        self._probes = 0
+        self._probe_successes = 0
+        CIRCUIT_TRANSITIONS.labels(state).inc()
+        if state != OPEN:
+            logger.info("Circuit for %s: %s -> %s", self.name, previous, state)
@@ -0,0 +1,97 @@
+from __future__ import annotations
+
+import asyncio
+import selectors
+from typing import Any, Awaitable, Optional, Protocol, TypeVar
+
+
+T = TypeVar("T")
+
+
+class Clock(Protocol):
+    """Time source and sleeper for pacing, cooldowns, batching and typing."""
+
+    def time(self) -> float: ...
+
+    async def sleep(self, seconds: float) -> None: ...
+
+
+class LoopClock:
+    """Time of the running event loop; virtual when the loop is a VirtualTimeLoop."""
+
+    def time(self) -> float:
+        return asyncio.get_running_loop().time()
+
+    async def sleep(self, seconds: float) -> None:
+        await asyncio.sleep(seconds)
+
+
+def loop_time() -> float:
+    return asyncio.get_running_loop().time()
+
+
+class _VirtualSelector:
+    """Wraps the real selector: when nothing is ready, jump the clock instead of blocking."""
+
+    def __init__(self, loop: "VirtualTimeLoop", selector: selectors.BaseSelector) -> None:
+        self._loop = loop
+        self._selector = selector
+
+    def select(self, timeout: Optional[float] = None) -> list:
+        events = self._selector.select(0)
+        if events or timeout == 0:
+            return events
+        if timeout is None:
+            # Sin timers pendientes solo la E/S real puede despertar al loop
+            return self._selector.select(None)
+        self._loop.advance(timeout)
+        return []
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._selector, name)
+
+
+class VirtualTimeLoop(asyncio.SelectorEventLoop):
+    """Event loop whose clock only moves when every task is waiting on a timer.
+
+    `loop.time()`, `asyncio.sleep`, `call_later` and `wait_for` timeouts all
+    run on virtual time, so code that paces itself with them (send lanes,
+    cooldowns, batch windows, typing simulation, inactivity deadlines) plays
+    hours of traffic in milliseconds and always in the same order. Real I/O
+    still works, but the clock does not wait for it: when no socket is ready
+    the loop jumps to the next timer. Use it with in-process fakes (LocalBackend,
+    bench.fake_discord), not with real network latency.
+    """
+
+    def __init__(self, start: float = 0.0) -> None:
+        super().__init__(selectors.DefaultSelector())
+        self._selector = _VirtualSelector(self, self._selector)
+        self._now = start
+        self.advanced = 0.0
+
+    def time(self) -> float:
+        return self._now
+
+    def advance(self, seconds: float) -> None:
+        if seconds > 0:
+            self._now += seconds
+            self.advanced += seconds
+
+
+def run_virtual(main: Awaitable[T], *, start: float = 0.0) -> T:
+    """Like asyncio.run, on a fresh VirtualTimeLoop."""
+    loop = VirtualTimeLoop(start)
+    try:
+        asyncio.set_event_loop(loop)
+        return loop.run_until_complete(main)
+    finally:
+        try:
+            pending = [t for t in asyncio.all_tasks(loop) if not t.done()]
+            for task in pending:
+                task.cancel()
+            if pending:
+                loop.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
+            loop.run_until_complete(loop.shutdown_asyncgens())
+        finally:
+            asyncio.set_event_loop(None)
+            loop.close()
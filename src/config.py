@@ -2,14 +2,12 @@ from __future__ import annotations
 
 import os
 from pathlib import Path
-from typing import Optional
+from typing import FrozenSet, List, Optional
 
-from dotenv import load_dotenv, find_dotenv
+from dotenv import dotenv_values, find_dotenv, load_dotenv
 from pydantic import BaseSettings, Field, validator
 import logging
 
-# Configurar logging básico temporalmente para debug
-logging.basicConfig(level=logging.DEBUG, format="%(name)s - %(levelname)s - %(message)s")
 logger = logging.getLogger(__name__)
 
 
@@ -39,14 +37,62 @@ class Settings(BaseSettings):
 
     # Optional with defaults
     GEMINI_MODEL: str = Field(default="gemini-2.5-flash")
+    GEMINI_BASE_URL: str = Field(default="https://generativelanguage.googleapis.com")
     REPLY_COOLDOWN_SECONDS: int = Field(default=10)
     TIMEOUT_S: int = Field(default=20)
     MAX_RETRIES: int = Field(default=3)
     DISCORD_SYSTEM_PROMPT: str = Field(default=DEFAULT_DISCORD_SYSTEM_PROMPT)
+
+    # Triggers del mismo canal dentro de la ventana van en una sola llamada a Gemini (0 = desactivado)
+    TRIGGER_BATCH_WINDOW_SECONDS: float = Field(default=2.0)
+    TRIGGER_BATCH_MAX_MESSAGES: int = Field(default=8)  # mensajes del lote que entran en el prompt
+
+    # Cliente HTTP compartido (pool keep-alive hacia la API de Gemini)
+    HTTP_MAX_CONNECTIONS: int = Field(default=20)
+    HTTP_MAX_KEEPALIVE_CONNECTIONS: int = Field(default=10)
+    HTTP_KEEPALIVE_EXPIRY_SECONDS: float = Field(default=60.0)
+    HTTP2_ENABLED: bool = Field(default=False)  # requiere `pip install httpx[http2]`
+
+    # Cuota compartida por todo el proceso: buckets RPM/TPM (0 = sin límite) y concurrencia AIMD
+    GEMINI_QUOTA_RPM: int = Field(default=0)
+    GEMINI_QUOTA_TPM: int = Field(default=0)
+    GEMINI_QUOTA_BURST_SECONDS: float = Field(default=10.0)  # cuánta cuota se puede gastar de golpe
+    GEMINI_MAX_CONCURRENCY: int = Field(default=8)  # techo de peticiones en vuelo; se reduce a la mitad con cada 429
+    GEMINI_RATE_LIMIT_PAUSE_SECONDS: float = Field(default=2.0)  # pausa global tras un 429 sin retryDelay/Retry-After
+
+    # Circuit breaker por modelo: con demasiados fallos (o intentos lentos) recientes las llamadas fallan al instante
+    CIRCUIT_BREAKER_ENABLED: bool = Field(default=True)
+    CIRCUIT_WINDOW_SIZE: int = Field(default=20)  # últimos intentos que cuentan
+    CIRCUIT_MIN_CALLS: int = Field(default=10)  # sin tantos intentos en la ventana no se abre
+    CIRCUIT_FAILURE_RATIO: float = Field(default=0.5)
+    CIRCUIT_SLOW_CALL_SECONDS: float = Field(default=10.0)  # un intento más lento cuenta como fallo (0 = no)
+    CIRCUIT_OPEN_SECONDS: float = Field(default=30.0)  # tiempo abierto antes de probar de nuevo
+    CIRCUIT_HALF_OPEN_PROBES: int = Field(default=2)  # intentos de prueba que deben salir bien para cerrar
+
+    # Backend de generación: "gemini" o "local" (respuestas deterministas sin red, para pruebas)
+    LLM_BACKEND: str = Field(default="gemini")
+    # Hedging: si GEMINI_MODEL no responde en su percentil LLM_HEDGE_PERCENTILE, se pide también a LLM_HEDGE_MODEL
+    LLM_HEDGE_ENABLED: bool = Field(default=False)
+    LLM_HEDGE_MODEL: str = Field(default="gemini-2.5-flash-lite")
+    LLM_HEDGE_PERCENTILE: float = Field(default=95.0)
+    LLM_HEDGE_MIN_DELAY_SECONDS: float = Field(default=1.0)  # nunca antes de esto (y mientras no hay muestras)
+    LLM_HEDGE_MAX_RATIO: float = Field(default=0.1)  # fracción máxima de peticiones con hedge
+
+    # Streaming (streamGenerateContent): corta en cuanto hay texto para el formato compacto
+    GEMINI_STREAMING_ENABLED: bool = Field(default=False)
+
+    # Caché de contexto en Gemini (cachedContents) para el system prompt
+    GEMINI_CONTEXT_CACHE_ENABLED: bool = Field(default=False)
+    GEMINI_CONTEXT_CACHE_TTL_SECONDS: int = Field(default=3600)
+    GEMINI_CONTEXT_CACHE_REFRESH_MARGIN_SECONDS: float = Field(default=300.0)  # renovar antes de caducar
+    GEMINI_CONTEXT_CACHE_RETRY_SECONDS: float = Field(default=600.0)  # espera tras un fallo al crearla
     
     # Optional: filtros de canal/servidor (si están vacíos, escucha en todos)
     ALLOWED_GUILD_IDS: Optional[str] = Field(default=None)  # comma-separated IDs
     ALLOWED_CHANNEL_IDS: Optional[str] = Field(default=None)  # comma-separated IDs
+
+    # Recarga en caliente de .env (además de SIGHUP): cada cuánto mirar si cambió (0 = solo SIGHUP)
+    SETTINGS_RELOAD_POLL_SECONDS: float = Field(default=0.0)
     
     # Configuración para simular comportamiento humano
     MIN_TYPING_DELAY: float = Field(default=2.0)  # Mínimo tiempo "pensando"
@@ -64,11 +110,83 @@ class Settings(BaseSettings):
 
     # Cola por canal
     QUEUE_MAX_SIZE_PER_CHANNEL: int = Field(default=10)
+    SEND_CONCURRENCY: int = Field(default=16)  # corrutinas de envío compartidas por todos los canales
+    # Coalescing: los envíos de un canal que llegan dentro de la ventana salen en un solo mensaje (0 = uno a uno)
     COALESCE_WINDOW_SECONDS: float = Field(default=2.0)
+    COALESCE_MAX_ITEMS: int = Field(default=5)  # con tantos pendientes se envía sin esperar al resto de la ventana
+    COALESCE_MAX_CHARS: int = Field(default=2000)  # tope del mensaje fusionado (nunca más que el límite de Discord)
+    # Control de admisión antes de llamar a Gemini (las menciones toleran la espera completa, los replies la mitad)
+    ADMISSION_MAX_WAIT_SECONDS: float = Field(default=30.0)
+    ADMISSION_MAX_GEMINI_WAITING: int = Field(default=32)  # replies se descartan con tantas peticiones esperando cuota
+
+    # Estado en memoria (por canal y por canal+autor), acotado por TTL y LRU
+    STATE_TTL_SECONDS: float = Field(default=86400.0)  # canales sin uso durante este tiempo se olvidan
+    STATE_MAX_CHANNELS: int = Field(default=5000)
+    STATE_MAX_COOLDOWNS: int = Field(default=20000)
+    SENT_INDEX_WINDOW_SECONDS: float = Field(default=21600.0)  # IDs propios recordados para detectar replies sin HTTP
+    SENT_INDEX_MAX_IDS: int = Field(default=50000)
+    MEMORY_MAX_TURNS: int = Field(default=20)  # turnos de conversación por canal
+    HISTORY_TOKEN_BUDGET: int = Field(default=1000)  # tokens estimados de historial por petición (0 = sin límite)
+
+    # Resumen rodante: al pasar SUMMARY_TRIGGER_TOKENS, los turnos viejos se pliegan en segundo plano en un resumen
+    SUMMARY_ENABLED: bool = Field(default=False)
+    SUMMARY_TRIGGER_TOKENS: int = Field(default=600)  # tokens estimados de historial (resumen incluido)
+    SUMMARY_KEEP_TURNS: int = Field(default=8)  # turnos recientes que nunca se pliegan
+    SUMMARY_MAX_CHARS: int = Field(default=600)
+    SUMMARY_CONCURRENCY: int = Field(default=1)  # resúmenes generándose a la vez (prioridad más baja en la cuota)
+
+    # Memoria a largo plazo por canal: ventana reciente + los intercambios antiguos más parecidos al prompt
+    VECTOR_MEMORY_ENABLED: bool = Field(default=False)
+    VECTOR_EMBEDDER: str = Field(default="hashing")  # "hashing" (local, determinista) o "gemini" (batchEmbedContents)
+    VECTOR_EMBEDDING_MODEL: str = Field(default="text-embedding-004")
+    VECTOR_DIM: int = Field(default=256)  # dimensiones del embedder "hashing"
+    VECTOR_RECENT_TURNS: int = Field(default=6)  # últimos turnos que siempre van en el prompt
+    VECTOR_TOP_K: int = Field(default=3)  # intercambios antiguos recuperados por petición
+    VECTOR_MIN_SCORE: float = Field(default=0.2)  # similitud coseno mínima para recuperar un intercambio
+    VECTOR_MAX_ITEMS_PER_CHANNEL: int = Field(default=128)  # intercambios indexados por canal (se pisan los más viejos)
+
+    # Memoria persistente opcional: "memory" (solo en proceso) o "sqlite" (WAL, escritura diferida)
+    MEMORY_BACKEND: str = Field(default="memory")
+    MEMORY_DB_PATH: str = Field(default="memory.sqlite3")
+    MEMORY_FLUSH_INTERVAL_SECONDS: float = Field(default=1.0)
+    MEMORY_FLUSH_BATCH_SIZE: int = Field(default=200)
+    MEMORY_DB_MAX_TURNS_PER_CHANNEL: int = Field(default=200)
+
+    # Logging: se formatea y escribe en un hilo aparte; el event loop solo encola
+    LOG_LEVEL: str = Field(default="INFO")
+    LOG_LEVELS: str = Field(default="httpx=WARNING,httpcore=WARNING,discord=INFO")  # nivel por logger: "nombre=NIVEL,..."
+    LOG_FORMAT: str = Field(default="text")  # "text" o "json" (una línea JSON por registro)
+    LOG_QUEUE_MAX_SIZE: int = Field(default=10000)  # con la cola llena se descartan registros en vez de bloquear
+    LOG_RATE_LIMIT_BURST: int = Field(default=5)  # avisos/errores iguales por ventana antes de resumirlos (0 = sin límite)
+    LOG_RATE_LIMIT_WINDOW_SECONDS: float = Field(default=60.0)
+
+    # Métricas (siempre se recogen en proceso); endpoint OpenMetrics/Prometheus opcional
+    METRICS_HTTP_ENABLED: bool = Field(default=False)
+    METRICS_HTTP_HOST: str = Field(default="127.0.0.1")
+    METRICS_HTTP_PORT: int = Field(default=9464)
+
+    # Event loop: "asyncio" o "uvloop" (si está instalado); vigilancia de retraso y llamadas bloqueantes
+    EVENT_LOOP: str = Field(default="asyncio")
+    LOOP_MONITOR_ENABLED: bool = Field(default=True)
+    LOOP_MONITOR_INTERVAL_SECONDS: float = Field(default=0.25)  # cada cuánto se mide el retraso del loop
+    LOOP_SLOW_CALLBACK_SECONDS: float = Field(default=0.1)  # bloqueos más largos se registran con su pila
+
+    # Trazas por trigger (muestreo en cabeza): "jsonl" a fichero local u "otlp" a un colector OTLP/HTTP
+    TRACING_ENABLED: bool = Field(default=False)
+    TRACING_SAMPLE_RATE: float = Field(default=0.1)  # fracción de triggers trazados
+    TRACING_EXPORTER: str = Field(default="jsonl")
+    TRACING_JSONL_PATH: str = Field(default="traces.jsonl")
+    TRACING_OTLP_ENDPOINT: str = Field(default="http://127.0.0.1:4318/v1/traces")
+    TRACING_FLUSH_INTERVAL_SECONDS: float = Field(default=2.0)
 
     # Mensaje aleatorio por inactividad
     INACTIVITY_ENABLED: bool = Field(default=True)
     INACTIVITY_SECONDS: float = Field(default=60)  # 5 minutos
+    INACTIVITY_CONCURRENCY: int = Field(default=4)  # generaciones de inactividad en paralelo
+    # Pool de mensajes de inactividad generados de antemano en segundo plano (0 = generar al vencer)
+    INACTIVITY_POOL_SIZE: int = Field(default=1)  # mensajes pregenerados por canal
+    INACTIVITY_POOL_MAX_AGE_SECONDS: float = Field(default=1800.0)  # los más viejos se descartan sin usarse
+    INACTIVITY_POOL_LEAD_SECONDS: float = Field(default=20.0)  # antelación con la que se genera cada mensaje antes de su plazo
 
     class Config:
         env_file = ".env"
@@ -81,30 +199,177 @@ class Settings(BaseSettings):
             raise ValueError("Configuration values must be non-negative")
         return v
 
+    @validator("MEMORY_BACKEND")
+    def _memory_backend(cls, v: str) -> str:  # noqa: N805
+        v = v.strip().lower()
+        if v not in ("memory", "sqlite"):
+            raise ValueError("MEMORY_BACKEND must be 'memory' or 'sqlite'")
+        return v
+
+    @validator("LLM_BACKEND")
+    def _llm_backend(cls, v: str) -> str:  # noqa: N805
+        v = v.strip().lower()
+        if v not in ("gemini", "local"):
+            raise ValueError("LLM_BACKEND must be 'gemini' or 'local'")
+        return v
+
+    @validator("LOG_FORMAT")
+    def _log_format(cls, v: str) -> str:  # noqa: N805
+        v = v.strip().lower()
+        if v not in ("text", "json"):
+            raise ValueError("LOG_FORMAT must be 'text' or 'json'")
+        return v
+
+    @validator("LOG_LEVEL")
+    def _log_level(cls, v: str) -> str:  # noqa: N805
+        v = v.strip().upper()
+        if not isinstance(logging.getLevelName(v), int):
+            raise ValueError(f"Unknown LOG_LEVEL {v!r}")
+        return v
+
+    @validator("EVENT_LOOP")
+    def _event_loop(cls, v: str) -> str:  # noqa: N805
+        v = v.strip().lower()
+        if v not in ("asyncio", "uvloop"):
+            raise ValueError("EVENT_LOOP must be 'asyncio' or 'uvloop'")
+        return v
+
+    @validator("VECTOR_EMBEDDER")
+    def _vector_embedder(cls, v: str) -> str:  # noqa: N805
+        v = v.strip().lower()
+        if v not in ("hashing", "gemini"):
+            raise ValueError("VECTOR_EMBEDDER must be 'hashing' or 'gemini'")
+        return v
+
+    @validator("TRACING_EXPORTER")
+    def _tracing_exporter(cls, v: str) -> str:  # noqa: N805
+        v = v.strip().lower()
+        if v not in ("jsonl", "otlp"):
+            raise ValueError("TRACING_EXPORTER must be 'jsonl' or 'otlp'")
+        return v
+
+    @validator("ALLOWED_GUILD_IDS", "ALLOWED_CHANNEL_IDS")
+    def _id_list(cls, v: Optional[str], field) -> Optional[str]:  # noqa: N805
+        # Una lista mal escrita no puede quedar en "sin filtro": la recarga falla y se mantiene la anterior
+        if v:
+            try:
+                _parse_ids(v)
+            except ValueError:
+                raise ValueError(f"{field.name} must be comma-separated integer IDs, got {v!r}") from None
+        return v
+
     def get_allowed_guild_ids(self) -> set[int]:
         """Parse comma-separated guild IDs into a set of integers."""
-        if not self.ALLOWED_GUILD_IDS:
-            return set()
-        try:
-            return {int(gid.strip()) for gid in self.ALLOWED_GUILD_IDS.split(",") if gid.strip()}
-        except ValueError:
-            return set()
+        return _parse_ids(self.ALLOWED_GUILD_IDS) if self.ALLOWED_GUILD_IDS else set()
 
     def get_allowed_channel_ids(self) -> set[int]:
         """Parse comma-separated channel IDs into a set of integers."""
-        if not self.ALLOWED_CHANNEL_IDS:
-            return set()
-        try:
-            return {int(cid.strip()) for cid in self.ALLOWED_CHANNEL_IDS.split(",") if cid.strip()}
-        except ValueError:
-            return set()
+        return _parse_ids(self.ALLOWED_CHANNEL_IDS) if self.ALLOWED_CHANNEL_IDS else set()
+
+
+def _parse_ids(value: str) -> set[int]:
+    return {int(part.strip()) for part in value.split(",") if part.strip()}
+
+
+class LocationFilter:
+    """ALLOWED_GUILD_IDS / ALLOWED_CHANNEL_IDS parsed once into frozensets."""
+
+    __slots__ = ("guild_ids", "channel_ids", "allow_all")
+
+    def __init__(self, guild_ids: FrozenSet[int], channel_ids: FrozenSet[int]) -> None:
+        self.guild_ids = guild_ids
+        self.channel_ids = channel_ids
+        self.allow_all = not guild_ids and not channel_ids
+
+    @classmethod
+    def from_settings(cls, s: Settings) -> "LocationFilter":
+        return cls(frozenset(s.get_allowed_guild_ids()), frozenset(s.get_allowed_channel_ids()))
+
+    def allows(self, guild_id: Optional[int], channel_id: int) -> bool:
+        if self.allow_all:
+            return True
+        if self.guild_ids and guild_id not in self.guild_ids:
+            return False
+        if self.channel_ids and channel_id not in self.channel_ids:
+            return False
+        return True
+
+
+# Cambiarlos en caliente no tiene efecto hasta reiniciar (sesión, pools y sockets ya abiertos)
+RESTART_REQUIRED_FIELDS = frozenset({
+    "DISCORD_TOKEN",
+    "HTTP_MAX_CONNECTIONS",
+    "HTTP_MAX_KEEPALIVE_CONNECTIONS",
+    "HTTP_KEEPALIVE_EXPIRY_SECONDS",
+    "HTTP2_ENABLED",
+    "MEMORY_BACKEND",
+    "MEMORY_DB_PATH",
+    "METRICS_HTTP_HOST",
+    "METRICS_HTTP_PORT",
+    "LOG_FORMAT",
+    "LOG_QUEUE_MAX_SIZE",
+    "SUMMARY_CONCURRENCY",
+    "EVENT_LOOP",
+    "LOOP_MONITOR_ENABLED",
+    # Leídos al construir el estado, los semáforos o en on_ready
+    "STATE_TTL_SECONDS",
+    "STATE_MAX_CHANNELS",
+    "STATE_MAX_COOLDOWNS",
+    "MEMORY_MAX_TURNS",
+    "SENT_INDEX_WINDOW_SECONDS",
+    "SENT_INDEX_MAX_IDS",
+    "SEND_CONCURRENCY",
+    "INACTIVITY_CONCURRENCY",
+    "TRACING_ENABLED",
+    "TRACING_SAMPLE_RATE",
+    "TRACING_EXPORTER",
+    "TRACING_JSONL_PATH",
+    "TRACING_OTLP_ENDPOINT",
+    "TRACING_FLUSH_INTERVAL_SECONDS",
+    "METRICS_HTTP_ENABLED",
+})
+
+
+# Entorno del proceso antes de aplicar .env: al recargar, lo que .env ya no define vuelve a esto
+_process_env = dict(os.environ)
+_env_file_keys: FrozenSet[str] = frozenset()
+
+
+def _load_env_file() -> bool:
+    """(Re)apply .env over the process environment, undoing keys removed from the file."""
+    global _env_file_keys
+    for key in _env_file_keys:
+        if key in _process_env:
+            os.environ[key] = _process_env[key]
+        else:
+            os.environ.pop(key, None)
+    if not env_path:
+        _env_file_keys = frozenset()
+        return False
+    _env_file_keys = frozenset(k for k, v in dotenv_values(env_path).items() if v is not None)
+    return load_dotenv(dotenv_path=env_path, override=True)
 
 
 # Busca y carga .env desde el directorio de trabajo hacia arriba
 env_path = find_dotenv(filename=".env", usecwd=True)
-loaded = load_dotenv(dotenv_path=env_path, override=True)
+loaded = _load_env_file()
 # Debug prints removidos - ya funciona
 
 settings = Settings()  # Singleton for app-wide config
 
 
+def reload_settings() -> List[str]:
+    """Re-read .env and the environment into the `settings` singleton.
+
+    The new Settings is fully validated before anything changes; on a
+    validation error the current settings stay in place and the error is
+    raised. Fields are then swapped in a single dict update, so code on the
+    event loop never sees a half-applied reload. Returns the changed fields.
+    """
+    _load_env_file()
+    fresh = Settings()
+    changed = [name for name in fresh.__fields__ if getattr(fresh, name) != getattr(settings, name)]
+    settings.__dict__.update(fresh.__dict__)
+    return changed
+
+
@@ -3,37 +3,211 @@ from __future__ import annotations
 import asyncio
 import logging
 import random
-from typing import Dict, Tuple, List, Optional
+import time
+from typing import List, Optional, Tuple
 
 import discord
 from discord.ext import commands
 
-from .config import settings
-from .gemini_client import generate_reply
+from . import llm_backend, vector_index
+from .admission import AdmissionController
+from .circuit_breaker import CircuitOpenError
+from .clock import Clock, LoopClock
+from .config import LocationFilter, settings
+from .gemini_client import (
+    PRIORITY_BACKGROUND,
+    PRIORITY_INACTIVITY,
+    PRIORITY_MENTION,
+    PRIORITY_REPLY,
+    close_client,
+    open_client,
+    quota,
+)
+from .inactivity import InactivityEngine, InactivityPool
+from .llm_backend import generate_reply
+from .logging_config import apply_levels
+from .loop_monitor import LoopMonitor
+from .memory_store import SQLiteMemoryStore
+from .metrics import REGISTRY, SEND_ERRORS, STAGE_SECONDS, TRIGGER_BATCH_SIZE, MetricsServer
+from .payload_builder import Turn
+from .send_scheduler import SendItem, SendScheduler
+from .settings_reloader import SettingsReloader
+from .state_store import ChannelState, SentMessageIndex, StateStore
+from .summarizer import HistoryCompactor, with_summary
+from .tracing import AnySpan, tracer
 
 
 logger = logging.getLogger(__name__)
 
+# Histogramas por etapa, resueltos una vez para no buscar etiquetas en cada mensaje
+_TRIGGER_SECONDS = STAGE_SECONDS.labels("trigger")
+_GENERATION_SECONDS = STAGE_SECONDS.labels("generation")
+_FORMATTING_SECONDS = STAGE_SECONDS.labels("formatting")
+_TYPING_SECONDS = STAGE_SECONDS.labels("typing")
+_SEND_SECONDS = STAGE_SECONDS.labels("send")
+_RECALL_SECONDS = STAGE_SECONDS.labels("recall")
+
+
+class SelfBot(commands.Bot):
+    """Bot with hooks to open and release shared resources."""
+
+    async def setup_hook(self) -> None:
+        # Una vez, tras el login y antes del gateway: ningún mensaje llega sin la base abierta
+        # y on_ready (que se repite en cada reconexión completa) no espera al disco
+        try:
+            await open_memory_store()
+        except Exception as e:  # noqa: BLE001
+            logger.error("Failed to open memory store at %s; keeping history in memory only: %s", settings.MEMORY_DB_PATH, e)
+
+    async def close(self) -> None:
+        try:
+            await settings_reloader.stop()
+            await inactivity.close()
+            await inactivity_pool.close()
+            await compactor.close()
+            await send_scheduler.close()
+            await close_client()
+            await metrics_server.stop()
+            await tracer.stop()
+            await loop_monitor.stop()
+            await close_memory_store()
+        finally:
+            await super().close()
+
 
 # discord.py-self no necesita intents explícitos para selfbots
 # Los selfbots tienen acceso a todos los eventos por defecto
-bot = commands.Bot(command_prefix="!", self_bot=True)
+bot = SelfBot(command_prefix="!", self_bot=True)
+
+
+# Reloj y sleeper de pacing, cooldowns, lotes y typing; sustituible (p. ej. en simulaciones).
+# Con el LoopClock por defecto, un VirtualTimeLoop (src/clock.py) hace virtual todo el cliente
+clock: Clock = LoopClock()
+
+
+def _loop_time() -> float:
+    return clock.time()
+
 
-# Cooldown dictionary: key=(channel_id, author_id) -> last_reply_time
-cooldowns: Dict[Tuple[int, int], float] = {}
-# Pacing por canal para evitar 429
-last_send_by_channel: Dict[int, float] = {}
-# Colas y workers por canal
-send_queues: Dict[int, asyncio.Queue] = {}
-send_workers: Dict[int, asyncio.Task] = {}
+# Estado por canal (último trigger, memoria) y cooldowns por
+# (canal, autor), acotados por TTL y LRU para no crecer con cada canal visto
+state = StateStore(
+    max_channels=settings.STATE_MAX_CHANNELS,
+    max_cooldowns=settings.STATE_MAX_COOLDOWNS,
+    ttl_seconds=settings.STATE_TTL_SECONDS,
+    memory_turns=settings.MEMORY_MAX_TURNS,
+    clock=_loop_time,
+)
 
-# Seguimiento de actividad (último trigger por canal)
-last_trigger_by_channel: Dict[int, float] = {}
-inactivity_task: Optional[asyncio.Task] = None
+# IDs de nuestros propios mensajes: responde "¿es un reply a nosotros?" sin fetch_message
+sent_index = SentMessageIndex(
+    window_seconds=settings.SENT_INDEX_WINDOW_SECONDS,
+    max_ids=settings.SENT_INDEX_MAX_IDS,
+)
 
-# Memoria por canal: guarda hasta 20 últimos intercambios donde nos mencionan
-# Estructura: channel_id -> List[{"role": "user"|"model", "text": str}]
-memory_by_channel: Dict[int, List[Dict[str, str]]] = {}
+# Backend persistente opcional de la memoria de conversación (MEMORY_BACKEND=sqlite)
+memory_store: Optional[SQLiteMemoryStore] = None
+
+
+async def open_memory_store() -> Optional[SQLiteMemoryStore]:
+    global memory_store
+    if memory_store is None and settings.MEMORY_BACKEND == "sqlite":
+        store = SQLiteMemoryStore(
+            settings.MEMORY_DB_PATH,
+            flush_interval=settings.MEMORY_FLUSH_INTERVAL_SECONDS,
+            batch_size=settings.MEMORY_FLUSH_BATCH_SIZE,
+            max_turns_per_channel=settings.MEMORY_DB_MAX_TURNS_PER_CHANNEL,
+        )
+        # Solo se instala si arrancó: uno a medias haría esperar cada carga y acumularía escrituras
+        await store.start()
+        memory_store = store
+    return memory_store
+
+
+async def close_memory_store() -> None:
+    global memory_store
+    store, memory_store = memory_store, None
+    if store is not None:
+        await store.close()
+
+
+async def _ensure_history_loaded(ch: ChannelState) -> None:
+    """Load the channel's persisted history the first time it is needed."""
+    if ch.history_loaded or memory_store is None:
+        return
+    if ch.history_loader is None:
+        ch.history_loader = asyncio.ensure_future(_load_history(ch.channel_id))
+    try:
+        turns, indexed = await ch.history_loader
+    except Exception as e:  # noqa: BLE001
+        logger.warning("Failed to load history for channel %s: %s", ch.channel_id, e)
+        turns, indexed = [], []
+    if not ch.history_loaded:
+        ch.history_loaded = True
+        ch.history_loader = None
+        # Lo persistido es más antiguo que lo que ya haya en memoria; el maxlen
+        # del deque se queda con los turnos más recientes
+        merged = turns + list(ch.memory)
+        ch.memory.clear()
+        ch.memory.extend(merged)
+        if ch.vectors is None:
+            for user, model, vector in indexed:
+                ch.vectors = vector_index.index_exchange(ch.vectors, vector, user, model)
+
+
+async def _load_history(channel_id: int) -> Tuple[List[Turn], List[Tuple[Turn, Turn, vector_index.Vector]]]:
+    """Persisted turns, plus their (user, model) exchanges embedded in one batch if vector memory is on."""
+    limit = settings.MEMORY_MAX_TURNS
+    if settings.VECTOR_MEMORY_ENABLED:
+        # Lo que no cabe en la memoria reciente sigue siendo recuperable por similitud
+        limit = max(limit, 2 * settings.VECTOR_MAX_ITEMS_PER_CHANNEL)
+    turns = [Turn(t["role"], t["text"]) for t in await memory_store.load(channel_id, limit)]
+    indexed: List[Tuple[Turn, Turn, vector_index.Vector]] = []
+    pairs = vector_index.pair_turns(turns) if settings.VECTOR_MEMORY_ENABLED else []
+    if pairs:
+        try:
+            vectors = await vector_index.embedder.embed([user.text for user, _ in pairs])
+        except Exception as e:  # noqa: BLE001
+            logger.warning("Failed to embed history for channel %s: %s", channel_id, e)
+        else:
+            indexed = [(user, model, vector) for (user, model), vector in zip(pairs, vectors)]
+    return turns, indexed
+
+
+async def _history_for(ch: ChannelState, content: str) -> Tuple[List[Turn], Optional[vector_index.Vector]]:
+    """History for the prompt and the prompt's embedding (None without vector memory).
+
+    With VECTOR_MEMORY_ENABLED: the last VECTOR_RECENT_TURNS turns plus the
+    VECTOR_TOP_K older exchanges most similar to the prompt. Otherwise, or if
+    embedding fails, the whole recent memory (MEMORY_MAX_TURNS). The channel's
+    rolling summary, if any, goes first.
+    """
+    history = list(ch.memory)
+    if not settings.VECTOR_MEMORY_ENABLED:
+        return with_summary(ch, history), None
+    started = time.perf_counter()
+    with tracer.span("recall") as span:
+        try:
+            query = (await vector_index.embedder.embed([content]))[0]
+        except Exception as e:  # noqa: BLE001
+            logger.warning("Embedding failed for channel %s, using recent history only: %s", ch.channel_id, e)
+            return with_summary(ch, history), None
+        recent = settings.VECTOR_RECENT_TURNS
+        window = history[-recent:] if recent > 0 else []
+        # Fijados: el recorte a HISTORY_TOKEN_BUDGET quita antes los recientes más viejos
+        recalled = [turn.pin() for turn in vector_index.recall(ch.vectors, query, recent)]
+        span.set("recalled_turns", len(recalled))
+    _RECALL_SECONDS.observe(time.perf_counter() - started)
+    return with_summary(ch, recalled + window), query
+
+
+def _remember(ch: ChannelState, role: str, text: str) -> Turn:
+    # El turno se serializa una vez aquí y se reutiliza en cada petición posterior
+    turn = Turn(role, text)
+    ch.memory.append(turn)
+    if memory_store is not None:
+        memory_store.append(ch.channel_id, role, text)
+    return turn
 
 
 async def _simulate_human_typing(text: str, channel) -> None:
@@ -43,161 +217,231 @@ async def _simulate_human_typing(text: str, channel) -> None:
     # Tiempo inicial de "pensamiento" (más variable)
     thinking_time = random.uniform(settings.MIN_TYPING_DELAY, min(settings.MAX_TYPING_DELAY, settings.TYPING_MAX_SECONDS_CAP))
     # Breve pre-pausa
-    await asyncio.sleep(thinking_time)
+    await clock.sleep(thinking_time)
     # Tiempo de "escritura" basado en longitud del texto, cap pequeño para fluidez
     word_count = max(1, len(text.split()))
     typing_time = min(max(0.4, word_count / settings.WORDS_PER_SECOND), settings.TYPING_MAX_SECONDS_CAP)
     # Variación natural
     typing_time *= random.uniform(0.85, 1.15)
     async with channel.typing():
-        await asyncio.sleep(typing_time)
-
-
-def _ensure_send_worker(channel_id: int) -> None:
-    if channel_id in send_queues:
+        await clock.sleep(typing_time)
+
+
+async def _deliver(items: List[SendItem]) -> None:
+    """Send one scheduled batch as a single message: simulated typing, then reply/send.
+
+    Coalesced items are joined line by line (the scheduler keeps the result
+    within Discord's limit). A batch is either all replies of one channel or
+    all plain channel sends; a merged reply answers the newest message of the
+    batch, so it lands right below everything it answers.
+    """
+    item = items[-1]
+    reply_to: Optional[discord.Message] = item.get("reply_to")
+    if reply_to is not None and len(items) > 1:
+        # Los IDs de Discord crecen con el tiempo: el más alto es el mensaje más reciente
+        reply_to = max((i["reply_to"] for i in items), key=lambda m: m.id)
+    content: str = "\n".join(i["content"] for i in items) if len(items) > 1 else item["content"]
+    channel = reply_to.channel if reply_to is not None else item.get("channel")
+    if channel is None:
         return
-    queue: asyncio.Queue = asyncio.Queue(maxsize=settings.QUEUE_MAX_SIZE_PER_CHANNEL)
-    send_queues[channel_id] = queue
-
-    async def _worker() -> None:
-        while True:
-            # Coalesce window: agrupar items cercanos para no saltarnos mensajes
-            item = await queue.get()
-            try:
-                reply_to: Optional[discord.Message] = item.get("reply_to")
-                content: str = item["content"]
-                channel = reply_to.channel if reply_to is not None else item.get("channel")
-                if channel is None:
-                    continue
-                # Pequeña ventana para coalescer si hay más items pendientes
-                coalesced = [content]
-                try:
-                    with asyncio.timeout(settings.COALESCE_WINDOW_SECONDS):
-                        while True:
-                            nxt = queue.get_nowait()
-                            coalesced.append(nxt["content"])
-                            queue.task_done()
-                except Exception:
-                    pass
-                content = "\n".join(coalesced)
-
-                # Simular comportamiento humano
-                await _simulate_human_typing(content, channel)
-
-                # Pacing por canal antes de enviar
-                now_send = asyncio.get_running_loop().time()
-                last_send = last_send_by_channel.get(channel.id, 0.0)
-                min_gap = settings.MIN_SECONDS_BETWEEN_MESSAGES_PER_CHANNEL
-                jitter = random.uniform(0.0, settings.SEND_JITTER_SECONDS)
-                wait_needed = (last_send + min_gap) - now_send
-                if wait_needed > 0:
-                    await asyncio.sleep(wait_needed + jitter)
 
+    for queued in items:
+        if queued.get("span") is not None:
+            # Incluye la espera de pacing (y de coalescing) del canal: el scheduler libera el carril cuando toca
+            tracer.span("queue_wait", parent=queued["span"], start_ns=queued["enqueued_ns"]).end()
+    span = items[-1].get("span")
+
+    with tracer.activate(span):
+        # Simular comportamiento humano
+        started = time.perf_counter()
+        with tracer.span("typing"):
+            await _simulate_human_typing(content, channel)
+        typed = time.perf_counter()
+        _TYPING_SECONDS.observe(typed - started)
+
+        try:
+            with tracer.span("send"):
                 if reply_to is not None:
-                    await reply_to.reply(content, mention_author=False)
+                    sent = await reply_to.reply(content, mention_author=False)
                 else:
-                    await channel.send(content)
-                last_send_by_channel[channel.id] = asyncio.get_running_loop().time()
-            except Exception as e:  # noqa: BLE001
-                logger.error("Send worker error", exc_info=e)
-            finally:
-                queue.task_done()
-
-    send_workers[channel_id] = asyncio.create_task(_worker())
+                    sent = await channel.send(content)
+        except Exception:
+            SEND_ERRORS.inc()
+            raise
+    if sent is not None:
+        sent_index.add(sent.id)
+    _SEND_SECONDS.observe(time.perf_counter() - typed)
+
+
+# Un único scheduler de envíos: carriles FIFO por canal + heap de deadlines de pacing
+send_scheduler = SendScheduler(lambda items: _deliver(items), clock=_loop_time)
+
+# Gauges leídos solo al hacer scrape: coste cero en el camino caliente
+REGISTRY.callback("discord_ia_send_queue_items", "Sends waiting in all channel lanes", send_scheduler.total_depth)
+REGISTRY.callback("discord_ia_send_queue_max_depth", "Deepest channel send lane", send_scheduler.max_depth)
+REGISTRY.callback("discord_ia_send_lanes", "Channels with a live send lane", send_scheduler.active_lanes)
+REGISTRY.callback("discord_ia_state", "Per-channel state store sizes and counters", state.counters, labelname="key")
+REGISTRY.callback(
+    "discord_ia_reply_index_lookups",
+    "Reply-to-us checks answered by the sent message index (hit/miss) or by fetching",
+    sent_index.counters,
+    kind="counter",
+    labelname="result",
+)
+REGISTRY.callback("discord_ia_reply_index_size", "Own message IDs in the sent message index", sent_index.__len__)
+
+metrics_server = MetricsServer(settings.METRICS_HTTP_HOST, settings.METRICS_HTTP_PORT)
+
+# Retraso del event loop y pilas de las llamadas que lo bloquean (LOOP_MONITOR_ENABLED)
+loop_monitor = LoopMonitor()
+
+REGISTRY.callback(
+    "discord_ia_event_loop", "Event loop implementation in use", loop_monitor.implementation, labelname="implementation"
+)
+
+# Filtros de ubicación compilados una vez; una recarga los sustituye de una sola asignación
+location_filter = LocationFilter.from_settings(settings)
+
+
+def _seed_inactivity_channels() -> None:
+    # Los canales permitidos cuentan como activos desde ahora para el mensaje de inactividad
+    now = clock.time()
+    for cid in location_filter.channel_ids:
+        ch = state.channel(cid)
+        if ch.last_trigger is None:
+            ch.last_trigger = now
+        inactivity.watch(cid)
+        inactivity_pool.watch(cid)
+
+
+def _on_settings_reloaded(changed: List[str]) -> None:
+    global location_filter
+    location_filter = LocationFilter.from_settings(settings)
+    if "ALLOWED_CHANNEL_IDS" in changed:
+        _seed_inactivity_channels()
+    if "INACTIVITY_SECONDS" in changed:
+        inactivity.reschedule()
+    if "INACTIVITY_SECONDS" in changed or "INACTIVITY_POOL_LEAD_SECONDS" in changed:
+        inactivity_pool.reschedule()
+    if any(name.startswith("LLM_") or name == "GEMINI_MODEL" for name in changed):
+        llm_backend.configure()
+    if any(name in ("VECTOR_EMBEDDER", "VECTOR_EMBEDDING_MODEL", "VECTOR_DIM") for name in changed):
+        vector_index.configure()
+    if any(name.startswith("LOG_") for name in changed):
+        apply_levels(settings)
+
+
+settings_reloader = SettingsReloader(_on_settings_reloaded)
 
 
 def _enqueue_send(message: discord.Message, content: str) -> None:
-    _ensure_send_worker(message.channel.id)
-    send_queues[message.channel.id].put_nowait({
+    item: SendItem = {
         "reply_to": message,
         "content": content,
-    })
+    }
+    span = tracer.current()
+    if span is not None:
+        # La traza sigue en la corrutina de envío a través del item de la cola
+        item["span"] = span
+        item["enqueued_ns"] = time.time_ns()
+    send_scheduler.enqueue(message.channel.id, item)
 
 
 def _enqueue_send_channel(channel: discord.abc.Messageable, content: str) -> None:
     channel_id = getattr(channel, "id", None)
     if channel_id is None:
         return
-    _ensure_send_worker(channel_id)
-    send_queues[channel_id].put_nowait({
+    send_scheduler.enqueue(channel_id, {
         "channel": channel,
         "content": content,
     })
 
 
-async def _inactivity_watcher() -> None:
-    check_interval = 30.0
-    while True:
-        await asyncio.sleep(check_interval)
-        if not settings.INACTIVITY_ENABLED:
-            continue
-        now = asyncio.get_running_loop().time()
-        for channel_id, last_ts in list(last_trigger_by_channel.items()):
-            if now - last_ts < settings.INACTIVITY_SECONDS:
-                continue
-            channel = bot.get_channel(channel_id)
-            if channel is None:
-                try:
-                    channel = await bot.fetch_channel(channel_id)  # type: ignore[attr-defined]
-                except Exception:
-                    continue
-            try:
-                history = memory_by_channel.get(channel_id, [])[-6:]
-                inactivity_prompt = (
-                    "inactividad: envía un saludo breve (1–2 líneas), natural y amistoso para reactivar la conversación. "
-                    "No menciones que eres IA ni expliques el motivo."
-                )
-                text = await generate_reply(inactivity_prompt, settings.DISCORD_SYSTEM_PROMPT, history=history)
-                text = _format_compact(text, max_lines=2, max_chars=220)
-            except Exception:
-                continue
-            if not text:
-                continue
-            _enqueue_send_channel(channel, text)
-            last_trigger_by_channel[channel_id] = now
+_INACTIVITY_PROMPT = (
+    "inactividad: envía un saludo breve (1–2 líneas), natural y amistoso para reactivar la conversación. "
+    "No menciones que eres IA ni expliques el motivo."
+)
 
 
-def _enqueue_send_channel(channel: discord.abc.Messageable, content: str) -> None:
-    channel_id = getattr(channel, "id", None)
-    if channel_id is None:
+def _last_activity(channel_id: int) -> Optional[float]:
+    # peek: los mensajes de inactividad no renuevan el TTL del canal
+    ch = state.peek(channel_id)
+    return ch.last_trigger if ch is not None else None
+
+
+async def _generate_inactivity_text(ch: ChannelState, priority: int = PRIORITY_INACTIVITY) -> str:
+    text = await generate_reply(
+        _INACTIVITY_PROMPT,
+        settings.DISCORD_SYSTEM_PROMPT,
+        history=list(ch.memory)[-6:],
+        sink=CompactFormatter(),
+        priority=priority,
+    )
+    return _format_compact(text, max_lines=2, max_chars=220)
+
+
+async def _send_inactivity_message(channel_id: int) -> None:
+    ch = state.peek(channel_id)
+    if ch is None:
         return
-    _ensure_send_worker(channel_id)
-    send_queues[channel_id].put_nowait({
-        "channel": channel,
-        "content": content,
-    })
+    # Sin hueco en el carril o con cola de cuota: no se gasta Gemini; el motor reintenta más tarde
+    if admission.admit(channel_id, PRIORITY_INACTIVITY) is not None:
+        return
+    try:
+        channel = bot.get_channel(channel_id)
+        if channel is None:
+            channel = await bot.fetch_channel(channel_id)  # type: ignore[attr-defined]
+        # Lo normal es que el pool ya lo tenga generado; si no, se genera ahora como antes
+        text = inactivity_pool.take(ch)
+        if text is None:
+            if llm_backend.circuit_open():
+                # Con Gemini caído ni se intenta: el motor vuelve a probar más tarde
+                return
+            text = await _generate_inactivity_text(ch)
+        if not text:
+            return
+        try:
+            _enqueue_send_channel(channel, text)
+        except asyncio.QueueFull:
+            admission.reject(PRIORITY_INACTIVITY, "queue_full_after_generation")
+            return
+        ch.last_trigger = clock.time()
+    finally:
+        admission.release(channel_id)
 
 
-async def _inactivity_watcher() -> None:
-    check_interval = 30.0
-    while True:
-        await asyncio.sleep(check_interval)
-        if not settings.INACTIVITY_ENABLED:
-            continue
-        now = asyncio.get_running_loop().time()
-        for channel_id, last_ts in list(last_trigger_by_channel.items()):
-            if now - last_ts < settings.INACTIVITY_SECONDS:
-                continue
-            channel = bot.get_channel(channel_id)
-            if channel is None:
-                try:
-                    channel = await bot.fetch_channel(channel_id)  # type: ignore[attr-defined]
-                except Exception:
-                    continue
-            try:
-                history = memory_by_channel.get(channel_id, [])[-6:]
-                inactivity_prompt = (
-                    "inactividad: envía un saludo breve (1–2 líneas), natural y amistoso para reactivar la conversación. "
-                    "No menciones que eres IA ni expliques el motivo."
-                )
-                msg = await generate_reply(inactivity_prompt, settings.DISCORD_SYSTEM_PROMPT, history=history)
-                msg = _format_compact(msg, max_lines=2, max_chars=220)
-            except Exception:
-                continue
-            if not msg:
-                continue
-            _enqueue_send_channel(channel, msg)
-            last_trigger_by_channel[channel_id] = now
+def _mean_delivery_seconds() -> float:
+    # Media observada de typing + envío; 0 hasta que haya muestras
+    total = 0.0
+    for child in (_TYPING_SECONDS, _SEND_SECONDS):
+        if child.count:
+            total += child.sum / child.count
+    return total
+
+
+admission = AdmissionController(send_scheduler.depth, lambda: quota.waiting, _mean_delivery_seconds)
+
+REGISTRY.callback("discord_ia_admission_reserved", "Admitted replies still generating", admission.reserved)
+
+# Resúmenes de historial en segundo plano (SUMMARY_ENABLED), con la prioridad más baja en la cuota
+compactor = HistoryCompactor(generate_reply, clock=_loop_time)
+
+REGISTRY.callback("discord_ia_summary_inflight", "History compactions being generated", compactor.inflight)
+
+inactivity = InactivityEngine(_send_inactivity_message, _last_activity, clock=_loop_time)
+
+REGISTRY.callback("discord_ia_inactivity_channels", "Channels with a pending inactivity deadline", inactivity.pending)
+REGISTRY.callback("discord_ia_inactivity_inflight", "Inactivity messages being generated", inactivity.inflight)
+
+# Mensajes de inactividad generados de antemano en los canales callados, en segundo plano
+inactivity_pool = InactivityPool(
+    lambda ch: _generate_inactivity_text(ch, PRIORITY_BACKGROUND),
+    lambda channel_id: state.peek(channel_id),
+    busy=lambda: quota.waiting > 0 or llm_backend.circuit_open(),
+    clock=_loop_time,
+)
+
+REGISTRY.callback("discord_ia_inactivity_pool_channels", "Channels with a pending pool fill", inactivity_pool.pending)
 
 
 def _format_compact(text: str, max_lines: int = 2, max_chars: int = 220) -> str:
@@ -230,6 +474,83 @@ def _format_compact(text: str, max_lines: int = 2, max_chars: int = 220) -> str:
     return compact.strip()
 
 
+def _compact_is_settled(text: str, max_lines: int = 2, max_chars: int = 220) -> bool:
+    """True if appending more text can no longer change _format_compact(text).
+
+    `text` must already be normalized (lines stripped and joined by spaces).
+    """
+    if len(text) > max_chars:
+        # el recorte a max_chars ya es definitivo
+        return True
+    # Frases completas que sobreviven al recorte (y al rstrip) de _format_compact
+    head = text[: max_chars - 2].replace("¿", "").replace("¡", "")
+    tokens = head.split(". ")
+    if not tokens[-1].strip():
+        return False
+    return sum(1 for t in tokens[:-1] if t) >= max_lines
+
+
+class CompactFormatter:
+    """Incremental front-end of _format_compact for streamed replies.
+
+    feed() returns True once the formatted result is fixed, so the caller can
+    stop reading the stream. Only the first max_chars of normalized text are
+    ever inspected, so each chunk costs O(max_chars) at most.
+    """
+
+    def __init__(self, max_lines: int = 2, max_chars: int = 220) -> None:
+        self.max_lines = max_lines
+        self.max_chars = max_chars
+        self.reset()
+
+    def reset(self) -> None:
+        self._chunks: List[str] = []
+        self._joined = ""  # líneas completas ya normalizadas
+        self._tail = ""  # línea en curso
+        self.settled = False
+
+    @property
+    def text(self) -> str:
+        return "".join(self._chunks)
+
+    def feed(self, chunk: str) -> bool:
+        self._chunks.append(chunk)
+        if self.settled:
+            return True
+        *complete, self._tail = (self._tail + chunk).split("\n")
+        for line in complete:
+            line = line.strip()
+            if line:
+                self._joined = f"{self._joined} {line}" if self._joined else line
+        tail = self._tail.strip()
+        current = f"{self._joined} {tail}" if self._joined and tail else (self._joined or tail)
+        self.settled = _compact_is_settled(current, self.max_lines, self.max_chars)
+        return self.settled
+
+    def result(self) -> str:
+        return _format_compact(self.text, max_lines=self.max_lines, max_chars=self.max_chars)
+
+
+def _batch_prompt(messages: List[discord.Message]) -> str:
+    """User text for a trigger batch: the lone message, or one "name: text" line each."""
+    if len(messages) == 1:
+        return messages[0].content or ""
+    lines = ["(varios mensajes seguidos; responde a todos en una sola respuesta)"]
+    for m in messages[-settings.TRIGGER_BATCH_MAX_MESSAGES:]:
+        name = getattr(m.author, "display_name", None) or m.author.name
+        lines.append(f"{name}: {m.content or ''}")
+    return "\n".join(lines)
+
+
+def _batch_text(messages: List[discord.Message]) -> str:
+    """What the batch's users wrote, one message per line: the user turn kept in memory."""
+    return "\n".join(m.content or "" for m in messages[-settings.TRIGGER_BATCH_MAX_MESSAGES:])
+
+
+def _mentions_us(message: discord.Message) -> bool:
+    return bot.user is not None and any(u.id == bot.user.id for u in message.mentions)
+
+
 def _should_trigger(message: discord.Message) -> bool:
     if message.author == bot.user:
         return False
@@ -259,7 +580,8 @@ async def _is_reply_to_us(message: discord.Message) -> bool:
     if not ref or not ref.message_id:
         return False
     try:
-        ref_msg = await message.channel.fetch_message(ref.message_id)
+        with tracer.span("is_reply_to_us"):
+            ref_msg = await message.channel.fetch_message(ref.message_id)
         return bot.user is not None and ref_msg.author.id == bot.user.id
     except Exception as e:  # noqa: BLE001
         logger.debug("Failed to fetch referenced message: %s", e)
@@ -269,55 +591,58 @@ async def _is_reply_to_us(message: discord.Message) -> bool:
 @bot.event
 async def on_ready() -> None:
     logger.info("Logged in as %s", bot.user)
-    global inactivity_task
-    if inactivity_task is None:
-        inactivity_task = asyncio.create_task(_inactivity_watcher())
+    loop_monitor.start()
+    # Tras una reconexión completa pudimos perdernos mensajes propios enviados desde otro cliente
+    sent_index.reset_coverage()
+    # Cliente HTTP compartido para Gemini (idempotente si hay reconexiones)
+    open_client()
+    tracer.start()
+    if settings.METRICS_HTTP_ENABLED:
+        try:
+            await metrics_server.start()
+        except OSError as e:
+            logger.error("Failed to start metrics endpoint: %s", e)
+    # Recarga de .env con SIGHUP (o sondeo del fichero) sin reconectar el gateway
+    settings_reloader.start()
+    inactivity.start()
+    inactivity_pool.start()
     # Inicializa seguimiento de inactividad para canales permitidos
     try:
-        now = asyncio.get_running_loop().time()
-        allowed_channels = settings.get_allowed_channel_ids()
-        if allowed_channels:
-            for cid in allowed_channels:
-                last_trigger_by_channel.setdefault(cid, now)
+        _seed_inactivity_channels()
     except Exception as e:  # noqa: BLE001
         logger.debug("Failed to seed inactivity channels: %s", e)
 
 
 def _is_allowed_location(message: discord.Message) -> bool:
     """Check if message is from allowed guild/channel based on config."""
-    allowed_guilds = settings.get_allowed_guild_ids()
-    allowed_channels = settings.get_allowed_channel_ids()
-    
-    # Si no hay filtros configurados, permitir todos
-    if not allowed_guilds and not allowed_channels:
+    if location_filter.allow_all:
         return True
-    
-    # Verificar guild si está configurado
-    if allowed_guilds:
-        guild_id = message.guild.id if message.guild else None
-        if guild_id not in allowed_guilds:
-            return False
-    
-    # Verificar canal si está configurado
-    if allowed_channels:
-        if message.channel.id not in allowed_channels:
-            return False
-    
-    return True
+    guild = message.guild
+    return location_filter.allows(guild.id if guild else None, message.channel.id)
 
 
 @bot.event
 async def on_message(message: discord.Message) -> None:
-    if message.author == bot.user:
-        return
-    
-    # Filtrar por canal/servidor permitido
+    # Filtrar por canal/servidor permitido antes de cualquier otro trabajo
     if not _is_allowed_location(message):
         return
 
+    if message.author == bot.user:
+        # También lo que escribimos desde otro cliente: un reply a eso es un reply a nosotros
+        sent_index.add(message.id)
+        return
+
+    # Raíz de la traza del trigger; se descarta si el mensaje no resulta ser un trigger
+    with tracer.trace("on_message", channel_id=message.channel.id) as root:
+        await _handle_message(message, root)
+
+
+async def _handle_message(message: discord.Message, root: AnySpan) -> None:
+    started = time.perf_counter()
     trigger = False
+    mentioned = _mentions_us(message)
     # Fast path: mention
-    if bot.user and any(u.id == bot.user.id for u in message.mentions):
+    if mentioned:
         trigger = True
     else:
         # Potential path: reply to us
@@ -326,49 +651,151 @@ async def on_message(message: discord.Message) -> None:
             if getattr(ref, "resolved", None) is not None:
                 trigger = bot.user is not None and ref.resolved.author.id == bot.user.id
             else:
-                trigger = await _is_reply_to_us(message)
+                # Índice local primero; fetch solo si el mensaje es anterior a lo que cubre
+                ours = sent_index.is_ours(ref.message_id)
+                trigger = ours if ours is not None else await _is_reply_to_us(message)
+    _TRIGGER_SECONDS.observe(time.perf_counter() - started)
 
     if not trigger:
+        root.drop()
         return
 
-    now = asyncio.get_running_loop().time()
-    key = (message.channel.id, message.author.id)
-    last = cooldowns.get(key, 0.0)
-    if now - last < settings.REPLY_COOLDOWN_SECONDS:
+    if not state.try_cooldown(message.channel.id, message.author.id, settings.REPLY_COOLDOWN_SECONDS):
+        root.set("outcome", "cooldown")
         return
-    cooldowns[key] = now
-    last_trigger_by_channel[message.channel.id] = now
+    ch = state.channel(message.channel.id)
+    ch.last_trigger = clock.time()
+    inactivity.watch(message.channel.id)
+    inactivity_pool.watch(message.channel.id)
 
-    content = message.content or ""
-    # Construir historial solo con las últimas 20 entradas para este canal
-    history = memory_by_channel.get(message.channel.id, [])[-20:]
+    if _join_pending_batch(ch, message):
+        root.set("outcome", "batched")
+        return
 
+    if llm_backend.circuit_open():
+        # Gemini caído: fallar ya en vez de esperar cuota y reintentos para nada
+        root.set("outcome", "circuit_open")
+        return
+
+    # Admisión antes de pagar la llamada a Gemini: si la respuesta
+    # no va a poder salir (carril lleno o demasiada espera) se descarta aquí
+    reason = admission.admit(message.channel.id, PRIORITY_MENTION if mentioned else PRIORITY_REPLY)
+    if reason is not None:
+        root.set("outcome", "shed")
+        root.set("shed_reason", reason)
+        return
     try:
-        reply_text = await generate_reply(
-            content,
-            settings.DISCORD_SYSTEM_PROMPT,
-            history=history,
-        )
+        await _answer(message, ch, root)
+    finally:
+        admission.release(message.channel.id)
+
+
+def _join_pending_batch(ch: ChannelState, message: discord.Message) -> bool:
+    """Queue the trigger behind the channel's reply in flight; False if there is none."""
+    if settings.TRIGGER_BATCH_WINDOW_SECONDS <= 0 or ch.pending_triggers is None:
+        return False
+    # Quien abrió la respuesta en curso responde también a este
+    if not ch.pending_triggers:
+        ch.pending_since = clock.time()
+    ch.pending_triggers.append(message)
+    return True
+
+
+async def _answer(message: discord.Message, ch: ChannelState, root: AnySpan) -> None:
+    """Answer the trigger at once, then the triggers batched behind it.
+
+    With TRIGGER_BATCH_WINDOW_SECONDS > 0, triggers of the channel that arrive
+    while a reply is being generated join a batch; when the reply is out, the
+    batch is answered by one follow-up call, once the window has passed since
+    its first trigger arrived. A trigger with nothing in flight never waits.
+    """
+    if settings.TRIGGER_BATCH_WINDOW_SECONDS <= 0:
+        await _answer_batch([message], ch, root)
+        return
+    ch.pending_triggers = []
+    try:
+        await _answer_batch([message], ch, root)
+        while ch.pending_triggers:
+            with tracer.span("batch_window"):
+                # Se relee: la ventana se puede recargar mientras tanto
+                wait = ch.pending_since + settings.TRIGGER_BATCH_WINDOW_SECONDS - clock.time()
+                if wait > 0:
+                    await clock.sleep(wait)
+            batch, ch.pending_triggers = ch.pending_triggers, []
+            with tracer.span("batch_follow_up") as span:
+                await _answer_batch(batch, ch, span)
+    finally:
+        ch.pending_triggers = None
+
+
+async def _answer_batch(batch: List[discord.Message], ch: ChannelState, root: AnySpan) -> None:
+    """Generate and enqueue one reply for a batch of triggers, threaded on the last one."""
+    TRIGGER_BATCH_SIZE.observe(len(batch))
+    priority = PRIORITY_MENTION if any(_mentions_us(m) for m in batch) else PRIORITY_REPLY
+    root.set("batch_size", len(batch))
+    # Una sola respuesta, en hilo con el último mensaje del lote
+    target = batch[-1]
+
+    content = _batch_prompt(batch)
+    # A la memoria (y a la búsqueda por similitud) van los mensajes tal cual, sin la cabecera del prompt
+    user_text = _batch_text(batch)
+    await _ensure_history_loaded(ch)
+    # Historial del canal (reciente + recuperado; generate_reply lo recorta a HISTORY_TOKEN_BUDGET)
+    history, query = await _history_for(ch, user_text)
+
+    started = time.perf_counter()
+    try:
+        with tracer.span("generate_reply", history_turns=len(history)):
+            reply_text = await generate_reply(
+                content,
+                settings.DISCORD_SYSTEM_PROMPT,
+                history=history,
+                # con streaming, deja de leer en cuanto el formato compacto está completo
+                sink=CompactFormatter(max_lines=2, max_chars=220),
+                # las menciones directas pasan antes que los replies en la cola de cuota
+                priority=priority,
+            )
+    except CircuitOpenError as e:
+        # Esperado durante una caída: la transición ya quedó en el log del circuito
+        logger.debug("Generation skipped: %s", e)
+        root.set("outcome", "circuit_open")
+        return
     except Exception as e:  # noqa: BLE001
         logger.error("Gemini generation failed", exc_info=e)
+        root.set("outcome", "generation_failed")
         return
+    generated = time.perf_counter()
+    _GENERATION_SECONDS.observe(generated - started)
 
     # fuerza 1–2 líneas/220 chars
-    reply_text = _format_compact(reply_text, max_lines=2, max_chars=220)
+    with tracer.span("format_compact"):
+        reply_text = _format_compact(reply_text, max_lines=2, max_chars=220)
+    _FORMATTING_SECONDS.observe(time.perf_counter() - generated)
 
     # Discord 2000 char limit (aquí ya debería ser corto, pero por si acaso)
     if not reply_text:
+        root.set("outcome", "empty")
         return
 
     chunks = [reply_text[i : i + 2000] for i in range(0, len(reply_text), 2000)]
-    for chunk in chunks:
-        _enqueue_send(message, chunk)
+    try:
+        for chunk in chunks:
+            _enqueue_send(target, chunk)
+    except asyncio.QueueFull:
+        # Solo pasa si el carril se llenó mientras se generaba (p. ej. mensajes de inactividad)
+        admission.reject(priority, "queue_full_after_generation")
+        root.set("outcome", "queue_full")
+        logger.warning("Send lane for channel %s filled up during generation; reply dropped", target.channel.id)
+        return
 
     # Actualizar memoria: añadimos user input y nuestra respuesta (solo una vez)
-    channel_mem = memory_by_channel.setdefault(message.channel.id, [])
-    channel_mem.append({"role": "user", "text": content})
-    channel_mem.append({"role": "model", "text": reply_text})
-    if len(channel_mem) > 20:
-        memory_by_channel[message.channel.id] = channel_mem[-20:]
+    user_turn = _remember(ch, "user", user_text)
+    model_turn = _remember(ch, "model", reply_text)
+    if query is not None:
+        # El embedding del prompt sirve también como clave del intercambio: sin llamada extra
+        ch.vectors = vector_index.index_exchange(ch.vectors, query, user_turn, model_turn)
+    compactor.maybe_compact(ch)
+    # Lo que hubiera en el pool se generó con la conversación de antes
+    inactivity_pool.invalidate(ch)
 
 
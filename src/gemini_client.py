@@ -1,12 +1,23 @@
 from __future__ import annotations
 
+import asyncio
+import hashlib
+import heapq
+import itertools
+import json
 import logging
-from typing import Dict, Any, List, Optional
+import time
+from typing import Callable, Dict, Any, List, Optional, Protocol, Sequence, Set, Tuple
 
 import httpx
-from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_exception
+from tenacity import retry, stop_after_attempt, wait_random_exponential, retry_if_exception
 
+from .circuit_breaker import STATE_VALUES, CircuitBreaker
+from .clock import loop_time
 from .config import settings
+from .metrics import GEMINI_REQUESTS, GEMINI_RETRIES, GEMINI_TOKENS, REGISTRY
+from .payload_builder import GENERATION_CONFIG, HistoryItem, build_body, estimator
+from .tracing import tracer
 
 
 logger = logging.getLogger(__name__)
@@ -16,6 +27,62 @@ class TransientHTTPException(Exception):
     pass
 
 
+class _CacheMiss(Exception):
+    """The referenced cachedContents entry no longer exists on the server."""
+
+
+class StreamSink(Protocol):
+    """Receives streamed text; feed() returns True once no more text is needed."""
+
+    text: str
+
+    def reset(self) -> None: ...
+
+    def feed(self, chunk: str) -> bool: ...
+
+
+# Cliente HTTP compartido: se abre en on_ready y se cierra al apagar el bot.
+# Reutiliza conexiones keep-alive para no pagar TCP+TLS en cada respuesta.
+_client: Optional[httpx.AsyncClient] = None
+
+
+def _build_client() -> httpx.AsyncClient:
+    http2 = settings.HTTP2_ENABLED
+    if http2:
+        try:
+            import h2  # noqa: F401
+        except ImportError:
+            logger.warning("HTTP2_ENABLED is set but 'h2' is not installed (pip install httpx[http2]); using HTTP/1.1")
+            http2 = False
+    limits = httpx.Limits(
+        max_connections=settings.HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=settings.HTTP_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=settings.HTTP_KEEPALIVE_EXPIRY_SECONDS,
+    )
+    return httpx.AsyncClient(
+        base_url=settings.GEMINI_BASE_URL,
+        limits=limits,
+        http2=http2,
+        timeout=settings.TIMEOUT_S,
+    )
+
+
+def open_client() -> httpx.AsyncClient:
+    """Return the shared HTTP client, creating it if needed."""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = _build_client()
+    return _client
+
+
+async def close_client() -> None:
+    """Close the shared HTTP client and its pooled connections."""
+    global _client
+    client, _client = _client, None
+    if client is not None:
+        await client.aclose()
+
+
 def _is_retryable_exception(exc: BaseException) -> bool:
     if isinstance(exc, httpx.HTTPStatusError):
         status = exc.response.status_code
@@ -27,67 +94,536 @@ def _is_retryable_exception(exc: BaseException) -> bool:
     return False
 
 
+def _count_retry(retry_state) -> None:
+    GEMINI_RETRIES.inc()
+
+
+# Campos de usageMetadata que exportamos como contadores de tokens
+_USAGE_FIELDS = (
+    ("promptTokenCount", "prompt"),
+    ("candidatesTokenCount", "candidates"),
+    ("cachedContentTokenCount", "cached"),
+    ("thoughtsTokenCount", "thoughts"),
+)
+
+
+def _record_usage(usage: Optional[Dict[str, Any]]) -> Optional[int]:
+    """Export usageMetadata token counts; returns totalTokenCount if present."""
+    if not usage:
+        return None
+    for field, kind in _USAGE_FIELDS:
+        count = usage.get(field)
+        if count:
+            GEMINI_TOKENS.labels(kind).inc(count)
+    return usage.get("totalTokenCount")
+
+
+# Prioridades de generación: número más bajo sale antes de la cola de cuota
+PRIORITY_MENTION = 0
+PRIORITY_REPLY = 1
+PRIORITY_INACTIVITY = 2
+PRIORITY_BACKGROUND = 3  # trabajo que nadie espera (p. ej. resúmenes de historial)
+
+
+def _retry_after(resp: httpx.Response) -> Optional[float]:
+    """Server-requested pause: RetryInfo.retryDelay in the error body, else Retry-After."""
+    try:
+        details = resp.json().get("error", {}).get("details") or []
+    except Exception:  # noqa: BLE001
+        details = []
+    for detail in details:
+        delay = detail.get("retryDelay") if isinstance(detail, dict) else None
+        if isinstance(delay, str) and delay.endswith("s"):
+            try:
+                return max(0.0, float(delay[:-1]))
+            except ValueError:
+                pass
+    header = resp.headers.get("Retry-After")
+    if header:
+        try:
+            return max(0.0, float(header))
+        except ValueError:
+            pass
+    return None
+
+
+class _TokenBucket:
+    __slots__ = ("tokens", "updated")
+
+    def __init__(self) -> None:
+        self.tokens: Optional[float] = None  # se llena al primer uso
+        self.updated = 0.0
+
+    def wait_for(self, amount: float, per_minute: int, now: float) -> float:
+        """Seconds until `amount` is available (0 if it already is); refills first."""
+        if per_minute <= 0:
+            return 0.0
+        rate = per_minute / 60.0
+        capacity = max(1.0, rate * settings.GEMINI_QUOTA_BURST_SECONDS)
+        if self.tokens is None:
+            self.tokens = capacity
+        else:
+            self.tokens = min(capacity, self.tokens + (now - self.updated) * rate)
+        self.updated = now
+        # Una petición mayor que la capacidad espera a tener el bucket lleno
+        missing = min(amount, capacity) - self.tokens
+        return missing / rate if missing > 0 else 0.0
+
+    def take(self, amount: float, per_minute: int) -> None:
+        if per_minute > 0 and self.tokens is not None:
+            self.tokens -= amount
+
+
+class _Grant:
+    __slots__ = ("tokens", "started", "outcome", "retry_after", "used_tokens")
+
+    def __init__(self, tokens: int, started: float) -> None:
+        self.tokens = tokens
+        self.started = started
+        self.outcome = "error"  # "ok" | "throttled" | "error"
+        self.retry_after: Optional[float] = None
+        self.used_tokens: Optional[int] = None
+
+
+class QuotaScheduler:
+    """Process-wide admission for Gemini requests.
+
+    Every attempt (including tenacity retries) waits here for a slot: RPM and
+    TPM token buckets (GEMINI_QUOTA_RPM/TPM, 0 = unlimited), an AIMD
+    concurrency limit that halves on 429 and grows by 1/limit per success up
+    to GEMINI_MAX_CONCURRENCY, and a global pause honoring the server's
+    retry delay. Waiters leave strictly by priority, then FIFO, so inactivity
+    pings yield to mentions and replies.
+    """
+
+    def __init__(self, clock: Callable[[], float] = time.monotonic) -> None:
+        self._clock = clock
+        self._limit = float(max(1, settings.GEMINI_MAX_CONCURRENCY))
+        self._inflight = 0
+        self._waiters: List[Tuple[int, int, asyncio.Future, int]] = []
+        self._seq = itertools.count()
+        self._requests = _TokenBucket()
+        self._tokens = _TokenBucket()
+        self._paused_until = 0.0
+        self._last_decrease = float("-inf")
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self.throttled = 0
+
+    @property
+    def limit(self) -> int:
+        return int(self._limit)
+
+    @property
+    def inflight(self) -> int:
+        return self._inflight
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiters)
+
+    async def acquire(self, priority: int, tokens: int) -> _Grant:
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), future, tokens))
+        self._pump()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Se concedió justo antes de cancelar: devolvemos el hueco
+                self._inflight -= 1
+                self._pump()
+            raise
+        return _Grant(tokens, self._clock())
+
+    def release(self, grant: _Grant) -> None:
+        now = self._clock()
+        self._inflight -= 1
+        max_limit = float(max(1, settings.GEMINI_MAX_CONCURRENCY))
+        if grant.outcome == "throttled":
+            self.throttled += 1
+            # Una sola reducción por "ronda": los 429 de peticiones que ya
+            # estaban en vuelo antes del último recorte no vuelven a recortar
+            if grant.started >= self._last_decrease:
+                self._limit = max(1.0, self._limit / 2)
+                self._last_decrease = now
+            pause = grant.retry_after if grant.retry_after is not None else settings.GEMINI_RATE_LIMIT_PAUSE_SECONDS
+            self._paused_until = max(self._paused_until, now + pause)
+        elif grant.outcome == "ok":
+            self._limit = min(max_limit, self._limit + 1.0 / self._limit)
+        self._limit = min(self._limit, max_limit)
+        if grant.used_tokens is not None:
+            # Corrige lo estimado con lo que Gemini dice haber consumido
+            self._tokens.take(grant.used_tokens - grant.tokens, settings.GEMINI_QUOTA_TPM)
+        self._pump()
+
+    def _pump(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        now = self._clock()
+        while self._waiters:
+            _, _, future, tokens = self._waiters[0]
+            if future.done():
+                heapq.heappop(self._waiters)  # cancelado mientras esperaba
+                continue
+            if self._inflight >= int(self._limit):
+                return  # lo despierta el próximo release()
+            delay = max(
+                self._paused_until - now,
+                self._requests.wait_for(1, settings.GEMINI_QUOTA_RPM, now),
+                self._tokens.wait_for(tokens, settings.GEMINI_QUOTA_TPM, now),
+            )
+            if delay > 0:
+                self._timer = asyncio.get_running_loop().call_later(delay, self._pump)
+                return
+            heapq.heappop(self._waiters)
+            self._requests.take(1, settings.GEMINI_QUOTA_RPM)
+            self._tokens.take(tokens, settings.GEMINI_QUOTA_TPM)
+            self._inflight += 1
+            future.set_result(None)
+
+
+# Reloj del event loop: los timers de _pump corren en él (y así también bajo tiempo virtual)
+quota = QuotaScheduler(clock=loop_time)
+REGISTRY.callback("discord_ia_gemini_concurrency_limit", "AIMD concurrency limit for Gemini", lambda: quota.limit)
+REGISTRY.callback("discord_ia_gemini_inflight", "Gemini requests in flight", lambda: quota.inflight)
+REGISTRY.callback("discord_ia_gemini_waiting", "Gemini requests waiting for quota", lambda: quota.waiting)
+REGISTRY.callback(
+    "discord_ia_gemini_throttled", "Gemini attempts answered with 429", lambda: quota.throttled, kind="counter"
+)
+
+
+# Un circuito por modelo: la caída de uno no corta el hedge hacia el otro
+_breakers: Dict[str, CircuitBreaker] = {}
+
+
+def breaker_for(model: Optional[str] = None) -> CircuitBreaker:
+    model = model or settings.GEMINI_MODEL
+    breaker = _breakers.get(model)
+    if breaker is None:
+        breaker = _breakers[model] = CircuitBreaker(model, clock=loop_time)
+    return breaker
+
+
+def circuit_open(model: Optional[str] = None) -> bool:
+    """True while the model's circuit is open (calls would fail without trying)."""
+    return breaker_for(model).is_open()
+
+
+REGISTRY.callback(
+    "discord_ia_gemini_circuit_state",
+    "Circuit breaker state per model (0 closed, 1 half-open, 2 open)",
+    lambda: {model: STATE_VALUES[b.state] for model, b in _breakers.items()},
+    labelname="model",
+)
+
+
+def _retry_wait(retry_state) -> float:
+    exc = retry_state.outcome.exception()
+    if isinstance(exc, httpx.HTTPStatusError) and exc.response.status_code == 429:
+        # La pausa la impone el scheduler de cuota para todos a la vez
+        return 0.0
+    if circuit_open(retry_state.kwargs.get("model")):
+        # El siguiente intento fallará al instante: no se hace esperar al llamador
+        return 0.0
+    return _backoff(retry_state)
+
+
+# Backoff con jitter completo: los reintentos de distintos triggers no se sincronizan
+_backoff = wait_random_exponential(multiplier=1, max=10)
+
+
+class _CacheEntry:
+    __slots__ = ("name", "expires_at")
+
+    def __init__(self, name: str, expires_at: float) -> None:
+        self.name = name
+        self.expires_at = expires_at
+
+
+class SystemPromptCache:
+    """Registers the system prompt with Gemini's cachedContents API.
+
+    One cache is kept per (model, system prompt) hash. Lookups never block the
+    reply path: while no usable cache exists the prompt is sent inline and the
+    cache is created (or its TTL extended) in the background.
+    """
+
+    def __init__(self, clock: Callable[[], float] = time.monotonic) -> None:
+        self._clock = clock
+        self._entries: Dict[str, _CacheEntry] = {}
+        self._failed_until: Dict[str, float] = {}
+        self._pending: Dict[str, asyncio.Task] = {}
+        self._tasks: Set[asyncio.Task] = set()
+
+    @staticmethod
+    def config_hash(model: str, system_prompt: str) -> str:
+        return hashlib.sha256(f"{model}\0{system_prompt}".encode("utf-8")).hexdigest()
+
+    def lookup(self, client: httpx.AsyncClient, model: str, system_prompt: str) -> Optional[str]:
+        """Return the cache name to reference, or None to send the prompt inline."""
+        key = self.config_hash(model, system_prompt)
+        now = self._clock()
+        entry = self._entries.get(key)
+        if entry is not None and now >= entry.expires_at:
+            del self._entries[key]
+            entry = None
+        if key not in self._pending and now >= self._failed_until.get(key, 0.0):
+            if entry is None:
+                self._spawn(key, self._create(client, key, model, system_prompt))
+            elif entry.expires_at - now <= settings.GEMINI_CONTEXT_CACHE_REFRESH_MARGIN_SECONDS:
+                self._spawn(key, self._refresh(client, key, entry))
+        return entry.name if entry is not None else None
+
+    def invalidate(self, name: str) -> None:
+        for key, entry in list(self._entries.items()):
+            if entry.name == name:
+                del self._entries[key]
+
+    def _spawn(self, key: str, coro) -> None:
+        task = asyncio.create_task(coro)
+        self._pending[key] = task
+        self._tasks.add(task)
+
+        def _done(t: asyncio.Task) -> None:
+            self._tasks.discard(t)
+            if self._pending.get(key) is t:
+                del self._pending[key]
+
+        task.add_done_callback(_done)
+
+    async def _create(self, client: httpx.AsyncClient, key: str, model: str, system_prompt: str) -> None:
+        ttl = settings.GEMINI_CONTEXT_CACHE_TTL_SECONDS
+        body = {
+            "model": f"models/{model}",
+            "displayName": f"discord-system-prompt-{key[:12]}",
+            "systemInstruction": {"parts": [{"text": system_prompt}]},
+            "ttl": f"{ttl}s",
+        }
+        try:
+            resp = await client.post(
+                "/v1beta/cachedContents",
+                params={"key": settings.GEMINI_API_KEY},
+                json=body,
+                timeout=settings.TIMEOUT_S,
+            )
+            resp.raise_for_status()
+            name = resp.json()["name"]
+        except Exception as e:  # noqa: BLE001
+            # p. ej. el prompt no llega al mínimo de tokens cacheables: seguimos inline
+            logger.warning("Context cache creation failed, sending system prompt inline: %s", e)
+            self._failed_until[key] = self._clock() + settings.GEMINI_CONTEXT_CACHE_RETRY_SECONDS
+            return
+        self._entries[key] = _CacheEntry(name, self._clock() + ttl)
+        self._failed_until.pop(key, None)
+        logger.info("Registered system prompt cache %s for model %s", name, model)
+
+    async def _refresh(self, client: httpx.AsyncClient, key: str, entry: _CacheEntry) -> None:
+        ttl = settings.GEMINI_CONTEXT_CACHE_TTL_SECONDS
+        try:
+            resp = await client.patch(
+                f"/v1beta/{entry.name}",
+                params={"key": settings.GEMINI_API_KEY, "updateMask": "ttl"},
+                json={"ttl": f"{ttl}s"},
+                timeout=settings.TIMEOUT_S,
+            )
+            resp.raise_for_status()
+        except Exception as e:  # noqa: BLE001
+            # Si ya no existe, la próxima búsqueda lo recrea
+            logger.warning("Context cache refresh failed for %s: %s", entry.name, e)
+            self.invalidate(entry.name)
+            return
+        entry.expires_at = self._clock() + ttl
+
+
+# Reloj del event loop, como la cuota: caducidad y renovación también bajo tiempo virtual
+context_cache = SystemPromptCache(clock=loop_time)
+
+
+def _is_cache_miss(resp: httpx.Response) -> bool:
+    """Gemini rejects requests whose cached_content expired or was deleted."""
+    if resp.status_code not in (400, 403, 404):
+        return False
+    return "cache" in resp.text.lower()
+
+
+_HEADERS = {"Content-Type": "application/json"}
+
+
+def _extract_chunk_text(data: Dict[str, Any]) -> str:
+    candidates = data.get("candidates") or []
+    if not candidates:
+        return ""
+    content = candidates[0].get("content") or {}
+    return "".join(part.get("text", "") for part in content.get("parts") or [])
+
+
+async def _post_json(
+    client: httpx.AsyncClient, url: str, params: Dict[str, str], body: bytes, *, cached: bool
+) -> Dict[str, Any]:
+    resp = await client.post(url, headers=_HEADERS, params=params, content=body, timeout=settings.TIMEOUT_S)
+    GEMINI_REQUESTS.labels(resp.status_code).inc()
+    if cached and _is_cache_miss(resp):
+        raise _CacheMiss()
+    if resp.status_code == 429:
+        # Surface as retryable
+        raise httpx.HTTPStatusError("Rate limited", request=resp.request, response=resp)
+    resp.raise_for_status()
+    return resp.json()
+
+
+async def _post_stream(
+    client: httpx.AsyncClient,
+    url: str,
+    params: Dict[str, str],
+    body: bytes,
+    *,
+    cached: bool,
+    sink: StreamSink,
+) -> Tuple[str, Optional[Dict[str, Any]]]:
+    """Read a streamGenerateContent SSE response until the sink has enough text.
+
+    Returns the text read and the last usageMetadata seen.
+    """
+    sink.reset()
+    async with client.stream(
+        "POST", url, headers=_HEADERS, params={**params, "alt": "sse"}, content=body, timeout=settings.TIMEOUT_S
+    ) as resp:
+        GEMINI_REQUESTS.labels(resp.status_code).inc()
+        if resp.status_code >= 400:
+            await resp.aread()
+            if cached and _is_cache_miss(resp):
+                raise _CacheMiss()
+            if resp.status_code == 429:
+                raise httpx.HTTPStatusError("Rate limited", request=resp.request, response=resp)
+            resp.raise_for_status()
+        usage = None
+        async for line in resp.aiter_lines():
+            if not line.startswith("data:"):
+                continue
+            data = json.loads(line[5:])
+            # El último chunk trae el total; si cortamos antes nos quedamos con el parcial
+            usage = data.get("usageMetadata") or usage
+            chunk = _extract_chunk_text(data)
+            if chunk and sink.feed(chunk):
+                # Salir del bloque cierra el stream: el resto lo descartaría _format_compact
+                break
+    return sink.text, usage
+
+
 @retry(
     stop=stop_after_attempt(settings.MAX_RETRIES),
-    wait=wait_exponential(multiplier=1, min=1, max=10),
+    wait=_retry_wait,
     retry=retry_if_exception(_is_retryable_exception),
+    before_sleep=_count_retry,
     reraise=True,
 )
 async def generate_reply(
     text: str,
     system_prompt: str,
     *,
-    history: Optional[List[Dict[str, str]]] = None,
+    history: Optional[Sequence[HistoryItem]] = None,
+    sink: Optional[StreamSink] = None,
+    priority: int = PRIORITY_MENTION,
+    model: Optional[str] = None,
 ) -> str:
     """Call Gemini to generate a reply for given user text.
 
-    Uses Google Generative Language API generateContent endpoint for the configured model.
+    Uses Google Generative Language API generateContent endpoint for `model`
+    (GEMINI_MODEL by default).
+    With GEMINI_STREAMING_ENABLED and a `sink`, uses streamGenerateContent instead and
+    stops reading as soon as the sink reports it has enough text.
+    Each attempt first waits for a slot from the process-wide quota scheduler.
+    History is trimmed to HISTORY_TOKEN_BUDGET estimated tokens, newest turns first.
     """
-    base_url = "https://generativelanguage.googleapis.com"
-    url = f"{base_url}/v1beta/models/{settings.GEMINI_MODEL}:generateContent"
-
-    contents: List[Dict[str, Any]] = []
-    if history:
-        for msg in history:
-            role = msg.get("role", "user")
-            msg_text = msg.get("text", "")
-            if not msg_text:
-                continue
-            contents.append({"role": role, "parts": [{"text": msg_text}]})
-
-    contents.append({"role": "user", "parts": [{"text": text}]})
-
-    payload: Dict[str, Any] = {
-        # Using snake_case per requested spec
-        "system_instruction": {
-            "parts": [{"text": system_prompt}],
-        },
-        "contents": contents,
-        "generation_config": {
-            "temperature": 0.7,
-            "max_output_tokens": 300
-        }
-    }
-
-    headers = {"Content-Type": "application/json"}
+    stream = sink is not None and settings.GEMINI_STREAMING_ENABLED
+    method = "streamGenerateContent" if stream else "generateContent"
+    model = model or settings.GEMINI_MODEL
+    url = f"/v1beta/models/{model}:{method}"
     params = {"key": settings.GEMINI_API_KEY}
 
-    async with httpx.AsyncClient(timeout=settings.TIMEOUT_S) as client:
+    client = open_client()
+    cached = None
+    if settings.GEMINI_CONTEXT_CACHE_ENABLED:
+        cached = context_cache.lookup(client, model, system_prompt)
+
+    def _body(cached_content: Optional[str]) -> Tuple[bytes, int]:
+        return build_body(
+            text, system_prompt, history, cached_content=cached_content, budget=settings.HISTORY_TOKEN_BUDGET
+        )
+
+    async def _send(body: bytes, cached_content: Optional[str]) -> Any:
+        if stream:
+            return await _post_stream(client, url, params, body, cached=bool(cached_content), sink=sink)
+        data = await _post_json(client, url, params, body, cached=bool(cached_content))
+        return data, data.get("usageMetadata")
+
+    # Con el circuito abierto se falla aquí, sin esperar cuota ni red (y tenacity no reintenta)
+    breaker = breaker_for(model)
+    breaker.reject_if_open()
+    # Cada intento de tenacity es un span hijo del "generate_reply" del llamador
+    parent = tracer.current()
+    with tracer.span("gemini_attempt", model=model, stream=stream, priority=priority) as span:
+        span.set("attempt", parent.incr("attempts") if parent is not None else 1)
+        # La estimación cuenta el system prompt aunque esté en caché, igual que promptTokenCount
+        body, prompt_tokens = _body(cached)
+        span.set("prompt_tokens_estimate", prompt_tokens)
+        with tracer.span("quota_wait"):
+            grant = await quota.acquire(priority, prompt_tokens + GENERATION_CONFIG["max_output_tokens"])
+        probe = False
+        failed: Optional[bool] = None  # None: el resultado no dice nada de la salud del servicio
+        sent_at = loop_time()
         try:
-            resp = await client.post(url, headers=headers, params=params, json=payload)
-            if resp.status_code == 429:
-                # Surface as retryable
-                raise httpx.HTTPStatusError("Rate limited", request=resp.request, response=resp)
-            resp.raise_for_status()
-            data = resp.json()
-        except (httpx.TimeoutException, httpx.HTTPStatusError) as e:
+            # Pudo abrirse mientras esperábamos cuota; en half-open solo pasan unas pocas sondas
+            probe = breaker.before_call()
+            try:
+                result, usage = await _send(body, cached)
+            except _CacheMiss:
+                # Caché caducada/borrada en el servidor: reenviamos el prompt inline
+                logger.info("Context cache %s missing, falling back to inline system prompt", cached)
+                span.set("cache_miss", True)
+                context_cache.invalidate(cached)
+                result, usage = await _send(_body(None)[0], None)
+            failed = False
+            grant.outcome = "ok"
+            grant.used_tokens = _record_usage(usage)
+            if usage and usage.get("promptTokenCount"):
+                estimator.calibrate(prompt_tokens, usage["promptTokenCount"])
+                span.set("prompt_tokens", usage["promptTokenCount"])
+        except httpx.TimeoutException as e:
+            failed = True
+            GEMINI_REQUESTS.labels("timeout").inc()
+            logger.warning("Gemini request failed (will retry if retryable): %s", e)
+            raise
+        except httpx.HTTPStatusError as e:
+            span.set("http.status_code", e.response.status_code)
+            if e.response.status_code == 429:
+                grant.outcome = "throttled"
+                grant.retry_after = _retry_after(e.response)
+            elif e.response.status_code >= 500:
+                failed = True
             logger.warning("Gemini request failed (will retry if retryable): %s", e)
             raise
         except httpx.HTTPError as e:
             # Network level errors
+            failed = True
+            GEMINI_REQUESTS.labels("network").inc()
             logger.warning("HTTP error to Gemini: %s", e)
             raise TransientHTTPException(str(e)) from e
+        finally:
+            quota.release(grant)
+            if failed is None:
+                breaker.release(probe)
+            else:
+                breaker.record(probe, failed=failed, seconds=loop_time() - sent_at)
 
+    if stream:
+        if not result:
+            logger.error("Gemini stream ended without text")
+            raise ValueError("No text parts in response")
+        return result
+
+    data = result
     try:
         # Typical shape: candidates[0].content.parts[0].text
         candidates = data.get("candidates")
@@ -99,7 +635,10 @@ async def generate_reply(
             raise ValueError("No text parts in response")
         return parts[0]["text"]
     except Exception as e:  # noqa: BLE001
-        logger.error("Failed to parse Gemini response: %s | payload=%s", e, data)
+        candidates = data.get("candidates") if isinstance(data, dict) else None
+        finish = candidates[0].get("finishReason") if candidates and isinstance(candidates[0], dict) else None
+        feedback = data.get("promptFeedback") if isinstance(data, dict) else None
+        # El payload completo solo en DEBUG: en ERROR cada fallo volcaba la respuesta entera
+        logger.error("Failed to parse Gemini response: %s (finishReason=%s, promptFeedback=%s)", e, finish, feedback)
+        logger.debug("Unparseable Gemini payload: %s", data)
         raise
-
-
@@ -0,0 +1,337 @@
+from __future__ import annotations
+
+import asyncio
+import heapq
+import logging
+import random
+from collections import deque
+from typing import Awaitable, Callable, List, Optional, Set, Tuple
+
+from .config import settings
+from .metrics import INACTIVITY_POOL_FILLS, INACTIVITY_POOL_LOOKUPS
+from .state_store import ChannelState
+
+
+logger = logging.getLogger(__name__)
+
+# Reintento tras una generación fallida (el watcher anterior volvía a mirar cada 30 s)
+_RETRY_SECONDS = 30.0
+# Con Gemini ocupado (cola de cuota o circuito abierto) el llenado del pool espera esto
+_BUSY_RETRY_SECONDS = 5.0
+
+
+class InactivityEngine:
+    """Fires the inactivity message of each channel from a min-heap of deadlines.
+
+    A channel's deadline is its last activity + INACTIVITY_SECONDS, read lazily
+    through `last_activity` when its heap entry comes due: activity only moves
+    the real deadline later, so triggers never touch the heap and a stale entry
+    is just pushed back once. The engine sleeps until the earliest deadline and
+    each wakeup costs O(due channels · log n). Due channels are handed to `fire`
+    under a bound of INACTIVITY_CONCURRENCY concurrent generations.
+    """
+
+    def __init__(
+        self,
+        fire: Callable[[int], Awaitable[None]],
+        last_activity: Callable[[int], Optional[float]],
+        *,
+        clock: Optional[Callable[[], float]] = None,
+    ) -> None:
+        self._fire = fire
+        self._last_activity = last_activity
+        self._clock = clock or (lambda: asyncio.get_running_loop().time())
+        self._heap: List[Tuple[float, int]] = []
+        self._scheduled: Set[int] = set()
+        self._inflight: Set[int] = set()
+        self._tasks: Set[asyncio.Task] = set()
+        self._runner: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+
+    # --- API -------------------------------------------------------------
+    def start(self) -> None:
+        if self._runner is not None:
+            return
+        self._wakeup = asyncio.Event()
+        self._slots = asyncio.Semaphore(max(1, settings.INACTIVITY_CONCURRENCY))
+        self._runner = asyncio.create_task(self._run())
+
+    async def close(self) -> None:
+        runner, self._runner = self._runner, None
+        tasks = list(self._tasks)
+        if runner is not None:
+            tasks.append(runner)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def watch(self, channel_id: int) -> None:
+        """Track the channel; no-op if it already has a deadline or is generating."""
+        if channel_id in self._scheduled or channel_id in self._inflight:
+            return
+        last = self._last_activity(channel_id)
+        if last is not None:
+            self._push(channel_id, last + settings.INACTIVITY_SECONDS)
+
+    def reschedule(self) -> None:
+        """Recompute every deadline, e.g. after INACTIVITY_SECONDS changed."""
+        channels = list(self._scheduled)
+        self._heap.clear()
+        self._scheduled.clear()
+        for channel_id in channels:
+            self.watch(channel_id)
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def pending(self) -> int:
+        return len(self._scheduled)
+
+    def inflight(self) -> int:
+        return len(self._inflight)
+
+    # --- internos --------------------------------------------------------
+    def _push(self, channel_id: int, due: float) -> None:
+        self._scheduled.add(channel_id)
+        heapq.heappush(self._heap, (due, channel_id))
+        # Solo hace falta despertar si cambia el próximo vencimiento
+        if self._wakeup is not None and self._heap[0][1] == channel_id:
+            self._wakeup.set()
+
+    async def _next_due(self) -> int:
+        while True:
+            delay: Optional[float] = None
+            now = self._clock()
+            while self._heap:
+                due, channel_id = self._heap[0]
+                if due > now:
+                    delay = due - now
+                    break
+                heapq.heappop(self._heap)
+                self._scheduled.discard(channel_id)
+                last = self._last_activity(channel_id)
+                if last is None:
+                    continue  # canal olvidado por el StateStore
+                actual = last + settings.INACTIVITY_SECONDS
+                if actual > now:
+                    self._push(channel_id, actual)  # hubo actividad desde que se programó
+                    continue
+                if not settings.INACTIVITY_ENABLED:
+                    # Desactivado (puede reactivarse en caliente): se vuelve a mirar un periodo después
+                    self._push(channel_id, now + settings.INACTIVITY_SECONDS)
+                    continue
+                return channel_id
+            self._wakeup.clear()
+            # Igual que SendScheduler: asyncio.wait para que close() no se pierda el cancel
+            waiter = asyncio.ensure_future(self._wakeup.wait())
+            try:
+                await asyncio.wait({waiter}, timeout=delay)
+            finally:
+                waiter.cancel()
+
+    async def _run(self) -> None:
+        while True:
+            await self._slots.acquire()
+            try:
+                channel_id = await self._next_due()
+            except BaseException:
+                self._slots.release()
+                raise
+            self._inflight.add(channel_id)
+            task = asyncio.create_task(self._fire_one(channel_id))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _fire_one(self, channel_id: int) -> None:
+        try:
+            await self._fire(channel_id)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:  # noqa: BLE001
+            logger.debug("Inactivity message failed for channel %s: %s", channel_id, e)
+        finally:
+            self._inflight.discard(channel_id)
+            self._slots.release()
+            last = self._last_activity(channel_id)
+            if last is not None:
+                now = self._clock()
+                due = last + settings.INACTIVITY_SECONDS
+                # Si no se envió nada, la actividad no avanzó: reintento más tarde, sin bucle caliente
+                self._push(channel_id, due if due > now else now + _RETRY_SECONDS)
+
+
+class InactivityPool:
+    """Keeps a few inactivity messages per channel generated ahead of time.
+
+    Each message is generated INACTIVITY_POOL_LEAD_SECONDS before the deadline
+    that will serve it (the next one for the first entry, the one after for
+    the second, and so on up to INACTIVITY_POOL_SIZE), minus up to half that
+    lead of jitter so channels that went quiet together do not fill together.
+    Filling that late leaves little room for a new turn to throw the message
+    away, and a channel that never goes quiet costs no generation at all.
+    A single background worker does the fills; they wait while `busy()` says Gemini
+    has real work queued, and a result is thrown away if the channel's history
+    moved while it was being generated. New turns invalidate the pool and
+    entries older than INACTIVITY_POOL_MAX_AGE_SECONDS are never served. The
+    pool lives on ChannelState, so it is evicted with the channel.
+    """
+
+    def __init__(
+        self,
+        generate: Callable[[ChannelState], Awaitable[str]],
+        channel: Callable[[int], Optional[ChannelState]],
+        *,
+        busy: Callable[[], bool],
+        clock: Optional[Callable[[], float]] = None,
+    ) -> None:
+        self._generate = generate
+        self._channel = channel
+        self._busy = busy
+        self._clock = clock or (lambda: asyncio.get_running_loop().time())
+        self._heap: List[Tuple[float, int]] = []
+        self._scheduled: Set[int] = set()
+        self._runner: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+
+    # --- API -------------------------------------------------------------
+    def start(self) -> None:
+        if self._runner is not None:
+            return
+        self._wakeup = asyncio.Event()
+        self._runner = asyncio.create_task(self._run())
+
+    async def close(self) -> None:
+        runner, self._runner = self._runner, None
+        if runner is not None:
+            runner.cancel()
+            await asyncio.gather(runner, return_exceptions=True)
+
+    def watch(self, channel_id: int) -> None:
+        """Schedule a fill for the channel if its pool has room; no-op if one is pending."""
+        if channel_id in self._scheduled:
+            return
+        ch = self._channel(channel_id)
+        if ch is None:
+            return
+        due = self._fill_at(ch, self._clock())
+        if due is not None:
+            self._push(channel_id, due + self._jitter())
+
+    def invalidate(self, ch: ChannelState) -> None:
+        """The channel's history changed: drop what was generated from the old one."""
+        ch.idle_replies = None
+        self.watch(ch.channel_id)
+
+    def reschedule(self) -> None:
+        """Recompute every fill time, e.g. after INACTIVITY_SECONDS changed."""
+        channels = list(self._scheduled)
+        self._heap.clear()
+        self._scheduled.clear()
+        for channel_id in channels:
+            self.watch(channel_id)
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def pending(self) -> int:
+        return len(self._scheduled)
+
+    def take(self, ch: ChannelState) -> Optional[str]:
+        """Oldest fresh pre-generated message for the channel, or None (counted as a miss)."""
+        pool = ch.idle_replies
+        now = self._clock()
+        while pool:
+            made, text = pool.popleft()
+            if now - made <= settings.INACTIVITY_POOL_MAX_AGE_SECONDS:
+                INACTIVITY_POOL_LOOKUPS.labels("hit").inc()
+                self.watch(ch.channel_id)
+                return text
+        INACTIVITY_POOL_LOOKUPS.labels("miss").inc()
+        self.watch(ch.channel_id)
+        return None
+
+    # --- internos --------------------------------------------------------
+    @staticmethod
+    def _jitter() -> float:
+        return random.uniform(0.0, settings.INACTIVITY_POOL_LEAD_SECONDS * 0.5)
+
+    def _fill_at(self, ch: ChannelState, now: float) -> Optional[float]:
+        """When the channel's pool should get its next message (None: full or disabled)."""
+        if not settings.INACTIVITY_ENABLED or settings.INACTIVITY_POOL_SIZE <= 0 or ch.last_trigger is None:
+            return None
+        pool = ch.idle_replies
+        queued = 0
+        if pool:
+            while pool and now - pool[0][0] > settings.INACTIVITY_POOL_MAX_AGE_SECONDS:
+                pool.popleft()
+            queued = len(pool)
+            if queued >= settings.INACTIVITY_POOL_SIZE:
+                return None
+        # Cada mensaje de inactividad renueva last_trigger: la entrada n se sirve en el plazo n+1
+        deadline = ch.last_trigger + settings.INACTIVITY_SECONDS * (queued + 1)
+        return max(deadline - settings.INACTIVITY_POOL_LEAD_SECONDS, now)
+
+    def _push(self, channel_id: int, due: float) -> None:
+        self._scheduled.add(channel_id)
+        heapq.heappush(self._heap, (due, channel_id))
+        if self._wakeup is not None and self._heap[0][1] == channel_id:
+            self._wakeup.set()
+
+    async def _next_due(self) -> ChannelState:
+        while True:
+            delay: Optional[float] = None
+            now = self._clock()
+            while self._heap:
+                due, channel_id = self._heap[0]
+                if due > now:
+                    delay = due - now
+                    break
+                heapq.heappop(self._heap)
+                self._scheduled.discard(channel_id)
+                ch = self._channel(channel_id)
+                if ch is None:
+                    continue  # canal olvidado por el StateStore
+                actual = self._fill_at(ch, now)
+                if actual is None:
+                    continue  # lleno: take() lo vuelve a programar
+                if actual > now:
+                    self._push(channel_id, actual + self._jitter())  # hubo actividad desde que se programó
+                    continue
+                return ch
+            self._wakeup.clear()
+            waiter = asyncio.ensure_future(self._wakeup.wait())
+            try:
+                await asyncio.wait({waiter}, timeout=delay)
+            finally:
+                waiter.cancel()
+
+    async def _run(self) -> None:
+        # Un solo llenado a la vez: el trabajo de fondo nunca compite en paralelo con las respuestas
+        while True:
+            ch = await self._next_due()
+            if self._busy():
+                self._push(ch.channel_id, self._clock() + _BUSY_RETRY_SECONDS)
+                continue
+            if await self._fill(ch):
+                self.watch(ch.channel_id)
+            else:
+                self._push(ch.channel_id, self._clock() + _RETRY_SECONDS)
+
+    async def _fill(self, ch: ChannelState) -> bool:
+        # Si llega un turno nuevo mientras se genera, el mensaje ya no corresponde a la conversación
+        marker = ch.memory[-1] if ch.memory else None
+        try:
+            text = await self._generate(ch)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:  # noqa: BLE001
+            INACTIVITY_POOL_FILLS.labels("failed").inc()
+            logger.debug("Inactivity pool fill failed for channel %s: %s", ch.channel_id, e)
+            return False
+        if not text or (ch.memory[-1] if ch.memory else None) is not marker:
+            INACTIVITY_POOL_FILLS.labels("discarded").inc()
+            return True
+        if ch.idle_replies is None:
+            ch.idle_replies = deque()
+        ch.idle_replies.append((self._clock(), text))
+        INACTIVITY_POOL_FILLS.labels("ok").inc()
+        return True
@@ -0,0 +1,292 @@
+from __future__ import annotations
+
+import asyncio
+import copy
+import hashlib
+import logging
+from collections import deque
+from typing import Deque, Dict, List, Optional, Protocol, Sequence
+
+from . import gemini_client
+from .clock import loop_time
+from .config import settings
+from .gemini_client import PRIORITY_INACTIVITY, PRIORITY_MENTION, StreamSink
+from .metrics import LLM_GENERATIONS, LLM_HEDGE_CALL_SECONDS, LLM_HEDGES
+from .payload_builder import HistoryItem
+from .tracing import tracer
+
+
+logger = logging.getLogger(__name__)
+
+
+class LLMBackend(Protocol):
+    """Anything that turns a prompt (plus history) into reply text."""
+
+    name: str
+
+    async def generate(
+        self,
+        text: str,
+        system_prompt: str,
+        *,
+        history: Optional[Sequence[HistoryItem]] = None,
+        sink: Optional[StreamSink] = None,
+        priority: int = PRIORITY_MENTION,
+    ) -> str: ...
+
+
+class GeminiBackend:
+    """Gemini REST client for one model (GEMINI_MODEL if not given)."""
+
+    def __init__(self, model: Optional[str] = None) -> None:
+        self.model = model
+        self.name = f"gemini:{model or settings.GEMINI_MODEL}"
+
+    async def generate(
+        self,
+        text: str,
+        system_prompt: str,
+        *,
+        history: Optional[Sequence[HistoryItem]] = None,
+        sink: Optional[StreamSink] = None,
+        priority: int = PRIORITY_MENTION,
+    ) -> str:
+        return await gemini_client.generate_reply(
+            text, system_prompt, history=history, sink=sink, priority=priority, model=self.model
+        )
+
+    def circuit_open(self) -> bool:
+        return gemini_client.circuit_open(self.model)
+
+
+_LOCAL_REPLIES = (
+    "jaja sí, totalmente",
+    "holaaa~ qué tal vas?",
+    "mmm no sé, cuéntame más",
+    "eso suena genial ✨",
+    "uff, vaya día llevas",
+)
+
+
+class LocalBackend:
+    """Deterministic stand-in with no network: the same prompt always gets the same reply."""
+
+    name = "local"
+
+    def __init__(self, latency: float = 0.0) -> None:
+        self.latency = latency
+
+    async def generate(
+        self,
+        text: str,
+        system_prompt: str,
+        *,
+        history: Optional[Sequence[HistoryItem]] = None,
+        sink: Optional[StreamSink] = None,
+        priority: int = PRIORITY_MENTION,
+    ) -> str:
+        if self.latency > 0:
+            await asyncio.sleep(self.latency)
+        digest = hashlib.sha1(text.encode("utf-8")).digest()
+        reply = _LOCAL_REPLIES[digest[0] % len(_LOCAL_REPLIES)]
+        if sink is not None:
+            sink.reset()
+            sink.feed(reply)
+        return reply
+
+
+class LatencyTracker:
+    """Sliding window of recent latencies with a cached percentile."""
+
+    def __init__(self, window: int = 256, refresh_every: int = 16) -> None:
+        self._samples: Deque[float] = deque(maxlen=window)
+        self._refresh_every = refresh_every
+        self._since_refresh = 0
+        self._sorted: List[float] = []
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def add(self, seconds: float) -> None:
+        self._samples.append(seconds)
+        self._since_refresh += 1
+        if self._since_refresh >= self._refresh_every or len(self._samples) <= self._refresh_every:
+            # Reordenar 256 muestras cada 16 peticiones, no en cada una
+            self._sorted = sorted(self._samples)
+            self._since_refresh = 0
+
+    def percentile(self, q: float) -> Optional[float]:
+        if not self._sorted:
+            return None
+        index = min(len(self._sorted) - 1, max(0, int(round(q / 100.0 * len(self._sorted))) - 1))
+        return self._sorted[index]
+
+
+# Con menos muestras el percentil no dice nada: se usa LLM_HEDGE_MIN_DELAY_SECONDS
+_MIN_SAMPLES = 20
+
+
+class HedgedBackend:
+    """Sends a second request to a faster fallback when the primary is slow.
+
+    If the primary has not answered after its recent LLM_HEDGE_PERCENTILE
+    latency (never less than LLM_HEDGE_MIN_DELAY_SECONDS), the same prompt goes
+    to the fallback too. The first successful answer wins and the other request
+    is cancelled. A primary failure starts the fallback at once. Hedges are
+    capped to LLM_HEDGE_MAX_RATIO of requests so a slow primary cannot double
+    the load, and inactivity messages are never hedged.
+
+    A primary cancelled because the fallback won still counts in the latency
+    window, at the time it had already run (a lower bound), so the hedge delay
+    is not computed from the primaries that happened to be fast. Latency of
+    calls that were hedged and of those that were not is kept apart in
+    `call_latency` and in discord_ia_llm_hedge_call_seconds.
+    """
+
+    def __init__(self, primary: LLMBackend, fallback: LLMBackend, *, tracker: Optional[LatencyTracker] = None) -> None:
+        self.primary = primary
+        self.fallback = fallback
+        self.name = f"hedged:{primary.name}+{fallback.name}"
+        self.tracker = tracker or LatencyTracker()
+        self.call_latency: Dict[str, LatencyTracker] = {"unhedged": LatencyTracker(), "hedged": LatencyTracker()}
+        self._budget = 1.0
+        self.requests = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+
+    def circuit_open(self) -> bool:
+        # Con uno de los dos disponible todavía se puede responder
+        return _circuit_open(self.primary) and _circuit_open(self.fallback)
+
+    def hedge_delay(self) -> float:
+        floor = settings.LLM_HEDGE_MIN_DELAY_SECONDS
+        if len(self.tracker) < _MIN_SAMPLES:
+            return floor
+        return max(floor, self.tracker.percentile(settings.LLM_HEDGE_PERCENTILE) or floor)
+
+    def _take_budget(self) -> bool:
+        if self._budget >= 1.0:
+            self._budget -= 1.0
+            return True
+        return False
+
+    async def generate(
+        self,
+        text: str,
+        system_prompt: str,
+        *,
+        history: Optional[Sequence[HistoryItem]] = None,
+        sink: Optional[StreamSink] = None,
+        priority: int = PRIORITY_MENTION,
+    ) -> str:
+        if priority >= PRIORITY_INACTIVITY:
+            return await self.primary.generate(text, system_prompt, history=history, sink=sink, priority=priority)
+        self.requests += 1
+        # Cada petición aporta LLM_HEDGE_MAX_RATIO de presupuesto; cada hedge gasta 1
+        self._budget = min(10.0, self._budget + settings.LLM_HEDGE_MAX_RATIO)
+
+        def _start(backend: LLMBackend, own_sink: Optional[StreamSink]) -> asyncio.Task:
+            return asyncio.create_task(
+                backend.generate(text, system_prompt, history=history, sink=own_sink, priority=priority)
+            )
+
+        started = loop_time()
+        delay = self.hedge_delay()
+        primary = _start(self.primary, sink)
+        hedge: Optional[asyncio.Task] = None
+        can_hedge = True
+        pending = {primary}
+        error: Optional[BaseException] = None
+        try:
+            while pending:
+                timeout = None
+                if hedge is None and can_hedge:
+                    timeout = max(0.0, delay - (loop_time() - started))
+                done, pending = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return self._won(task is primary, task.result(), started, hedge is not None, not primary.done())
+                    if error is None or task is primary:
+                        error = task.exception()
+                primary_failed = primary.done() and primary.exception() is not None
+                if hedge is None and (primary_failed or self._take_budget()):
+                    # Sink propio: dos streams no pueden escribir en el mismo formateador
+                    hedge = _start(self.fallback, copy.copy(sink) if sink is not None else None)
+                    pending.add(hedge)
+                    self.hedged += 1
+                    span = tracer.current()
+                    if span is not None:
+                        span.set("hedged", True)
+                elif hedge is None:
+                    # Sin presupuesto para hedge: a esperar solo al primario
+                    can_hedge = False
+            raise error
+        finally:
+            for task in (primary, hedge):
+                if task is not None and not task.done():
+                    task.cancel()
+
+    def _won(self, is_primary: bool, result: str, started: float, hedged: bool, primary_running: bool) -> str:
+        elapsed = loop_time() - started
+        outcome = "hedged" if hedged else "unhedged"
+        self.call_latency[outcome].add(elapsed)
+        LLM_HEDGE_CALL_SECONDS.labels(outcome).observe(elapsed)
+        if is_primary:
+            self.tracker.add(elapsed)
+            if hedged:
+                LLM_HEDGES.labels("primary").inc()
+            return result
+        if primary_running:
+            # Se va a cancelar: solo se sabe que tardaba más de `elapsed`. Dejarlo fuera bajaría
+            # el percentil (y el umbral de hedge) a los primarios que sí terminaron a tiempo
+            self.tracker.add(elapsed)
+        self.hedge_wins += 1
+        LLM_HEDGES.labels("fallback").inc()
+        span = tracer.current()
+        if span is not None:
+            span.set("hedge_winner", "fallback")
+        return result
+
+
+def _circuit_open(current: LLMBackend) -> bool:
+    check = getattr(current, "circuit_open", None)
+    return check() if check is not None else False
+
+
+def circuit_open() -> bool:
+    """True while the configured backend would fail every call without trying (see CircuitBreaker)."""
+    return _circuit_open(backend)
+
+
+def build_backend() -> LLMBackend:
+    """Backend described by the current settings."""
+    if settings.LLM_BACKEND == "local":
+        return LocalBackend()
+    primary = GeminiBackend()
+    if settings.LLM_HEDGE_ENABLED and settings.LLM_HEDGE_MODEL:
+        return HedgedBackend(primary, GeminiBackend(settings.LLM_HEDGE_MODEL))
+    return primary
+
+
+backend: LLMBackend = build_backend()
+
+
+def configure() -> None:
+    """Rebuild the backend from settings (startup, hot reload)."""
+    global backend
+    backend = build_backend()
+    logger.info("LLM backend: %s", backend.name)
+
+
+async def generate_reply(
+    text: str,
+    system_prompt: str,
+    *,
+    history: Optional[Sequence[HistoryItem]] = None,
+    sink: Optional[StreamSink] = None,
+    priority: int = PRIORITY_MENTION,
+) -> str:
+    """Generate a reply with the configured backend."""
+    current = backend
+    LLM_GENERATIONS.labels(current.name).inc()
+    return await current.generate(text, system_prompt, history=history, sink=sink, priority=priority)
@@ -1,14 +1,183 @@
+from __future__ import annotations
+
+import atexit
+import json
 import logging
+import logging.handlers
+import queue
 import sys
+import threading
+import time
+from typing import Dict, Optional, TextIO, Tuple
+
+from .metrics import LOG_RECORDS_DROPPED
+
+
+TEXT_FORMAT = "%(asctime)s | %(levelname)s | %(name)s | %(message)s"
+
+# Atributos estándar de LogRecord: lo que no esté aquí llegó por `extra=` y va al JSON
+_RECORD_ATTRS = frozenset(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "suppressed"}
+
+_DROPPED_QUEUE_FULL = LOG_RECORDS_DROPPED.labels("queue_full")
+_DROPPED_RATE_LIMITED = LOG_RECORDS_DROPPED.labels("rate_limited")
+
+
+class TextFormatter(logging.Formatter):
+    """TEXT_FORMAT plus a note when similar records were suppressed."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        text = super().format(record)
+        suppressed = getattr(record, "suppressed", 0)
+        if suppressed:
+            text += f" (+{suppressed} similar suppressed)"
+        return text
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: time, level, logger, message, exception and `extra` fields."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        out = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            out["exc_info"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            out["exc_info"] = record.exc_text
+        suppressed = getattr(record, "suppressed", 0)
+        if suppressed:
+            out["suppressed"] = suppressed
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS:
+                out[key] = value
+        return json.dumps(out, ensure_ascii=False, default=str)
+
+
+class RateLimitFilter(logging.Filter):
+    """Lets through `burst` identical warnings/errors per `window` seconds.
+
+    Records are identical when logger, level and message template match, so the
+    check never formats the message. The first record after a window closes
+    carries the number suppressed in it (`record.suppressed`). INFO and below
+    always pass.
+    """
+
+    def __init__(self, burst: int, window: float, *, clock=time.monotonic) -> None:
+        super().__init__()
+        self.burst = burst
+        self.window = window
+        self._clock = clock
+        # clave -> [inicio de la ventana, emitidos, suprimidos]
+        self._windows: Dict[Tuple[str, int, object], list] = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self.burst <= 0 or record.levelno < logging.WARNING:
+            return True
+        key = (record.name, record.levelno, record.msg)
+        now = self._clock()
+        with self._lock:
+            entry = self._windows.get(key)
+            if entry is None or now - entry[0] >= self.window:
+                if entry is not None and entry[2]:
+                    record.suppressed = entry[2]
+                if len(self._windows) >= 4096:
+                    self._prune(now)
+                self._windows[key] = [now, 1, 0]
+                return True
+            if entry[1] < self.burst:
+                entry[1] += 1
+                return True
+            entry[2] += 1
+        _DROPPED_RATE_LIMITED.inc()
+        return False
+
+    def _prune(self, now: float) -> None:
+        # Las ventanas cerradas solo guardan el contador de suprimidos; se pierden si hay demasiadas
+        stale = [k for k, e in self._windows.items() if now - e[0] >= self.window]
+        for k in stale:
+            del self._windows[k]
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that never blocks or formats in the caller.
+
+    The stock handler merges args and renders tracebacks before enqueueing;
+    here the record goes as is and the listener thread does all the work, so
+    log arguments must not be mutated after the call. A full queue drops the
+    record (counted in discord_ia_log_records_dropped) instead of waiting.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            _DROPPED_QUEUE_FULL.inc()
+
+
+_listener: Optional[logging.handlers.QueueListener] = None
+_rate_limit: Optional[RateLimitFilter] = None
+
+
+def parse_levels(spec: str) -> Dict[str, int]:
+    """Parse "httpx=WARNING,discord.gateway=ERROR" into logger name -> level."""
+    levels: Dict[str, int] = {}
+    for part in (spec or "").split(","):
+        name, sep, level = part.partition("=")
+        if not sep or not name.strip():
+            continue
+        value = logging.getLevelName(level.strip().upper())
+        if isinstance(value, int):
+            levels[name.strip()] = value
+    return levels
+
+
+def apply_levels(settings) -> None:
+    """Apply LOG_LEVEL, LOG_LEVELS and the rate limit; safe to call again on reload."""
+    logging.getLogger().setLevel(settings.LOG_LEVEL)
+    for name, level in parse_levels(settings.LOG_LEVELS).items():
+        logging.getLogger(name).setLevel(level)
+    if _rate_limit is not None:
+        _rate_limit.burst = settings.LOG_RATE_LIMIT_BURST
+        _rate_limit.window = settings.LOG_RATE_LIMIT_WINDOW_SECONDS
+
+
+def setup_logging(settings=None, *, stream: Optional[TextIO] = None) -> None:
+    """Route every record through a bounded queue to a writer thread."""
+    global _listener, _rate_limit
+    if settings is None:
+        from .config import settings
+    shutdown_logging()
+
+    output = logging.StreamHandler(stream=stream or sys.stdout)
+    output.setFormatter(JsonFormatter() if settings.LOG_FORMAT == "json" else TextFormatter(TEXT_FORMAT))
+    records: "queue.Queue[logging.LogRecord]" = queue.Queue(maxsize=max(0, settings.LOG_QUEUE_MAX_SIZE))
+    handler = NonBlockingQueueHandler(records)
+    _rate_limit = RateLimitFilter(settings.LOG_RATE_LIMIT_BURST, settings.LOG_RATE_LIMIT_WINDOW_SECONDS)
+    handler.addFilter(_rate_limit)
+
+    root = logging.getLogger()
+    for old in list(root.handlers):
+        root.removeHandler(old)
+    root.addHandler(handler)
+    apply_levels(settings)
+
+    _listener = logging.handlers.QueueListener(records, output, respect_handler_level=True)
+    _listener.start()
 
 
-def setup_logging() -> None:
-    logging.basicConfig(
-        level=logging.INFO,
-        format="%(asctime)s | %(levelname)s | %(name)s | %(message)s",
-        handlers=[
-            logging.StreamHandler(stream=sys.stdout),
-        ],
-    )
+def shutdown_logging() -> None:
+    """Stop the writer thread after it drains the queue."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
 
 
+atexit.register(shutdown_logging)
@@ -0,0 +1,155 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from typing import Callable, Dict, Optional
+
+from .config import settings
+from .metrics import LOOP_LAG_SECONDS, LOOP_STALLS
+
+
+logger = logging.getLogger(__name__)
+
+# Fichero desde el que asyncio invoca cada callback (Handle._run)
+_ASYNCIO_EVENTS = os.path.join("asyncio", "events.py")
+
+
+def _uvloop():
+    try:
+        import uvloop
+    except ImportError:  # uvloop es opcional: sin él se queda el loop de asyncio
+        return None
+    return uvloop
+
+
+def loop_factory(name: str) -> Optional[Callable[[], asyncio.AbstractEventLoop]]:
+    """Constructor of the named loop implementation, or None if it is not installed."""
+    if name == "asyncio":
+        return asyncio.new_event_loop
+    module = _uvloop() if name == "uvloop" else None
+    return module.new_event_loop if module is not None else None
+
+
+def install_event_loop(name: str) -> str:
+    """Make `name` the loop asyncio.run (and so bot.run) creates; returns the one in use."""
+    if name == "uvloop":
+        module = _uvloop()
+        if module is not None:
+            asyncio.set_event_loop_policy(module.EventLoopPolicy())
+            return "uvloop"
+        logger.warning("EVENT_LOOP=uvloop but 'uvloop' is not installed (pip install uvloop); using asyncio")
+    return "asyncio"
+
+
+def _callback_stack(frame) -> str:
+    frames = traceback.extract_stack(frame)
+    # Solo desde el callback que bloquea: sin asyncio.run ni _run_once por encima
+    for i in range(len(frames) - 1, -1, -1):
+        if frames[i].filename.endswith(_ASYNCIO_EVENTS):
+            frames = frames[i + 1:]
+            break
+    return "".join(traceback.format_list(frames))
+
+
+def loop_implementation() -> str:
+    loop = asyncio.get_running_loop()
+    return type(loop).__module__.split(".")[0]
+
+
+class LoopMonitor:
+    """Measures event-loop lag and logs the code that blocks the loop.
+
+    A coroutine sleeps LOOP_MONITOR_INTERVAL_SECONDS and records in
+    discord_ia_loop_lag_seconds how late it woke up: every callback ready at
+    that moment (gateway events, send lanes, timers) waited at least as long.
+    A watchdog thread pings the loop with call_soon_threadsafe; if the ping is
+    not answered within LOOP_SLOW_CALLBACK_SECONDS it grabs the loop thread's
+    stack while the blocking call is still running, and logs it with the total
+    blocked time once the loop answers. One report per stall. A C call that
+    holds the GIL throughout (json.loads of a huge body) stops the thread as
+    well: it shows in the lag histogram when it delays a sample, and is only
+    reported, without a stack, if a ping was already waiting when it started.
+    """
+
+    def __init__(self) -> None:
+        self._task: Optional[asyncio.Task] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._implementation = ""
+
+    def start(self) -> None:
+        if self._task is not None or not settings.LOOP_MONITOR_ENABLED:
+            return
+        loop = asyncio.get_running_loop()
+        self._implementation = loop_implementation()
+        self._stop.clear()
+        self._task = asyncio.create_task(self._sample())
+        self._thread = threading.Thread(
+            target=self._watch, args=(loop, threading.get_ident()), name="loop-watchdog", daemon=True
+        )
+        self._thread.start()
+
+    async def stop(self) -> None:
+        task, self._task = self._task, None
+        thread, self._thread = self._thread, None
+        self._stop.set()
+        if task is not None:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+        if thread is not None:
+            # El hilo duerme a lo sumo un intervalo; esperarlo fuera del loop
+            await asyncio.to_thread(thread.join, 2.0)
+
+    def implementation(self) -> Dict[str, float]:
+        return {self._implementation: 1.0} if self._implementation else {}
+
+    async def _sample(self) -> None:
+        while True:
+            interval = max(0.001, settings.LOOP_MONITOR_INTERVAL_SECONDS)
+            # perf_counter y no loop.time(): el reloj de uvloop va en milisegundos
+            expected = time.perf_counter() + interval
+            await asyncio.sleep(interval)
+            LOOP_LAG_SECONDS.observe(max(0.0, time.perf_counter() - expected))
+
+    def _watch(self, loop: asyncio.AbstractEventLoop, loop_thread: int) -> None:
+        answered = threading.Event()
+        answered_at = [0.0]
+
+        def answer() -> None:
+            answered_at[0] = time.perf_counter()
+            answered.set()
+
+        while not self._stop.wait(max(0.001, settings.LOOP_MONITOR_INTERVAL_SECONDS)):
+            threshold = max(0.001, settings.LOOP_SLOW_CALLBACK_SECONDS)
+            answered.clear()
+            sent = time.perf_counter()
+            try:
+                loop.call_soon_threadsafe(answer)
+            except RuntimeError:
+                return  # loop cerrado
+            if answered.wait(threshold):
+                if answered_at[0] - sent >= threshold:
+                    # Código C que no suelta el GIL (p. ej. json.loads de un cuerpo enorme):
+                    # este hilo no pudo ejecutarse hasta que terminó
+                    self._report(answered_at[0] - sent, threshold, "  <not captured: the call held the GIL>")
+                continue
+            # Pila tomada mientras la llamada bloqueante sigue en curso
+            frame = sys._current_frames().get(loop_thread)
+            stack = _callback_stack(frame) if frame is not None else "  <unavailable>"
+            while not answered.wait(0.5):
+                if self._stop.is_set():
+                    return
+            self._report(answered_at[0] - sent, threshold, stack)
+
+    @staticmethod
+    def _report(blocked: float, threshold: float, stack: str) -> None:
+        LOOP_STALLS.inc()
+        logger.warning(
+            "Event loop blocked for at least %.0f ms (threshold %.0f ms); loop thread was at:\n%s",
+            blocked * 1000, threshold * 1000, stack.rstrip(),
+        )
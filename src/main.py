@@ -1,20 +1,21 @@
 from __future__ import annotations
 
-from dotenv import load_dotenv
-
 from .logging_config import setup_logging
 
 
 def main() -> None:
-    load_dotenv()
-    setup_logging()
-    # importa después de configurar logging para ver mensajes de depuración
+    # src.config carga .env al importarse: cargarlo antes aquí haría pasar sus claves por
+    # variables del proceso, y al recargar ya no se desharían las que se quiten de .env
+    # configura logging antes de importar el cliente para no perder mensajes del arranque
     from .config import settings
+    setup_logging(settings)
+    from .loop_monitor import install_event_loop
+    # Antes de bot.run: asyncio.run crea el loop con la política instalada
+    install_event_loop(settings.EVENT_LOOP)
     from .discord_client import bot
-    bot.run(settings.DISCORD_TOKEN)
+    # log_handler=None: discord.py usa el pipeline de logging del proceso en vez de su StreamHandler síncrono
+    bot.run(settings.DISCORD_TOKEN, log_handler=None)
 
 
 if __name__ == "__main__":
     main()
-
-
@@ -0,0 +1,192 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import queue
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS turns (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    channel_id INTEGER NOT NULL,
+    role TEXT NOT NULL,
+    text TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS turns_by_channel ON turns (channel_id, id);
+"""
+
+_STOP = object()
+
+
+class SQLiteMemoryStore:
+    """Write-behind SQLite (WAL) backend for per-channel conversation history.
+
+    append() only puts the turn on an in-process queue; a dedicated thread owns
+    the connection and writes in batches every `flush_interval` seconds or
+    `batch_size` turns. Loads go through the same thread, after any pending
+    writes, so a channel always reads back what it wrote. Nothing is read at
+    startup: history is loaded per channel on first use. A load that the
+    thread has not answered when the store closes fails instead of waiting
+    forever, and loads on a closed store fail at once.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        *,
+        flush_interval: float = 1.0,
+        batch_size: int = 200,
+        max_turns_per_channel: int = 200,
+    ) -> None:
+        self.path = path
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.max_turns_per_channel = max_turns_per_channel
+        self._ops: "queue.Queue[Any]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._init_error: Optional[BaseException] = None
+        # Futuros de load/flush que el hilo todavía no ha contestado
+        self._waiting: Set["asyncio.Future[Any]"] = set()
+        self.written = 0
+        self.batches = 0
+        self.loads = 0
+
+    # --- API (event loop) --------------------------------------------------
+    async def start(self) -> None:
+        """Open the database on the store's thread; raises what opening it raised."""
+        if self._thread is not None:
+            return
+        ready = threading.Event()
+        thread = threading.Thread(target=self._run, args=(ready,), name="memory-store", daemon=True)
+        thread.start()
+        # Abrir la base (WAL, esquema) toca disco: el loop no se queda bloqueado esperando
+        await asyncio.to_thread(ready.wait)
+        if self._init_error is not None:
+            raise self._init_error
+        self._thread = thread
+
+    def append(self, channel_id: int, role: str, text: str) -> None:
+        """Queue a turn for writing; never blocks on disk."""
+        self._ops.put(("write", (channel_id, role, text, time.time())))
+
+    async def load(self, channel_id: int, limit: int) -> List[Dict[str, str]]:
+        """Return up to `limit` most recent turns of the channel, oldest first."""
+        return await self._call("load", channel_id, limit)
+
+    async def flush(self) -> None:
+        await self._call("flush")
+
+    async def close(self) -> None:
+        thread, self._thread = self._thread, None
+        if thread is None:
+            return
+        self._ops.put(_STOP)
+        await asyncio.to_thread(thread.join)
+        # Las respuestas del hilo se encolaron en el loop antes que el fin del join: ya están
+        # aplicadas, lo que queda aquí no se va a contestar nunca
+        for future in list(self._waiting):
+            _set_exception(future, RuntimeError("memory store closed before answering"))
+
+    def _call(self, kind: str, *args: Any) -> "asyncio.Future[Any]":
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        if self._thread is None:
+            future.set_exception(RuntimeError("memory store is not running"))
+            return future
+        self._waiting.add(future)
+        future.add_done_callback(self._waiting.discard)
+        self._ops.put((kind, args, loop, future))
+        return future
+
+    # --- hilo de escritura -------------------------------------------------
+    def _run(self, ready: threading.Event) -> None:
+        try:
+            conn = sqlite3.connect(self.path)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(_SCHEMA)
+        except sqlite3.Error as e:
+            self._init_error = e
+            return
+        finally:
+            ready.set()
+        pending: List[Tuple[int, str, str, float]] = []
+        deadline: Optional[float] = None
+        try:
+            while True:
+                timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+                try:
+                    op = self._ops.get(timeout=timeout)
+                except queue.Empty:
+                    op = None
+                if op is _STOP:
+                    break
+                if op is not None and op[0] == "write":
+                    pending.append(op[1])
+                    if deadline is None:
+                        deadline = time.monotonic() + self.flush_interval
+                    if len(pending) < self.batch_size:
+                        continue
+                # Lote lleno, deadline vencido o una operación que debe ver lo ya escrito
+                if pending:
+                    self._flush(conn, pending)
+                    pending = []
+                deadline = None
+                if op is not None and op[0] != "write":
+                    self._answer(conn, op)
+        finally:
+            if pending:
+                self._flush(conn, pending)
+            conn.close()
+
+    def _flush(self, conn: sqlite3.Connection, rows: List[Tuple[int, str, str, float]]) -> None:
+        try:
+            with conn:
+                conn.executemany(
+                    "INSERT INTO turns (channel_id, role, text, created_at) VALUES (?, ?, ?, ?)", rows
+                )
+                # Poda: solo conservamos los últimos N turnos de cada canal tocado
+                for channel_id in {row[0] for row in rows}:
+                    conn.execute(
+                        "DELETE FROM turns WHERE channel_id = ? AND id <= ("
+                        " SELECT id FROM turns WHERE channel_id = ? ORDER BY id DESC LIMIT 1 OFFSET ?)",
+                        (channel_id, channel_id, self.max_turns_per_channel),
+                    )
+            self.written += len(rows)
+            self.batches += 1
+        except sqlite3.Error as e:
+            logger.error("Failed to persist %d conversation turns", len(rows), exc_info=e)
+
+    def _answer(self, conn: sqlite3.Connection, op: Tuple[Any, ...]) -> None:
+        kind, args, loop, future = op
+        try:
+            result: Any = None
+            if kind == "load":
+                channel_id, limit = args
+                rows = conn.execute(
+                    "SELECT role, text FROM turns WHERE channel_id = ? ORDER BY id DESC LIMIT ?",
+                    (channel_id, limit),
+                ).fetchall()
+                result = [{"role": role, "text": text} for role, text in reversed(rows)]
+                self.loads += 1
+        except Exception as e:  # noqa: BLE001
+            loop.call_soon_threadsafe(_set_exception, future, e)
+            return
+        loop.call_soon_threadsafe(_set_result, future, result)
+
+
+def _set_result(future: "asyncio.Future[Any]", result: Any) -> None:
+    if not future.done():
+        future.set_result(result)
+
+
+def _set_exception(future: "asyncio.Future[Any]", exc: BaseException) -> None:
+    if not future.done():
+        future.set_exception(exc)
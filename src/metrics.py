@@ -0,0 +1,353 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import math
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+
+logger = logging.getLogger(__name__)
+
+# Buckets de latencia (segundos): de 1 ms a 60 s
+LATENCY_BUCKETS: Tuple[float, ...] = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0,
+)
+
+# Retraso del event loop (segundos): más fino por abajo que LATENCY_BUCKETS
+LAG_BUCKETS: Tuple[float, ...] = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+)
+
+CallbackValue = Union[float, Dict[str, float]]
+
+
+def _fmt(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric(ABC):
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        if not self.labelnames:
+            # Sin etiquetas: exportar 0 desde el arranque en vez de omitir la serie
+            self.labels()
+
+    def labels(self, *values: str):
+        key = tuple(str(v) for v in values)
+        child = self._children.get(key)
+        if child is None:
+            if len(key) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}")
+            child = self._children[key] = self._new_child()
+        return child
+
+    @abstractmethod
+    def _new_child(self): ...
+
+    def _default(self):
+        return self.labels()
+
+    @abstractmethod
+    def collect(self) -> List[str]: ...
+
+
+class _CounterChild:
+    __slots__ = ("value",)
+
+    def __init__(self) -> None:
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.value += amount
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self) -> _CounterChild:
+        return _CounterChild()
+
+    def inc(self, amount: float = 1.0) -> None:
+        self._default().inc(amount)
+
+    def collect(self) -> List[str]:
+        return [
+            f"{self.name}_total{_labels(self.labelnames, key)} {_fmt(child.value)}"
+            for key, child in self._children.items()
+        ]
+
+
+class _GaugeChild:
+    __slots__ = ("value",)
+
+    def __init__(self) -> None:
+        self.value = 0.0
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.value += amount
+
+    def dec(self, amount: float = 1.0) -> None:
+        self.value -= amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def _new_child(self) -> _GaugeChild:
+        return _GaugeChild()
+
+    def set(self, value: float) -> None:
+        self._default().set(value)
+
+    def collect(self) -> List[str]:
+        return [
+            f"{self.name}{_labels(self.labelnames, key)} {_fmt(child.value)}"
+            for key, child in self._children.items()
+        ]
+
+
+class _HistogramChild:
+    __slots__ = ("_upper", "_counts", "sum", "count")
+
+    def __init__(self, upper: Tuple[float, ...]) -> None:
+        self._upper = upper
+        self._counts = [0] * (len(upper) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        # Un bisect y tres sumas: barato para dejarlo siempre activo
+        self._counts[bisect_left(self._upper, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self) -> Iterable[Tuple[float, int]]:
+        running = 0
+        for bound, count in zip(self._upper + (math.inf,), self._counts):
+            running += count
+            yield bound, running
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+    ) -> None:
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self) -> _HistogramChild:
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float) -> None:
+        self._default().observe(value)
+
+    def collect(self) -> List[str]:
+        lines: List[str] = []
+        for key, child in self._children.items():
+            for bound, running in child.cumulative():
+                le = 'le="' + _fmt(bound) + '"'
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, le)} {running}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {_fmt(child.sum)}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {child.count}")
+        return lines
+
+
+class _CallbackMetric:
+    """Gauge or counter whose value is read at scrape time (no hot-path cost)."""
+
+    def __init__(
+        self, name: str, documentation: str, kind: str, fn: Callable[[], CallbackValue], labelname: str = ""
+    ) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.kind = kind
+        self._fn = fn
+        self._labelname = labelname
+
+    def collect(self) -> List[str]:
+        suffix = "_total" if self.kind == "counter" else ""
+        value = self._fn()
+        if isinstance(value, dict):
+            return [
+                f"{self.name}{suffix}{_labels((self._labelname,), (str(k),))} {_fmt(v)}"
+                for k, v in value.items()
+            ]
+        return [f"{self.name}{suffix} {_fmt(value)}"]
+
+
+class Registry:
+    def __init__(self) -> None:
+        self._metrics: Dict[str, Union[_Metric, _CallbackMetric]] = {}
+
+    def register(self, metric):
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(
+        self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS
+    ) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def callback(
+        self, name: str, documentation: str, fn: Callable[[], CallbackValue], *, kind: str = "gauge", labelname: str = ""
+    ) -> None:
+        self.register(_CallbackMetric(name, documentation, kind, fn, labelname))
+
+    def render(self) -> str:
+        """Render all metrics in the OpenMetrics text format."""
+        out: List[str] = []
+        for metric in self._metrics.values():
+            try:
+                lines = metric.collect()
+            except Exception as e:  # noqa: BLE001
+                logger.warning("Failed to collect metric %s: %s", metric.name, e)
+                continue
+            out.append(f"# TYPE {metric.name} {metric.kind}")
+            out.append(f"# HELP {metric.name} {metric.documentation}")
+            out.extend(lines)
+        out.append("# EOF")
+        return "\n".join(out) + "\n"
+
+
+REGISTRY = Registry()
+
+# --- métricas del pipeline de respuesta -------------------------------------
+STAGE_SECONDS = REGISTRY.histogram(
+    "discord_ia_stage_seconds",
+    "Latency of each reply pipeline stage",
+    ("stage",),
+)
+GEMINI_REQUESTS = REGISTRY.counter(
+    "discord_ia_gemini_requests", "Gemini HTTP attempts by outcome (HTTP status, timeout, network)", ("outcome",)
+)
+GEMINI_RETRIES = REGISTRY.counter("discord_ia_gemini_retries", "Gemini attempts retried by tenacity")
+GEMINI_TOKENS = REGISTRY.counter(
+    "discord_ia_gemini_tokens", "Tokens reported by Gemini usageMetadata", ("kind",)
+)
+TRIGGER_BATCH_SIZE = REGISTRY.histogram(
+    "discord_ia_trigger_batch_size",
+    "Triggers answered by a single Gemini call",
+    buckets=(1, 2, 3, 5, 8, 13, 21),
+)
+SEND_ERRORS = REGISTRY.counter("discord_ia_send_errors", "Failed Discord sends")
+SEND_BATCH_SIZE = REGISTRY.histogram(
+    "discord_ia_send_batch_size",
+    "Queued replies merged into a single Discord send",
+    buckets=(1, 2, 3, 5, 8),
+)
+ADMISSION_REJECTIONS = REGISTRY.counter(
+    "discord_ia_admission_rejections", "Triggers shed before generation by priority and reason", ("priority", "reason")
+)
+LLM_GENERATIONS = REGISTRY.counter("discord_ia_llm_generations", "Reply generations by LLM backend", ("backend",))
+LLM_HEDGES = REGISTRY.counter(
+    "discord_ia_llm_hedges", "Hedged generations by the request that answered first", ("winner",)
+)
+LLM_HEDGE_CALL_SECONDS = REGISTRY.histogram(
+    "discord_ia_llm_hedge_call_seconds", "Latency of hedgeable generations, hedged or not", ("kind",)
+)
+CIRCUIT_TRANSITIONS = REGISTRY.counter(
+    "discord_ia_circuit_transitions", "Gemini circuit breaker transitions by new state", ("state",)
+)
+CIRCUIT_REJECTIONS = REGISTRY.counter(
+    "discord_ia_circuit_rejections", "Gemini calls failed fast because the circuit was open"
+)
+INACTIVITY_POOL_LOOKUPS = REGISTRY.counter(
+    "discord_ia_inactivity_pool_lookups", "Inactivity messages served from the pool (hit) or generated when due (miss)",
+    ("result",),
+)
+INACTIVITY_POOL_FILLS = REGISTRY.counter(
+    "discord_ia_inactivity_pool_fills", "Background inactivity message generations by outcome", ("outcome",)
+)
+SUMMARY_COMPACTIONS = REGISTRY.counter(
+    "discord_ia_summary_compactions", "Background history compactions by outcome", ("outcome",)
+)
+SUMMARY_FOLDED_TURNS = REGISTRY.counter("discord_ia_summary_folded_turns", "Turns folded into channel summaries")
+LOOP_LAG_SECONDS = REGISTRY.histogram(
+    "discord_ia_loop_lag_seconds", "How late the event loop ran a timer scheduled by the monitor", buckets=LAG_BUCKETS
+)
+LOOP_STALLS = REGISTRY.counter(
+    "discord_ia_loop_stalls", "Times the event loop stayed blocked past LOOP_SLOW_CALLBACK_SECONDS"
+)
+LOG_RECORDS_DROPPED = REGISTRY.counter(
+    "discord_ia_log_records_dropped", "Log records not written (rate limited or queue full)", ("reason",)
+)
+
+
+class MetricsServer:
+    """Tiny HTTP endpoint serving REGISTRY in the OpenMetrics text format."""
+
+    def __init__(self, host: str, port: int, registry: Registry = REGISTRY) -> None:
+        self.host = host
+        self.port = port
+        self.registry = registry
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    async def start(self) -> None:
+        if self._server is not None:
+            return
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        logger.info("Metrics endpoint listening on http://%s:%s/metrics", self.host, self.port)
+
+    async def stop(self) -> None:
+        server, self._server = self._server, None
+        if server is not None:
+            server.close()
+            await server.wait_closed()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            request_line = await reader.readline()
+            while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                pass
+            parts = request_line.decode("latin-1").split()
+            if len(parts) >= 2 and parts[0] == "GET" and parts[1].split("?")[0] == "/metrics":
+                status, ctype = "200 OK", "application/openmetrics-text; version=1.0.0; charset=utf-8"
+                body = self.registry.render().encode("utf-8")
+            else:
+                status, ctype, body = "404 Not Found", "text/plain", b"not found\n"
+            writer.write(
+                f"HTTP/1.1 {status}\r\nContent-Type: {ctype}\r\nContent-Length: {len(body)}\r\n"
+                "Connection: close\r\n\r\n".encode("latin-1") + body
+            )
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
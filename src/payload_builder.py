@@ -0,0 +1,133 @@
+from __future__ import annotations
+
+import json
+from functools import lru_cache
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+
+# Texto latino: ~4 caracteres por token; el factor aprendido corrige el resto
+_CHARS_PER_TOKEN = 4.0
+# Tokens fijos por turno (rol y separadores)
+_TURN_OVERHEAD = 4
+
+GENERATION_CONFIG = {
+    "temperature": 0.7,
+    "max_output_tokens": 300,
+}
+_GENERATION_FRAGMENT = '"generation_config":' + json.dumps(GENERATION_CONFIG)
+
+
+class TokenEstimator:
+    """Local token estimate (chars / 4) scaled by a factor learned from usageMetadata."""
+
+    def __init__(self, alpha: float = 0.1) -> None:
+        self.alpha = alpha
+        self.factor = 1.0
+        self.samples = 0
+
+    def estimate_chars(self, chars: int) -> int:
+        return int(chars * self.factor / _CHARS_PER_TOKEN) + 1
+
+    def calibrate(self, estimated: int, actual: int) -> None:
+        """Move the factor towards the one that would have predicted `actual`."""
+        if estimated <= 0 or actual <= 0:
+            return
+        # Un valor atípico (p. ej. un prompt casi todo emojis) no desajusta el factor de golpe
+        ratio = min(4.0, max(0.25, actual / estimated))
+        self.factor += self.alpha * (self.factor * ratio - self.factor)
+        self.samples += 1
+
+
+estimator = TokenEstimator()
+
+
+class Turn:
+    """One conversation turn, serialized to its `contents` JSON fragment once.
+
+    A pinned turn (channel summary, recalled exchange) is never trimmed by
+    build_body: its cost comes off the budget before the recent turns.
+    """
+
+    __slots__ = ("role", "text", "fragment", "pinned")
+
+    def __init__(self, role: str, text: str, *, pinned: bool = False) -> None:
+        self.role = role
+        self.text = text
+        self.fragment = json.dumps({"role": role, "parts": [{"text": text}]}, ensure_ascii=False)
+        self.pinned = pinned
+
+    def pin(self) -> "Turn":
+        """Pinned copy sharing the serialized fragment (the turn itself may still be in memory)."""
+        turn = Turn.__new__(Turn)
+        turn.role, turn.text, turn.fragment, turn.pinned = self.role, self.text, self.fragment, True
+        return turn
+
+    def tokens(self) -> int:
+        # Se calcula al usarlo: así el factor calibrado aplica también a turnos viejos
+        return estimator.estimate_chars(len(self.text)) + _TURN_OVERHEAD
+
+    def as_dict(self) -> Dict[str, str]:
+        return {"role": self.role, "text": self.text}
+
+
+HistoryItem = Union[Turn, Dict[str, str]]
+
+
+def as_turn(item: HistoryItem) -> Turn:
+    if isinstance(item, Turn):
+        return item
+    return Turn(item.get("role", "user"), item.get("text", ""))
+
+
+@lru_cache(maxsize=8)
+def _system_head(system_prompt: str) -> str:
+    return '{"system_instruction":' + json.dumps({"parts": [{"text": system_prompt}]}, ensure_ascii=False)
+
+
+def build_body(
+    text: str,
+    system_prompt: str,
+    history: Optional[Sequence[HistoryItem]] = None,
+    *,
+    cached_content: Optional[str] = None,
+    budget: int = 0,
+) -> Tuple[bytes, int]:
+    """Serialize a generateContent body from pre-serialized turn fragments.
+
+    Pinned turns are always sent. The rest of the history is kept from the
+    newest turn backwards while its estimate fits what pinned turns left of
+    `budget` tokens (0 = no limit); the current message is always sent.
+    Returns the body and the estimated prompt tokens, system prompt included
+    even when cached, which is what usageMetadata.promptTokenCount reports.
+    """
+    fragments: List[str] = []
+    used = 0
+    if history:
+        turns = [as_turn(item) for item in history]
+        used = sum(turn.tokens() for turn in turns if turn.pinned and turn.text)
+        full = False
+        for turn in reversed(turns):
+            if not turn.text:
+                continue
+            if not turn.pinned:
+                if full:
+                    continue
+                cost = turn.tokens()
+                if budget and used + cost > budget:
+                    # Sin hueco para más turnos recientes; los fijados que queden antes siguen entrando
+                    full = True
+                    continue
+                used += cost
+            fragments.append(turn.fragment)
+        fragments.reverse()
+    current = Turn("user", text)
+    fragments.append(current.fragment)
+
+    if cached_content:
+        # El system prompt ya vive en la caché del servidor
+        head = '{"cached_content":' + json.dumps(cached_content)
+    else:
+        head = _system_head(system_prompt)
+    body = head + ',"contents":[' + ",".join(fragments) + "]," + _GENERATION_FRAGMENT + "}"
+    prompt_tokens = used + current.tokens() + estimator.estimate_chars(len(system_prompt))
+    return body.encode("utf-8"), prompt_tokens
@@ -0,0 +1,264 @@
+from __future__ import annotations
+
+import asyncio
+import heapq
+import itertools
+import logging
+import random
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+
+from .config import settings
+from .metrics import SEND_BATCH_SIZE, STAGE_SECONDS
+from .tracing import detached_task
+
+
+logger = logging.getLogger(__name__)
+
+SendItem = Dict[str, Any]
+
+_PACING_SECONDS = STAGE_SECONDS.labels("pacing")
+
+# Límite de Discord por mensaje: un lote fusionado nunca lo supera
+DISCORD_MAX_CHARS = 2000
+
+
+def _chars(item: SendItem) -> int:
+    return len(item["content"])
+
+
+def _is_reply(item: SendItem) -> bool:
+    # Las respuestas de un canal se fusionan entre sí y los envíos sueltos al canal
+    # (inactividad) entre sí, nunca unas con otros
+    return item.get("reply_to") is not None
+
+
+class _Lane:
+    """FIFO of pending sends for one channel."""
+
+    __slots__ = ("channel_id", "items", "last_send", "opened", "ready", "due", "token", "active")
+
+    def __init__(self, channel_id: int) -> None:
+        self.channel_id = channel_id
+        self.items: Deque[SendItem] = deque()
+        self.last_send = float("-inf")
+        # Cuándo llegó el item más antiguo pendiente: la ventana de coalescing cuenta desde ahí
+        self.opened = float("-inf")
+        # Hueco de pacing ya sorteado (con su jitter) y deadline vigente en el heap
+        self.ready = float("-inf")
+        self.due = float("-inf")
+        # Token de la entrada vigente en el heap (las demás están obsoletas)
+        self.token = -1
+        self.active = False
+
+
+class SendScheduler:
+    """Paces outbound sends for every channel from a single deadline heap.
+
+    Each channel with pending sends has a FIFO lane. The heap holds the time at
+    which each lane may send next (last send + MIN_SECONDS_BETWEEN_MESSAGES_PER_CHANNEL),
+    and a fixed pool of SEND_CONCURRENCY sender coroutines pops due lanes.
+    A lane is dropped once it is empty and its pacing gap has elapsed, so
+    memory and task count follow the active channels only.
+
+    With COALESCE_WINDOW_SECONDS > 0 the items at the head of a lane that
+    can go out together (replies, or plain channel sends such as inactivity
+    messages, never mixed) are merged into one message within
+    COALESCE_MAX_ITEMS, COALESCE_MAX_CHARS and Discord's 2000-character limit.
+    The window only holds a lane back once its head already has something to
+    merge and room to grow: then it is not due before the oldest item has
+    waited the window (overlapping the pacing gap). A lone item, or one the
+    next item cannot join, goes out at its pacing slot.
+    """
+
+    def __init__(
+        self,
+        deliver: Callable[[List[SendItem]], Awaitable[None]],
+        *,
+        clock: Optional[Callable[[], float]] = None,
+    ) -> None:
+        self._deliver = deliver
+        self._clock = clock or (lambda: asyncio.get_running_loop().time())
+        self._lanes: Dict[int, _Lane] = {}
+        self._heap: List[Tuple[float, int, int]] = []
+        self._tokens = itertools.count()
+        self._senders: List[asyncio.Task] = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self._drained: Optional[asyncio.Event] = None
+        self._outstanding = 0
+
+    # --- API -------------------------------------------------------------
+    def enqueue(self, channel_id: int, item: SendItem) -> None:
+        """Queue an item for the channel; raises asyncio.QueueFull if its lane is full."""
+        lane = self._lanes.get(channel_id)
+        if lane is None:
+            lane = self._lanes[channel_id] = _Lane(channel_id)
+        if len(lane.items) >= settings.QUEUE_MAX_SIZE_PER_CHANNEL:
+            raise asyncio.QueueFull()
+        self._ensure_started()
+        lane.items.append(item)
+        self._outstanding += 1
+        self._drained.clear()
+        if len(lane.items) == 1:
+            lane.opened = self._clock()
+        if lane.active:
+            return
+        if len(lane.items) == 1:
+            self._schedule(lane, self._next_slot(lane))
+        elif self._window() > 0:
+            # El item nuevo puede abrir la ventana (ya hay qué fusionar) o cerrarla (lote completo)
+            due = self._due(lane)
+            if due != lane.due:
+                self._schedule(lane, due)
+
+    def depth(self, channel_id: int) -> int:
+        lane = self._lanes.get(channel_id)
+        return len(lane.items) if lane is not None else 0
+
+    def total_depth(self) -> int:
+        return sum(len(lane.items) for lane in self._lanes.values())
+
+    def max_depth(self) -> int:
+        return max((len(lane.items) for lane in self._lanes.values()), default=0)
+
+    def active_lanes(self) -> int:
+        return len(self._lanes)
+
+    async def join(self) -> None:
+        """Wait until every queued item has been delivered (or failed)."""
+        if self._drained is not None:
+            await self._drained.wait()
+
+    async def close(self) -> None:
+        senders, self._senders = self._senders, []
+        for task in senders:
+            task.cancel()
+        await asyncio.gather(*senders, return_exceptions=True)
+
+    # --- internos --------------------------------------------------------
+    def _ensure_started(self) -> None:
+        if self._senders:
+            return
+        self._wakeup = asyncio.Event()
+        self._drained = asyncio.Event()
+        self._drained.set()
+        # Se arrancan con el primer envío, casi siempre dentro de la traza de un trigger
+        self._senders = [
+            detached_task(self._run_sender()) for _ in range(max(1, settings.SEND_CONCURRENCY))
+        ]
+
+    @staticmethod
+    def _window() -> float:
+        return settings.COALESCE_WINDOW_SECONDS
+
+    @staticmethod
+    def _max_chars() -> int:
+        return min(DISCORD_MAX_CHARS, max(1, settings.COALESCE_MAX_CHARS))
+
+    def _should_wait(self, lane: _Lane) -> bool:
+        """Whether the head batch has something to merge and could still grow."""
+        reply = _is_reply(lane.items[0])
+        count, size = 0, -1
+        for item in lane.items:
+            if _is_reply(item) != reply:
+                # El siguiente item no se puede fusionar: el lote de cabeza ya no crece
+                return False
+            count += 1
+            # +1 por el salto de línea que separa cada item en el mensaje fusionado
+            size += _chars(item) + 1
+            if count >= settings.COALESCE_MAX_ITEMS or size >= self._max_chars():
+                return False
+        # Un item solo no espera a nadie: sale en su hueco de pacing
+        return count > 1
+
+    def _take_batch(self, lane: _Lane) -> List[SendItem]:
+        batch = [lane.items.popleft()]
+        if self._window() <= 0:
+            return batch
+        reply = _is_reply(batch[0])
+        size, limit = _chars(batch[0]), self._max_chars()
+        while lane.items and len(batch) < settings.COALESCE_MAX_ITEMS and _is_reply(lane.items[0]) == reply:
+            size += 1 + _chars(lane.items[0])
+            if size > limit:
+                break
+            batch.append(lane.items.popleft())
+        if lane.items:
+            # Lo que no cupo ya esperó su ventana: sale en el siguiente hueco de pacing
+            lane.opened = float("-inf")
+        return batch
+
+    def _next_slot(self, lane: _Lane) -> float:
+        now = self._clock()
+        ready = lane.last_send + settings.MIN_SECONDS_BETWEEN_MESSAGES_PER_CHANNEL
+        if ready <= now:
+            due = now
+        else:
+            # Igual que antes: jitter solo cuando hay que esperar al pacing
+            due = ready + random.uniform(0.0, settings.SEND_JITTER_SECONDS)
+            if lane.items:
+                # Solo cuenta como espera de pacing si hay algo esperando salir
+                _PACING_SECONDS.observe(due - now)
+        lane.ready = due
+        return self._due(lane)
+
+    def _due(self, lane: _Lane) -> float:
+        window = self._window()
+        if window > 0 and lane.items and self._should_wait(lane):
+            # La ventana corre a la vez que el pacing: solo se espera lo que falte
+            return max(lane.ready, lane.opened + window)
+        return lane.ready
+
+    def _schedule(self, lane: _Lane, due: float) -> None:
+        lane.due = due
+        lane.token = next(self._tokens)
+        heapq.heappush(self._heap, (due, lane.token, lane.channel_id))
+        self._wakeup.set()
+
+    async def _next_due_lane(self) -> _Lane:
+        while True:
+            delay: Optional[float] = None
+            while self._heap:
+                due, token, channel_id = self._heap[0]
+                lane = self._lanes.get(channel_id)
+                if lane is None or lane.token != token:
+                    heapq.heappop(self._heap)  # entrada obsoleta
+                    continue
+                delay = due - self._clock()
+                if delay > 0:
+                    break
+                heapq.heappop(self._heap)
+                lane.token = -1
+                if lane.items:
+                    lane.active = True
+                    return lane
+                # Carril vacío y pacing cumplido: ya no hace falta recordarlo
+                del self._lanes[channel_id]
+                delay = None
+            self._wakeup.clear()
+            # asyncio.wait y no wait_for: en 3.11 wait_for se traga un cancel que
+            # llega justo cuando el evento se activa y close() no termina nunca
+            waiter = asyncio.ensure_future(self._wakeup.wait())
+            try:
+                await asyncio.wait({waiter}, timeout=delay)
+            finally:
+                waiter.cancel()
+
+    async def _run_sender(self) -> None:
+        while True:
+            lane = await self._next_due_lane()
+            batch = self._take_batch(lane)
+            SEND_BATCH_SIZE.observe(len(batch))
+            try:
+                await self._deliver(batch)
+                lane.last_send = self._clock()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:  # noqa: BLE001
+                logger.error("Send worker error", exc_info=e)
+            finally:
+                lane.active = False
+                self._outstanding -= len(batch)
+                if self._outstanding == 0:
+                    self._drained.set()
+                # Siguiente envío del canal, o retiro del carril cuando pase el gap
+                self._schedule(lane, self._next_slot(lane))
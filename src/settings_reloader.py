@@ -0,0 +1,91 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import signal
+from typing import Callable, List, Optional
+
+from . import config
+from .config import RESTART_REQUIRED_FIELDS, settings
+
+
+logger = logging.getLogger(__name__)
+
+ReloadCallback = Callable[[List[str]], None]
+
+
+class SettingsReloader:
+    """Reloads `.env` into the live settings on SIGHUP or when the file changes.
+
+    The gateway connection is untouched: settings are swapped in place and
+    `on_reload` recompiles whatever was derived from them (location filters...).
+    """
+
+    def __init__(self, on_reload: Optional[ReloadCallback] = None) -> None:
+        self._on_reload = on_reload
+        self._task: Optional[asyncio.Task] = None
+        self._signal_installed = False
+        self._mtime = self._env_mtime()
+
+    def start(self) -> None:
+        loop = asyncio.get_running_loop()
+        if not self._signal_installed:
+            try:
+                loop.add_signal_handler(signal.SIGHUP, self.reload)
+                self._signal_installed = True
+            except (AttributeError, NotImplementedError, RuntimeError):
+                # Windows no tiene SIGHUP: queda el sondeo del fichero
+                logger.debug("SIGHUP reload not available on this platform")
+        if self._task is None and settings.SETTINGS_RELOAD_POLL_SECONDS > 0 and config.env_path:
+            self._task = asyncio.create_task(self._watch())
+
+    async def stop(self) -> None:
+        if self._signal_installed:
+            try:
+                asyncio.get_running_loop().remove_signal_handler(signal.SIGHUP)
+            except (AttributeError, NotImplementedError, RuntimeError):
+                pass
+            self._signal_installed = False
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+
+    def reload(self) -> List[str]:
+        """Apply the current `.env`; keeps the old settings if it does not validate."""
+        self._mtime = self._env_mtime()
+        try:
+            changed = config.reload_settings()
+        except Exception as e:  # noqa: BLE001
+            logger.error("Settings reload rejected, keeping current settings: %s", e)
+            return []
+        if not changed:
+            logger.info("Settings reloaded: no changes")
+            return changed
+        logger.info("Settings reloaded: %s", ", ".join(sorted(changed)))
+        stale = RESTART_REQUIRED_FIELDS.intersection(changed)
+        if stale:
+            logger.warning("Changed settings need a restart to take effect: %s", ", ".join(sorted(stale)))
+        if self._on_reload is not None:
+            try:
+                self._on_reload(changed)
+            except Exception as e:  # noqa: BLE001
+                logger.error("Settings reload hook failed", exc_info=e)
+        return changed
+
+    @staticmethod
+    def _env_mtime() -> Optional[int]:
+        if not config.env_path:
+            return None
+        try:
+            return os.stat(config.env_path).st_mtime_ns
+        except OSError:
+            return None
+
+    async def _watch(self) -> None:
+        while True:
+            await asyncio.sleep(max(0.1, settings.SETTINGS_RELOAD_POLL_SECONDS))
+            mtime = self._env_mtime()
+            if mtime is not None and mtime != self._mtime:
+                self.reload()
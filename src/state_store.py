@@ -0,0 +1,217 @@
+from __future__ import annotations
+
+import asyncio
+import time
+from collections import OrderedDict, deque
+from typing import TYPE_CHECKING, Any, Callable, Deque, Dict, List, Optional, Tuple
+
+from .payload_builder import Turn
+
+if TYPE_CHECKING:
+    from .vector_index import ChannelVectors
+
+
+class ChannelState:
+    """Per-channel record: activity and conversation memory."""
+
+    __slots__ = (
+        "channel_id",
+        "last_seen",
+        "last_trigger",
+        "memory",
+        "history_loaded",
+        "history_loader",
+        "pending_triggers",
+        "pending_since",
+        "vectors",
+        "summary",
+        "idle_replies",
+    )
+
+    def __init__(self, channel_id: int, memory_turns: int, now: float) -> None:
+        self.channel_id = channel_id
+        self.last_seen = now
+        self.last_trigger: Optional[float] = None
+        # Turnos ya serializados para el payload; el deque descarta los más viejos
+        self.memory: Deque[Turn] = deque(maxlen=memory_turns)
+        # Carga perezosa desde el backend persistente (si lo hay)
+        self.history_loaded = False
+        self.history_loader: Optional[asyncio.Future] = None
+        # Triggers llegados mientras se responde en el canal (esperan una única respuesta),
+        # o None si no hay respuesta en curso; pending_since: llegada del primero
+        self.pending_triggers: Optional[List[Any]] = None
+        self.pending_since = 0.0
+        # Índice de intercambios antiguos (memoria vectorial), creado con el primer intercambio
+        self.vectors: Optional["ChannelVectors"] = None
+        # Resumen acumulado de los turnos ya plegados (HistoryCompactor), como un turno más
+        self.summary: Optional[Turn] = None
+        # Mensajes de inactividad pregenerados (InactivityPool): (generado en, texto), el más viejo primero
+        self.idle_replies: Optional[Deque[Tuple[float, str]]] = None
+
+
+class StateStore:
+    """Bounded store for per-channel and per-(channel, author) state.
+
+    Channels expire `ttl_seconds` after their last access and the least recently
+    used ones are evicted beyond `max_channels`. Cooldown entries are dropped as
+    soon as their cooldown has elapsed, or LRU beyond `max_cooldowns`. Eviction is
+    amortized into lookups, so there is no background sweeper.
+    """
+
+    def __init__(
+        self,
+        *,
+        max_channels: int,
+        max_cooldowns: int,
+        ttl_seconds: float,
+        memory_turns: int,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.max_channels = max_channels
+        self.max_cooldowns = max_cooldowns
+        self.ttl_seconds = ttl_seconds
+        self.memory_turns = memory_turns
+        self._clock = clock
+        self._channels: "OrderedDict[int, ChannelState]" = OrderedDict()
+        self._cooldowns: "OrderedDict[Tuple[int, int], float]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions_ttl = 0
+        self.evictions_lru = 0
+        self.cooldown_evictions = 0
+
+    # --- canales -----------------------------------------------------------
+    def channel(self, channel_id: int) -> ChannelState:
+        """Return the channel record, creating it if needed, and mark it as used."""
+        now = self._clock()
+        ch = self._channels.get(channel_id)
+        if ch is not None:
+            self.hits += 1
+            ch.last_seen = now
+            self._channels.move_to_end(channel_id)
+        else:
+            self.misses += 1
+            ch = ChannelState(channel_id, self.memory_turns, now)
+            self._channels[channel_id] = ch
+        self._evict_channels(now)
+        return ch
+
+    def peek(self, channel_id: int) -> Optional[ChannelState]:
+        """Return the channel record without creating it or refreshing its TTL."""
+        return self._channels.get(channel_id)
+
+    def channels(self) -> List[ChannelState]:
+        return list(self._channels.values())
+
+    def _evict_channels(self, now: float) -> None:
+        # El frente del OrderedDict es el menos usado: basta mirar desde ahí
+        while self._channels:
+            channel_id, ch = next(iter(self._channels.items()))
+            expired = now - ch.last_seen >= self.ttl_seconds
+            over_cap = len(self._channels) > self.max_channels
+            if not expired and not over_cap:
+                return
+            del self._channels[channel_id]
+            if expired:
+                self.evictions_ttl += 1
+            else:
+                self.evictions_lru += 1
+
+    # --- cooldowns ---------------------------------------------------------
+    def try_cooldown(self, channel_id: int, author_id: int, cooldown: float) -> bool:
+        """Start the (channel, author) cooldown; False if it is still running."""
+        now = self._clock()
+        key = (channel_id, author_id)
+        last = self._cooldowns.get(key)
+        if last is not None and now - last < cooldown:
+            return False
+        self._cooldowns[key] = now
+        self._cooldowns.move_to_end(key)
+        while self._cooldowns:
+            oldest_key, oldest = next(iter(self._cooldowns.items()))
+            if now - oldest < cooldown and len(self._cooldowns) <= self.max_cooldowns:
+                break
+            del self._cooldowns[oldest_key]
+            self.cooldown_evictions += 1
+        return True
+
+    # --- métricas ----------------------------------------------------------
+    def counters(self) -> Dict[str, int]:
+        return {
+            "channels": len(self._channels),
+            "cooldowns": len(self._cooldowns),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions_ttl": self.evictions_ttl,
+            "evictions_lru": self.evictions_lru,
+            "cooldown_evictions": self.cooldown_evictions,
+        }
+
+
+DISCORD_EPOCH_MS = 1420070400000
+# Margen por desfase entre nuestro reloj y el de Discord
+_CLOCK_SKEW_SECONDS = 5.0
+
+
+def snowflake_time(snowflake: int) -> float:
+    """Unix time in seconds encoded in a Discord snowflake."""
+    return ((snowflake >> 22) + DISCORD_EPOCH_MS) / 1000.0
+
+
+class SentMessageIndex:
+    """IDs of messages we authored, bounded by age and count.
+
+    Answers "is this message ours?" without HTTP. A hit is authoritative, and
+    so is a miss for a message created after the index coverage start: every
+    message of ours since then was recorded. For older messages is_ours()
+    returns None and the caller has to fetch. Coverage moves forward as
+    entries age out of `window_seconds` or are evicted beyond `max_ids`.
+    """
+
+    def __init__(self, *, window_seconds: float, max_ids: int, clock: Callable[[], float] = time.time) -> None:
+        self.window_seconds = window_seconds
+        self.max_ids = max_ids
+        self._clock = clock
+        self._ids: "OrderedDict[int, None]" = OrderedDict()
+        self._covered_from = clock() + _CLOCK_SKEW_SECONDS
+        self.hits = 0
+        self.misses = 0
+        self.unknown = 0
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def reset_coverage(self) -> None:
+        """Forget what we could vouch for (e.g. after a gateway gap we did not see)."""
+        self._covered_from = max(self._covered_from, self._clock() + _CLOCK_SKEW_SECONDS)
+
+    def add(self, message_id: int) -> None:
+        self._ids[message_id] = None
+        self._evict()
+
+    def is_ours(self, message_id: int) -> Optional[bool]:
+        """True/False when known locally; None if the message predates the coverage."""
+        if message_id in self._ids:
+            self.hits += 1
+            return True
+        self._evict()
+        if snowflake_time(message_id) > self._covered_from:
+            self.misses += 1
+            return False
+        self.unknown += 1
+        return None
+
+    def _evict(self) -> None:
+        cutoff = self._clock() - self.window_seconds
+        # Los snowflakes crecen con el tiempo: el más antiguo está al frente
+        while self._ids:
+            oldest = next(iter(self._ids))
+            oldest_at = snowflake_time(oldest)
+            if oldest_at >= cutoff and len(self._ids) <= self.max_ids:
+                break
+            del self._ids[oldest]
+            self._covered_from = max(self._covered_from, oldest_at)
+        self._covered_from = max(self._covered_from, cutoff)
+
+    def counters(self) -> Dict[str, int]:
+        return {"hit": self.hits, "miss": self.misses, "fetch": self.unknown}
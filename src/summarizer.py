@@ -0,0 +1,153 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, List, Optional, Set
+
+from .config import settings
+from .gemini_client import PRIORITY_BACKGROUND
+from .metrics import SUMMARY_COMPACTIONS, SUMMARY_FOLDED_TURNS
+from .payload_builder import Turn
+from .state_store import ChannelState
+from .tracing import detached_task
+
+
+logger = logging.getLogger(__name__)
+
+# generate_reply(text, system_prompt, *, priority) -> texto
+Generate = Callable[..., Awaitable[str]]
+
+SUMMARY_PREFIX = "[resumen de la conversación anterior] "
+
+_SUMMARY_SYSTEM_PROMPT = (
+    "Resumes conversaciones de un chat de Discord para usarlas como memoria. "
+    "Conserva nombres, datos concretos, preferencias y temas abiertos; omite saludos y relleno. "
+    "Escribe en el idioma de la conversación, en texto plano, sin viñetas."
+)
+
+# Tras un fallo, el canal no vuelve a intentarlo hasta pasado este tiempo
+_RETRY_SECONDS = 60.0
+# Se pliega antes de llenar la memoria: margen para los turnos que entran mientras se genera
+_HEADROOM_TURNS = 4
+
+
+def history_tokens(ch: ChannelState) -> int:
+    total = sum(turn.tokens() for turn in ch.memory)
+    return total + (ch.summary.tokens() if ch.summary is not None else 0)
+
+
+def with_summary(ch: ChannelState, turns: List[Turn]) -> List[Turn]:
+    return [ch.summary, *turns] if ch.summary is not None else turns
+
+
+def _clip(text: str, max_chars: int) -> str:
+    text = " ".join(text.split())
+    if len(text) <= max_chars:
+        return text
+    cut = text.rfind(" ", 0, max_chars)
+    return text[: cut if cut > 0 else max_chars].rstrip() + "…"
+
+
+class HistoryCompactor:
+    """Folds the oldest turns of long channels into a rolling summary, off the reply path.
+
+    After each reply `maybe_compact` checks the channel: once its history
+    (summary included) passes SUMMARY_TRIGGER_TOKENS, or the memory deque is
+    a few turns from dropping the oldest ones, a background task asks the LLM, at PRIORITY_BACKGROUND,
+    to merge the previous summary with every turn except the last
+    SUMMARY_KEEP_TURNS. The folded turns are then removed and the summary goes
+    first in the history as a single turn. One task per channel and
+    SUMMARY_CONCURRENCY in total; replies never wait for them.
+    """
+
+    def __init__(self, generate: Generate, *, clock: Callable[[], float]) -> None:
+        self._generate = generate
+        self._clock = clock
+        self._inflight: Set[int] = set()
+        self._tasks: Set[asyncio.Task] = set()
+        self._retry_at: Dict[int, float] = {}
+        self._slots: Optional[asyncio.Semaphore] = None
+
+    def inflight(self) -> int:
+        return len(self._inflight)
+
+    def maybe_compact(self, ch: ChannelState) -> None:
+        if not settings.SUMMARY_ENABLED or ch.channel_id in self._inflight:
+            return
+        if len(ch.memory) <= settings.SUMMARY_KEEP_TURNS:
+            return
+        about_to_drop = ch.memory.maxlen is not None and len(ch.memory) >= ch.memory.maxlen - _HEADROOM_TURNS
+        if not about_to_drop and history_tokens(ch) <= settings.SUMMARY_TRIGGER_TOKENS:
+            return
+        now = self._clock()
+        if self._retry_at.get(ch.channel_id, 0.0) > now:
+            return
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(max(1, settings.SUMMARY_CONCURRENCY))
+        self._inflight.add(ch.channel_id)
+        # Fuera de la traza del trigger que la dispara: esa traza ya habrá terminado
+        task = detached_task(self._compact(ch, self._slots))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def close(self) -> None:
+        tasks = list(self._tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _compact(self, ch: ChannelState, slots: asyncio.Semaphore) -> None:
+        try:
+            async with slots:
+                folded = list(ch.memory)[: max(0, len(ch.memory) - settings.SUMMARY_KEEP_TURNS)]
+                if not folded:
+                    return
+                text = await self._generate(
+                    self._prompt(ch.summary, folded),
+                    _SUMMARY_SYSTEM_PROMPT,
+                    priority=PRIORITY_BACKGROUND,
+                )
+            summary = _clip(text, settings.SUMMARY_MAX_CHARS)
+            if not summary:
+                raise ValueError("empty summary")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:  # noqa: BLE001
+            SUMMARY_COMPACTIONS.labels("failed").inc()
+            logger.warning("History compaction failed for channel %s: %s", ch.channel_id, e)
+            self._set_retry(ch.channel_id)
+            return
+        finally:
+            self._inflight.discard(ch.channel_id)
+        # Mientras se generaba pudieron entrar turnos nuevos (o salir plegados por el maxlen,
+        # que ya están en el resumen): solo se quitan los plegados que siguen al frente
+        gone = {id(turn) for turn in folded}
+        while ch.memory and id(ch.memory[0]) in gone:
+            ch.memory.popleft()
+        ch.summary = Turn("user", SUMMARY_PREFIX + summary, pinned=True)
+        self._retry_at.pop(ch.channel_id, None)
+        SUMMARY_COMPACTIONS.labels("ok").inc()
+        SUMMARY_FOLDED_TURNS.inc(len(folded))
+        logger.debug("Folded %d turns of channel %s into a %d-char summary", len(folded), ch.channel_id, len(summary))
+
+    def _set_retry(self, channel_id: int) -> None:
+        now = self._clock()
+        if len(self._retry_at) >= 1024:
+            self._retry_at = {k: v for k, v in self._retry_at.items() if v > now}
+        self._retry_at[channel_id] = now + _RETRY_SECONDS
+
+    @staticmethod
+    def _prompt(previous: Optional[Turn], turns: List[Turn]) -> str:
+        lines = []
+        if previous is not None:
+            lines.append("Resumen hasta ahora: " + previous.text[len(SUMMARY_PREFIX):])
+            lines.append("")
+        lines.append("Conversación a incorporar:")
+        for turn in turns:
+            lines.append(f"{'yo' if turn.role == 'model' else 'usuario'}: {turn.text}")
+        lines.append("")
+        lines.append(
+            f"Escribe un único resumen actualizado (máximo {settings.SUMMARY_MAX_CHARS} caracteres) "
+            "que sustituya al anterior."
+        )
+        return "\n".join(lines)
@@ -0,0 +1,360 @@
+from __future__ import annotations
+
+import asyncio
+import contextvars
+import json
+import logging
+import os
+import random
+import time
+from abc import ABC, abstractmethod
+from typing import Any, Coroutine, Dict, List, Optional, Union
+
+import httpx
+
+from .config import settings
+
+
+logger = logging.getLogger(__name__)
+
+AttrValue = Union[str, int, float, bool]
+
+_current: "contextvars.ContextVar[Optional[Span]]" = contextvars.ContextVar("discord_ia_span", default=None)
+
+
+def _new_id(nbytes: int) -> str:
+    return os.urandom(nbytes).hex()
+
+
+class Span:
+    """One timed operation of a sampled trace.
+
+    Spans that end while their root is still open are held on the root, so a
+    root that turns out to be uninteresting (a message that is not a trigger)
+    can be dropped together with its children. Later spans (queue, send) are
+    exported as they end.
+    """
+
+    __slots__ = (
+        "name", "trace_id", "span_id", "parent_id", "start_ns", "end_ns",
+        "attributes", "error", "_tracer", "_root", "_held", "_dropped", "_token",
+    )
+    sampled = True
+
+    def __init__(
+        self, tracer: "Tracer", name: str, trace_id: str, parent: Optional["Span"], start_ns: Optional[int]
+    ) -> None:
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = _new_id(8)
+        self.parent_id = parent.span_id if parent is not None else None
+        self.start_ns = start_ns if start_ns is not None else time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.attributes: Dict[str, AttrValue] = {}
+        self.error: Optional[str] = None
+        self._tracer = tracer
+        self._root: Span = parent._root if parent is not None else self
+        self._held: Optional[List[Span]] = [] if parent is None else None
+        self._dropped = False
+        self._token: Optional[contextvars.Token] = None
+
+    def set(self, key: str, value: AttrValue) -> None:
+        self.attributes[key] = value
+
+    def incr(self, key: str) -> int:
+        value = int(self.attributes.get(key, 0)) + 1
+        self.attributes[key] = value
+        return value
+
+    def drop(self) -> None:
+        """Discard the whole trace (only meaningful on the root, before it ends)."""
+        self._root._dropped = True
+
+    def end(self, end_ns: Optional[int] = None) -> None:
+        if self.end_ns is not None:
+            return
+        self.end_ns = end_ns if end_ns is not None else time.time_ns()
+        root = self._root
+        if root is not self:
+            if root.end_ns is None:
+                root._held.append(self)
+            elif not root._dropped:
+                self._tracer.export(self)
+            return
+        held, self._held = self._held, None
+        if not self._dropped:
+            for span in held:
+                self._tracer.export(span)
+            self._tracer.export(self)
+
+    def __enter__(self) -> "Span":
+        self._token = _current.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is not None and not issubclass(exc_type, asyncio.CancelledError):
+            self.error = exc_type.__name__
+        _current.reset(self._token)
+        self.end()
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start_ns": self.start_ns,
+            "end_ns": self.end_ns,
+            "duration_ms": round((self.end_ns - self.start_ns) / 1e6, 3),
+            "attributes": self.attributes,
+            "error": self.error,
+        }
+
+
+class _NoopSpan:
+    """Stand-in for unsampled traces: every operation is a no-op."""
+
+    __slots__ = ()
+    sampled = False
+
+    def set(self, key: str, value: AttrValue) -> None:
+        pass
+
+    def incr(self, key: str) -> int:
+        return 0
+
+    def drop(self) -> None:
+        pass
+
+    def end(self, end_ns: Optional[int] = None) -> None:
+        pass
+
+    def __enter__(self) -> "_NoopSpan":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+AnySpan = Union[Span, _NoopSpan]
+
+
+class _Activation:
+    """Makes an existing span current without ending it (e.g. in a sender task).
+
+    An unsampled or missing span clears the current one instead, so work done
+    for it never lands in whatever trace the task happened to inherit.
+    """
+
+    __slots__ = ("_span", "_token")
+
+    def __init__(self, span: Optional[AnySpan]) -> None:
+        self._span = span
+        self._token: Optional[contextvars.Token] = None
+
+    def __enter__(self) -> Optional[AnySpan]:
+        self._token = _current.set(self._span if isinstance(self._span, Span) else None)
+        return self._span
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if self._token is not None:
+            _current.reset(self._token)
+
+
+class _BufferedExporter(ABC):
+    """Collects finished spans in memory and writes them in batches off the hot path."""
+
+    def __init__(self, *, flush_interval: float, max_buffer: int = 10000) -> None:
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+        self._buffer: List[Span] = []
+        self._task: Optional[asyncio.Task] = None
+        self.exported = 0
+        self.dropped = 0
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self) -> None:
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+        await self.flush()
+
+    def export(self, span: Span) -> None:
+        if len(self._buffer) >= self.max_buffer:
+            # Sin colector que drene: mejor perder trazas que memoria
+            self.dropped += 1
+            return
+        self._buffer.append(span)
+
+    async def flush(self) -> None:
+        batch, self._buffer = self._buffer, []
+        if not batch:
+            return
+        try:
+            await self._write(batch)
+            self.exported += len(batch)
+        except Exception as e:  # noqa: BLE001
+            self.dropped += len(batch)
+            logger.warning("Failed to export %d spans: %s", len(batch), e)
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    @abstractmethod
+    async def _write(self, batch: List[Span]) -> None: ...
+
+
+class JsonlExporter(_BufferedExporter):
+    """Appends one JSON object per span to a local file."""
+
+    def __init__(self, path: str, **kwargs: Any) -> None:
+        super().__init__(**kwargs)
+        self.path = path
+
+    async def _write(self, batch: List[Span]) -> None:
+        data = "".join(json.dumps(span.as_dict(), ensure_ascii=False) + "\n" for span in batch)
+        await asyncio.to_thread(self._append, data)
+
+    def _append(self, data: str) -> None:
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(data)
+
+
+def _otlp_value(value: AttrValue) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+class OtlpHttpExporter(_BufferedExporter):
+    """Posts batches to an OTLP/HTTP collector using the JSON encoding (/v1/traces)."""
+
+    def __init__(self, endpoint: str, *, service_name: str = "discord-ia-conversacional", **kwargs: Any) -> None:
+        super().__init__(**kwargs)
+        self.endpoint = endpoint
+        self.service_name = service_name
+        self._client: Optional[httpx.AsyncClient] = None
+
+    async def close(self) -> None:
+        await super().close()
+        client, self._client = self._client, None
+        if client is not None:
+            await client.aclose()
+
+    def encode(self, batch: List[Span]) -> Dict[str, Any]:
+        spans = []
+        for span in batch:
+            item: Dict[str, Any] = {
+                "traceId": span.trace_id,
+                "spanId": span.span_id,
+                "name": span.name,
+                "kind": 1,  # SPAN_KIND_INTERNAL
+                "startTimeUnixNano": str(span.start_ns),
+                "endTimeUnixNano": str(span.end_ns),
+                "attributes": [{"key": k, "value": _otlp_value(v)} for k, v in span.attributes.items()],
+                # STATUS_CODE_ERROR = 2, STATUS_CODE_UNSET = 0
+                "status": {"code": 2, "message": span.error} if span.error else {"code": 0},
+            }
+            if span.parent_id:
+                item["parentSpanId"] = span.parent_id
+            spans.append(item)
+        return {
+            "resourceSpans": [{
+                "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": self.service_name}}]},
+                "scopeSpans": [{"scope": {"name": __name__}, "spans": spans}],
+            }]
+        }
+
+    async def _write(self, batch: List[Span]) -> None:
+        if self._client is None:
+            self._client = httpx.AsyncClient(timeout=5.0)
+        resp = await self._client.post(self.endpoint, json=self.encode(batch))
+        resp.raise_for_status()
+
+
+class Tracer:
+    """Head-sampled tracing of the reply pipeline; near-free when disabled or unsampled."""
+
+    def __init__(self) -> None:
+        self.exporter: Optional[_BufferedExporter] = None
+        self.sample_rate = 0.0
+        self._random = random.random
+
+    @property
+    def enabled(self) -> bool:
+        return self.exporter is not None
+
+    def start(self) -> None:
+        """Create the exporter from settings (idempotent)."""
+        if self.exporter is not None or not settings.TRACING_ENABLED:
+            return
+        kind = settings.TRACING_EXPORTER
+        interval = settings.TRACING_FLUSH_INTERVAL_SECONDS
+        if kind == "otlp":
+            self.exporter = OtlpHttpExporter(settings.TRACING_OTLP_ENDPOINT, flush_interval=interval)
+        else:
+            self.exporter = JsonlExporter(settings.TRACING_JSONL_PATH, flush_interval=interval)
+        self.sample_rate = settings.TRACING_SAMPLE_RATE
+        self.exporter.start()
+        logger.info("Tracing enabled (%s exporter, sample rate %.3f)", kind, self.sample_rate)
+
+    async def stop(self) -> None:
+        exporter, self.exporter = self.exporter, None
+        if exporter is not None:
+            await exporter.close()
+
+    def export(self, span: Span) -> None:
+        if self.exporter is not None:
+            self.exporter.export(span)
+
+    def trace(self, name: str, **attributes: AttrValue) -> AnySpan:
+        """Start a root span; the sampling decision is taken here for the whole trace."""
+        if self.exporter is None or self._random() >= self.sample_rate:
+            return NOOP_SPAN
+        span = Span(self, name, _new_id(16), None, None)
+        span.attributes.update(attributes)
+        return span
+
+    def span(
+        self, name: str, *, parent: Optional[AnySpan] = None, start_ns: Optional[int] = None, **attributes: AttrValue
+    ) -> AnySpan:
+        """Child of `parent` or of the current span; a no-op outside a sampled trace."""
+        if parent is None:
+            parent = _current.get()
+        if not isinstance(parent, Span):
+            return NOOP_SPAN
+        span = Span(self, name, parent.trace_id, parent, start_ns)
+        if attributes:
+            span.attributes.update(attributes)
+        return span
+
+    @staticmethod
+    def current() -> Optional[Span]:
+        return _current.get()
+
+    @staticmethod
+    def activate(span: Optional[AnySpan]) -> _Activation:
+        return _Activation(span)
+
+
+tracer = Tracer()
+
+
+def detached_task(coro: Coroutine[Any, Any, Any]) -> "asyncio.Task[Any]":
+    """create_task outside the current trace, for tasks that outlive the code that starts them.
+
+    A task copies the caller's context: started from inside a trigger it
+    would keep that trigger's span as current for good.
+    """
+    return contextvars.Context().run(asyncio.create_task, coro)
@@ -0,0 +1,231 @@
+from __future__ import annotations
+
+import hashlib
+import heapq
+import logging
+import math
+import operator
+import re
+from array import array
+from typing import List, Optional, Protocol, Sequence, Tuple
+
+from .config import settings
+from .gemini_client import open_client
+from .payload_builder import Turn
+
+try:
+    import numpy as np
+except ImportError:  # está en requirements.txt; sin él se usa array('f') y productos escalares en Python
+    np = None
+
+
+logger = logging.getLogger(__name__)
+
+Vector = Sequence[float]
+
+
+class EmbeddingProvider(Protocol):
+    """Turns texts into vectors; one call per batch."""
+
+    name: str
+
+    async def embed(self, texts: Sequence[str]) -> List[Vector]: ...
+
+
+_WORD = re.compile(r"\w+", re.UNICODE)
+
+
+class HashingEmbedder:
+    """Deterministic local embeddings: signed feature hashing of words and word bigrams.
+
+    No network and no model: the same text always gets the same vector, in
+    this process or any other, which makes it the provider for benches and
+    tests. Relevance is lexical only.
+    """
+
+    name = "hashing"
+
+    def __init__(self, dim: int = 256) -> None:
+        self.dim = dim
+
+    def embed_one(self, text: str) -> List[float]:
+        vec = [0.0] * self.dim
+        words = _WORD.findall(text.lower())
+        features = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+        for feature in features:
+            h = int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "little")
+            vec[h % self.dim] += 1.0 if (h >> 63) & 1 else -1.0
+        return vec
+
+    async def embed(self, texts: Sequence[str]) -> List[Vector]:
+        return [self.embed_one(text) for text in texts]
+
+
+class GeminiEmbedder:
+    """Gemini batchEmbedContents on the shared HTTP client (embedding quota is separate from generation)."""
+
+    def __init__(self, model: str) -> None:
+        self.model = model
+        self.name = f"gemini:{model}"
+
+    async def embed(self, texts: Sequence[str]) -> List[Vector]:
+        body = {
+            "requests": [
+                {"model": f"models/{self.model}", "content": {"parts": [{"text": text}]}} for text in texts
+            ]
+        }
+        resp = await open_client().post(
+            f"/v1beta/models/{self.model}:batchEmbedContents",
+            params={"key": settings.GEMINI_API_KEY},
+            json=body,
+            timeout=settings.TIMEOUT_S,
+        )
+        resp.raise_for_status()
+        return [item["values"] for item in resp.json()["embeddings"]]
+
+
+def build_embedder() -> EmbeddingProvider:
+    if settings.VECTOR_EMBEDDER == "gemini":
+        return GeminiEmbedder(settings.VECTOR_EMBEDDING_MODEL)
+    return HashingEmbedder(settings.VECTOR_DIM)
+
+
+embedder: EmbeddingProvider = build_embedder()
+
+
+def configure() -> None:
+    """Rebuild the embedding provider from settings (startup, hot reload)."""
+    global embedder
+    embedder = build_embedder()
+
+
+# Sin numpy: math.sumprod (Python 3.12+) va en C; antes, map(mul) sobre la vista de la fila
+_dot = getattr(math, "sumprod", None) or (lambda a, b: sum(map(operator.mul, a, b)))
+
+
+def _normalized(vector: Vector) -> List[float]:
+    norm = math.sqrt(sum(x * x for x in vector))
+    if norm == 0.0:
+        return [0.0] * len(vector)
+    return [x / norm for x in vector]
+
+
+class Exchange:
+    """One user turn and our reply, kept as the already serialized Turns."""
+
+    __slots__ = ("seq", "user", "model")
+
+    def __init__(self, seq: int, user: Turn, model: Turn) -> None:
+        self.seq = seq
+        self.user = user
+        self.model = model
+
+
+class ChannelVectors:
+    """Bounded per-channel index of past exchanges, packed in one float32 block.
+
+    Vectors are L2-normalized on insert, so cosine similarity is a dot product
+    and a search is one matrix-vector product over every stored row (NumPy),
+    or a loop of dot products over an array('f') without it. Rows grow by
+    doubling up to `capacity`; after that the oldest exchange is overwritten,
+    so a channel never holds more than capacity × dim × 4 bytes of vectors.
+    """
+
+    __slots__ = ("dim", "capacity", "seq", "_rows", "_data", "_items")
+
+    def __init__(self, dim: int, capacity: int) -> None:
+        self.dim = dim
+        self.capacity = max(1, capacity)
+        self.seq = 0  # exchanges añadidos desde el principio (también los ya sobrescritos)
+        self._rows = 0  # filas reservadas
+        self._data = np.zeros((0, dim), dtype=np.float32) if np is not None else array("f")
+        self._items: List[Exchange] = []
+
+    def __len__(self) -> int:
+        return min(self.seq, self.capacity)
+
+    def nbytes(self) -> int:
+        return self._rows * self.dim * 4
+
+    def add(self, vector: Vector, user: Turn, model: Turn) -> None:
+        if len(vector) != self.dim:
+            raise ValueError(f"expected {self.dim} dimensions, got {len(vector)}")
+        slot = self.seq % self.capacity
+        if slot >= self._rows:
+            self._grow()
+        unit = _normalized(vector)
+        if np is not None:
+            self._data[slot] = unit
+        else:
+            self._data[slot * self.dim : (slot + 1) * self.dim] = array("f", unit)
+        exchange = Exchange(self.seq, user, model)
+        if slot < len(self._items):
+            self._items[slot] = exchange
+        else:
+            self._items.append(exchange)
+        self.seq += 1
+
+    def _grow(self) -> None:
+        rows = min(self.capacity, max(16, self._rows * 2))
+        if np is not None:
+            data = np.zeros((rows, self.dim), dtype=np.float32)
+            data[: self._rows] = self._data
+            self._data = data
+        else:
+            self._data.extend(array("f", bytes(4 * (rows - self._rows) * self.dim)))
+        self._rows = rows
+
+    def search(self, query: Vector, k: int, *, before_seq: int, min_score: float = 0.0) -> List[Exchange]:
+        """Top-k exchanges older than `before_seq` by cosine similarity, oldest first."""
+        count = len(self)
+        if k <= 0 or count == 0 or len(query) != self.dim:
+            return []
+        # Los exchanges de la ventana reciente ya van en el prompt: fuera del ranking
+        skip = {s % self.capacity for s in range(max(before_seq, self.seq - count), self.seq)}
+        unit = _normalized(query)
+        if np is not None:
+            scores = self._data[:count] @ np.asarray(unit, dtype=np.float32)
+            if skip:
+                scores[list(skip)] = -np.inf
+            top = min(k, count)
+            idx = np.argpartition(-scores, top - 1)[:top] if top < count else np.arange(count)
+            ranked = [(float(scores[i]), int(i)) for i in idx]
+        else:
+            rows, dim = memoryview(self._data), self.dim
+            ranked = heapq.nlargest(
+                k,
+                ((_dot(rows[i * dim : (i + 1) * dim], unit), i) for i in range(count) if i not in skip),
+            )
+        picked = [self._items[slot] for score, slot in ranked if score >= min_score]
+        picked.sort(key=lambda e: e.seq)
+        return picked
+
+
+def recall(vectors: Optional[ChannelVectors], query: Vector, recent_turns: int) -> List[Turn]:
+    """Older turns relevant to `query`, excluding the exchanges in the recent window."""
+    if vectors is None:
+        return []
+    before = vectors.seq - recent_turns // 2
+    found = vectors.search(query, settings.VECTOR_TOP_K, before_seq=before, min_score=settings.VECTOR_MIN_SCORE)
+    turns: List[Turn] = []
+    for exchange in found:
+        turns.append(exchange.user)
+        turns.append(exchange.model)
+    return turns
+
+
+def index_exchange(current: Optional[ChannelVectors], vector: Vector, user: Turn, model: Turn) -> ChannelVectors:
+    """Add an exchange, (re)creating the channel index if the dimension changed."""
+    if current is None or current.dim != len(vector):
+        current = ChannelVectors(len(vector), settings.VECTOR_MAX_ITEMS_PER_CHANNEL)
+    current.add(vector, user, model)
+    return current
+
+
+def pair_turns(turns: Sequence[Turn]) -> List[Tuple[Turn, Turn]]:
+    """(user, model) pairs in order, skipping turns without a partner."""
+    pairs: List[Tuple[Turn, Turn]] = []
+    for first, second in zip(turns, turns[1:]):
+        if first.role == "user" and second.role == "model":
+            pairs.append((first, second))
+    return pairs
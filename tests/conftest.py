@@ -0,0 +1,9 @@
+import os
+
+# src.config exige credenciales al importarse; los tests no llegan a la red
+os.environ.setdefault("DISCORD_TOKEN", "test")
+os.environ.setdefault("GEMINI_API_KEY", "test")
+
+# discord.py-self 2.0 falla al importarse después de trio (httpcore lo carga si está
+# instalado); src.discord_client lo importa primero, los tests también
+import discord  # noqa: E402,F401
@@ -0,0 +1,96 @@
+import pytest
+
+from src.admission import AdmissionController
+from src.config import settings
+from src.gemini_client import PRIORITY_INACTIVITY, PRIORITY_MENTION, PRIORITY_REPLY
+
+
+@pytest.fixture(autouse=True)
+def admission_settings(monkeypatch):
+    monkeypatch.setattr(settings, "QUEUE_MAX_SIZE_PER_CHANNEL", 4)
+    monkeypatch.setattr(settings, "MIN_SECONDS_BETWEEN_MESSAGES_PER_CHANNEL", 1.0)
+    monkeypatch.setattr(settings, "ADMISSION_MAX_WAIT_SECONDS", 10.0)
+    monkeypatch.setattr(settings, "ADMISSION_MAX_GEMINI_WAITING", 3)
+
+
+class Load:
+    """Queued sends per channel, Gemini waiters and delivery time, as the controller sees them."""
+
+    def __init__(self):
+        self.depth = {}
+        self.waiting = 0
+        self.send_seconds = 0.0
+
+    def controller(self):
+        return AdmissionController(
+            lambda cid: self.depth.get(cid, 0), lambda: self.waiting, lambda: self.send_seconds
+        )
+
+
+def test_mentions_may_fill_the_whole_lane():
+    load = Load()
+    admission = load.controller()
+    load.depth[1] = 3
+    assert admission.admit(1, PRIORITY_MENTION) is None
+    # La reserva cuenta como un envío más en cola
+    assert admission.ahead(1) == 4
+    assert admission.admit(1, PRIORITY_MENTION) == "queue_full"
+
+
+def test_replies_leave_the_last_slot_to_mentions():
+    load = Load()
+    admission = load.controller()
+    load.depth[1] = 2
+    assert admission.admit(1, PRIORITY_REPLY) is None
+    assert admission.admit(1, PRIORITY_REPLY) == "queue_full"
+    assert admission.admit(1, PRIORITY_MENTION) is None
+
+
+def test_expected_wait_sheds_replies_before_mentions(monkeypatch):
+    monkeypatch.setattr(settings, "QUEUE_MAX_SIZE_PER_CHANNEL", 20)
+    load = Load()
+    admission = load.controller()
+    load.depth[1] = 3
+    load.send_seconds = 1.0
+    # 3 por delante × (1 s de pacing + 1 s de envío) = 6 s: más que la mitad de 10
+    assert admission.expected_wait(1) == 6.0
+    assert admission.admit(1, PRIORITY_REPLY) == "queue_wait"
+    assert admission.admit(1, PRIORITY_MENTION) is None
+    # Las reservas cuentan: 4 × 2 s = 8 s y 5 × 2 s = 10 s entran, 6 × 2 s = 12 s no
+    assert admission.admit(1, PRIORITY_MENTION) is None
+    assert admission.admit(1, PRIORITY_MENTION) is None
+    assert admission.admit(1, PRIORITY_MENTION) == "queue_wait"
+
+
+def test_gemini_backlog_sheds_replies_but_not_mentions():
+    load = Load()
+    admission = load.controller()
+    load.waiting = 3
+    assert admission.admit(1, PRIORITY_REPLY) == "gemini_backlog"
+    assert admission.admit(1, PRIORITY_MENTION) is None
+
+
+def test_inactivity_only_on_an_idle_lane_and_quota():
+    load = Load()
+    admission = load.controller()
+    load.waiting = 1
+    assert admission.admit(1, PRIORITY_INACTIVITY) == "gemini_backlog"
+    load.waiting = 0
+    load.depth[1] = 1
+    assert admission.admit(1, PRIORITY_INACTIVITY) == "queue_busy"
+    load.depth[1] = 0
+    assert admission.admit(1, PRIORITY_INACTIVITY) is None
+    # Su propia reserva ya ocupa el carril
+    assert admission.admit(1, PRIORITY_INACTIVITY) == "queue_busy"
+
+
+def test_release_returns_the_reservation():
+    load = Load()
+    admission = load.controller()
+    assert admission.admit(1, PRIORITY_MENTION) is None
+    assert admission.admit(2, PRIORITY_MENTION) is None
+    assert admission.reserved() == 2
+    admission.release(1)
+    admission.release(1)  # de más: no queda negativo
+    assert admission.ahead(1) == 0
+    assert admission.reserved() == 1
@@ -0,0 +1,132 @@
+import pytest
+
+from src.circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpenError
+from src.config import settings
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture(autouse=True)
+def breaker_settings(monkeypatch):
+    monkeypatch.setattr(settings, "CIRCUIT_BREAKER_ENABLED", True)
+    monkeypatch.setattr(settings, "CIRCUIT_WINDOW_SIZE", 4)
+    monkeypatch.setattr(settings, "CIRCUIT_MIN_CALLS", 4)
+    monkeypatch.setattr(settings, "CIRCUIT_FAILURE_RATIO", 0.5)
+    monkeypatch.setattr(settings, "CIRCUIT_SLOW_CALL_SECONDS", 10.0)
+    monkeypatch.setattr(settings, "CIRCUIT_OPEN_SECONDS", 30.0)
+    monkeypatch.setattr(settings, "CIRCUIT_HALF_OPEN_PROBES", 2)
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture
+def breaker(clock):
+    return CircuitBreaker("test-model", clock=clock)
+
+
+def fail(breaker, n=1, *, failed=True, seconds=0.0):
+    for _ in range(n):
+        probe = breaker.before_call()
+        breaker.record(probe, failed=failed, seconds=seconds)
+
+
+def open_breaker(breaker):
+    fail(breaker, 2, failed=False)
+    fail(breaker, 2)
+    assert breaker.state == OPEN
+
+
+def test_opens_at_failure_ratio_once_min_calls_are_seen(breaker):
+    fail(breaker, 3)
+    # Menos de CIRCUIT_MIN_CALLS intentos: sigue cerrado aunque todos fallen
+    assert breaker.state == CLOSED
+    fail(breaker, 1, failed=False)
+    assert breaker.state == OPEN
+
+
+def test_window_forgets_old_failures(breaker):
+    fail(breaker, 1)
+    fail(breaker, 3, failed=False)
+    fail(breaker, 1)
+    # La ventana es de 4: [ok, ok, ok, fallo] no llega al 50%
+    assert breaker.state == CLOSED
+
+
+def test_slow_calls_count_as_failures(breaker):
+    fail(breaker, 2, failed=False)
+    fail(breaker, 2, failed=False, seconds=11.0)
+    assert breaker.state == OPEN
+
+
+def test_open_circuit_fails_fast(breaker):
+    open_breaker(breaker)
+    assert breaker.is_open()
+    with pytest.raises(CircuitOpenError):
+        breaker.reject_if_open()
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+
+def test_half_open_probes_close_the_circuit(breaker, clock):
+    open_breaker(breaker)
+    clock.now += 30.0
+    assert breaker.state == HALF_OPEN
+    assert not breaker.is_open()
+    probes = [breaker.before_call(), breaker.before_call()]
+    assert probes == [True, True]
+    # Solo CIRCUIT_HALF_OPEN_PROBES sondas a la vez
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    breaker.record(True, failed=False)
+    assert breaker.state == HALF_OPEN
+    breaker.record(True, failed=False)
+    assert breaker.state == CLOSED
+    assert breaker.before_call() is False
+
+
+def test_failed_probe_reopens(breaker, clock):
+    open_breaker(breaker)
+    clock.now += 30.0
+    probe = breaker.before_call()
+    breaker.record(probe, failed=True)
+    assert breaker.state == OPEN
+    clock.now += 29.0
+    assert breaker.state == OPEN
+    clock.now += 1.0
+    assert breaker.state == HALF_OPEN
+
+
+def test_released_probe_frees_its_slot(breaker, clock):
+    open_breaker(breaker)
+    clock.now += 30.0
+    breaker.before_call()
+    probe = breaker.before_call()
+    # Un 429 no dice nada de la salud del servicio: devuelve la sonda sin contar
+    breaker.release(probe)
+    assert breaker.before_call() is True
+    assert breaker.state == HALF_OPEN
+
+
+def test_late_outcomes_do_not_count_after_opening(breaker):
+    admitted = [breaker.before_call() for _ in range(5)]
+    for probe in admitted[:4]:
+        breaker.record(probe, failed=True)
+    assert breaker.state == OPEN
+    breaker.record(admitted[4], failed=False)
+    assert breaker.state == OPEN
+
+
+def test_disabled_breaker_never_opens(breaker, monkeypatch):
+    monkeypatch.setattr(settings, "CIRCUIT_BREAKER_ENABLED", False)
+    fail(breaker, 10)
+    assert breaker.state == CLOSED
+    breaker.reject_if_open()
@@ -0,0 +1,130 @@
+import asyncio
+import random
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from src.clock import VirtualTimeLoop, run_virtual
+from src.config import settings
+from src.send_scheduler import SendScheduler
+
+
+def test_sleep_advances_virtual_time_only():
+    async def main():
+        loop = asyncio.get_running_loop()
+        await asyncio.sleep(3600)
+        return loop.time(), loop.advanced
+
+    started = time.perf_counter()
+    now, advanced = run_virtual(main(), start=100.0)
+    assert now == pytest.approx(3700.0)
+    assert advanced == pytest.approx(3600.0)
+    assert time.perf_counter() - started < 1.0
+
+
+def test_timers_fire_in_deadline_order():
+    async def main():
+        loop = asyncio.get_running_loop()
+        fired = []
+
+        async def wake(delay):
+            await asyncio.sleep(delay)
+            fired.append((delay, loop.time()))
+
+        await asyncio.gather(*(wake(d) for d in (5.0, 0.5, 60.0, 2.0)))
+        return fired
+
+    assert run_virtual(main()) == [(0.5, 0.5), (2.0, 2.0), (5.0, 5.0), (60.0, 60.0)]
+
+
+def test_wait_for_times_out_on_virtual_time():
+    async def main():
+        loop = asyncio.get_running_loop()
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(asyncio.Event().wait(), timeout=30.0)
+        return loop.time()
+
+    assert run_virtual(main()) == pytest.approx(30.0)
+
+
+def test_run_virtual_cancels_leftover_tasks():
+    cleaned = []
+
+    async def forever():
+        try:
+            await asyncio.sleep(1e9)
+        finally:
+            cleaned.append(True)
+
+    async def main():
+        asyncio.create_task(forever())
+        await asyncio.sleep(0)
+
+    run_virtual(main())
+    assert cleaned == [True]
+
+
+def test_real_io_still_works():
+    async def main():
+        async def echo(reader, writer):
+            writer.write(await reader.readline())
+            await writer.drain()
+            writer.close()
+
+        server = await asyncio.start_server(echo, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(b"hola\n")
+        line = await reader.readline()
+        writer.close()
+        server.close()
+        await server.wait_closed()
+        return line
+
+    assert run_virtual(main()) == b"hola\n"
+
+
+def _paced_timeline(seed):
+    # Envíos con pacing y jitter aleatorio: la misma semilla da la misma línea de tiempo
+    async def main():
+        random.seed(seed)
+        loop = asyncio.get_running_loop()
+        sent = []
+
+        async def deliver(items):
+            await asyncio.sleep(random.uniform(0.1, 0.5))
+            sent.append((loop.time(), [i["content"] for i in items]))
+
+        scheduler = SendScheduler(deliver, clock=loop.time)
+        for n in range(40):
+            await asyncio.sleep(random.expovariate(2.0))
+            target = SimpleNamespace(id=random.randint(1, 3))
+            scheduler.enqueue(random.randint(1, 4), {"reply_to": target, "content": f"m{n}"})
+        await scheduler.join()
+        await scheduler.close()
+        return sent
+
+    return run_virtual(main())
+
+
+def test_same_seed_gives_identical_runs(monkeypatch):
+    monkeypatch.setattr(settings, "MIN_SECONDS_BETWEEN_MESSAGES_PER_CHANNEL", 3.0)
+    monkeypatch.setattr(settings, "SEND_JITTER_SECONDS", 0.5)
+    monkeypatch.setattr(settings, "COALESCE_WINDOW_SECONDS", 2.0)
+    monkeypatch.setattr(settings, "QUEUE_MAX_SIZE_PER_CHANNEL", 100)
+    first = _paced_timeline(7)
+    assert len(first) > 0
+    assert _paced_timeline(7) == first
+    assert _paced_timeline(8) != first
+
+
+def test_virtual_loop_is_a_selector_loop():
+    loop = VirtualTimeLoop(start=5.0)
+    try:
+        assert isinstance(loop, asyncio.SelectorEventLoop)
+        assert loop.time() == 5.0
+        loop.advance(-1.0)
+        assert loop.time() == 5.0
+    finally:
+        loop.close()
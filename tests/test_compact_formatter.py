@@ -0,0 +1,68 @@
+import pytest
+
+from src.discord_client import CompactFormatter, _format_compact
+
+TEXTS = [
+    "",
+    "hola",
+    "holaaa~ owo ✨",
+    "  primera línea  \n\n   segunda línea \n tercera",
+    "Claro. Te cuento. Fue ayer. Y luego nada más.",
+    "¿En serio? ¡Qué fuerte! Bueno. Ya veremos.",
+    "una frase larguísima sin puntos " * 12,
+    "algo corto, con coma; y punto y coma " * 5,
+    "Primero esto. " + "x" * 300,
+    "línea uno\nlínea dos. Otra frase. Y otra más.\n\n\nfin",
+    "a. b. c. d. e.",
+    "termina justo en punto.",
+]
+
+
+def feed_until_settled(text, size):
+    formatter = CompactFormatter()
+    for start in range(0, len(text), size):
+        if formatter.feed(text[start:start + size]):
+            break
+    return formatter
+
+
+@pytest.mark.parametrize("text", TEXTS)
+@pytest.mark.parametrize("size", [1, 3, 16, 1000])
+def test_stopping_at_settled_gives_the_full_result(text, size):
+    formatter = feed_until_settled(text, size)
+    # Cortar el stream cuando feed() devuelve True no cambia la respuesta final
+    assert formatter.result() == _format_compact(text)
+
+
+@pytest.mark.parametrize("text", TEXTS)
+def test_unsettled_only_while_more_text_could_change_the_result(text):
+    formatter = feed_until_settled(text, 1)
+    if formatter.settled:
+        for extra in (" más", ". Otra frase", "\nnueva línea", "x" * 300):
+            assert _format_compact(formatter.text + extra) == formatter.result()
+
+
+def test_long_reply_settles_early():
+    text = "Primera frase. Segunda frase. " + "relleno " * 1000
+    formatter = feed_until_settled(text, 8)
+    assert formatter.settled
+    assert len(formatter.text) < 100
+
+
+def test_reset_starts_over():
+    formatter = CompactFormatter()
+    formatter.feed("Una. Dos. Tres.")
+    formatter.reset()
+    assert formatter.text == ""
+    assert not formatter.settled
+    assert not formatter.feed("hola")
+    assert formatter.result() == "hola"
+
+
+def test_custom_limits_match_format_compact():
+    text = "Uno. Dos. Tres. Cuatro. " + "y" * 50
+    formatter = CompactFormatter(max_lines=3, max_chars=40)
+    for ch in text:
+        if formatter.feed(ch):
+            break
+    assert formatter.result() == _format_compact(text, max_lines=3, max_chars=40)
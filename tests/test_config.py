@@ -0,0 +1,65 @@
+import os
+
+import pytest
+from pydantic import ValidationError
+
+from src import config
+from src.config import reload_settings, settings
+
+
+@pytest.fixture
+def env_file(tmp_path, monkeypatch):
+    """A .env owned by the test; the environment and settings are restored afterwards."""
+    path = tmp_path / ".env"
+    path.write_text("")
+    saved_environ = dict(os.environ)
+    saved_settings = dict(settings.__dict__)
+    monkeypatch.delenv("ALLOWED_CHANNEL_IDS", raising=False)
+    monkeypatch.delenv("CIRCUIT_FAILURE_RATIO", raising=False)
+    monkeypatch.setattr(config, "env_path", str(path))
+    monkeypatch.setattr(config, "_process_env", dict(os.environ))
+    monkeypatch.setattr(config, "_env_file_keys", frozenset())
+    yield path
+    os.environ.clear()
+    os.environ.update(saved_environ)
+    settings.__dict__.update(saved_settings)
+
+
+def test_reload_applies_changes_from_env_file(env_file):
+    env_file.write_text("ALLOWED_CHANNEL_IDS=1,2\n")
+    assert "ALLOWED_CHANNEL_IDS" in reload_settings()
+    assert settings.get_allowed_channel_ids() == {1, 2}
+
+
+def test_key_removed_from_env_file_reverts_to_default(env_file):
+    env_file.write_text("ALLOWED_CHANNEL_IDS=1,2\n")
+    reload_settings()
+    env_file.write_text("")
+    assert "ALLOWED_CHANNEL_IDS" in reload_settings()
+    assert settings.ALLOWED_CHANNEL_IDS is None
+    assert "ALLOWED_CHANNEL_IDS" not in os.environ
+
+
+def test_key_removed_from_env_file_reverts_to_process_env(env_file, monkeypatch):
+    monkeypatch.setitem(config._process_env, "CIRCUIT_FAILURE_RATIO", "0.3")
+    os.environ["CIRCUIT_FAILURE_RATIO"] = "0.3"
+    env_file.write_text("CIRCUIT_FAILURE_RATIO=0.9\n")
+    reload_settings()
+    assert settings.CIRCUIT_FAILURE_RATIO == 0.9
+    env_file.write_text("")
+    reload_settings()
+    assert settings.CIRCUIT_FAILURE_RATIO == 0.3
+    assert os.environ["CIRCUIT_FAILURE_RATIO"] == "0.3"
+
+
+def test_invalid_reload_keeps_current_settings(env_file):
+    env_file.write_text("ALLOWED_CHANNEL_IDS=1,2\n")
+    reload_settings()
+    env_file.write_text("ALLOWED_CHANNEL_IDS=1,dos\n")
+    with pytest.raises(ValidationError):
+        reload_settings()
+    assert settings.get_allowed_channel_ids() == {1, 2}
+
+
+def test_restart_required_fields_exist():
+    assert config.RESTART_REQUIRED_FIELDS <= set(config.Settings.__fields__)
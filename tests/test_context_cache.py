@@ -0,0 +1,194 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+
+from src import gemini_client
+from src.clock import loop_time, run_virtual
+from src.config import settings
+from src.gemini_client import QuotaScheduler, SystemPromptCache
+
+MODEL = "gemini-test"
+PROMPT = "eres una persona más del servidor"
+
+
+class FakeCacheEndpoint:
+    """cachedContents stand-in: records every request, answers with `status`."""
+
+    def __init__(self, status: int = 200) -> None:
+        self.status = status
+        self.requests = []
+        self.created = 0
+
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        self.requests.append((request.method, request.url.path, request.url.params, json.loads(request.content)))
+        if self.status != 200:
+            return httpx.Response(self.status, json={"error": {"message": "too few tokens"}})
+        if request.method == "POST" and request.url.path == "/v1beta/cachedContents":
+            self.created += 1
+            return httpx.Response(200, json={"name": f"cachedContents/c{self.created}"})
+        if request.method == "PATCH":
+            return httpx.Response(200, json={})
+        return httpx.Response(404)
+
+    def methods(self):
+        return [method for method, _, _, _ in self.requests]
+
+
+@pytest.fixture(autouse=True)
+def cache_settings(monkeypatch):
+    monkeypatch.setattr(settings, "GEMINI_CONTEXT_CACHE_TTL_SECONDS", 3600)
+    monkeypatch.setattr(settings, "GEMINI_CONTEXT_CACHE_REFRESH_MARGIN_SECONDS", 300.0)
+    monkeypatch.setattr(settings, "GEMINI_CONTEXT_CACHE_RETRY_SECONDS", 600.0)
+
+
+def run(endpoint, scenario):
+    """Run `scenario(cache, lookup)` on virtual time: TTLs pass with asyncio.sleep."""
+
+    async def main():
+        cache = SystemPromptCache(clock=loop_time)
+        async with httpx.AsyncClient(transport=httpx.MockTransport(endpoint), base_url="https://gemini.test") as client:
+
+            async def lookup():
+                name = cache.lookup(client, MODEL, PROMPT)
+                # Las creaciones y renovaciones van en segundo plano: se esperan aquí
+                await asyncio.gather(*cache._tasks)
+                return name
+
+            return await scenario(cache, lookup)
+
+    return run_virtual(main())
+
+
+def entry(cache):
+    return cache._entries[SystemPromptCache.config_hash(MODEL, PROMPT)]
+
+
+def test_first_lookup_sends_inline_and_creates_the_cache():
+    endpoint = FakeCacheEndpoint()
+
+    async def scenario(cache, lookup):
+        return await lookup(), await lookup()
+
+    assert run(endpoint, scenario) == (None, "cachedContents/c1")
+    method, path, params, body = endpoint.requests[0]
+    assert (method, path, params["key"]) == ("POST", "/v1beta/cachedContents", settings.GEMINI_API_KEY)
+    assert body["model"] == f"models/{MODEL}"
+    assert body["systemInstruction"] == {"parts": [{"text": PROMPT}]}
+    assert body["ttl"] == "3600s"
+
+
+def test_live_cache_is_reused_without_requests():
+    endpoint = FakeCacheEndpoint()
+
+    async def scenario(cache, lookup):
+        await lookup()
+        return [await lookup() for _ in range(5)]
+
+    assert run(endpoint, scenario) == ["cachedContents/c1"] * 5
+    assert endpoint.methods() == ["POST"]
+
+
+def test_cache_near_expiry_is_refreshed_in_the_background():
+    endpoint = FakeCacheEndpoint()
+
+    async def scenario(cache, lookup):
+        await lookup()
+        await asyncio.sleep(3600 - 100)
+        name = await lookup()
+        return name, entry(cache).expires_at - loop_time()
+
+    name, remaining = run(endpoint, scenario)
+    # Se sigue usando mientras se renueva el TTL
+    assert name == "cachedContents/c1"
+    assert remaining == 3600.0
+    method, path, params, body = endpoint.requests[1]
+    assert (method, path, params["updateMask"], body) == ("PATCH", "/v1beta/cachedContents/c1", "ttl", {"ttl": "3600s"})
+
+
+def test_expired_cache_is_recreated():
+    endpoint = FakeCacheEndpoint()
+
+    async def scenario(cache, lookup):
+        await lookup()
+        await asyncio.sleep(3600)
+        return await lookup(), await lookup()
+
+    assert run(endpoint, scenario) == (None, "cachedContents/c2")
+    assert endpoint.methods() == ["POST", "POST"]
+
+
+def test_invalidated_cache_is_recreated():
+    endpoint = FakeCacheEndpoint()
+
+    async def scenario(cache, lookup):
+        name = (await lookup(), await lookup())[1]
+        # Gemini respondió que la caché ya no existe
+        cache.invalidate(name)
+        return await lookup(), await lookup()
+
+    assert run(endpoint, scenario) == (None, "cachedContents/c2")
+
+
+def test_failed_creation_waits_before_retrying():
+    endpoint = FakeCacheEndpoint(status=400)
+
+    async def scenario(cache, lookup):
+        names = [await lookup() for _ in range(3)]
+        endpoint.status = 200
+        await asyncio.sleep(599)
+        names.append(await lookup())
+        assert endpoint.methods() == ["POST"]
+        await asyncio.sleep(1)
+        names += [await lookup(), await lookup()]
+        return names
+
+    assert run(endpoint, scenario) == [None, None, None, None, None, "cachedContents/c1"]
+    assert endpoint.methods() == ["POST", "POST"]
+
+
+def test_one_cache_per_model_and_prompt():
+    assert SystemPromptCache.config_hash(MODEL, PROMPT) != SystemPromptCache.config_hash(MODEL, PROMPT + ".")
+    assert SystemPromptCache.config_hash(MODEL, PROMPT) != SystemPromptCache.config_hash("otro", PROMPT)
+
+
+def test_generate_reply_falls_back_inline_when_the_cache_is_gone(monkeypatch):
+    calls = []
+
+    def endpoint(request: httpx.Request) -> httpx.Response:
+        body = json.loads(request.content)
+        calls.append((request.url.path.rsplit("/", 1)[-1], "cached_content" in body))
+        if request.url.path == "/v1beta/cachedContents":
+            return httpx.Response(200, json={"name": f"cachedContents/c{len(calls)}"})
+        if "cached_content" in body and len(calls) == 3:
+            # Caducada o borrada en el servidor antes de que la renováramos
+            return httpx.Response(404, json={"error": {"message": f"CachedContent {body['cached_content']} not found"}})
+        return httpx.Response(200, json={"candidates": [{"content": {"parts": [{"text": "holi"}]}}]})
+
+    monkeypatch.setattr(settings, "GEMINI_CONTEXT_CACHE_ENABLED", True)
+    monkeypatch.setattr(gemini_client, "context_cache", SystemPromptCache(clock=loop_time))
+    monkeypatch.setattr(gemini_client, "quota", QuotaScheduler(clock=loop_time))
+    monkeypatch.setattr(gemini_client, "_breakers", {})
+
+    async def main():
+        client = httpx.AsyncClient(transport=httpx.MockTransport(endpoint), base_url="https://gemini.test")
+        monkeypatch.setattr(gemini_client, "_client", client)
+        replies = []
+        async with client:
+            for _ in range(4):
+                replies.append(await gemini_client.generate_reply("hola", PROMPT))
+                await asyncio.gather(*gemini_client.context_cache._tasks)
+        return replies
+
+    assert run_virtual(main()) == ["holi"] * 4
+    generate = f"{settings.GEMINI_MODEL}:generateContent"
+    assert calls == [
+        (generate, False),  # sin caché todavía: prompt inline mientras se crea
+        ("cachedContents", False),
+        (generate, True),
+        (generate, False),  # la caché ya no existe: se reenvía inline
+        (generate, False),  # y se vuelve a crear en segundo plano
+        ("cachedContents", False),
+        (generate, True),
+    ]
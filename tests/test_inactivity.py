@@ -0,0 +1,167 @@
+import asyncio
+
+import pytest
+
+from src.clock import run_virtual
+from src.config import settings
+from src.inactivity import InactivityEngine, InactivityPool
+from src.payload_builder import Turn
+from src.state_store import ChannelState
+
+
+@pytest.fixture(autouse=True)
+def inactivity_settings(monkeypatch):
+    monkeypatch.setattr(settings, "INACTIVITY_ENABLED", True)
+    monkeypatch.setattr(settings, "INACTIVITY_SECONDS", 300.0)
+    monkeypatch.setattr(settings, "INACTIVITY_POOL_SIZE", 1)
+    monkeypatch.setattr(settings, "INACTIVITY_POOL_LEAD_SECONDS", 20.0)
+    monkeypatch.setattr(settings, "INACTIVITY_POOL_MAX_AGE_SECONDS", 1800.0)
+
+
+def run_pool(exchange_every, minutes=60.0):
+    """One channel with an exchange every `exchange_every` seconds (None: always quiet).
+
+    Deadlines are served from the pool as the engine would. Returns
+    (generations, deadlines, hits).
+    """
+
+    async def main():
+        loop = asyncio.get_running_loop()
+        ch = ChannelState(1, 20, 0.0)
+        ch.last_trigger = 0.0
+        generations = [0]
+
+        async def generate(channel):
+            generations[0] += 1
+            await asyncio.sleep(1.5)
+            return "holaaa"
+
+        pool = InactivityPool(generate, lambda cid: ch, busy=lambda: False, clock=loop.time)
+        pool.start()
+        pool.watch(1)
+        deadlines = hits = 0
+        next_exchange = exchange_every if exchange_every else float("inf")
+        end = minutes * 60.0
+        while True:
+            deadline = ch.last_trigger + settings.INACTIVITY_SECONDS
+            now = min(deadline, next_exchange)
+            if now >= end:
+                break
+            await asyncio.sleep(now - loop.time())
+            if now == next_exchange:
+                ch.last_trigger = now
+                ch.memory.append(Turn("user", "eh"))
+                pool.invalidate(ch)
+                next_exchange += exchange_every
+            else:
+                deadlines += 1
+                hits += pool.take(ch) is not None
+                ch.last_trigger = now
+        await pool.close()
+        return generations[0], deadlines, hits
+
+    return run_virtual(main())
+
+
+@pytest.mark.parametrize("size", [1, 2])
+def test_quiet_channel_generates_one_message_per_deadline(monkeypatch, size):
+    monkeypatch.setattr(settings, "INACTIVITY_POOL_SIZE", size)
+    generations, deadlines, hits = run_pool(None)
+    assert deadlines == 11
+    assert hits == deadlines
+    # Como mucho el siguiente ya generado al terminar, y los de más del tamaño del pool
+    assert generations <= deadlines + size
+
+
+@pytest.mark.parametrize("size", [1, 2])
+def test_busy_channel_never_fills_the_pool(monkeypatch, size):
+    monkeypatch.setattr(settings, "INACTIVITY_POOL_SIZE", size)
+    # Siempre hay un turno nuevo antes de que llegue la antelación del plazo
+    generations, deadlines, _ = run_pool(270.0)
+    assert deadlines == 0
+    assert generations == 0
+
+
+def test_wasted_fills_are_bounded_by_late_turns():
+    # Un turno justo dentro de la antelación tira lo generado; el resto del tiempo no se genera nada
+    generations, deadlines, _ = run_pool(290.0)
+    exchanges = int(60 * 60.0 // 290.0)
+    assert deadlines == 0
+    assert generations <= exchanges + 1
+
+
+def run_engine(last, schedule, *, fire_seconds=0.0, sends=True, until=1000.0):
+    """Run an InactivityEngine over `last` (channel -> last activity) until `until`.
+
+    `schedule(engine, last)` runs alongside it; each fire takes `fire_seconds`
+    and, with `sends`, counts as activity. Returns (fires, peak in flight).
+    """
+
+    async def main():
+        loop = asyncio.get_running_loop()
+        fires, in_flight, peak = [], [0], [0]
+
+        async def fire(channel_id):
+            fires.append((loop.time(), channel_id))
+            in_flight[0] += 1
+            peak[0] = max(peak[0], in_flight[0])
+            try:
+                await asyncio.sleep(fire_seconds)
+            finally:
+                in_flight[0] -= 1
+            if sends:
+                last[channel_id] = loop.time()
+
+        engine = InactivityEngine(fire, last.get, clock=loop.time)
+        engine.start()
+        for channel_id in list(last):
+            engine.watch(channel_id)
+        await schedule(engine, last)
+        await asyncio.sleep(until - loop.time())
+        await engine.close()
+        return fires, peak[0]
+
+    return run_virtual(main())
+
+
+async def nothing(engine, last):
+    pass
+
+
+def test_engine_fires_each_period_after_the_last_activity():
+    fires, _ = run_engine({1: 0.0}, nothing)
+    assert fires == [(300.0, 1), (600.0, 1), (900.0, 1)]
+
+
+def test_activity_moves_the_deadline_later():
+    async def schedule(engine, last):
+        await asyncio.sleep(200.0)
+        # Un trigger no toca el heap: la entrada vieja se reprograma al vencer
+        last[1] = 200.0
+        engine.watch(1)
+
+    fires, _ = run_engine({1: 0.0, 2: 0.0}, schedule, until=550.0)
+    assert fires == [(300.0, 2), (500.0, 1)]
+
+
+def test_generations_are_bounded_by_inactivity_concurrency(monkeypatch):
+    monkeypatch.setattr(settings, "INACTIVITY_CONCURRENCY", 2)
+    fires, peak = run_engine({cid: 0.0 for cid in range(6)}, nothing, fire_seconds=10.0, until=350.0)
+    assert peak == 2
+    assert [t for t, _ in fires] == [300.0, 300.0, 310.0, 310.0, 320.0, 320.0]
+
+
+def test_failed_send_retries_later_without_a_hot_loop():
+    fires, _ = run_engine({1: 0.0}, nothing, sends=False, until=400.0)
+    assert fires == [(300.0, 1), (330.0, 1), (360.0, 1), (390.0, 1)]
+
+
+def test_forgotten_and_disabled_channels_do_not_fire(monkeypatch):
+    async def schedule(engine, last):
+        del last[1]  # olvidado por el StateStore
+
+    fires, _ = run_engine({1: 0.0}, schedule)
+    assert fires == []
+    monkeypatch.setattr(settings, "INACTIVITY_ENABLED", False)
+    fires, _ = run_engine({2: 0.0}, nothing)
+    assert fires == []
@@ -0,0 +1,145 @@
+import asyncio
+
+import pytest
+
+from src.clock import run_virtual
+from src.config import settings
+from src.gemini_client import PRIORITY_INACTIVITY
+from src.llm_backend import HedgedBackend, LatencyTracker, LocalBackend
+
+
+class Scripted:
+    """Backend whose calls take the next scripted latency (a float) or raise (an exception)."""
+
+    def __init__(self, name, *script):
+        self.name = name
+        self.script = list(script)
+        self.calls = 0
+        self.cancelled = 0
+
+    async def generate(self, text, system_prompt, *, history=None, sink=None, priority=0):
+        step = self.script[min(self.calls, len(self.script) - 1)]
+        self.calls += 1
+        try:
+            if isinstance(step, BaseException):
+                await asyncio.sleep(0.1)
+                raise step
+            await asyncio.sleep(step)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        return f"{self.name}: {text}"
+
+
+@pytest.fixture(autouse=True)
+def hedge_settings(monkeypatch):
+    monkeypatch.setattr(settings, "LLM_HEDGE_MIN_DELAY_SECONDS", 2.0)
+    monkeypatch.setattr(settings, "LLM_HEDGE_PERCENTILE", 90.0)
+    monkeypatch.setattr(settings, "LLM_HEDGE_MAX_RATIO", 1.0)
+
+
+def generate(backend, text="hola", **kwargs):
+    """One generation on virtual time: (reply, seconds it took)."""
+
+    async def main():
+        loop = asyncio.get_running_loop()
+        result = await backend.generate(text, "prompt", **kwargs)
+        return result, loop.time()
+
+    return run_virtual(main())
+
+
+def test_fast_primary_is_not_hedged():
+    primary, fallback = Scripted("primary", 1.0), Scripted("fallback", 0.5)
+    assert generate(HedgedBackend(primary, fallback)) == ("primary: hola", 1.0)
+    assert fallback.calls == 0
+
+
+def test_slow_primary_is_hedged_after_the_delay():
+    primary, fallback = Scripted("primary", 30.0), Scripted("fallback", 1.0)
+    backend = HedgedBackend(primary, fallback)
+    assert generate(backend) == ("fallback: hola", 3.0)
+    assert primary.cancelled == 1
+    assert (backend.hedged, backend.hedge_wins) == (1, 1)
+
+
+def test_cancelled_primary_counts_as_a_lower_bound():
+    primary, fallback = Scripted("primary", 1.0, 30.0, RuntimeError("500")), Scripted("fallback", 1.0)
+    backend = HedgedBackend(primary, fallback)
+    generate(backend)
+    generate(backend)
+    # Cancelado a los 3 s: entra en la ventana con lo que ya llevaba, no se pierde
+    assert sorted(backend.tracker._samples) == [1.0, 3.0]
+    generate(backend)
+    # Un primario que falla no dice nada de su latencia
+    assert len(backend.tracker) == 2
+    assert backend.call_latency["unhedged"].percentile(50) == 1.0
+    assert sorted(backend.call_latency["hedged"]._samples) == [pytest.approx(1.1), 3.0]
+
+
+def test_primary_still_wins_if_it_answers_first():
+    primary, fallback = Scripted("primary", 2.5), Scripted("fallback", 5.0)
+    backend = HedgedBackend(primary, fallback)
+    assert generate(backend) == ("primary: hola", 2.5)
+    assert fallback.cancelled == 1
+    assert (backend.hedged, backend.hedge_wins) == (1, 0)
+
+
+def test_primary_failure_starts_the_fallback_at_once():
+    primary, fallback = Scripted("primary", RuntimeError("500")), Scripted("fallback", 1.0)
+    assert generate(HedgedBackend(primary, fallback)) == ("fallback: hola", pytest.approx(1.1))
+
+
+def test_both_failing_raises_the_primary_error():
+    primary = Scripted("primary", RuntimeError("primary down"))
+    fallback = Scripted("fallback", RuntimeError("fallback down"))
+    with pytest.raises(RuntimeError, match="primary down"):
+        generate(HedgedBackend(primary, fallback))
+
+
+def test_inactivity_messages_are_never_hedged():
+    primary, fallback = Scripted("primary", 30.0), Scripted("fallback", 1.0)
+    assert generate(HedgedBackend(primary, fallback), priority=PRIORITY_INACTIVITY) == ("primary: hola", 30.0)
+    assert fallback.calls == 0
+
+
+def test_hedges_are_capped_by_the_ratio(monkeypatch):
+    monkeypatch.setattr(settings, "LLM_HEDGE_MAX_RATIO", 0.25)
+    primary, fallback = Scripted("primary", 10.0), Scripted("fallback", 1.0)
+    backend = HedgedBackend(primary, fallback)
+    for _ in range(8):
+        generate(backend)
+    # Presupuesto inicial de 1 más 0.25 por petición: 1 + 8 × 0.25 = 3 hedges
+    assert (backend.requests, backend.hedged) == (8, 3)
+
+
+def test_hedge_delay_follows_the_primary_percentile():
+    backend = HedgedBackend(Scripted("primary", 1.0), Scripted("fallback", 1.0))
+    for _ in range(19):
+        backend.tracker.add(5.0)
+    # Pocas muestras: el mínimo configurado
+    assert backend.hedge_delay() == 2.0
+    backend.tracker.add(5.0)
+    assert backend.hedge_delay() == 5.0
+    # Primario rápido otra vez: el percentil baja del mínimo, que manda
+    for _ in range(256):
+        backend.tracker.add(0.5)
+    assert backend.hedge_delay() == 2.0
+
+
+def test_latency_tracker_percentile():
+    tracker = LatencyTracker(window=100, refresh_every=1)
+    assert tracker.percentile(50) is None
+    for n in range(1, 101):
+        tracker.add(float(n))
+    assert tracker.percentile(50) == 50.0
+    assert tracker.percentile(99) == 99.0
+    tracker.add(1000.0)
+    # Ventana deslizante: el 1 ya salió
+    assert tracker.percentile(1) == 2.0
+
+
+def test_local_backend_is_deterministic():
+    backend = LocalBackend()
+    first, _ = generate(backend, "qué tal?")
+    assert generate(backend, "qué tal?")[0] == first
@@ -0,0 +1,117 @@
+import io
+import json
+import logging
+import queue
+from types import SimpleNamespace
+
+import pytest
+
+from src import logging_config
+from src.logging_config import (
+    JsonFormatter,
+    NonBlockingQueueHandler,
+    RateLimitFilter,
+    TextFormatter,
+    parse_levels,
+    setup_logging,
+    shutdown_logging,
+)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def record(msg="falló %s", *args, level=logging.WARNING, name="src.test", **extra):
+    rec = logging.LogRecord(name, level, __file__, 1, msg, args or ("x",), None)
+    rec.__dict__.update(extra)
+    return rec
+
+
+def test_rate_limit_lets_a_burst_through_and_reports_the_rest():
+    clock = FakeClock()
+    limit = RateLimitFilter(2, 10.0, clock=clock)
+    assert [limit.filter(record()) for _ in range(5)] == [True, True, False, False, False]
+    # Otra plantilla u otro nivel es otra clave
+    assert limit.filter(record("otro %s"))
+    assert limit.filter(record(level=logging.ERROR))
+    clock.now = 10.0
+    first = record()
+    assert limit.filter(first)
+    assert first.suppressed == 3
+
+
+def test_rate_limit_never_drops_info():
+    limit = RateLimitFilter(1, 10.0, clock=FakeClock())
+    assert all(limit.filter(record(level=logging.INFO)) for _ in range(10))
+    assert all(RateLimitFilter(0, 10.0).filter(record()) for _ in range(10))
+
+
+def test_formatters_carry_suppressed_and_extra_fields():
+    rec = record("canal %s", 42, suppressed=7, channel_id=42)
+    assert TextFormatter("%(message)s").format(rec) == "canal 42 (+7 similar suppressed)"
+    data = json.loads(JsonFormatter().format(rec))
+    assert (data["message"], data["level"], data["logger"]) == ("canal 42", "WARNING", "src.test")
+    assert (data["suppressed"], data["channel_id"]) == (7, 42)
+
+
+def test_queue_handler_drops_instead_of_blocking_and_never_formats():
+    rendered = []
+    arg = type("Arg", (), {"__str__": lambda self: rendered.append(1) or "arg"})()
+    records = queue.Queue(maxsize=1)
+    handler = NonBlockingQueueHandler(records)
+    handler.handle(record("uno %s", arg))
+    handler.handle(record("dos %s", arg))
+    assert records.qsize() == 1
+    # El formateo queda para el hilo del listener
+    assert rendered == []
+    assert records.get_nowait().args == (arg,)
+
+
+def test_parse_levels_ignores_malformed_parts():
+    assert parse_levels("httpx=warning, discord.gateway=ERROR,nada,=INFO,x=NOPE") == {
+        "httpx": logging.WARNING,
+        "discord.gateway": logging.ERROR,
+    }
+
+
+@pytest.fixture
+def restore_root_logging():
+    root = logging.getLogger()
+    handlers, level = list(root.handlers), root.level
+    yield
+    shutdown_logging()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    for handler in handlers:
+        root.addHandler(handler)
+    root.setLevel(level)
+    logging.getLogger("src.noisy").setLevel(logging.NOTSET)
+
+
+def test_setup_logging_writes_json_from_the_listener_thread(restore_root_logging):
+    settings = SimpleNamespace(
+        LOG_FORMAT="json",
+        LOG_LEVEL="INFO",
+        LOG_LEVELS="src.noisy=ERROR",
+        LOG_QUEUE_MAX_SIZE=100,
+        LOG_RATE_LIMIT_BURST=1,
+        LOG_RATE_LIMIT_WINDOW_SECONDS=60.0,
+    )
+    out = io.StringIO()
+    setup_logging(settings, stream=out)
+    log = logging.getLogger("src.test")
+    log.info("hola %s", "mundo", extra={"channel_id": 1})
+    log.warning("repetido")
+    log.warning("repetido")
+    logging.getLogger("src.noisy").warning("no sale")
+    # Vacía la cola antes de parar el hilo
+    shutdown_logging()
+    lines = [json.loads(line) for line in out.getvalue().splitlines()]
+    assert [(line["level"], line["message"]) for line in lines] == [("INFO", "hola mundo"), ("WARNING", "repetido")]
+    assert lines[0]["channel_id"] == 1
+    assert logging_config._listener is None
@@ -0,0 +1,94 @@
+import asyncio
+import logging
+import time
+
+import pytest
+
+from src.config import settings
+from src.loop_monitor import LoopMonitor, install_event_loop, loop_factory
+from src.metrics import LOOP_LAG_SECONDS, LOOP_STALLS
+
+
+@pytest.fixture(autouse=True)
+def monitor_settings(monkeypatch):
+    monkeypatch.setattr(settings, "LOOP_MONITOR_ENABLED", True)
+    monkeypatch.setattr(settings, "LOOP_MONITOR_INTERVAL_SECONDS", 0.01)
+    monkeypatch.setattr(settings, "LOOP_SLOW_CALLBACK_SECONDS", 0.05)
+
+
+def stalls():
+    return LOOP_STALLS.labels().value
+
+
+def lag_samples():
+    return LOOP_LAG_SECONDS.labels().count
+
+
+def blocking_handler():
+    # Un callback que bloquea el loop (p. ej. E/S síncrona)
+    time.sleep(0.3)
+
+
+def monitored(body):
+    """Run `body()` on a real loop (the watchdog measures wall time) with the monitor started."""
+
+    async def main():
+        monitor = LoopMonitor()
+        monitor.start()
+        try:
+            await body()
+        finally:
+            await monitor.stop()
+        return monitor
+
+    return asyncio.run(main())
+
+
+def test_blocking_call_is_reported_once_with_its_stack(caplog):
+    before = stalls()
+
+    async def body():
+        await asyncio.sleep(0.05)
+        blocking_handler()
+        await asyncio.sleep(0.1)
+
+    with caplog.at_level(logging.WARNING, logger="src.loop_monitor"):
+        monitored(body)
+    assert stalls() - before == 1
+    [report] = [r for r in caplog.records if r.name == "src.loop_monitor"]
+    assert "blocking_handler" in report.getMessage()
+    # La pila empieza en el callback, sin la maquinaria de asyncio por encima
+    assert "base_events.py" not in report.getMessage()
+
+
+def test_idle_loop_records_lag_without_stalls(monkeypatch):
+    # Umbral holgado: una pausa de la máquina que corre los tests no es un bloqueo del loop
+    monkeypatch.setattr(settings, "LOOP_SLOW_CALLBACK_SECONDS", 0.5)
+    before_stalls, before_samples = stalls(), lag_samples()
+
+    async def body():
+        await asyncio.sleep(0.2)
+
+    monitor = monitored(body)
+    assert stalls() == before_stalls
+    assert lag_samples() - before_samples >= 5
+    assert monitor.implementation() == {"asyncio": 1.0}
+    assert monitor._thread is None and monitor._task is None
+
+
+def test_disabled_monitor_does_not_start(monkeypatch):
+    monkeypatch.setattr(settings, "LOOP_MONITOR_ENABLED", False)
+
+    async def body():
+        pass
+
+    monitor = monitored(body)
+    assert monitor.implementation() == {}
+
+
+def test_event_loop_selection_falls_back_to_asyncio():
+    assert loop_factory("asyncio") is asyncio.new_event_loop
+    assert loop_factory("nope") is None
+    if loop_factory("uvloop") is None:
+        assert install_event_loop("uvloop") == "asyncio"
+    assert install_event_loop("asyncio") == "asyncio"
@@ -0,0 +1,93 @@
+import asyncio
+import sqlite3
+
+import pytest
+
+from src.memory_store import SQLiteMemoryStore
+
+
+def run(main):
+    # Hilo de escritura real: loop normal, no el de tiempo virtual
+    return asyncio.run(main())
+
+
+def test_round_trip_reads_back_unflushed_writes(tmp_path):
+    async def main():
+        store = SQLiteMemoryStore(str(tmp_path / "memory.sqlite3"), flush_interval=60.0)
+        await store.start()
+        store.append(1, "user", "hola")
+        store.append(1, "model", "buenas")
+        store.append(2, "user", "otro canal")
+        # El load pasa por el mismo hilo, después de las escrituras pendientes
+        turns = await store.load(1, 10)
+        await store.close()
+        return turns
+
+    assert run(main) == [{"role": "user", "text": "hola"}, {"role": "model", "text": "buenas"}]
+
+
+def test_close_flushes_pending_writes(tmp_path):
+    path = str(tmp_path / "memory.sqlite3")
+
+    async def write():
+        store = SQLiteMemoryStore(path, flush_interval=60.0, batch_size=1000)
+        await store.start()
+        for n in range(5):
+            store.append(1, "user", f"m{n}")
+        await store.close()
+        return store.written
+
+    async def read():
+        store = SQLiteMemoryStore(path)
+        await store.start()
+        turns = await store.load(1, 3)
+        await store.close()
+        return [t["text"] for t in turns]
+
+    assert run(write) == 5
+    # Los más recientes, del más viejo al más nuevo
+    assert run(read) == ["m2", "m3", "m4"]
+
+
+def test_keeps_only_the_last_turns_per_channel(tmp_path):
+    async def main():
+        store = SQLiteMemoryStore(str(tmp_path / "memory.sqlite3"), max_turns_per_channel=4)
+        await store.start()
+        for n in range(10):
+            store.append(1, "user", f"m{n}")
+        await store.flush()
+        turns = await store.load(1, 100)
+        await store.close()
+        return [t["text"] for t in turns]
+
+    assert run(main) == ["m6", "m7", "m8", "m9"]
+
+
+def test_start_raises_when_the_database_cannot_open(tmp_path):
+    async def main():
+        store = SQLiteMemoryStore(str(tmp_path / "missing" / "memory.sqlite3"))
+        with pytest.raises(sqlite3.Error):
+            await store.start()
+        # No quedó a medias: las cargas fallan en vez de esperar
+        with pytest.raises(RuntimeError):
+            await store.load(1, 10)
+
+    run(main)
+
+
+def test_unanswered_load_fails_on_close(tmp_path, monkeypatch):
+    async def main():
+        store = SQLiteMemoryStore(str(tmp_path / "memory.sqlite3"))
+        await store.start()
+        # El hilo se traga la petición: sin close() el load esperaría para siempre
+        monkeypatch.setattr(store, "_answer", lambda conn, op: None)
+        load = asyncio.ensure_future(store.load(1, 10))
+        await asyncio.sleep(0.05)
+        assert not load.done()
+        await store.close()
+        with pytest.raises(RuntimeError):
+            await load
+        with pytest.raises(RuntimeError):
+            await store.load(1, 10)
+
+    run(main)
@@ -0,0 +1,84 @@
+import json
+
+import pytest
+
+from src import payload_builder
+from src.payload_builder import GENERATION_CONFIG, TokenEstimator, Turn, build_body
+
+
+@pytest.fixture(autouse=True)
+def fresh_estimator(monkeypatch):
+    monkeypatch.setattr(payload_builder, "estimator", TokenEstimator())
+
+
+def turn(role, n, **kwargs):
+    # 36 caracteres: 9 + 1 tokens de texto + 4 por turno = 14
+    return Turn(role, f"{n}".ljust(36, "x"), **kwargs)
+
+
+def texts(body):
+    return [c["parts"][0]["text"][:2].rstrip("x") for c in json.loads(body)["contents"]]
+
+
+def test_body_is_the_generate_content_json():
+    history = [Turn("user", "hola"), {"role": "model", "text": "buenas"}]
+    body, _ = build_body("qué tal", "sé breve", history)
+    assert json.loads(body) == {
+        "system_instruction": {"parts": [{"text": "sé breve"}]},
+        "contents": [
+            {"role": "user", "parts": [{"text": "hola"}]},
+            {"role": "model", "parts": [{"text": "buenas"}]},
+            {"role": "user", "parts": [{"text": "qué tal"}]},
+        ],
+        "generation_config": GENERATION_CONFIG,
+    }
+
+
+def test_cached_content_replaces_the_system_prompt():
+    body, tokens = build_body("hola", "x" * 400, cached_content="cachedContents/abc")
+    data = json.loads(body)
+    assert data["cached_content"] == "cachedContents/abc"
+    assert "system_instruction" not in data
+    # El prompt cacheado sigue contando en promptTokenCount
+    assert tokens >= 100
+
+
+def test_budget_keeps_the_newest_turns_that_fit():
+    history = [turn("user", n) for n in range(6)]
+    body, tokens = build_body("ok", "", history, budget=3 * 14)
+    assert texts(body) == ["3", "4", "5", "ok"]
+    _, unlimited = build_body("ok", "", history)
+    assert unlimited - tokens == 3 * 14
+
+
+def test_pinned_turns_are_always_sent_and_come_off_the_budget_first():
+    history = [turn("model", 0, pinned=True)] + [turn("user", n) for n in range(1, 5)] + [turn("user", 5).pin()]
+    body, _ = build_body("ok", "", history, budget=3 * 14)
+    # Los dos fijados gastan 28 de 42: solo cabe el reciente más nuevo
+    assert texts(body) == ["0", "4", "5", "ok"]
+    body, _ = build_body("ok", "", history, budget=1)
+    assert texts(body) == ["0", "5", "ok"]
+
+
+def test_empty_turns_are_skipped():
+    body, _ = build_body("ok", "", [Turn("user", ""), Turn("model", "sí")])
+    assert texts(body) == ["sí", "ok"]
+
+
+def test_pin_shares_the_serialized_fragment():
+    original = Turn("user", "hola")
+    pinned = original.pin()
+    assert pinned.pinned and not original.pinned
+    assert pinned.fragment is original.fragment
+
+
+def test_estimator_moves_towards_the_observed_tokens():
+    estimator = TokenEstimator(alpha=0.5)
+    estimator.calibrate(100, 200)
+    assert estimator.factor == pytest.approx(1.5)
+    # Un atípico se recorta a 4x
+    estimator = TokenEstimator(alpha=1.0)
+    estimator.calibrate(10, 1000)
+    assert estimator.factor == pytest.approx(4.0)
+    estimator.calibrate(0, 50)
+    assert estimator.samples == 1
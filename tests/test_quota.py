@@ -0,0 +1,114 @@
+import asyncio
+
+import pytest
+
+from src.clock import run_virtual
+from src.config import settings
+from src.gemini_client import QuotaScheduler
+
+
+@pytest.fixture(autouse=True)
+def quota_settings(monkeypatch):
+    monkeypatch.setattr(settings, "GEMINI_MAX_CONCURRENCY", 1)
+    monkeypatch.setattr(settings, "GEMINI_QUOTA_RPM", 0)
+    monkeypatch.setattr(settings, "GEMINI_QUOTA_TPM", 0)
+    monkeypatch.setattr(settings, "GEMINI_RATE_LIMIT_PAUSE_SECONDS", 5.0)
+
+
+def scheduler():
+    return QuotaScheduler(clock=lambda: asyncio.get_running_loop().time())
+
+
+def test_cancelled_waiter_leaves_no_slot_behind():
+    async def main():
+        quota = scheduler()
+        first = await quota.acquire(0, 10)
+        waiter = asyncio.create_task(quota.acquire(0, 10))
+        await asyncio.sleep(0)
+        assert quota.waiting == 1
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        quota.release(first)
+        assert quota.inflight == 0
+        # El hueco pasa al siguiente sin esperar a nadie
+        await asyncio.wait_for(quota.acquire(0, 10), timeout=1.0)
+        assert (quota.inflight, quota.waiting) == (1, 0)
+
+    run_virtual(main())
+
+
+def test_cancel_right_after_the_grant_gives_the_slot_back():
+    async def main():
+        quota = scheduler()
+        first = await quota.acquire(0, 10)
+        waiter = asyncio.create_task(quota.acquire(0, 10))
+        await asyncio.sleep(0)
+        # release() concede el hueco al waiter, que se cancela antes de poder usarlo
+        quota.release(first)
+        assert quota.inflight == 1
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        assert quota.inflight == 0
+
+    run_virtual(main())
+
+
+def test_waiters_leave_by_priority_then_fifo():
+    async def main():
+        quota = scheduler()
+        holder = await quota.acquire(0, 10)
+        order = []
+
+        async def take(priority, name):
+            grant = await quota.acquire(priority, 10)
+            order.append(name)
+            quota.release(grant)
+
+        tasks = [
+            asyncio.create_task(take(priority, name))
+            for priority, name in ((2, "inactividad"), (0, "mención 1"), (1, "reply"), (0, "mención 2"))
+        ]
+        await asyncio.sleep(0)
+        quota.release(holder)
+        await asyncio.gather(*tasks)
+        return order
+
+    assert run_virtual(main()) == ["mención 1", "mención 2", "reply", "inactividad"]
+
+
+def test_throttled_release_halves_the_limit_and_pauses(monkeypatch):
+    monkeypatch.setattr(settings, "GEMINI_MAX_CONCURRENCY", 4)
+
+    async def main():
+        loop = asyncio.get_running_loop()
+        quota = scheduler()
+        grant = await quota.acquire(0, 10)
+        grant.outcome = "throttled"
+        grant.retry_after = 2.0
+        quota.release(grant)
+        assert quota.limit == 2
+        await quota.acquire(0, 10)
+        return loop.time()
+
+    # Espera lo que pidió el servidor, no GEMINI_RATE_LIMIT_PAUSE_SECONDS
+    assert run_virtual(main()) == pytest.approx(2.0)
+
+
+def test_rpm_bucket_spaces_requests(monkeypatch):
+    monkeypatch.setattr(settings, "GEMINI_MAX_CONCURRENCY", 8)
+    monkeypatch.setattr(settings, "GEMINI_QUOTA_RPM", 60)
+    monkeypatch.setattr(settings, "GEMINI_QUOTA_BURST_SECONDS", 2.0)
+
+    async def main():
+        loop = asyncio.get_running_loop()
+        quota = scheduler()
+        started = []
+        for _ in range(4):
+            quota.release(await quota.acquire(0, 1))
+            started.append(loop.time())
+        return started
+
+    # Ráfaga de 2 (1/s × 2 s) y después una por segundo
+    assert run_virtual(main()) == pytest.approx([0.0, 0.0, 1.0, 2.0])
@@ -0,0 +1,157 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from src.clock import run_virtual
+from src.config import settings
+from src.send_scheduler import SendScheduler
+
+
+@pytest.fixture(autouse=True)
+def pacing(monkeypatch):
+    monkeypatch.setattr(settings, "MIN_SECONDS_BETWEEN_MESSAGES_PER_CHANNEL", 3.0)
+    monkeypatch.setattr(settings, "SEND_JITTER_SECONDS", 0.0)
+    monkeypatch.setattr(settings, "COALESCE_WINDOW_SECONDS", 0.0)
+    monkeypatch.setattr(settings, "COALESCE_MAX_ITEMS", 5)
+    monkeypatch.setattr(settings, "COALESCE_MAX_CHARS", 2000)
+    monkeypatch.setattr(settings, "QUEUE_MAX_SIZE_PER_CHANNEL", 10)
+
+
+def reply(message_id, content):
+    return {"reply_to": SimpleNamespace(id=message_id), "content": content}
+
+
+def run(schedule):
+    """Run `schedule(scheduler)` on virtual time; returns every delivery as (time, channel, contents)."""
+
+    async def main():
+        loop = asyncio.get_running_loop()
+        sent = []
+        scheduler = None
+
+        async def deliver(items):
+            channel = next(cid for cid, lane in scheduler._lanes.items() if lane.active)
+            sent.append((loop.time(), channel, [i["content"] for i in items]))
+
+        scheduler = SendScheduler(deliver, clock=loop.time)
+        await schedule(scheduler)
+        await scheduler.join()
+        await scheduler.close()
+        return sent
+
+    return run_virtual(main())
+
+
+def test_sends_of_a_channel_are_paced():
+    async def schedule(scheduler):
+        for n in range(3):
+            scheduler.enqueue(1, reply(n, f"a{n}"))
+        scheduler.enqueue(2, reply(10, "b0"))
+
+    sent = run(schedule)
+    assert sorted(sent) == [(0.0, 1, ["a0"]), (0.0, 2, ["b0"]), (3.0, 1, ["a1"]), (6.0, 1, ["a2"])]
+
+
+def test_idle_channel_sends_at_once_after_the_gap():
+    async def schedule(scheduler):
+        scheduler.enqueue(1, reply(1, "a"))
+        await asyncio.sleep(10.0)
+        scheduler.enqueue(1, reply(2, "b"))
+
+    assert run(schedule) == [(0.0, 1, ["a"]), (10.0, 1, ["b"])]
+
+
+def test_full_lane_raises_queue_full(monkeypatch):
+    monkeypatch.setattr(settings, "QUEUE_MAX_SIZE_PER_CHANNEL", 2)
+
+    async def schedule(scheduler):
+        scheduler.enqueue(1, reply(1, "a"))
+        scheduler.enqueue(1, reply(2, "b"))
+        with pytest.raises(asyncio.QueueFull):
+            scheduler.enqueue(1, reply(3, "c"))
+
+    assert len(run(schedule)) == 2
+
+
+def test_lone_send_skips_the_window(monkeypatch):
+    monkeypatch.setattr(settings, "COALESCE_WINDOW_SECONDS", 2.0)
+
+    async def schedule(scheduler):
+        scheduler.enqueue(1, reply(7, "uno"))
+        await asyncio.sleep(0.5)
+        scheduler.enqueue(1, reply(8, "dos"))
+
+    # Nada con qué fusionarse: cada uno sale en su hueco de pacing
+    assert run(schedule) == [(0.0, 1, ["uno"]), (3.0, 1, ["dos"])]
+
+
+def test_window_merges_replies_of_a_channel(monkeypatch):
+    monkeypatch.setattr(settings, "COALESCE_WINDOW_SECONDS", 4.0)
+
+    async def schedule(scheduler):
+        scheduler.enqueue(1, reply(7, "uno"))
+        await asyncio.sleep(0.5)
+        scheduler.enqueue(1, reply(8, "dos"))
+        await asyncio.sleep(0.5)
+        scheduler.enqueue(1, reply(9, "tres"))
+        scheduler.enqueue(2, reply(10, "otro canal"))
+
+    # La ventana cuenta desde "dos" (0.5 + 4.0), más allá del hueco de pacing
+    assert run(schedule) == [(0.0, 1, ["uno"]), (1.0, 2, ["otro canal"]), (4.5, 1, ["dos", "tres"])]
+
+
+def test_window_never_merges_replies_with_channel_sends(monkeypatch):
+    monkeypatch.setattr(settings, "COALESCE_WINDOW_SECONDS", 2.0)
+    monkeypatch.setattr(settings, "MIN_SECONDS_BETWEEN_MESSAGES_PER_CHANNEL", 0.0)
+    channel = SimpleNamespace(id=1)
+
+    async def schedule(scheduler):
+        scheduler.enqueue(1, reply(7, "a 7"))
+        scheduler.enqueue(1, reply(8, "a 8"))
+        scheduler.enqueue(1, {"channel": channel, "content": "inactividad"})
+        scheduler.enqueue(1, {"channel": channel, "content": "inactividad 2"})
+
+    # El item siguiente no se puede fusionar: nada que esperar
+    assert run(schedule) == [(0.0, 1, ["a 7", "a 8"]), (0.0, 1, ["inactividad", "inactividad 2"])]
+
+
+def test_full_batch_skips_the_rest_of_the_window(monkeypatch):
+    monkeypatch.setattr(settings, "COALESCE_WINDOW_SECONDS", 2.0)
+    monkeypatch.setattr(settings, "COALESCE_MAX_ITEMS", 2)
+
+    async def schedule(scheduler):
+        for n in range(3):
+            scheduler.enqueue(1, reply(n, f"m{n}"))
+
+    # El resto ya esperó su ventana: sale en el siguiente hueco de pacing
+    assert run(schedule) == [(0.0, 1, ["m0", "m1"]), (3.0, 1, ["m2"])]
+
+
+def test_merged_message_fits_the_char_cap(monkeypatch):
+    monkeypatch.setattr(settings, "COALESCE_WINDOW_SECONDS", 2.0)
+    monkeypatch.setattr(settings, "COALESCE_MAX_CHARS", 100)
+
+    async def schedule(scheduler):
+        scheduler.enqueue(1, reply(7, "x" * 60))
+        scheduler.enqueue(1, reply(8, "y" * 39))
+        scheduler.enqueue(1, reply(9, "z" * 10))
+
+    sent = run(schedule)
+    # 60 + salto de línea + 39 = 100: el tercero ya no cabe
+    assert [len("\n".join(contents)) for _, _, contents in sent] == [100, 10]
+    assert [t for t, _, _ in sent] == [0.0, 3.0]
+
+
+def test_depth_and_lane_retirement():
+    async def schedule(scheduler):
+        scheduler.enqueue(1, reply(1, "a"))
+        scheduler.enqueue(1, reply(2, "b"))
+        assert scheduler.depth(1) == 2
+        assert scheduler.active_lanes() == 1
+        await scheduler.join()
+        # Vacío y con el gap cumplido: el carril desaparece
+        await asyncio.sleep(settings.MIN_SECONDS_BETWEEN_MESSAGES_PER_CHANNEL + 0.1)
+        assert scheduler.active_lanes() == 0
+
+    assert len(run(schedule)) == 2
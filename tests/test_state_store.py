@@ -0,0 +1,138 @@
+from src.state_store import DISCORD_EPOCH_MS, SentMessageIndex, StateStore, snowflake_time
+
+T0 = 1_700_000_000.0
+
+
+class FakeClock:
+    def __init__(self, now: float = 0.0) -> None:
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def snowflake(at: float, seq: int = 0) -> int:
+    return ((int(at * 1000) - DISCORD_EPOCH_MS) << 22) | seq
+
+
+def store(clock, **kwargs):
+    options = {"max_channels": 100, "max_cooldowns": 100, "ttl_seconds": 60.0, "memory_turns": 4}
+    options.update(kwargs)
+    return StateStore(clock=clock, **options)
+
+
+def test_channel_is_created_once_and_counted():
+    s = store(FakeClock())
+    first = s.channel(1)
+    assert s.channel(1) is first
+    assert (s.hits, s.misses) == (1, 1)
+    assert first.memory.maxlen == 4
+
+
+def test_idle_channels_expire_after_ttl():
+    clock = FakeClock()
+    s = store(clock)
+    s.channel(1)
+    clock.now = 30.0
+    s.channel(2)
+    clock.now = 60.0
+    # El 1 lleva 60 s sin uso; el 2 sigue vivo
+    s.channel(3)
+    assert s.peek(1) is None
+    assert s.peek(2) is not None
+    assert s.evictions_ttl == 1
+
+
+def test_least_recently_used_channel_is_evicted_over_the_cap():
+    s = store(FakeClock(), max_channels=2)
+    s.channel(1)
+    s.channel(2)
+    s.channel(1)
+    s.channel(3)
+    assert [ch.channel_id for ch in s.channels()] == [1, 3]
+    assert s.evictions_lru == 1
+
+
+def test_peek_does_not_refresh_the_ttl():
+    clock = FakeClock()
+    s = store(clock)
+    s.channel(1)
+    clock.now = 59.0
+    assert s.peek(1) is not None
+    clock.now = 60.0
+    s.channel(2)
+    assert s.peek(1) is None
+
+
+def test_cooldown_blocks_until_elapsed_then_is_dropped():
+    clock = FakeClock()
+    s = store(clock)
+    assert s.try_cooldown(1, 10, 5.0)
+    assert not s.try_cooldown(1, 10, 5.0)
+    assert s.try_cooldown(1, 11, 5.0)
+    clock.now = 5.0
+    assert s.try_cooldown(1, 10, 5.0)
+    # Los cooldowns vencidos se borran al pasar por ellos
+    assert s.counters()["cooldowns"] == 1
+    assert s.cooldown_evictions == 1
+
+
+def test_cooldowns_are_capped():
+    s = store(FakeClock(), max_cooldowns=2)
+    for author in range(5):
+        assert s.try_cooldown(1, author, 100.0)
+    assert s.counters()["cooldowns"] == 2
+    # El más antiguo salió por el tope: vuelve a poder disparar
+    assert s.try_cooldown(1, 0, 100.0)
+
+
+def test_snowflake_time_round_trip():
+    assert snowflake_time(snowflake(T0 + 1.5)) == T0 + 1.5
+
+
+def test_sent_index_answers_inside_its_coverage():
+    clock = FakeClock(T0)
+    index = SentMessageIndex(window_seconds=3600.0, max_ids=100, clock=clock)
+    ours = snowflake(T0 + 10)
+    index.add(ours)
+    assert index.is_ours(ours) is True
+    # Posterior al inicio de la cobertura y no registrado: seguro que no es nuestro
+    assert index.is_ours(snowflake(T0 + 20)) is False
+    # Anterior al arranque (más el margen de desfase): hay que preguntar a Discord
+    assert index.is_ours(snowflake(T0 - 100)) is None
+    assert index.is_ours(snowflake(T0 + 4)) is None
+    assert index.counters() == {"hit": 1, "miss": 1, "fetch": 2}
+
+
+def test_sent_index_coverage_follows_the_window():
+    clock = FakeClock(T0)
+    index = SentMessageIndex(window_seconds=60.0, max_ids=100, clock=clock)
+    old = snowflake(T0 + 10)
+    index.add(old)
+    clock.now = T0 + 100
+    index.add(snowflake(T0 + 100))
+    assert len(index) == 1
+    # Lo anterior a now - window ya no está garantizado
+    assert index.is_ours(snowflake(T0 + 30)) is None
+    assert index.is_ours(snowflake(T0 + 50)) is False
+
+
+def test_sent_index_coverage_follows_count_evictions():
+    clock = FakeClock(T0)
+    index = SentMessageIndex(window_seconds=3600.0, max_ids=2, clock=clock)
+    ids = [snowflake(T0 + 10 * n) for n in range(1, 4)]
+    for message_id in ids:
+        index.add(message_id)
+    assert len(index) == 2
+    assert index.is_ours(ids[0]) is None
+    assert index.is_ours(ids[2]) is True
+    assert index.is_ours(snowflake(T0 + 15)) is False
+
+
+def test_reset_coverage_forgets_what_we_could_vouch_for():
+    clock = FakeClock(T0)
+    index = SentMessageIndex(window_seconds=3600.0, max_ids=100, clock=clock)
+    clock.now = T0 + 100
+    index.reset_coverage()
+    assert index.is_ours(snowflake(T0 + 50)) is None
+    assert index.is_ours(snowflake(T0 + 200)) is False
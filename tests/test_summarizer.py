@@ -0,0 +1,158 @@
+import asyncio
+
+import pytest
+
+from src.clock import run_virtual
+from src.config import settings
+from src.gemini_client import PRIORITY_BACKGROUND
+from src.payload_builder import Turn
+from src.state_store import ChannelState
+from src.summarizer import SUMMARY_PREFIX, HistoryCompactor, with_summary
+
+
+@pytest.fixture(autouse=True)
+def summary_settings(monkeypatch):
+    monkeypatch.setattr(settings, "SUMMARY_ENABLED", True)
+    monkeypatch.setattr(settings, "SUMMARY_KEEP_TURNS", 2)
+    monkeypatch.setattr(settings, "SUMMARY_TRIGGER_TOKENS", 100)
+    monkeypatch.setattr(settings, "SUMMARY_MAX_CHARS", 60)
+    monkeypatch.setattr(settings, "SUMMARY_CONCURRENCY", 1)
+
+
+class Summarizer:
+    """generate_reply stand-in: records prompts, takes `seconds`, answers from `replies` in order."""
+
+    def __init__(self, *replies, seconds=1.0):
+        self.replies = list(replies)
+        self.seconds = seconds
+        self.prompts = []
+        self.in_flight = 0
+        self.peak = 0
+
+    async def __call__(self, text, system_prompt, *, priority):
+        assert priority == PRIORITY_BACKGROUND
+        self.prompts.append(text)
+        self.in_flight += 1
+        self.peak = max(self.peak, self.in_flight)
+        try:
+            await asyncio.sleep(self.seconds)
+        finally:
+            self.in_flight -= 1
+        reply = self.replies.pop(0) if len(self.replies) > 1 else self.replies[0]
+        if isinstance(reply, BaseException):
+            raise reply
+        return reply
+
+
+def channel(turns, channel_id=1, maxlen=50):
+    ch = ChannelState(channel_id, maxlen, 0.0)
+    for n in range(turns):
+        # ~15 tokens cada uno: 8 turnos pasan de 100
+        ch.memory.append(Turn("user" if n % 2 == 0 else "model", f"turno {n} ".ljust(40, ".")))
+    return ch
+
+
+def compact(generate, *channels, after=None):
+    async def main():
+        loop = asyncio.get_running_loop()
+        compactor = HistoryCompactor(generate, clock=loop.time)
+        for ch in channels:
+            compactor.maybe_compact(ch)
+        if after is not None:
+            await after(compactor)
+        await asyncio.sleep(100.0)
+        await compactor.close()
+
+    run_virtual(main())
+
+
+def texts(ch):
+    return [turn.text.split()[1] for turn in ch.memory]
+
+
+def test_short_history_is_left_alone():
+    generate = Summarizer("resumen")
+    ch = channel(4)
+    compact(generate, ch)
+    assert generate.prompts == []
+    assert ch.summary is None
+
+
+def test_long_history_folds_all_but_the_last_turns():
+    generate = Summarizer("ana pidió una receta de tortilla")
+    ch = channel(8)
+    compact(generate, ch)
+    assert texts(ch) == ["6", "7"]
+    assert ch.summary.text == SUMMARY_PREFIX + "ana pidió una receta de tortilla"
+    assert ch.summary.pinned
+    assert with_summary(ch, list(ch.memory))[0] is ch.summary
+    assert "usuario: turno 0" in generate.prompts[0] and "yo: turno 5" in generate.prompts[0]
+    assert "turno 6" not in generate.prompts[0]
+
+
+def test_next_round_merges_the_previous_summary():
+    generate = Summarizer("primero", "segundo")
+    ch = channel(8)
+    compact(generate, ch)
+    for n in range(8, 14):
+        ch.memory.append(Turn("user", f"turno {n} ".ljust(40, ".")))
+    compact(generate, ch)
+    assert generate.prompts[1].startswith("Resumen hasta ahora: primero")
+    assert ch.summary.text == SUMMARY_PREFIX + "segundo"
+    assert texts(ch) == ["12", "13"]
+
+
+def test_turns_added_during_generation_are_kept():
+    generate = Summarizer("resumen", seconds=10.0)
+    ch = channel(8)
+
+    async def during(compactor):
+        await asyncio.sleep(5.0)
+        ch.memory.append(Turn("user", "turno 8"))
+        # Ya hay una compactación en curso para el canal
+        compactor.maybe_compact(ch)
+
+    compact(generate, ch, after=during)
+    assert len(generate.prompts) == 1
+    assert texts(ch) == ["6", "7", "8"]
+
+
+def test_memory_about_to_drop_turns_compacts_below_the_token_trigger():
+    generate = Summarizer("resumen")
+    ch = ChannelState(1, 10, 0.0)
+    for n in range(6):
+        ch.memory.append(Turn("user", f"t {n}"))
+    compact(generate, ch)
+    assert generate.prompts
+    assert texts(ch) == ["4", "5"]
+
+
+def test_summary_is_clipped_to_max_chars():
+    generate = Summarizer("palabra " * 30)
+    ch = channel(8)
+    compact(generate, ch)
+    text = ch.summary.text[len(SUMMARY_PREFIX):]
+    assert len(text) <= 61 and text.endswith("…")
+
+
+def test_failure_keeps_the_turns_and_waits_before_retrying():
+    generate = Summarizer(RuntimeError("500"), "resumen")
+    ch = channel(8)
+
+    async def retry(compactor):
+        await asyncio.sleep(30.0)
+        compactor.maybe_compact(ch)  # todavía dentro de la espera
+        await asyncio.sleep(40.0)
+        compactor.maybe_compact(ch)
+
+    compact(generate, ch, after=retry)
+    assert len(generate.prompts) == 2
+    assert ch.summary.text == SUMMARY_PREFIX + "resumen"
+
+
+def test_compactions_are_bounded_by_summary_concurrency():
+    generate = Summarizer("resumen")
+    channels = [channel(8, channel_id=n) for n in range(4)]
+    compact(generate, *channels)
+    assert generate.peak == 1
+    assert all(ch.summary is not None for ch in channels)
@@ -0,0 +1,78 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from src import discord_client
+from src.clock import run_virtual
+from src.config import settings
+from src.state_store import ChannelState
+from src.tracing import NOOP_SPAN
+
+
+@pytest.fixture(autouse=True)
+def batching(monkeypatch):
+    monkeypatch.setattr(settings, "TRIGGER_BATCH_WINDOW_SECONDS", 2.0)
+    monkeypatch.setattr(settings, "VECTOR_MEMORY_ENABLED", False)
+    monkeypatch.setattr(settings, "SUMMARY_ENABLED", False)
+    monkeypatch.setattr(discord_client, "memory_store", None)
+    monkeypatch.setattr(discord_client, "inactivity_pool", SimpleNamespace(invalidate=lambda ch: None))
+
+
+def message(message_id, name, content):
+    author = SimpleNamespace(name=name, display_name=name)
+    return SimpleNamespace(id=message_id, content=content, author=author, mentions=[], channel=SimpleNamespace(id=1))
+
+
+def run(monkeypatch, arrivals):
+    """Answer the first message at t=0; the rest arrive at their times. Returns (calls, sends, memory)."""
+    calls, sends = [], []
+
+    async def generate_reply(content, system_prompt, **kwargs):
+        calls.append((asyncio.get_running_loop().time(), content))
+        await asyncio.sleep(1.0)
+        return f"respuesta {len(calls)}"
+
+    monkeypatch.setattr(discord_client, "generate_reply", generate_reply)
+    monkeypatch.setattr(discord_client, "_enqueue_send", lambda target, text: sends.append((target.id, text)))
+
+    async def main():
+        ch = ChannelState(1, 20, 0.0)
+        (_, first), rest = arrivals[0], arrivals[1:]
+        answer = asyncio.ensure_future(discord_client._answer(first, ch, NOOP_SPAN))
+        for at, follower in rest:
+            await asyncio.sleep(at - asyncio.get_running_loop().time())
+            assert discord_client._join_pending_batch(ch, follower)
+        await answer
+        assert ch.pending_triggers is None
+        return [(turn.role, turn.text) for turn in ch.memory]
+
+    memory = run_virtual(main())
+    return calls, sends, memory
+
+
+def test_lone_trigger_is_answered_at_once(monkeypatch):
+    calls, sends, memory = run(monkeypatch, [(0.0, message(1, "ana", "hola"))])
+    assert calls == [(0.0, "hola")]
+    assert sends == [(1, "respuesta 1")]
+    assert memory == [("user", "hola"), ("model", "respuesta 1")]
+
+
+def test_triggers_during_a_reply_are_answered_together(monkeypatch):
+    calls, sends, memory = run(monkeypatch, [
+        (0.0, message(1, "ana", "hola")),
+        (0.5, message(2, "bea", "qué tal")),
+        (1.5, message(3, "carlos", "buenas")),
+    ])
+    # El lote sale cuando pasa la ventana desde su primer trigger (0.5 + 2.0)
+    assert [t for t, _ in calls] == [0.0, 2.5]
+    assert calls[1][1].splitlines()[1:] == ["bea: qué tal", "carlos: buenas"]
+    assert sends == [(1, "respuesta 1"), (3, "respuesta 2")]
+    # La memoria guarda lo que escribieron, no la cabecera del prompt del lote
+    assert memory[2:] == [("user", "qué tal\nbuenas"), ("model", "respuesta 2")]
+
+
+def test_no_batching_without_window(monkeypatch):
+    monkeypatch.setattr(settings, "TRIGGER_BATCH_WINDOW_SECONDS", 0.0)
+    ch = ChannelState(1, 20, 0.0)
+    assert not discord_client._join_pending_batch(ch, message(1, "ana", "hola"))
@@ -0,0 +1,112 @@
+import pytest
+
+from src import vector_index
+from src.config import settings
+from src.payload_builder import Turn
+from src.vector_index import ChannelVectors, HashingEmbedder, index_exchange, pair_turns, recall
+
+# Vocabulario sin palabras en común: la similitud es solo la de los temas
+TOPICS = [
+    "fútbol estadio gol",
+    "tortilla patatas cebolla",
+    "examen matemáticas lunes",
+    "playa vacaciones verano",
+    "concierto rock guitarra",
+    "gato armario maullido",
+]
+
+
+@pytest.fixture(params=["numpy", "python"])
+def backend(request, monkeypatch):
+    # Las dos implementaciones de la búsqueda: producto matriz-vector y array('f')
+    if request.param == "numpy":
+        pytest.importorskip("numpy")
+    else:
+        monkeypatch.setattr(vector_index, "np", None)
+    return request.param
+
+
+@pytest.fixture
+def embedder():
+    return HashingEmbedder(dim=1024)
+
+
+def exchange(n):
+    return Turn("user", f"u{n}"), Turn("model", f"m{n}")
+
+
+def filled(embedder, texts, capacity=64):
+    vectors = ChannelVectors(embedder.dim, capacity)
+    for n, text in enumerate(texts):
+        vectors.add(embedder.embed_one(text), *exchange(n))
+    return vectors
+
+
+def test_hashing_embedder_is_deterministic(embedder):
+    assert embedder.embed_one("Hola qué tal") == embedder.embed_one("hola QUÉ tal")
+    assert embedder.embed_one("hola") != embedder.embed_one("adiós")
+    assert len(embedder.embed_one("")) == 1024
+
+
+def test_search_finds_the_most_similar_exchange(backend, embedder):
+    vectors = filled(embedder, TOPICS)
+    query = embedder.embed_one("fútbol gol")
+    found = vectors.search(query, 1, before_seq=vectors.seq)
+    assert [e.seq for e in found] == [0]
+
+
+def test_search_returns_top_k_oldest_first(backend, embedder):
+    vectors = filled(embedder, TOPICS)
+    query = embedder.embed_one("gato examen fútbol")
+    found = vectors.search(query, 3, before_seq=vectors.seq)
+    assert [e.seq for e in found] == [0, 2, 5]
+
+
+def test_search_skips_the_recent_window(backend, embedder):
+    vectors = filled(embedder, TOPICS)
+    query = embedder.embed_one("gato armario")
+    # Los exchanges desde before_seq ya van en el prompt
+    assert [e.seq for e in vectors.search(query, 1, before_seq=6)] == [5]
+    assert all(e.seq != 5 for e in vectors.search(query, 1, before_seq=5))
+
+
+def test_min_score_filters_unrelated_exchanges(backend, embedder):
+    vectors = filled(embedder, TOPICS)
+    query = embedder.embed_one("xyzzy quux")
+    assert vectors.search(query, 3, before_seq=vectors.seq, min_score=0.2) == []
+
+
+def test_capacity_overwrites_the_oldest(backend, embedder):
+    texts = [f"palabra{n}" for n in range(40)]
+    vectors = filled(embedder, texts, capacity=16)
+    assert len(vectors) == 16
+    assert vectors.nbytes() == 16 * embedder.dim * 4
+    found = vectors.search(embedder.embed_one("palabra3"), 1, before_seq=vectors.seq, min_score=0.1)
+    # El exchange 3 ya fue sobrescrito
+    assert all(e.seq >= 24 for e in found)
+    found = vectors.search(embedder.embed_one("palabra30"), 1, before_seq=vectors.seq)
+    assert [e.seq for e in found] == [30]
+
+
+def test_dimension_mismatch(backend, embedder):
+    vectors = ChannelVectors(embedder.dim, 8)
+    with pytest.raises(ValueError):
+        vectors.add([1.0, 0.0], *exchange(0))
+    assert vectors.search([1.0, 0.0], 3, before_seq=0) == []
+    # index_exchange recrea el índice si cambió el embedder
+    recreated = index_exchange(vectors, [1.0, 0.0], *exchange(0))
+    assert recreated is not vectors and recreated.dim == 2
+
+
+def test_recall_returns_pinnable_turn_pairs(backend, embedder, monkeypatch):
+    monkeypatch.setattr(settings, "VECTOR_TOP_K", 2)
+    monkeypatch.setattr(settings, "VECTOR_MIN_SCORE", 0.1)
+    vectors = filled(embedder, TOPICS)
+    turns = recall(vectors, embedder.embed_one("tortilla patatas"), recent_turns=4)
+    assert [t.text for t in turns] == ["u1", "m1"]
+    assert recall(None, [0.0] * embedder.dim, 4) == []
+
+
+def test_pair_turns_skips_unpaired_turns():
+    turns = [Turn("model", "a"), Turn("user", "b"), Turn("model", "c"), Turn("user", "d"), Turn("user", "e")]
+    assert [(u.text, m.text) for u, m in pair_turns(turns)] == [("b", "c")]